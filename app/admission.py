@@ -0,0 +1,216 @@
+"""
+ADMISSION CONTROL
+Protects the model quota and keeps sessions responsive under load.
+
+- Per-user token buckets: each client may start USER_BURST turns at once and
+  USER_TURNS_PER_MINUTE on average; extra turns are rejected immediately
+- Per-model concurrency: at most MODEL_CONCURRENCY calls in flight per chat
+  model (EMBEDDING_CONCURRENCY for the embedding model)
+- Priority queue: when a model is saturated, waiting calls are served by
+  priority (INTERACTIVE answers before BACKGROUND work such as emotion
+  updates and summaries), then in arrival order
+- Load shedding: a call is rejected right away when the model's queue is
+  full, and after a bounded wait (shorter for background work) otherwise
+
+Rejections raise Overloaded / RateLimited; callers degrade gracefully (an
+in-character "busy" reply, a skipped emotion update, a deferred summary).
+"""
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+import telemetry
+from models import EMBEDDING_MODEL
+
+# Call priorities (lower is served first)
+INTERACTIVE = 0
+BACKGROUND = 1
+
+MODEL_CONCURRENCY = int(os.getenv("MODEL_CONCURRENCY", "8"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "16"))
+MODEL_QUEUE_LIMIT = int(os.getenv("MODEL_QUEUE_LIMIT", "32"))            # Waiting calls per model before shedding
+ADMISSION_TIMEOUT = float(os.getenv("ADMISSION_TIMEOUT", "15"))          # Max queueing seconds, interactive calls
+BACKGROUND_TIMEOUT = float(os.getenv("BACKGROUND_TIMEOUT", "2"))         # Max queueing seconds, background calls
+USER_TURNS_PER_MINUTE = float(os.getenv("USER_TURNS_PER_MINUTE", "20"))
+USER_BURST = int(os.getenv("USER_BURST", "5"))
+MAX_TRACKED_CLIENTS = 10000  # Idle buckets are dropped beyond this many clients
+
+class Overloaded(Exception):
+    """Raised when a model call is shed because the model is saturated"""
+
+class RateLimited(Exception):
+    """Raised when a client exceeds its turn rate"""
+
+class TokenBucket:
+    """Classic token bucket: `capacity` tokens, refilled at `rate` tokens per second"""
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, now):
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+class ModelGate:
+    """Bounded concurrency for one model with a priority-ordered wait queue"""
+
+    def __init__(self, limit, queue_limit):
+        self.limit = limit
+        self.queue_limit = queue_limit
+        self.active = 0
+        self.waiting = []  # Heap of [priority, sequence] entries
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def acquire(self, priority, timeout):
+        """
+        Takes a slot, waiting behind higher-priority and earlier callers
+
+        Raises:
+            Overloaded: If the queue is full or no slot frees up within timeout
+        """
+        with self._cond:
+            if self.active < self.limit and not self.waiting:
+                self.active += 1
+                return
+            if len(self.waiting) >= self.queue_limit:
+                raise Overloaded("model queue is full")
+
+            entry = [priority, next(self._sequence)]
+            heapq.heappush(self.waiting, entry)
+            deadline = time.monotonic() + timeout
+            while not (self.waiting[0] is entry and self.active < self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.waiting.remove(entry)
+                    heapq.heapify(self.waiting)
+                    self._cond.notify_all()  # The next entry may now be at the head
+                    raise Overloaded("timed out waiting for a model slot")
+                self._cond.wait(remaining)
+            heapq.heappop(self.waiting)
+            self.active += 1
+            self._cond.notify_all()  # Another free slot may serve the new head
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+class AdmissionController:
+    """Per-client rate limits and per-model concurrency shared by every session in the process"""
+
+    def __init__(self, model_concurrency=MODEL_CONCURRENCY, embedding_concurrency=EMBEDDING_CONCURRENCY,
+                 queue_limit=MODEL_QUEUE_LIMIT, timeout=ADMISSION_TIMEOUT, background_timeout=BACKGROUND_TIMEOUT,
+                 turns_per_minute=USER_TURNS_PER_MINUTE, burst=USER_BURST, clock=time.monotonic):
+        """
+        Args:
+            model_concurrency (int): Concurrent calls per chat model
+            embedding_concurrency (int): Concurrent calls to the embedding model
+            queue_limit (int): Waiting calls per model before new ones are shed
+            timeout (float): Max queueing seconds for interactive calls
+            background_timeout (float): Max queueing seconds for background calls
+            turns_per_minute (float): Sustained turn rate per client (0 disables rate limiting)
+            burst (int): Turns a client may start back to back
+            clock (callable): Monotonic time source (replaceable in tests)
+        """
+        self.model_concurrency = model_concurrency
+        self.embedding_concurrency = embedding_concurrency
+        self.queue_limit = queue_limit
+        self.timeouts = {INTERACTIVE: timeout, BACKGROUND: background_timeout}
+        self.rate = turns_per_minute / 60
+        self.burst = burst
+        self.clock = clock
+        self._gates = {}    # model name -> ModelGate
+        self._buckets = {}  # client id -> TokenBucket
+        self._lock = threading.Lock()
+
+    def admit_turn(self, client_id):
+        """
+        Charges one turn to a client
+
+        Raises:
+            RateLimited: If the client has no turns left right now
+        """
+        if not self.rate:
+            return
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(client_id)
+            if bucket is None:
+                if len(self._buckets) >= MAX_TRACKED_CLIENTS:
+                    self._drop_idle_buckets(now)
+                bucket = self._buckets[client_id] = TokenBucket(self.rate, self.burst, now)
+            admitted = bucket.try_take(now)
+        if not admitted:
+            telemetry.count("admission.rate_limited")
+            raise RateLimited(f"Too many turns from {client_id}")
+
+    def _drop_idle_buckets(self, now):
+        """Forgets clients whose buckets have refilled (they'd get a fresh full bucket anyway)"""
+        for client_id, bucket in list(self._buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.capacity:
+                del self._buckets[client_id]
+
+    def _gate(self, model):
+        with self._lock:
+            gate = self._gates.get(model)
+            if gate is None:
+                limit = self.embedding_concurrency if model == EMBEDDING_MODEL else self.model_concurrency
+                gate = self._gates[model] = ModelGate(limit, self.queue_limit)
+            return gate
+
+    @contextmanager
+    def model_slot(self, model, priority=INTERACTIVE):
+        """
+        Holds a concurrency slot for `model` while the block runs
+
+        Args:
+            model (str): Model name (e.g. models.CHAT_MODEL)
+            priority (int): INTERACTIVE or BACKGROUND
+
+        Raises:
+            Overloaded: If the call is shed
+        """
+        gate = self._gate(model)
+        start = time.perf_counter()
+        try:
+            gate.acquire(priority, self.timeouts[priority])
+        except Overloaded:
+            telemetry.count("admission.shed_background" if priority == BACKGROUND else "admission.shed")
+            raise
+        telemetry.observe("admission.wait", time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            gate.release()
+
+_controller = None
+_controller_lock = threading.Lock()
+
+def get_controller():
+    """Process-wide admission controller"""
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdmissionController()
+        return _controller
+
+def set_controller(controller):
+    """Replaces the process-wide controller (e.g. with different limits in benchmarks)"""
+    global _controller
+    with _controller_lock:
+        _controller = controller
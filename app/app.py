@@ -4,23 +4,304 @@ Streamlit-based AI chatbot that lets users chat with characters extracted from b
 Characters maintain emotional states and conversation memory (for logged-in users).
 """
 
-import json
-from PyPDF2 import PdfReader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain.vectorstores import FAISS
 import os
-from typing import Union, List, Optional
-import re
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
 import streamlit as st
+import library
+import telemetry
 from pdf_processor import PDFProcessor
 from chat import ChatManager
 from character import CharacterManager
+from ui import render_chat_history, render_emotions
 from dotenv import load_dotenv
 
 # Load environment variables (API keys, etc.)
 load_dotenv()
 
+# Warm up a character in the background as soon as it is selected (see start_warmup)
+CHARACTER_WARMUP = os.getenv("CHARACTER_WARMUP", "1").lower() not in ("0", "false", "no")
+WARMUP_WORKERS = int(os.getenv("WARMUP_WORKERS", "2"))  # Threads shared by all sessions
+
+# ======================
+# CACHED RESOURCES
+# ======================
+# Streamlit re-executes main() on every interaction. Managers hold clients and a
+# database connection, so they are built once per process and shared by all sessions.
+
+@st.cache_resource
+def get_pdf_processor():
+    """Shared PDF/text processor"""
+    return PDFProcessor()
+
+@st.cache_resource
+def get_character_manager():
+    """Shared character state manager (owns the database connection)"""
+    return CharacterManager()
+
+@st.cache_resource
+def get_chat_manager(book_source):
+    """Shared chat manager per book; keeps the loaded index between turns"""
+    character_manager = get_character_manager()
+    book = character_manager.db.get_book(book_source)  # Index location of cataloged books
+    return ChatManager(book_source, character_manager=character_manager,
+                       index_path=book["index_dir"] if book else None)
+
+@st.cache_data(ttl=60)
+def list_catalog_books():
+    """Books in the catalog (refreshed every minute and after each ingestion)"""
+    return get_character_manager().db.list_books()
+
+@st.cache_resource
+def start_metrics_server():
+    """Exposes /metrics once per process when TELEMETRY_METRICS_PORT is set"""
+    port = os.getenv("TELEMETRY_METRICS_PORT")
+    if port and telemetry.is_enabled():
+        return telemetry.start_metrics_server(int(port))
+
+@st.cache_resource
+def get_warmup_pool():
+    """Threads running character warm-ups (see start_warmup)"""
+    return ThreadPoolExecutor(max_workers=WARMUP_WORKERS, thread_name_prefix="warmup")
+
+def get_cached_character_state(character_manager, character_name, book_source, user_id):
+    """
+    Returns character state from the session cache, querying the database only
+    the first time a character is shown (chat turns update the cache directly)
+    """
+    key = (book_source, character_name, user_id)
+    cache = st.session_state.setdefault('character_states', {})
+    if key not in cache:
+        collect_warmup(key)
+    if key not in cache:
+        cache[key] = character_manager.get_character_state(character_name, book_source, user_id)
+    return cache[key]
+
+def client_id():
+    """
+    Identity charged for rate limiting: the user ID, or a random per-session ID
+    for anonymous users (who would otherwise all share one budget)
+    """
+    if st.session_state.user_id != "anonymous":
+        return st.session_state.user_id
+    return st.session_state.setdefault('client_id', f"anonymous-{uuid.uuid4().hex}")
+
+# ======================
+# BACKGROUND WARM-UP
+# ======================
+# Selecting a character starts loading everything its first turn needs on a
+# background thread: state and saved history (which the page waits for), then
+# the book index, the chain and the user's message index (which finish while
+# the user types). Selecting another character cancels the previous warm-up.
+
+def _warm_up(chat_manager, character_name, user_id, session, cancelled):
+    """Warm-up job: publishes the session data as soon as it is loaded, then warms the rest"""
+    try:
+        loaded = chat_manager.load_session(character_name, user_id)
+    except Exception as e:
+        session.set_exception(e)
+        return
+    session.set_result(loaded)
+    if not cancelled.is_set():
+        chat_manager.warm_up_character(character_name, loaded["character_id"], user_id, cancelled)
+
+def cancel_warmup():
+    """Stops the session's warm-up: a queued one never runs, a running one skips its remaining steps"""
+    warmup = st.session_state.pop('warmup', None)
+    if warmup:
+        _, job, _, cancelled = warmup
+        cancelled.set()
+        job.cancel()
+
+def start_warmup():
+    """
+    Character selectbox callback (also called for the character shown first):
+    cancels the warm-up of the previous selection and starts one for the new one
+    """
+    book_source, user_id = st.session_state.book_source, st.session_state.user_id
+    key = (book_source, st.session_state.character_choice, user_id)
+    warmup = st.session_state.get('warmup')
+    if warmup and warmup[0] == key:
+        return
+    cancel_warmup()
+    if not CHARACTER_WARMUP or key in st.session_state.get('character_states', {}):
+        return  # Shown earlier in this session: everything is loaded already
+
+    session, cancelled = Future(), threading.Event()
+    job = get_warmup_pool().submit(_warm_up, get_chat_manager(book_source), key[1], user_id, session, cancelled)
+    st.session_state.warmup = (key, job, session, cancelled)
+
+def collect_warmup(key):
+    """
+    Moves the state and history loaded by the warm-up of `key` into the
+    session caches, waiting for them if the warm-up is loading them; does
+    nothing if there is no such warm-up, it is still queued behind other
+    sessions' warm-ups, or it failed (callers query instead)
+    """
+    warmup = st.session_state.get('warmup')
+    if not warmup or warmup[0] != key:
+        return
+    _, job, session, _ = warmup
+    if not session.done() and not job.running():
+        return  # Queued (or cancelled): querying now is faster than waiting for a thread
+    try:
+        loaded = session.result()
+    except Exception:
+        return
+    st.session_state.setdefault('character_states', {})[key] = (loaded["character_state"], loaded["character_id"])
+    if key[2] != "anonymous":
+        st.session_state.setdefault('transcripts', {}).setdefault(key, loaded["history"])
+
+# ======================
+# FRAGMENTS
+# ======================
+# Parts of the page that rerun on their own. A chat turn reruns only the chat
+# tail and the emotion panel; ingestion widgets rerun only the ingestion panel.
+# Everything else (CSS, authentication, character lookup, the transcript
+# rendered so far) is left as drawn by the last full run.
+
+# Messages the chat tail may hold before a full rerun folds them into the transcript,
+# so a turn's rerun cost doesn't grow with the length of the conversation
+CHAT_TAIL_LIMIT = 20
+
+def get_transcript(chat_manager, character_name):
+    """
+    Messages of the conversation with a character, loaded from the database
+    once per session for logged-in users and extended in place by each turn
+    """
+    if st.session_state.user_id == "anonymous":
+        return st.session_state.temp_messages.setdefault(character_name, [])
+    key = (st.session_state.book_source, character_name, st.session_state.user_id)
+    transcripts = st.session_state.setdefault('transcripts', {})
+    if key not in transcripts:
+        transcripts[key] = chat_manager.get_chat_history(character_name, st.session_state.user_id)
+    return transcripts[key]
+
+def submit_prompt():
+    """chat_input callback: hands the prompt to the chat tail and reruns only the two fragments it changes"""
+    st.session_state.pending_prompt = st.session_state.chat_prompt
+    st.rerun(["chat", "emotions"])  # In this order: the turn runs before the panel is redrawn
+
+@st.fragment(key="chat")
+def chat_tail(chat_manager, character_name, character_id):
+    """
+    Messages added since the last full run, plus the turn being answered
+
+    Args:
+        chat_manager (ChatManager): Chat engine of the current book
+        character_name (str): Character being conversed with
+        character_id (int): Database ID of the character (None for new characters)
+    """
+    transcript = get_transcript(chat_manager, character_name)
+    render_chat_history(transcript[st.session_state.transcript_shown:], character_name)
+
+    prompt = st.session_state.pop('pending_prompt', None)
+    if not prompt:
+        return
+    state_key = (st.session_state.book_source, character_name, st.session_state.user_id)
+    st.chat_message("user").write(prompt)
+    with st.spinner(f"{character_name} is thinking..."):
+        response, updated_state = chat_manager.process_user_input(
+            prompt,
+            character_name,
+            st.session_state.user_id,
+            character_state=st.session_state.character_states[state_key][0],
+            client_id=client_id()
+        )
+    st.chat_message("assistant").write(response)
+
+    # Extend the transcript and state caches instead of re-querying them
+    timestamp = datetime.now() if st.session_state.user_id != "anonymous" else None
+    transcript.append({'role': 'user', 'content': prompt, 'timestamp': timestamp})
+    transcript.append({'role': 'assistant', 'content': response, 'timestamp': timestamp})
+    st.session_state.character_states[state_key] = (updated_state, character_id)
+
+    if len(transcript) - st.session_state.transcript_shown >= CHAT_TAIL_LIMIT:
+        st.rerun()  # Full rerun: the tail becomes part of the transcript drawn once
+
+@st.fragment(key="emotions")
+def emotion_panel(container, character_name):
+    """
+    Emotion bars of the current character, drawn into a sidebar container
+
+    Args:
+        container: Sidebar container created by the full run
+        character_name (str): Character being conversed with
+    """
+    state_key = (st.session_state.book_source, character_name, st.session_state.user_id)
+    with container:
+        st.write(f"### {character_name}'s Emotional State")
+        render_emotions(st.session_state.character_states[state_key][0])
+
+@st.fragment
+def ingestion_panel(pdf_processor, character_manager):
+    """
+    Book catalog, PDF upload and text paste tabs; their widgets rerun only this
+    panel, and opening or ingesting a book reruns the whole app
+    """
+    open_tab, input_tab1, input_tab2 = st.tabs(["Open Book", "Upload PDF", "Paste Text"])
+
+    # Open Book Tab: books ingested earlier load straight from the catalog
+    with open_tab:
+        books = {book["book_source"]: book for book in list_catalog_books()}
+        if not books:
+            st.info("No books ingested yet - upload a PDF or paste text")
+        else:
+            chosen_book = st.selectbox("Choose a Book:", list(books), key="catalog_book")
+            if st.button("Open Book"):
+                if books[chosen_book]["characters"]:
+                    st.session_state['characters'] = books[chosen_book]["characters"]
+                    st.session_state.book_source = chosen_book
+                    # Load the index and build every character's chain before the first message
+                    get_chat_manager(chosen_book).warm_up(st.session_state['characters'])
+                    st.rerun()
+                else:
+                    st.warning("No identifiable characters were found in this book")
+
+    # PDF Upload Tab
+    with input_tab1:
+        pdf_docs = st.file_uploader("Upload PDF Files", accept_multiple_files=True)
+        book_source = st.text_input("Enter Book Source (e.g., Book Title):")
+
+        if st.button("Submit & Process") and pdf_docs and book_source:
+            with st.spinner("Processing..."), telemetry.trace("ingest", book_source=book_source):
+                # Extract text, index it with file/page metadata and extract characters
+                # (skipped when the same files were already ingested for this book)
+                characters, reused = library.ingest(pdf_processor, character_manager.db, book_source, pdf_docs=pdf_docs)
+                list_catalog_books.clear()
+            if not characters:
+                st.warning("No identifiable characters found in the book")
+            else:
+                st.session_state['characters'] = characters
+                st.session_state.book_source = book_source
+                get_chat_manager(book_source).warm_up(characters)
+                st.session_state.ingest_notice = "Book already ingested - opened it" if reused else "Processing complete!"
+                st.rerun()
+
+    # Text Input Tab
+    with input_tab2:
+        history_text = st.text_area("Paste history text here:", height=300, key="history_text")
+        book_source_text = st.text_input("Enter Text Source (e.g., Book Title):", key="text_source")
+
+        if st.button("Process Text") and history_text and book_source_text:
+            with st.spinner("Processing..."), telemetry.trace("ingest", book_source=book_source_text):
+                characters, reused = library.ingest(pdf_processor, character_manager.db, book_source_text, text=history_text)
+                list_catalog_books.clear()
+            if not characters:
+                st.warning("No identifiable characters found in the text. Please provide a longer narrative content")
+            else:
+                st.session_state['characters'] = characters
+                st.session_state.book_source = book_source_text
+                get_chat_manager(book_source_text).warm_up(characters)
+                st.session_state.ingest_notice = "Text processing complete!"
+                st.rerun()
+
+    # Outcome of an ingestion that just finished (shown once, after the full rerun)
+    if 'ingest_notice' in st.session_state:
+        st.success(st.session_state.pop('ingest_notice'))
+
 def main():
     """Main application function that runs the Streamlit interface"""
     
@@ -82,8 +363,9 @@ def main():
     # ======================
     # INITIALIZE MANAGERS
     # ======================
-    pdf_processor = PDFProcessor()  # Handles PDF/text processing
-    character_manager = CharacterManager()  # Manages character states
+    pdf_processor = get_pdf_processor()  # Handles PDF/text processing
+    character_manager = get_character_manager()  # Manages character states
+    start_metrics_server()
 
     # ======================
     # SESSION STATE SETUP
@@ -122,125 +404,43 @@ def main():
     # ======================
     with st.sidebar:
         st.title("Menu:")
-        input_tab1, input_tab2 = st.tabs(["Upload PDF", "Paste Text"])
-        
-        # PDF Upload Tab
-        with input_tab1:
-            pdf_docs = st.file_uploader("Upload PDF Files", accept_multiple_files=True)
-            book_source = st.text_input("Enter Book Source (e.g., Book Title):")
-            
-            if st.button("Submit & Process") and pdf_docs and book_source:
-                with st.spinner("Processing..."):
-                    # Extract text and process
-                    raw_text = pdf_processor.get_pdf_text(pdf_docs)
-                    text_chunks = pdf_processor.get_text_chunks(raw_text)
-                    pdf_processor.create_vector_store(text_chunks)
-                    
-                    # Extract characters and update state
-                    characters = pdf_processor.extract_characters(raw_text)
-                    st.session_state['characters'] = characters
-                    st.session_state.book_source = book_source
-                    st.success("Processing complete!")
-
-        # Text Input Tab
-        with input_tab2:
-            history_text = st.text_area("Paste history text here:", height=300, key="history_text")
-            book_source_text = st.text_input("Enter Text Source (e.g., Book Title):", key="text_source")
-            
-            if st.button("Process Text") and history_text and book_source_text:
-                with st.spinner("Processing..."):
-                    characters = pdf_processor.process_input(history_text)
-                    if not characters:
-                        st.warning("No identifiable characters found in the text. Please provide a longer narrative content")
-                    else:
-                        st.session_state['characters'] = characters
-                        st.session_state.book_source = book_source_text
-                        st.success("Text processing complete!")
+        ingestion_panel(pdf_processor, character_manager)
 
     # ======================
     # CHAT INTERFACE
     # ======================
     if 'characters' in st.session_state and st.session_state.book_source:
-        # Character selection dropdown
-        character_name = st.selectbox("Choose a Character:", st.session_state['characters'])
+        # Character selection dropdown; a new selection starts warming the character up
+        character_name = st.selectbox("Choose a Character:", st.session_state['characters'],
+                                      key="character_choice", on_change=start_warmup)
+        start_warmup()  # The character shown first (no-op once started or loaded)
 
-        # Initialize message history for character
-        if character_name not in st.session_state.temp_messages:
-            st.session_state.temp_messages[character_name] = []
-
-        # Emotion display container
+        # Emotion display container (filled by the emotion panel fragment)
         emotion_container = st.sidebar.container()
 
-        # Get current character state
-        character_state, character_id = character_manager.get_character_state(
+        # Get current character state (cached in the session after the first lookup)
+        _, character_id = get_cached_character_state(
+            character_manager,
             character_name, 
             st.session_state.book_source,
             st.session_state.user_id
         )
 
-        # Display emotion bars
-        with emotion_container:
-            st.write(f"### {character_name}'s Emotional State")
-            character_state.display_emotions()
-
         # Initialize chat manager
-        chat_manager = ChatManager(st.session_state.book_source)
+        chat_manager = get_chat_manager(st.session_state.book_source)
 
-        # Display chat history
-        if st.session_state.user_id != "anonymous":
-            # Show saved conversations for logged-in users
-            chat_manager.display_chat_history(character_name, st.session_state.user_id)
-        else:
-            # Show temporary messages for anonymous users
-            for msg in st.session_state.temp_messages[character_name]:
-                if msg['role'] == 'user':
-                    st.markdown(f'<div class="user"><strong>👤 You:</strong> {msg["content"]}</div>',
-                                unsafe_allow_html=True)
-                else:
-                    st.markdown(f'<div class="bot"><strong>🤖 {character_name}:</strong> {msg["content"]}</div>',
-                                unsafe_allow_html=True)
+        # Display the chat history drawn by full runs; the chat tail fragment adds to it
+        transcript = get_transcript(chat_manager, character_name)
+        render_chat_history(transcript, character_name)
+        st.session_state.transcript_shown = len(transcript)
+
+        chat_tail(chat_manager, character_name, character_id)
+        emotion_panel(emotion_container, character_name)
 
         # ======================
         # CHAT INPUT HANDLING
         # ======================
-        if prompt := st.chat_input(f"Ask {character_name}..."):
-            with st.spinner(f"{character_name} is thinking..."):
-                # Process user input and get response
-                response, updated_state = chat_manager.process_user_input(
-                    prompt,
-                    character_name,
-                    st.session_state.user_id
-                )
-
-                # Store messages for anonymous users
-                if st.session_state.user_id == "anonymous":
-                    st.session_state.temp_messages[character_name].append({'role': 'user', 'content': prompt})
-                    st.session_state.temp_messages[character_name].append({'role': 'assistant', 'content': response})
-
-                # Display messages
-                st.chat_message("user").write(prompt)
-                st.chat_message("assistant").write(response)
-
-                # Update emotion display
-                with emotion_container:
-                    st.write(f"### {character_name}'s Emotional State")
-                    latest_state, character_id = character_manager.get_character_state(
-                        character_name, 
-                        st.session_state.book_source,
-                        st.session_state.user_id
-                    )
-                    latest_state.display_emotions()
-
-                # Persist character state for logged-in users
-                if st.session_state.user_id != "anonymous":
-                    character_manager.save_character_state(
-                        character_name, 
-                        latest_state, 
-                        st.session_state.book_source, 
-                        st.session_state.user_id
-                    )
-
-                st.rerun()  # Refresh to update UI
+        st.chat_input(f"Ask {character_name}...", key="chat_prompt", on_submit=submit_prompt)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,346 @@
+"""
+ASYNC DATABASE ACCESS
+asyncio counterpart of DatabaseManager built on psycopg 3, for serving many
+concurrent turns without a thread (or a shared locked connection) per session.
+
+- AsyncDatabaseManager: the DatabaseManager operations as coroutines over an
+  async connection pool; each call checks out its own connection, so calls
+  from different sessions run concurrently instead of queueing on one lock
+- Multi-statement operations (a turn's conversation and messages, emotion
+  batches) are pipelined: statements are sent back to back and the results
+  collected afterwards, so they cost one network round trip instead of one each
+- SyncDatabaseAdapter: exposes an AsyncDatabaseManager to the synchronous chat
+  engine by running its coroutines on a private event loop thread
+
+Select it with DB_BACKEND=async (see database.get_database). The schema is
+owned by DatabaseManager.initialize_database and created through it on start.
+"""
+
+import asyncio
+import inspect
+import logging
+import os
+import threading
+import time
+from datetime import date
+import telemetry
+from database import (
+    ARCHIVED_RANGE_SQL, CONVERSATION_HISTORY_SQL, EMOTION_SAMPLES_SQL, EMOTION_TRAJECTORY_SQL,
+    INSERT_CHARACTER_SQL, INSERT_CONVERSATION_SQL, INSERT_MESSAGE_SQL, INSERT_USER_STATE_SQL, LIST_BOOKS_SQL,
+    MESSAGES_AFTER_SQL, MESSAGES_BY_IDS_SQL, SELECT_BOOK_SQL, SELECT_CHARACTER_ID_SQL, SELECT_CHARACTER_STATE_SQL,
+    SELECT_MEMORY_SQL, UPDATE_USER_STATE_SQL, UPSERT_BOOK_SQL, UPSERT_MEMORY_SQL,
+    DatabaseManager, StaleStateError, book_from_row, emotion_sample_batch, join_emotion_samples, message_from_row,
+    state_from_row, trajectory_from_rows,
+)
+from message_archive import MessageArchive, as_message
+
+logger = logging.getLogger(__name__)
+
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "20"))
+
+class AsyncDatabaseManager:
+    """Coroutine versions of the DatabaseManager operations over a psycopg 3 connection pool"""
+
+    def __init__(self, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE):
+        """
+        Args:
+            min_size (int): Connections opened up front
+            max_size (int): Upper bound on concurrent connections
+        """
+        from psycopg.conninfo import make_conninfo
+        from psycopg_pool import AsyncConnectionPool
+
+        conninfo = make_conninfo(
+            dbname=os.getenv("DB_NAME", "chatbot_db"),
+            user=os.getenv("DB_USER", "postgres"),
+            password=os.getenv("DB_PASSWORD", "postgres"),
+            host=os.getenv("DB_HOST"),
+            port=os.getenv("DB_PORT"),
+        )
+        # Autocommit: a single-statement call is one round trip (no BEGIN/COMMIT);
+        # multi-statement writes open an explicit transaction
+        self.pool = AsyncConnectionPool(conninfo, min_size=min_size, max_size=max_size, open=False,
+                                        kwargs={"autocommit": True})
+        self.archive = MessageArchive()
+        self._partitioned_month = None
+
+    async def connect(self):
+        """Creates the schema (once, through DatabaseManager) and opens the pool"""
+        await self._check_message_partitions()
+        await self.pool.open(wait=True)
+
+    async def _check_message_partitions(self):
+        """Schema and upcoming message partitions through DatabaseManager, once per month"""
+        month = date.today().replace(day=1)
+        if self._partitioned_month != month:
+            self._partitioned_month = month
+            await asyncio.to_thread(lambda: DatabaseManager().close())
+
+    async def close(self):
+        await self.pool.close()
+
+    async def _execute(self, cur, query, params=None):
+        """Runs one statement, reporting it to telemetry like the sync cursor does"""
+        if not telemetry.is_enabled():
+            return await cur.execute(query, params)
+        start = time.perf_counter()
+        try:
+            return await cur.execute(query, params)
+        finally:
+            telemetry.count("db.queries")
+            telemetry.observe("db.query", time.perf_counter() - start)
+
+    # ======================
+    # CHARACTER STATE
+    # ======================
+
+    async def ensure_character(self, character_name, book_source):
+        async with self.pool.connection() as conn, conn.cursor() as cur:
+            await self._execute(cur, INSERT_CHARACTER_SQL, (character_name, book_source))
+            result = await cur.fetchone()
+            if result is None:
+                await self._execute(cur, SELECT_CHARACTER_ID_SQL, (character_name, book_source))
+                result = await cur.fetchone()
+            return result[0]
+
+    async def save_character_state(self, character_name, character_state, book_source, user_id):
+        """
+        Writes a user's state with optimistic concurrency (see DatabaseManager.save_character_state)
+
+        Raises:
+            StaleStateError: If the stored version no longer matches character_state.version
+        """
+        character_id = await self.ensure_character(character_name, book_source)
+        if not user_id or user_id == "anonymous":
+            return character_id
+
+        async with self.pool.connection() as conn, conn.cursor() as cur:
+            if character_state.version == 0:
+                await self._execute(cur, INSERT_USER_STATE_SQL, (character_id, user_id, character_state.to_vector()))
+            else:
+                await self._execute(cur, UPDATE_USER_STATE_SQL, (character_state.to_vector(), user_id, character_id,
+                                                                 character_state.version))
+            if cur.rowcount == 0:
+                raise StaleStateError(
+                    f"State of {character_name} for {user_id} changed since version {character_state.version}"
+                )
+        character_state.version += 1
+        return character_id
+
+    async def get_character_state(self, character_name, book_source, user_id):
+        async with self.pool.connection() as conn, conn.cursor() as cur:
+            await self._execute(cur, SELECT_CHARACTER_STATE_SQL, (user_id or "anonymous", character_name, book_source))
+            return state_from_row(await cur.fetchone())
+
+    # ======================
+    # CONVERSATIONS AND MESSAGES
+    # ======================
+
+    async def create_conversation(self, character_id, user_id):
+        if not user_id or user_id == "anonymous":
+            return "anonymous"
+        async with self.pool.connection() as conn, conn.cursor() as cur:
+            await self._execute(cur, INSERT_CONVERSATION_SQL, (character_id, user_id))
+            return (await cur.fetchone())[0]
+
+    async def save_message(self, conversation_id, role, content):
+        if not conversation_id or conversation_id == "anonymous":
+            return None
+        await self._check_message_partitions()
+        async with self.pool.connection() as conn, conn.cursor() as cur:
+            await self._execute(cur, INSERT_MESSAGE_SQL, (conversation_id, role.lower(), content))
+            return (await cur.fetchone())[0]
+
+    async def save_turn(self, character_id, user_id, messages):
+        """
+        Creates a conversation and saves its messages in one transaction; the
+        message inserts are pipelined behind the conversation insert
+
+        Args:
+            character_id (int): Database ID of the character
+            user_id (str): User identifier
+            messages (list): (role, content) tuples in order
+
+        Returns:
+            list: Message IDs in order (None for anonymous users)
+        """
+        if not user_id or user_id == "anonymous":
+            return [None] * len(messages)
+        await self._check_message_partitions()
+        async with self.pool.connection() as conn:
+            async with conn.transaction(), conn.pipeline():
+                cursors = [conn.cursor() for _ in range(len(messages) + 1)]
+                # The conversation id is taken from the same statement batch via currval()
+                await self._execute(cursors[0], INSERT_CONVERSATION_SQL, (character_id, user_id))
+                for cur, (role, content) in zip(cursors[1:], messages):
+                    await self._execute(cur, """
+                        INSERT INTO messages (conversation_id, role, content)
+                        VALUES (currval(pg_get_serial_sequence('conversations', 'conversation_id')), %s, %s)
+                        RETURNING message_id
+                    """, (role.lower(), content))
+            return [(await cur.fetchone())[0] for cur in cursors[1:]]
+
+    async def _archived_range(self, cur, character_id, user_id):
+        """(first timestamp, last timestamp, last message id) of the archived messages, or None"""
+        await self._execute(cur, ARCHIVED_RANGE_SQL, (character_id, user_id, user_id))
+        row = await cur.fetchone()
+        return row if row[0] is not None else None
+
+    async def get_conversation_history(self, character_id, user_id=None, limit=20, before=None):
+        """Most recent messages in time order, read through to the archive (see DatabaseManager)"""
+        async with self.pool.connection() as conn, conn.cursor() as cur:
+            await self._execute(cur, CONVERSATION_HISTORY_SQL, {"character_id": character_id, "user_id": user_id,
+                                                                "before": before, "limit": limit})
+            messages = [message_from_row(row) for row in await cur.fetchall()]
+            archived = await self._archived_range(cur, character_id, user_id) if len(messages) < limit else None
+        if archived:
+            older_than = messages[-1]["timestamp"] if messages else before
+            rows = await asyncio.to_thread(self.archive.history, character_id, user_id, limit - len(messages),
+                                           older_than, archived[0], archived[1])
+            messages += [as_message(row) for row in rows]
+        return messages[::-1]
+
+    async def get_messages_after(self, character_id, user_id, after_message_id=0, limit=None, oldest_first=False):
+        """Messages newer than a message id in id order, read through to the archive (see DatabaseManager)"""
+        async with self.pool.connection() as conn, conn.cursor() as cur:
+            await self._execute(cur, MESSAGES_AFTER_SQL.format(order="ASC" if oldest_first else "DESC"),
+                                (character_id, user_id, after_message_id, limit))
+            rows = await cur.fetchall()
+            archived = None
+            if oldest_first or limit is None or len(rows) < limit:
+                archived = await self._archived_range(cur, character_id, user_id)
+        messages = [message_from_row(row) for row in (rows if oldest_first else reversed(rows))]
+        if archived and archived[2] > after_message_id:
+            seen = {message["message_id"] for message in messages}
+            rows = await asyncio.to_thread(self.archive.messages_after, character_id, user_id, after_message_id,
+                                           archived[0], archived[1])
+            messages = [as_message(row) for row in rows if row["message_id"] not in seen] + messages
+            if limit:
+                messages = messages[:limit] if oldest_first else messages[-limit:]
+        return messages
+
+    async def get_messages_by_ids(self, message_ids):
+        """Messages recalled by semantic (mention) search, by id"""
+        if not message_ids:
+            return []
+        try:
+            async with self.pool.connection() as conn, conn.cursor() as cur:
+                await self._execute(cur, MESSAGES_BY_IDS_SQL, (list(message_ids),))
+                messages = [message_from_row(row) for row in await cur.fetchall()]
+        except Exception as e:
+            logger.error(f"Failed to get messages: {e}")
+            return []
+        # Ids not in the database belong to archived months
+        missing = set(message_ids) - {message["message_id"] for message in messages}
+        if missing and self.archive.partitions():
+            messages += [as_message(row) for row in await asyncio.to_thread(self.archive.messages_by_ids, missing)]
+        return messages
+
+    # ======================
+    # LONG-TERM MEMORY
+    # ======================
+
+    async def save_to_memory(self, character_id, key, value):
+        async with self.pool.connection() as conn, conn.cursor() as cur:
+            await self._execute(cur, UPSERT_MEMORY_SQL, (character_id, key, value))
+
+    async def get_from_memory(self, character_id, key):
+        async with self.pool.connection() as conn, conn.cursor() as cur:
+            await self._execute(cur, SELECT_MEMORY_SQL, (character_id, key))
+            result = await cur.fetchone()
+            return result[0] if result else None
+
+    # ======================
+    # BOOK CATALOG
+    # ======================
+
+    async def save_book(self, book_source, content_hash, index_dir, characters, metadata=None):
+        from psycopg.types.json import Jsonb
+
+        async with self.pool.connection() as conn, conn.cursor() as cur:
+            await self._execute(cur, UPSERT_BOOK_SQL, (book_source, content_hash, index_dir, list(characters),
+                                                       Jsonb(metadata or {})))
+
+    async def get_book(self, book_source):
+        async with self.pool.connection() as conn, conn.cursor() as cur:
+            await self._execute(cur, SELECT_BOOK_SQL, (book_source,))
+            return book_from_row(await cur.fetchone())
+
+    async def list_books(self):
+        async with self.pool.connection() as conn, conn.cursor() as cur:
+            await self._execute(cur, LIST_BOOKS_SQL)
+            return [{"book_source": row[0], "characters": row[1], "ingested_at": row[2]}
+                    for row in await cur.fetchall()]
+
+    # ======================
+    # EMOTION HISTORY
+    # ======================
+
+    async def save_emotion_samples(self, samples):
+        """Appends emotion samples; executemany pipelines the inserts in one round trip"""
+        async with self.pool.connection() as conn, conn.cursor() as cur:
+            await cur.executemany("""
+                INSERT INTO emotion_history (character_id, user_id, recorded_at, state) VALUES (%s, %s, %s, %s)
+            """, samples)
+            telemetry.count("db.queries")
+
+    async def get_emotion_trajectory(self, character_id, user_id, since=None, until=None, bucket_seconds=60):
+        """Same as DatabaseManager.get_emotion_trajectory"""
+        async with self.pool.connection() as conn, conn.cursor() as cur:
+            await self._execute(cur, EMOTION_TRAJECTORY_SQL, {"width": bucket_seconds, "character_id": character_id,
+                                                              "user_id": user_id, "since": since, "until": until})
+            return trajectory_from_rows(await cur.fetchall())
+
+    async def fetch_emotion_samples(self, book_source=None, since=None, batch_size=10000):
+        """
+        Same as DatabaseManager.fetch_emotion_samples: rows are streamed through a
+        server-side cursor on a pooled connection, batch_size per round trip
+        """
+        batches = []
+        async with self.pool.connection() as conn, conn.transaction():
+            # A server-side cursor lives in a transaction (the pool's connections autocommit otherwise)
+            async with conn.cursor(name="emotion_samples") as cur:
+                await self._execute(cur, EMOTION_SAMPLES_SQL, {"book_source": book_source, "since": since})
+                while rows := await cur.fetchmany(batch_size):
+                    batches.append(emotion_sample_batch(rows))
+        return join_emotion_samples(batches)
+
+class SyncDatabaseAdapter:
+    """
+    Blocking facade over an AsyncDatabaseManager for synchronous callers
+    (ChatManager, CharacterManager, the memory layers). Every coroutine method
+    of the wrapped manager becomes a plain method that runs it on the adapter's
+    event loop; calls from many threads share the loop and the pool.
+    """
+
+    def __init__(self, async_db=None):
+        """
+        Args:
+            async_db (AsyncDatabaseManager): Manager to wrap (default: a new one)
+        """
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="async-db", daemon=True)
+        self._thread.start()
+        self.async_db = async_db or AsyncDatabaseManager()
+        self._run(self.async_db.connect())
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def __getattr__(self, name):
+        if name == "async_db":  # Not set yet (during __init__)
+            raise AttributeError(name)
+        attribute = getattr(self.async_db, name)
+        if not inspect.iscoroutinefunction(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            return self._run(attribute(*args, **kwargs))
+
+        call.__name__ = name
+        return call
+
+    def close(self):
+        self._run(self.async_db.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
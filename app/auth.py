@@ -0,0 +1,156 @@
+"""
+API AUTHENTICATION
+Signed bearer tokens that carry a user's identity to the chat service.
+
+The service never takes a user ID from request parameters. A trusted backend
+(the site's login, a gateway) that shares API_SECRET_KEY with the service
+issues a token for the user it authenticated, and the client sends it as
+`Authorization: Bearer <token>`. A token is the user ID and an expiry time,
+signed with HMAC-SHA256; it can't be altered or forged without the key.
+
+Requests without a token are anonymous. When API_SECRET_KEY is not set, no
+token can be verified and every request is anonymous.
+
+A token may also carry scopes for operations beyond chatting: ingesting a
+book (INGEST_SCOPE) replaces what every user chats against, so it needs a
+token issued with that scope.
+
+Usage (issue a token from the command line, e.g. for testing):
+    API_SECRET_KEY=... python app/auth.py alice --ttl 3600
+    API_SECRET_KEY=... python app/auth.py ingest-bot --scope ingest
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+API_SECRET_KEY = os.getenv("API_SECRET_KEY", "")
+API_TOKEN_TTL = int(os.getenv("API_TOKEN_TTL", str(24 * 3600)))  # Seconds a token stays valid
+INGEST_SCOPE = "ingest"  # Adding or replacing books in the catalog
+
+class InvalidToken(ValueError):
+    """Raised for a token that is malformed, tampered with or expired"""
+
+class MissingScope(InvalidToken):
+    """Raised for a valid token (or none) that doesn't grant a required scope"""
+
+def _encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def _decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+def _sign(payload, secret):
+    return hmac.new(secret.encode("utf-8"), payload.encode("ascii"), hashlib.sha256).digest()
+
+def issue_token(user_id, ttl=API_TOKEN_TTL, secret=None, now=None, scopes=()):
+    """
+    Signs a token for an authenticated user
+
+    Args:
+        user_id (str): User identifier
+        ttl (int): Seconds until the token expires
+        secret (str): Signing key (default: API_SECRET_KEY)
+        now (float): Current time (default: time.time())
+        scopes (Iterable[str]): Extra operations the token grants (e.g. INGEST_SCOPE)
+
+    Returns:
+        str: The token
+
+    Raises:
+        ValueError: If there is no signing key or the user ID is empty or "anonymous"
+    """
+    secret = secret or API_SECRET_KEY
+    if not secret:
+        raise ValueError("API_SECRET_KEY is not set")
+    if not user_id or user_id == "anonymous":
+        raise ValueError("Tokens are only issued for named users")
+    claims = {"sub": user_id, "exp": int((now or time.time()) + ttl)}
+    if scopes:
+        claims["scope"] = sorted(set(scopes))
+    payload = _encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+    return f"{payload}.{_encode(_sign(payload, secret))}"
+
+def verify_token(token, secret=None, now=None, scope=None):
+    """
+    Checks a token's signature and expiry
+
+    Args:
+        token (str): Token from the Authorization header
+        secret (str): Signing key (default: API_SECRET_KEY)
+        now (float): Current time (default: time.time())
+        scope (str): Scope the token must grant, if any
+
+    Returns:
+        str: The user ID the token was issued for
+
+    Raises:
+        InvalidToken: If the token is malformed, its signature is wrong, it has
+            expired, or no signing key is configured
+        MissingScope: If the token is valid but doesn't grant scope
+    """
+    secret = secret or API_SECRET_KEY
+    if not secret:
+        raise InvalidToken("Tokens can't be verified: API_SECRET_KEY is not set")
+    payload, _, signature = token.partition(".")
+    try:
+        valid = hmac.compare_digest(_decode(signature), _sign(payload, secret))
+        claims = json.loads(_decode(payload)) if valid else None
+    except (ValueError, UnicodeError):
+        raise InvalidToken("Malformed token") from None
+    if claims is None:
+        raise InvalidToken("Invalid token signature")
+    if not isinstance(claims, dict) or not claims.get("sub") or not isinstance(claims.get("exp"), int):
+        raise InvalidToken("Malformed token")
+    if claims["exp"] <= (now or time.time()):
+        raise InvalidToken("Token has expired")
+    if scope is not None and scope not in (claims.get("scope") or []):
+        raise MissingScope(f"Token does not grant the {scope} scope")
+    return claims["sub"]
+
+def user_from_headers(headers, query_params=None, scope=None):
+    """
+    Identity of a request: the user of its bearer token, else "anonymous"
+
+    Args:
+        headers: Request headers
+        query_params: Query parameters; a "token" parameter is accepted in place
+            of the header (browsers can't set headers on a WebSocket handshake)
+        scope (str): Scope the request needs; anonymous requests never have one
+
+    Returns:
+        str: User ID
+
+    Raises:
+        InvalidToken: If a token was sent but is not valid, or none was sent and scope is required
+        MissingScope: If the token is valid but doesn't grant scope
+    """
+    authorization = headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if authorization and scheme.lower() != "bearer":
+        raise InvalidToken("Expected a Bearer token")
+    if not token and query_params is not None:
+        token = query_params.get("token", "")
+    if not token.strip():
+        if scope is not None:
+            raise InvalidToken(f"A token with the {scope} scope is required")
+        return "anonymous"
+    return verify_token(token.strip(), scope=scope)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("user_id")
+    parser.add_argument("--ttl", type=int, default=API_TOKEN_TTL, help="Seconds until the token expires")
+    parser.add_argument("--scope", action="append", default=[], help=f"Extra scope to grant (e.g. {INGEST_SCOPE})")
+    args = parser.parse_args()
+    print(issue_token(args.user_id, args.ttl, scopes=args.scope))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+BOOK BUNDLES
+One-file export and import of an ingested book, for provisioning replicas
+without re-running ingestion (text extraction, embedding, dossiers).
+
+A bundle is an uncompressed tar stream (the vectors don't compress and the
+chunk texts already are). Its first member, bundle.json, records the bundle
+format, the book (source, content hash, character roster, catalog metadata),
+the embedding and chat model identifiers, and the size and SHA-256 of every
+other member. The other members are the files of the book's index directory
+(see book_index.BookIndex), stored as is.
+
+Import reads the bundle as a stream, from a file, a pipe or stdin. It writes
+each member to disk as it arrives and checks its size and checksum on the
+way. The finished directory replaces the book's index directory in one rename
+and is memory-mapped on first use like any other index, so nothing is unpacked
+into memory. Bundles of another format, of an index format this version can't
+read, or embedded with another model are rejected before any file is written.
+A book that is already present with the same content is skipped unless forced.
+
+Usage:
+    python app/book_bundle.py export "Pride and Prejudice" -o pride.bookbundle
+    python app/book_bundle.py import pride.bookbundle [more.bookbundle ...]
+    curl -s https://host/pride.bookbundle | python app/book_bundle.py import -
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tarfile
+import time
+from dotenv import load_dotenv
+from book_index import BOOK_FILE, BOOK_INDEX_DIR, FORMAT_VERSION, BookIndex, book_index_dir, read_book_info, write_book_info
+from library import find_current_book, index_metadata
+from models import CHAT_MODEL, EMBEDDING_MODEL
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_FORMAT = 1
+MANIFEST_NAME = "bundle.json"
+COPY_BLOCK_SIZE = 1 << 20
+
+def file_digest(path):
+    """SHA-256 hex digest of a file, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(COPY_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def find_book(book_source, index_root=BOOK_INDEX_DIR, db=None):
+    """
+    Ingestion record of a book: its book.json (bulk ingestion), else its catalog entry
+
+    Returns:
+        dict: book_source, content_hash, index_dir and characters, or None if not ingested
+    """
+    info = read_book_info(book_index_dir(book_source, index_root))
+    if info is None and db is not None:
+        info = db.get_book(book_source)
+    if info is None:
+        return None
+    return {key: info[key] for key in ("book_source", "content_hash", "index_dir", "characters")}
+
+# ======================
+# EXPORT
+# ======================
+
+def export_book(book, out):
+    """
+    Writes a book's bundle
+
+    Args:
+        book (dict): book_source, content_hash, index_dir and characters (see find_book)
+        out: Binary file object to write to (needn't be seekable)
+
+    Returns:
+        dict: The bundle manifest
+
+    Raises:
+        FileNotFoundError, ValueError: If the book's index is missing or unreadable
+    """
+    index_dir = book["index_dir"]
+    BookIndex.load(index_dir)  # Only complete indexes in the current format are exported
+    names = sorted(entry.name for entry in os.scandir(index_dir)
+                   if entry.is_file() and entry.name != BOOK_FILE and not entry.name.endswith(".tmp"))
+    manifest = {
+        "bundle_format": BUNDLE_FORMAT,
+        "index_format": FORMAT_VERSION,
+        "book_source": book["book_source"],
+        "content_hash": book["content_hash"],
+        "characters": list(book["characters"]),
+        "metadata": index_metadata(index_dir),
+        "embedding_model": EMBEDDING_MODEL,
+        "chat_model": CHAT_MODEL,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "files": [{"name": name, "size": os.path.getsize(os.path.join(index_dir, name)),
+                   "sha256": file_digest(os.path.join(index_dir, name))} for name in names],
+    }
+
+    with tarfile.open(fileobj=out, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+        data = json.dumps(manifest, indent=2).encode("utf-8")
+        member = tarfile.TarInfo(MANIFEST_NAME)
+        member.size, member.mtime = len(data), time.time()
+        tar.addfile(member, io.BytesIO(data))
+        for entry in manifest["files"]:
+            path = os.path.join(index_dir, entry["name"])
+            member = tarfile.TarInfo(entry["name"])
+            member.size, member.mtime = entry["size"], os.path.getmtime(path)
+            with open(path, "rb") as f:
+                tar.addfile(member, f)
+    return manifest
+
+# ======================
+# IMPORT
+# ======================
+
+def check_manifest(manifest):
+    """
+    Raises:
+        ValueError: If this version can't serve the bundled book
+    """
+    if manifest.get("bundle_format") != BUNDLE_FORMAT:
+        raise ValueError(f"Unsupported bundle format {manifest.get('bundle_format')} (expected {BUNDLE_FORMAT})")
+    if manifest.get("index_format") != FORMAT_VERSION:
+        raise ValueError(f"Bundle holds an index in format {manifest.get('index_format')}; "
+                         f"this version reads format {FORMAT_VERSION}")
+    if manifest.get("embedding_model") != EMBEDDING_MODEL:
+        raise ValueError(f"Bundle was embedded with {manifest.get('embedding_model')}, but questions are "
+                         f"embedded with {EMBEDDING_MODEL}; ingest the book again instead")
+    for entry in manifest["files"]:
+        if os.path.basename(entry["name"]) != entry["name"] or entry["name"] in (BOOK_FILE, MANIFEST_NAME, ""):
+            raise ValueError(f"Invalid file name {entry['name']!r} in bundle")
+
+def _copy_member(tar, member, entry, path):
+    """Streams one member to a file, checking its size and checksum"""
+    digest = hashlib.sha256()
+    source = tar.extractfile(member)
+    with open(path, "wb") as f:
+        for block in iter(lambda: source.read(COPY_BLOCK_SIZE), b""):
+            digest.update(block)
+            f.write(block)
+    if os.path.getsize(path) != entry["size"] or digest.hexdigest() != entry["sha256"]:
+        raise ValueError(f"{entry['name']} is corrupt (size or checksum mismatch)")
+
+def import_bundle(source, index_root=BOOK_INDEX_DIR, db=None, force=False):
+    """
+    Installs a bundled book as if it had been ingested here
+
+    Args:
+        source: Bundle path, or a binary file object read as a stream
+        index_root (str): Parent directory of the per-book indexes
+        db (DatabaseManager): Book catalog to record the book in (None to skip)
+        force (bool): Replace the book even if it is present with the same content
+
+    Returns:
+        Tuple[dict, bool]: The book's ingestion record, and whether the
+            existing copy was kept (same content already present)
+
+    Raises:
+        ValueError: If the bundle is malformed, corrupt or can't be served here
+    """
+    opened = open(source, "rb") if isinstance(source, (str, os.PathLike)) else None
+    try:
+        with tarfile.open(fileobj=opened or source, mode="r|") as tar:
+            member = tar.next()
+            if member is None or member.name != MANIFEST_NAME:
+                raise ValueError(f"Not a book bundle: it must start with {MANIFEST_NAME}")
+            manifest = json.load(tar.extractfile(member))
+            check_manifest(manifest)
+
+            index_dir = os.path.abspath(book_index_dir(manifest["book_source"], index_root))
+            existing = read_book_info(index_dir)
+            if not force and existing and existing.get("content_hash") == manifest["content_hash"] \
+                    and os.path.exists(BookIndex.meta_path(index_dir)):
+                # Already present (e.g. a replica provisioned again); the rest of the stream is not read
+                if db is not None and not find_current_book(db, existing["book_source"], existing["content_hash"]):
+                    register_book(db, existing, manifest)
+                return existing, True
+
+            tmp_dir = f"{index_dir}.import-{os.getpid()}"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+            try:
+                entries = {entry["name"]: entry for entry in manifest["files"]}
+                received = set()
+                while (member := tar.next()) is not None:  # Iterating the tar would yield bundle.json again
+                    entry = entries.get(member.name)
+                    if entry is None or not member.isfile() or member.name in received:
+                        raise ValueError(f"Unexpected member {member.name!r} in bundle")
+                    _copy_member(tar, member, entry, os.path.join(tmp_dir, member.name))
+                    received.add(member.name)
+                if received != set(entries):
+                    raise ValueError(f"Bundle is truncated: missing {', '.join(sorted(set(entries) - received))}")
+                BookIndex.load(tmp_dir)  # Vectors, chunks and meta agree
+
+                info = {
+                    "book_source": manifest["book_source"],
+                    "content_hash": manifest["content_hash"],
+                    "index_dir": index_dir,
+                    "characters": manifest["characters"],
+                    "chunks": manifest["metadata"]["chunks"],
+                    "bundle_created_at": manifest["created_at"],
+                    "ingested_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                }
+                write_book_info(tmp_dir, info)
+                _replace_dir(tmp_dir, index_dir)
+            except BaseException:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                raise
+    except tarfile.TarError as e:
+        raise ValueError(f"Not a readable book bundle: {e}") from None
+    finally:
+        if opened is not None:
+            opened.close()
+
+    if db is not None:
+        register_book(db, info, manifest)
+    return info, False
+
+def register_book(db, info, manifest):
+    """Adds an imported book to the database catalog"""
+    metadata = {**index_metadata(info["index_dir"]), "bundle_created_at": manifest["created_at"]}
+    db.save_book(info["book_source"], info["content_hash"], info["index_dir"], info["characters"], metadata)
+
+def _replace_dir(new_dir, index_dir):
+    """
+    Moves a complete index directory into place. Processes that have the old
+    files memory-mapped keep reading them; they reload once meta.json changes.
+    """
+    old_dir = f"{index_dir}.old-{os.getpid()}"
+    if os.path.exists(index_dir):
+        os.rename(index_dir, old_dir)
+    os.rename(new_dir, index_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+# ======================
+# COMMAND LINE
+# ======================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index-dir", default=BOOK_INDEX_DIR, help=f"Parent directory of book indexes (default {BOOK_INDEX_DIR})")
+    parser.add_argument("--no-catalog", action="store_true", help="Don't use the database book catalog")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Write a book's bundle")
+    export_parser.add_argument("book_source")
+    export_parser.add_argument("-o", "--output", default="-", help="Bundle file (default: stdout)")
+    import_parser = commands.add_parser("import", help="Install bundled books")
+    import_parser.add_argument("bundles", nargs="+", help="Bundle files ('-' reads stdin)")
+    import_parser.add_argument("--force", action="store_true", help="Replace books already present with the same content")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    db = None
+    if not args.no_catalog:
+        from database import DatabaseManager
+        db = DatabaseManager()
+
+    if args.command == "export":
+        book = find_book(args.book_source, args.index_dir, db)
+        if book is None:
+            sys.exit(f"{args.book_source} has not been ingested")
+        if args.output == "-":
+            manifest = export_book(book, sys.stdout.buffer)
+        else:
+            with open(args.output, "wb") as f:
+                manifest = export_book(book, f)
+        size = sum(entry["size"] for entry in manifest["files"])
+        logger.info(f"Exported {args.book_source}: {len(manifest['files'])} files, {size / 2**20:.1f} MiB")
+        return
+
+    failed = 0
+    for bundle in args.bundles:
+        start = time.perf_counter()
+        try:
+            info, kept = import_bundle(sys.stdin.buffer if bundle == "-" else bundle, args.index_dir, db, args.force)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to import {bundle}: {e}")
+            failed += 1
+            continue
+        logger.info(f"{'Kept' if kept else 'Imported'} {info['book_source']} ({len(info['characters'])} characters) "
+                    f"in {time.perf_counter() - start:.1f}s")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import numpy as np
+from chunk_store import ChunkStore, write_atomic
+
+logger = logging.getLogger(__name__)
+
+# Index directory layout (all files are read-only once written)
+INDEX_FILE = "index.faiss"     # FAISS vectors, memory-mapped on load
+META_FILE = "meta.json"        # Format, chunk codec, sources, counts; written last
+FORMAT_VERSION = 2             # 1: uncompressed chunks without file/page metadata
+BOOK_FILE = "book.json"        # Ingestion record (roster, content hash, counts); written after the index
+MENTIONS_FILE = "mentions.npz"  # Ids of the chunks mentioning each character (names in meta.json); optional
+VECTORS_FILE = "vectors.npy"    # Full-precision vectors of a quantized index, read row by row to re-rank; optional
+
+# Parent directory holding one index directory per book
+BOOK_INDEX_DIR = os.getenv("BOOK_INDEX_DIR", "book_indexes")
+
+# Storage of the vectors searched: "flat" (float32, exact), "fp16" or "sq8" (scalar
+# quantization, 2x / 4x smaller) or "pq" (product quantization, 32x smaller; needs re-ranking)
+INDEX_QUANTIZATION = os.getenv("INDEX_QUANTIZATION", "flat")
+QUANTIZATIONS = ("flat", "fp16", "sq8", "pq")
+# Keep the float32 vectors of quantized indexes on disk and re-rank their results exactly
+INDEX_RERANK = os.getenv("INDEX_RERANK", "1").lower() not in ("0", "false", "no")
+# Candidates fetched per result when re-ranking: coarser layouts need more (RERANK_CANDIDATES overrides)
+RERANK_CANDIDATES = {"fp16": 2, "sq8": 4, "pq": 64}
+if os.getenv("RERANK_CANDIDATES"):
+    RERANK_CANDIDATES = dict.fromkeys(RERANK_CANDIDATES, int(os.getenv("RERANK_CANDIDATES")))
+PQ_MIN_CHUNKS = 1024  # Fewer chunks can't train 256 centroids per sub-vector well; such books use sq8
+
+def book_index_dir(book_source, root=None):
+    """
+    Index directory of a book
+
+    Args:
+        book_source (str): Book identifier
+        root (str): Parent directory (default: BOOK_INDEX_DIR)
+
+    Returns:
+        str: Readable, filesystem-safe path unique to book_source
+    """
+    slug = re.sub(r"[^A-Za-z0-9._-]+", "_", book_source).strip("._")[:60] or "book"
+    digest = hashlib.sha1(book_source.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(root or BOOK_INDEX_DIR, f"{slug}-{digest}")
+
+def read_book_info(index_dir):
+    """Ingestion record of a book, or None if it was never fully ingested"""
+    try:
+        with open(os.path.join(index_dir, BOOK_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def write_book_info(index_dir, info):
+    """Records a completed ingestion; written last, so its presence means the book is usable"""
+    write_atomic(os.path.join(index_dir, BOOK_FILE), lambda f: f.write(json.dumps(info).encode("utf-8")))
+
+def pq_subquantizers(dimension):
+    """Sub-vectors per PQ code: about one byte per 8 dimensions (the largest divisor of the dimension up to that)"""
+    return next(m for m in range(max(dimension // 8, 1), 0, -1) if dimension % m == 0)
+
+def make_index(matrix, quantization):
+    """
+    Trained FAISS index holding the vectors in a quantization layout
+
+    Args:
+        matrix (np.ndarray): float32 vectors, one row per chunk
+        quantization (str): One of QUANTIZATIONS
+
+    Returns:
+        Tuple[faiss.Index, str]: The index and the layout actually used
+            (pq falls back to sq8 below PQ_MIN_CHUNKS chunks)
+
+    Raises:
+        ValueError: If the quantization is unknown
+    """
+    import faiss
+
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown index quantization {quantization!r}; use one of {', '.join(QUANTIZATIONS)}")
+    if quantization == "pq" and len(matrix) < PQ_MIN_CHUNKS:
+        logger.warning(f"{len(matrix)} chunks are too few to train product quantization; using sq8")
+        quantization = "sq8"
+
+    dimension = matrix.shape[1]
+    if quantization == "flat":
+        index = faiss.IndexFlatL2(dimension)
+    elif quantization == "pq":
+        index = faiss.IndexPQ(dimension, pq_subquantizers(dimension), 8)
+    else:
+        kind = faiss.ScalarQuantizer.QT_fp16 if quantization == "fp16" else faiss.ScalarQuantizer.QT_8bit
+        index = faiss.IndexScalarQuantizer(dimension, kind)
+    if not index.is_trained:
+        index.train(matrix)
+    index.add(matrix)
+    return index, quantization
+
+class RowFile:
+    """
+    Rows of a 2-D .npy file, read on demand with pread
+
+    Only the requested rows are copied into the process. A memory map would
+    map whole page-cache folios around each row touched, which for scattered
+    rows soon means most of the file.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            version = np.lib.format.read_magic(f)
+            read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+            self.shape, _, self.dtype = read_header(f)
+            self.offset = f.tell()
+        self.row_bytes = self.shape[1] * self.dtype.itemsize
+        self._fd = os.open(path, os.O_RDONLY)  # Pins this version of the file if the index is rebuilt
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, rows):
+        """Rows by id (a sequence of ints) as an array, one row per id"""
+        data = b"".join(os.pread(self._fd, self.row_bytes, self.offset + int(row) * self.row_bytes) for row in rows)
+        return np.frombuffer(data, dtype=self.dtype).reshape(len(rows), self.shape[1])
+
+    def __del__(self):
+        if getattr(self, "_fd", None) is not None:
+            os.close(self._fd)
+
+class BookIndex:
+    """
+    On-disk vector index for a book's text chunks:
+    - Vectors in a flat L2 FAISS index (same scoring as LangChain's FAISS store)
+    - Chunk texts compressed in a ChunkStore instead of a pickled docstore
+    - Loaded with FAISS mmap flags, so N worker processes share one copy of
+      the vectors in the page cache instead of N private heaps
+
+    - Chunks tagged at ingestion with the characters they mention, so a
+      search can be restricted to one character's chunks
+    - Optionally quantized vectors (see INDEX_QUANTIZATION), with the
+      float32 vectors kept on disk to re-rank candidates exactly
+
+    Exposes similarity_search_by_vector like the LangChain store it replaces.
+    """
+
+    def __init__(self, index, chunks, mentions=None, vectors=None, quantization="flat"):
+        """
+        Args:
+            index (faiss.Index): Vector index; row i holds chunk i
+            chunks (ChunkStore): Chunk texts
+            mentions (Dict[str, np.ndarray]): Optional character -> ids of the chunks mentioning them
+            vectors (RowFile): Optional float32 vectors on disk re-ranking a quantized index
+            quantization (str): Layout of the index vectors, one of QUANTIZATIONS
+        """
+        self.index = index
+        self.chunks = chunks
+        self.mentions = mentions
+        self.vectors = vectors
+        self.quantization = quantization
+        self._selectors = {}  # Character -> FAISS selector of their chunks, built on first use
+        self._pq_codes = None  # Code matrix of a PQ index (a view of its memory-mapped codes)
+
+    @staticmethod
+    def meta_path(index_dir):
+        """File whose modification time marks a completed (re)build"""
+        return os.path.join(index_dir, META_FILE)
+
+    @classmethod
+    def build(cls, index_dir, texts, vectors, metadatas=None, dedup=None, mentions=None,
+              quantization=None, rerank=None):
+        """
+        Writes an index for the given chunks and returns it loaded
+
+        Args:
+            index_dir (str): Target directory (created if missing)
+            texts (List[str]): Chunk texts
+            vectors (List[List[float]]): One embedding per chunk
+            metadatas (List[dict]): Optional {"source", "page"} per chunk
+            dedup (dict): Optional ingestion deduplication stats, kept in meta.json
+            mentions (Dict[str, List[int]]): Optional character -> ids of the chunks
+                mentioning them (see dossier.find_mentions)
+            quantization (str): Vector layout, one of QUANTIZATIONS (default: INDEX_QUANTIZATION)
+            rerank (bool): Keep float32 vectors to re-rank a quantized index (default: INDEX_RERANK)
+
+        Returns:
+            BookIndex: The freshly written index, memory-mapped
+
+        Raises:
+            ValueError: If the quantization is unknown
+        """
+        import faiss
+
+        matrix = np.asarray(vectors, dtype="float32")
+        index, quantization = make_index(matrix, quantization or INDEX_QUANTIZATION)
+        rerank = (INDEX_RERANK if rerank is None else rerank) and quantization != "flat"
+
+        os.makedirs(index_dir, exist_ok=True)
+        store_info = ChunkStore.write(index_dir, texts, metadatas)
+        index_path = os.path.join(index_dir, INDEX_FILE)
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        faiss.write_index(index, tmp_path)
+        os.replace(tmp_path, index_path)
+        # Drop the pickled docstore left by indexes saved with LangChain's FAISS.save_local
+        legacy_docstore = os.path.join(index_dir, "index.pkl")
+        if os.path.exists(legacy_docstore):
+            os.remove(legacy_docstore)
+        vectors_path = os.path.join(index_dir, VECTORS_FILE)
+        if rerank:
+            write_atomic(vectors_path, lambda f: np.save(f, matrix))
+        elif os.path.exists(vectors_path):
+            os.remove(vectors_path)
+        meta = {"format": FORMAT_VERSION, "chunks": len(texts), "dimension": int(matrix.shape[1]),
+                "quantization": quantization, "rerank": rerank, **store_info}
+        if dedup is not None:
+            meta["dedup"] = dict(dedup)
+        mentions_path = os.path.join(index_dir, MENTIONS_FILE)
+        if mentions is not None:
+            # All characters' ids concatenated; offsets[i]:offsets[i + 1] are those of meta["characters"][i]
+            ids = [np.asarray(chunk_ids, dtype="int64") for chunk_ids in mentions.values()]
+            offsets = np.cumsum([0] + [len(chunk_ids) for chunk_ids in ids], dtype="int64")
+            write_atomic(mentions_path, lambda f: np.savez(
+                f, ids=np.concatenate(ids) if ids else np.empty(0, dtype="int64"), offsets=offsets))
+            meta["characters"] = list(mentions)
+        elif os.path.exists(mentions_path):
+            os.remove(mentions_path)
+        write_atomic(cls.meta_path(index_dir), lambda f: f.write(json.dumps(meta).encode("utf-8")))
+        return cls.load(index_dir)
+
+    @classmethod
+    def load(cls, index_dir):
+        """
+        Opens an index read-only without copying vectors or texts into the heap
+
+        Args:
+            index_dir (str): Directory written by build()
+
+        Returns:
+            BookIndex: Loaded index
+
+        Raises:
+            FileNotFoundError: If the directory holds no index in this format
+                (e.g. an index saved by an older version; re-ingest the book)
+            ValueError: If the index format is unsupported or the vectors and
+                chunk texts are out of sync
+        """
+        import faiss
+
+        try:
+            with open(cls.meta_path(index_dir), encoding="utf-8") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"No book index in {index_dir}; ingest the book again") from None
+        if meta.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Index in {index_dir} uses format {meta.get('format')}; ingest the book again")
+        # IO_FLAG_MMAP_IFC maps flat vector codes (faiss >= 1.10); IO_FLAG_MMAP covers IVF lists
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+        index = faiss.read_index(os.path.join(index_dir, INDEX_FILE), flags)
+        chunks = ChunkStore(index_dir, meta["codec"], meta["sources"])
+        if index.ntotal != len(chunks) or meta.get("chunks") != len(chunks):
+            raise ValueError(f"Index in {index_dir} is incomplete or being rewritten")
+        mentions = None
+        if "characters" in meta:
+            with np.load(os.path.join(index_dir, MENTIONS_FILE)) as arrays:
+                ids, offsets = arrays["ids"], arrays["offsets"]
+            mentions = {name: ids[offsets[i]:offsets[i + 1]] for i, name in enumerate(meta["characters"])}
+        vectors = RowFile(os.path.join(index_dir, VECTORS_FILE)) if meta.get("rerank") else None
+        return cls(index, chunks, mentions, vectors, meta.get("quantization", "flat"))
+
+    def character_chunks(self, character_name):
+        """
+        Ids of the chunks mentioning a character, as tagged at ingestion
+
+        Returns:
+            np.ndarray: Ascending chunk ids, or None if the index has no tags
+                for this character (e.g. built before tagging)
+        """
+        return self.mentions.get(character_name) if self.mentions is not None else None
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, ids=None, character=None):
+        """
+        Returns the k chunks closest to an embedding with their distances; only these k are decompressed
+
+        A quantized index with float32 vectors on disk fetches RERANK_CANDIDATES
+        (per layout) times k candidates and keeps the k closest by exact distance.
+
+        Args:
+            embedding (List[float]): Query vector
+            k (int): Number of chunks
+            ids (array-like): Only consider these chunk ids; FAISS skips every
+                other vector instead of scoring and discarding it
+            character (str): Only consider the chunks mentioning this character
+                (like ids=character_chunks(character), with the selector cached)
+
+        Returns:
+            List[Tuple[Document, float]]: Matching chunks, best first (metadata: chunk_id,
+                source, page), with their squared L2 distance (approximate for
+                quantized indexes without re-ranking)
+        """
+        import faiss
+        from langchain_core.documents import Document
+
+        query = np.asarray(embedding, dtype="float32").reshape(1, -1)
+        candidates = k * max(RERANK_CANDIDATES.get(self.quantization, 1), 1) if self.vectors is not None else k
+        candidates = min(candidates, self.index.ntotal)
+        selector = None
+        if character is not None:
+            ids = self.character_chunks(character)
+            if ids is None:
+                ids = []
+            elif character not in self._selectors:
+                self._selectors[character] = faiss.IDSelectorBatch(ids)
+            selector = self._selectors.get(character)
+        elif ids is not None:
+            ids = np.asarray(ids, dtype="int64")
+            selector = faiss.IDSelectorBatch(ids)
+        if ids is not None:
+            candidates = min(candidates, len(ids))
+        if candidates <= 0:
+            return []
+
+        if selector is not None and self.quantization == "pq":
+            distances, chunk_ids = self._pq_search_subset(query, ids, candidates)
+        else:
+            params = faiss.SearchParameters(sel=selector) if selector is not None else None
+            distances, chunk_ids = self.index.search(query, candidates, params=params)
+            distances, chunk_ids = distances[0], chunk_ids[0]
+        if self.vectors is not None:
+            distances, chunk_ids = self._rerank(query, chunk_ids[chunk_ids >= 0], k)
+        return [(Document(page_content=self.chunks.get(int(chunk_id)), metadata=self.chunks.metadata(int(chunk_id))),
+                 float(distance))
+                for distance, chunk_id in zip(distances[:k], chunk_ids[:k]) if chunk_id >= 0]
+
+    def _pq_search_subset(self, query, ids, k):
+        """
+        Search restricted to some chunk ids for a PQ index, which takes no FAISS
+        selector: their codes are scored against the query's distance table
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The k best distances and chunk ids, best first
+        """
+        import faiss
+
+        pq = self.index.pq
+        if self._pq_codes is None:
+            codes = faiss.rev_swig_ptr(self.index.codes.data(), self.index.codes.size())
+            self._pq_codes = codes.reshape(self.index.ntotal, pq.code_size)
+        table = np.empty((pq.M, pq.ksub), dtype="float32")
+        pq.compute_distance_table(faiss.swig_ptr(np.ascontiguousarray(query[0])), faiss.swig_ptr(table))
+        ids = np.asarray(ids, dtype="int64")
+        distances = table[np.arange(pq.M), self._pq_codes[ids]].sum(axis=1)
+        best = np.argsort(distances)[:k]
+        return distances[best], ids[best]
+
+    def _rerank(self, query, chunk_ids, k):
+        """
+        The k candidates closest to the query by exact distance, computed from the
+        float32 vectors on disk (only the candidates' rows are read)
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Distances and chunk ids, best first
+        """
+        chunk_ids = np.sort(chunk_ids)  # In file order
+        distances = ((self.vectors[chunk_ids] - query) ** 2).sum(axis=1)
+        best = np.argsort(distances)[:k]
+        return distances[best], chunk_ids[best]
+
+    def similarity_search_by_vector(self, embedding, k=4, ids=None, character=None):
+        """
+        Returns the k chunks closest to an embedding; only these k are decompressed
+
+        Args:
+            embedding (List[float]): Query vector
+            k (int): Number of chunks
+            ids (array-like): Only consider these chunk ids
+            character (str): Only consider the chunks mentioning this character
+
+        Returns:
+            List[Document]: Matching chunks, best first (metadata: chunk_id, source, page)
+        """
+        return [document for document, _ in self.similarity_search_with_score_by_vector(embedding, k, ids, character)]
@@ -0,0 +1,231 @@
+"""
+BULK LIBRARY INGESTION
+Pre-loads many books from the command line, in parallel, without Streamlit.
+
+    python app/bulk_ingest.py LIBRARY_DIR [--workers 4]
+    python app/bulk_ingest.py --manifest books.jsonl
+
+A library directory holds one book per top-level PDF/.txt file, or per
+subdirectory (all PDFs inside, in name order, form one book). The book source
+defaults to the file or directory name. A manifest lists one JSON object per
+line: {"book_source": "...", "paths": ["a.pdf", ...]} ("path" also works),
+optionally with "quantization" to store that book's vectors quantized (see
+book_index.INDEX_QUANTIZATION; --quantization sets it for the other books).
+Books already ingested keep their layout unless re-ingested with --force.
+
+Each book gets its own index directory (see book_index.book_index_dir) and a
+book.json record with its roster, content hash and counts. The record is
+written last, so an interrupted run simply redoes unfinished books next time,
+and books whose content hash is unchanged are skipped. Ingested books are
+added to the database book catalog so the app can open them directly
+(--no-catalog skips this).
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from dotenv import load_dotenv
+from book_index import BOOK_FILE, BOOK_INDEX_DIR, QUANTIZATIONS, book_index_dir, read_book_info, write_book_info
+from dedup import DedupReport
+from library import content_hash, find_current_book, index_metadata
+
+logger = logging.getLogger(__name__)
+
+BOOK_EXTENSIONS = (".pdf", ".txt")
+
+def discover_books(library_dir):
+    """
+    Finds books in a library directory
+
+    Returns:
+        List[dict]: {"book_source", "paths"} per book, sorted by book source
+    """
+    books = []
+    for entry in sorted(os.scandir(library_dir), key=lambda e: e.name):
+        if entry.is_dir():
+            paths = sorted(os.path.join(entry.path, name) for name in os.listdir(entry.path)
+                           if name.lower().endswith(".pdf"))
+            if paths:
+                books.append({"book_source": entry.name, "paths": paths})
+        elif entry.name.lower().endswith(BOOK_EXTENSIONS):
+            books.append({"book_source": os.path.splitext(entry.name)[0], "paths": [entry.path]})
+    return books
+
+def read_manifest(manifest_path):
+    """
+    Reads a JSON-lines manifest; relative paths are resolved against its directory
+
+    Returns:
+        List[dict]: {"book_source", "paths"} per book
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    books = []
+    with open(manifest_path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            paths = entry.get("paths") or [entry["path"]]
+            paths = [os.path.join(base_dir, path) for path in paths]
+            book_source = entry.get("book_source") or os.path.splitext(os.path.basename(paths[0]))[0]
+            book = {"book_source": book_source, "paths": paths}
+            if entry.get("quantization"):
+                book["quantization"] = entry["quantization"]
+            books.append(book)
+    return books
+
+# ======================
+# WORKER PROCESS
+# ======================
+
+_processor = None  # One PDFProcessor (and model clients) per worker process
+
+def _init_worker():
+    global _processor
+    load_dotenv()
+    from pdf_processor import PDFProcessor
+    _processor = PDFProcessor()
+
+def ingest_book(book, index_root, digest):
+    """
+    Runs the ingestion pipeline for one book inside a worker process
+
+    Returns:
+        dict: Ingestion record also written to the book's book.json
+    """
+    start = time.perf_counter()
+    index_dir = os.path.abspath(book_index_dir(book["book_source"], index_root))
+    # A stale record must not survive a rewrite that gets interrupted
+    if os.path.exists(os.path.join(index_dir, BOOK_FILE)):
+        os.remove(os.path.join(index_dir, BOOK_FILE))
+    pdf_paths = [path for path in book["paths"] if path.lower().endswith(".pdf")]
+    if pdf_paths:
+        result = _processor.run_pipeline(index_dir, pdf_docs=pdf_paths, quantization=book.get("quantization"))
+    else:
+        with open(book["paths"][0], encoding="utf-8") as f:
+            result = _processor.run_pipeline(index_dir, text=f.read(), quantization=book.get("quantization"))
+    if not result["chunks"]:
+        raise ValueError(f"No text found in {book['book_source']}")
+
+    info = {
+        "book_source": book["book_source"],
+        "content_hash": digest,
+        "paths": book["paths"],
+        "index_dir": index_dir,
+        **result,
+        "seconds": round(time.perf_counter() - start, 3),
+        "ingested_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    write_book_info(index_dir, info)
+    return info
+
+# ======================
+# DRIVER
+# ======================
+
+def register_book(db, info):
+    """Adds an ingested book to the database catalog"""
+    metadata = {**index_metadata(info["index_dir"]), "pages": info["pages"], "seconds": info["seconds"]}
+    db.save_book(info["book_source"], info["content_hash"], info["index_dir"], info["characters"], metadata)
+
+def ingest_library(books, index_root=BOOK_INDEX_DIR, workers=None, force=False, db=None, initializer=_init_worker):
+    """
+    Ingests books in parallel, skipping those already ingested with the same content
+
+    Args:
+        books (List[dict]): {"book_source", "paths"} per book
+        index_root (str): Parent directory of the per-book indexes
+        workers (int): Worker processes (default: CPU count)
+        force (bool): Re-ingest books even if their content is unchanged
+        db (DatabaseManager): Book catalog to update (None to skip)
+        initializer (callable): Worker process setup (builds the PDFProcessor)
+
+    Returns:
+        dict: ingested, skipped and failed books plus pages, chunks, deduplication totals
+            and elapsed seconds
+    """
+    report = {"ingested": [], "skipped": [], "failed": [], "pages": 0, "chunks": 0, "dedup": DedupReport()}
+    pending = []
+    for book in books:
+        digest = content_hash(book["paths"])
+        existing = read_book_info(book_index_dir(book["book_source"], index_root))
+        if not force and existing and existing.get("content_hash") == digest:
+            report["skipped"].append(book["book_source"])
+            # Indexed by an earlier run without the catalog
+            if db is not None and not find_current_book(db, book["book_source"], digest):
+                register_book(db, existing)
+        else:
+            pending.append((book, digest))
+
+    start = time.perf_counter()
+    if pending:
+        # Spawned (not forked) workers, so no client or thread state is inherited from this process
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"),
+                                 initializer=initializer) as pool:
+            futures = {pool.submit(ingest_book, book, index_root, digest): book for book, digest in pending}
+            for future in as_completed(futures):
+                book_source = futures[future]["book_source"]
+                try:
+                    info = future.result()
+                    if db is not None:
+                        register_book(db, info)
+                except Exception as e:
+                    logger.error("Failed to ingest %s: %s", book_source, e)
+                    report["failed"].append(book_source)
+                    continue
+                report["ingested"].append(book_source)
+                report["pages"] += info["pages"]
+                report["chunks"] += info["chunks"]
+                report["dedup"].add(info["dedup"])
+                logger.info("Ingested %s: %d pages, %d chunks, %d characters in %.1fs "
+                            "(removed %d boilerplate lines, %d front-matter pages, %d duplicate pages, "
+                            "%d duplicate chunks)",
+                            book_source, info["pages"], info["chunks"], len(info["characters"]), info["seconds"],
+                            info["dedup"]["boilerplate_lines"], info["dedup"]["front_matter_pages"],
+                            info["dedup"]["duplicate_pages"], info["dedup"]["duplicate_chunks"])
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("library", nargs="?", help="Directory of books")
+    parser.add_argument("--manifest", help="JSON-lines manifest of books (instead of a directory)")
+    parser.add_argument("--index-dir", default=BOOK_INDEX_DIR, help=f"Parent directory of book indexes (default {BOOK_INDEX_DIR})")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="Re-ingest books whose content is unchanged")
+    parser.add_argument("--no-catalog", action="store_true", help="Don't record books in the database catalog")
+    parser.add_argument("--quantization", choices=QUANTIZATIONS,
+                        help="Vector layout of books the manifest sets none for (default: INDEX_QUANTIZATION)")
+    args = parser.parse_args()
+    if not args.library and not args.manifest:
+        parser.error("give a library directory or --manifest")
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    books = read_manifest(args.manifest) if args.manifest else discover_books(args.library)
+    if args.quantization:
+        for book in books:
+            book.setdefault("quantization", args.quantization)
+    db = None
+    if not args.no_catalog:
+        from database import DatabaseManager
+        db = DatabaseManager()
+    report = ingest_library(books, args.index_dir, args.workers, args.force, db)
+
+    seconds = report["seconds"] or float("nan")
+    print(f"{len(report['ingested'])} ingested, {len(report['skipped'])} skipped (unchanged), "
+          f"{len(report['failed'])} failed in {report['seconds']:.1f}s")
+    if report["ingested"]:
+        print(f"{report['pages'] / seconds:.1f} pages/s, {report['chunks'] / seconds:.1f} chunks/s")
+        saved = report["dedup"]
+        print(f"Deduplication saved {saved['embeddings_saved']} embeddings and {saved['chars_removed']} characters "
+              f"({saved['boilerplate_lines']} boilerplate lines, {saved['front_matter_pages']} front-matter pages, "
+              f"{saved['duplicate_pages']} duplicate pages, {saved['duplicate_chunks']} duplicate chunks)")
+    sys.exit(1 if report["failed"] else 0)
+
+if __name__ == "__main__":
+    main()
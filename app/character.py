@@ -1,9 +1,17 @@
-from database import DatabaseManager
+from database import StaleStateError, get_database
 from character_state import CharacterState
-from langchain_google_genai import ChatGoogleGenerativeAI
-import streamlit as st
+from emotion_history import EmotionRecorder
+from admission import BACKGROUND, Overloaded, get_controller
+from models import CHAT_MODEL, get_chat_model
+import logging
 import random
 import json
+import telemetry
+
+logger = logging.getLogger(__name__)
+
+# Attempts to re-apply an emotion update when another session saved the same state first
+STATE_SAVE_RETRIES = 3
 
 class CharacterManager:
     """
@@ -14,13 +22,21 @@ class CharacterManager:
     - Serving as interface between application and character data
     """
     
-    def __init__(self):
-        """Initialize with database connection"""
-        self.db = DatabaseManager()  # Handles all database operations
+    def __init__(self, db=None):
+        """
+        Initialize with database connection
+        
+        Args:
+            db: Optional database manager (defaults to a new one for DB_BACKEND)
+        """
+        self.db = db or get_database()  # Handles all database operations
+        self.emotion_history = EmotionRecorder(self.db)  # Batched emotion time series
         
     def get_character_state(self, character_name, book_source, user_id):
         """
-        Retrieves or creates a character's emotional state
+        Retrieves a character's emotional state without writing anything: a
+        character nobody has talked to yet gets the default state, and its row
+        is created when its first turn is saved
         
         Args:
             character_name (str): Name of the character
@@ -28,16 +44,11 @@ class CharacterManager:
             user_id (str): User identifier for personalization
             
         Returns:
-            tuple: (CharacterState object, character_id)
+            tuple: (CharacterState object, character_id or None if the character isn't stored yet)
         """
-        # Try to load existing state
         state, character_id = self.db.get_character_state(character_name, book_source, user_id)
-        
-        # Create new state if not found
         if state is None:
             state = CharacterState()  # Default neutral state
-            character_id = self.save_character_state(character_name, state, book_source, user_id)
-            
         return state, character_id
     
     def save_character_state(self, character_name, state, book_source, user_id):
@@ -52,6 +63,9 @@ class CharacterManager:
             
         Returns:
             str: Database ID of saved character
+            
+        Raises:
+            StaleStateError: If the user's stored state changed since it was read
         """
         return self.db.save_character_state(character_name, state, book_source, user_id)
         
@@ -62,7 +76,7 @@ class CharacterManager:
         Process:
         1. Sends current state + user input to LLM
         2. Parses JSON response with new emotional values
-        3. Updates character state
+        3. Updates and persists character state (re-applied on version conflicts)
         4. Falls back to random fluctuations if LLM fails
         
         Args:
@@ -75,7 +89,7 @@ class CharacterManager:
         Returns:
             CharacterState: Updated emotional state
         """
-        model = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.7)
+        model = get_chat_model(temperature=0.7)
         
         # Construct detailed prompt for emotion analysis
         prompt = f"""
@@ -116,30 +130,83 @@ class CharacterManager:
 
         try:
             # Get LLM response
-            response = model.invoke(prompt)
-            print(f"LLM Response: {response.content}")
+            # Background priority: yields to answer generation and is shed first under load
+            with telemetry.span("character.emotion_llm"), get_controller().model_slot(CHAT_MODEL, BACKGROUND):
+                response = model.invoke(prompt)
+            telemetry.record_usage(response)
+            logger.debug(f"LLM Response: {response.content}")
 
             # Clean JSON string
             json_string = response.content.strip()
             json_string = json_string.removeprefix("```json").removesuffix("```").strip()
 
             if json_string:
-                # Parse and update emotions
+                # Parse new emotions
                 emotion_data = json.loads(json_string)
-                character_state.update_emotions(emotion_data)
-                self.save_character_state(character_name, character_state, book_source, user_id)
             else:
                 raise ValueError("Empty LLM response")
 
-        except (json.JSONDecodeError, AttributeError, ValueError) as e:
-            print(f"Error processing LLM response: {e}")
+        except (json.JSONDecodeError, AttributeError, ValueError, Overloaded) as e:
+            logger.warning(f"Error processing LLM response: {e}")
             # Fallback: Small random fluctuations
-            character_state.arousal = max(0.0, min(1.0, character_state.arousal + random.uniform(-0.1, 0.1)))
-            character_state.valence = max(0.0, min(1.0, character_state.valence + random.uniform(-0.1, 0.1)))
-            self.save_character_state(character_name, character_state, book_source, user_id)
+            emotion_data = {
+                "arousal": max(0.0, min(1.0, character_state.arousal + random.uniform(-0.1, 0.1))),
+                "valence": max(0.0, min(1.0, character_state.valence + random.uniform(-0.1, 0.1)))
+            }
+
+        return self._apply_emotions(character_name, character_state, emotion_data, book_source, user_id)
+
+    def _apply_emotions(self, character_name, character_state, emotion_data, book_source, user_id):
+        """
+        Applies an emotion update, persists it and records a history sample
+        (logged-in users; anonymous state is never stored). If another session saved
+        this user's state in the meantime, the update is re-applied on top of
+        the latest stored state instead of overwriting it.
+        
+        Returns:
+            CharacterState: Updated emotional state
+        """
+        if not user_id or user_id == "anonymous":
+            character_state.update_emotions(emotion_data)
+            return character_state
+
+        for attempt in range(STATE_SAVE_RETRIES):
+            character_state.update_emotions(emotion_data)
+            try:
+                with telemetry.span("character.save_state"):
+                    character_id = self.save_character_state(character_name, character_state, book_source, user_id)
+                self.emotion_history.record(character_id, user_id, character_state)
+                return character_state
+            except StaleStateError:
+                telemetry.count("character.state_conflicts")
+                latest_state, _ = self.db.get_character_state(character_name, book_source, user_id)
+                if latest_state is not None:
+                    character_state = latest_state
 
+        logger.warning(f"Gave up saving emotions for {character_name} after {STATE_SAVE_RETRIES} conflicts")
         return character_state
 
+    def get_emotion_trajectory(self, character_name, book_source, user_id, since=None, until=None, bucket_seconds=60):
+        """
+        Downsampled history of a character's emotions in conversations with one user
+        
+        Args:
+            character_name (str): Character identifier
+            book_source (str): Source material identifier
+            user_id (str): User identifier
+            since (datetime): Optional start of the range
+            until (datetime): Optional end of the range
+            bucket_seconds (float): Width of the averaging buckets
+            
+        Returns:
+            list: {"time", "samples", "state"} per bucket, oldest first
+        """
+        state, character_id = self.db.get_character_state(character_name, book_source, user_id)
+        if character_id is None:
+            return []
+        self.emotion_history.flush()  # Include samples still waiting for the next batch
+        return self.db.get_emotion_trajectory(character_id, user_id, since, until, bucket_seconds)
+
     def get_conversation_history(self, character_name, book_source, user_id=None, limit=20):
         """
         Retrieves conversation history between user and character
@@ -154,6 +221,8 @@ class CharacterManager:
             list: Conversation messages (role, content, timestamp)
         """
         state, character_id = self.get_character_state(character_name, book_source, user_id)
+        if character_id is None:
+            return []
         return self.db.get_conversation_history(character_id, user_id, limit)
     
     def save_conversation(self, character_name, book_source, user_id, messages):
@@ -166,7 +235,7 @@ class CharacterManager:
             user_id (str): User identifier
             messages (list): List of message dicts (role, content)
         """
-        state, character_id = self.get_character_state(character_name, book_source, user_id)
+        character_id = self.db.ensure_character(character_name, book_source)
         conversation_id = self.db.create_conversation(character_id, user_id)
         for message in messages:
             self.db.save_message(conversation_id, message["role"], message["content"])
@@ -182,7 +251,7 @@ class CharacterManager:
             value (str): Information to store
             user_id (str): User identifier
         """
-        state, character_id = self.get_character_state(character_name, book_source, user_id)
+        character_id = self.db.ensure_character(character_name, book_source)
         self.db.save_to_memory(character_id, key, value)
     
     def get_from_memory(self, character_name, book_source, key, user_id):
@@ -199,4 +268,6 @@ class CharacterManager:
             str: Retrieved memory content or None
         """
         state, character_id = self.get_character_state(character_name, book_source, user_id)
+        if character_id is None:
+            return None
         return self.db.get_from_memory(character_id, key)
\ No newline at end of file
@@ -1,5 +1,3 @@
-import streamlit as st
-
 class CharacterState:
     """
     A class to represent and manage the emotional and cognitive state of a character.
@@ -18,12 +16,21 @@ class CharacterState:
         resolution_level (float): Problem-solving persistence (0.0-1.0)
         goal_directedness (float): Focus on objectives (0.0-1.0)
         securing_rate (float): Resource protection tendency (0.0-1.0)
+        version (int): Optimistic-concurrency version of the stored per-user state
+                       (0 = not stored yet, i.e. still the shared baseline)
     """
+
+    # Attribute order used for compact vector storage
+    FIELDS = (
+        "arousal", "valence", "dominance",
+        "sadness", "anger", "joy", "fear",
+        "selection_threshold", "resolution_level", "goal_directedness", "securing_rate"
+    )
     
     def __init__(self, arousal=0.5, valence=0.5, dominance=0.5, 
                  sadness=0.0, anger=0.0, joy=0.0, fear=0.0,
                  selection_threshold=0.5, resolution_level=0.5, 
-                 goal_directedness=0.5, securing_rate=0.5):
+                 goal_directedness=0.5, securing_rate=0.5, version=0):
         """
         Initialize character state with default neutral values (0.5) unless specified.
         
@@ -39,6 +46,7 @@ class CharacterState:
             resolution_level: Initial problem-solving persistence (default: 0.5)
             goal_directedness: Initial focus on objectives (default: 0.5)
             securing_rate: Initial resource protection tendency (default: 0.5)
+            version: Stored state version (default: 0, not stored yet)
         """
         # Core emotional dimensions
         self.arousal = arousal          # Energy level (calm vs excited)
@@ -57,6 +65,32 @@ class CharacterState:
         self.goal_directedness = goal_directedness      # Focus on objectives
         self.securing_rate = securing_rate              # Resource protection tendency
 
+        # Storage metadata
+        self.version = version
+
+    @classmethod
+    def from_vector(cls, values, version=0):
+        """
+        Build a state from a compact vector in FIELDS order
+        
+        Args:
+            values (list): Eleven floats
+            version (int): Stored state version
+            
+        Returns:
+            CharacterState: New state
+        """
+        return cls(**dict(zip(cls.FIELDS, values)), version=version)
+
+    def to_vector(self):
+        """
+        Export the state as a compact vector in FIELDS order
+        
+        Returns:
+            list: Eleven floats
+        """
+        return [float(getattr(self, field)) for field in self.FIELDS]
+
     def update_emotions(self, emotion_data):
         """
         Update emotional state with new values from a dictionary.
@@ -83,15 +117,24 @@ class CharacterState:
         self.goal_directedness = emotion_data.get("goal_directedness", self.goal_directedness)
         self.securing_rate = emotion_data.get("securing_rate", self.securing_rate)
 
-    def display_emotions(self):
+    def to_dict(self):
+        """
+        Export the state as a plain dictionary (e.g. for JSON responses)
+        
+        Returns:
+            dict: Attribute name to value for all eleven parameters
         """
-        Display all emotional and cognitive states as Streamlit progress bars.
-        Formats the display with clear section headers and visual indicators.
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def emotion_groups(self):
         """
-        st.write("### Emotional State")
+        Group related parameters under display labels. Rendering is left to
+        the client (see ui.render_emotions for the Streamlit one).
         
-        # Group related parameters for organized display
-        emotion_groups = {
+        Returns:
+            dict: Group name to {label: value}
+        """
+        return {
             "Core Dimensions": {
                 "Arousal": self.arousal,
                 "Valence": self.valence,
@@ -110,13 +153,3 @@ class CharacterState:
                 "Securing Rate": self.securing_rate
             }
         }
-        
-        # Display each group with appropriate formatting
-        for group_name, emotions in emotion_groups.items():
-            st.write(f"**{group_name}**")
-            for emotion, value in emotions.items():
-                # Ensure value is within valid range before display
-                clamped_value = max(0.0, min(1.0, value))
-                st.write(f"{emotion}:")
-                st.progress(clamped_value)
-            st.write("---")  # Visual separator between groups
\ No newline at end of file
@@ -1,11 +1,100 @@
-from character_state import CharacterState
-from database import DatabaseManager
-from langchain.chains.question_answering import load_qa_chain
-from langchain.prompts import PromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from langchain.vectorstores import FAISS
+import os
+import time
+from functools import lru_cache
+import numpy as np
+import telemetry
+from admission import Overloaded, RateLimited, get_controller
+from book_index import BookIndex, book_index_dir
 from character import CharacterManager
-import streamlit as st
+from coalesce import SingleFlight
+from dossier import DOSSIER_FILE, format_dossier, read_dossiers
+from models import CHAT_MODEL, EMBEDDING_MODEL, get_chat_model, get_embeddings
+from memory import ConversationMemory
+from vector_memory import ConversationVectorMemory
+
+# Maximum number of (book, character) chains kept in memory per process
+CHAIN_CACHE_SIZE = int(os.getenv("CHAIN_CACHE_SIZE", "256"))
+
+# Book chunks retrieved per turn; fewer when the character's dossier is already in the prompt
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "4"))
+DOSSIER_RETRIEVAL_K = int(os.getenv("DOSSIER_RETRIEVAL_K", "2"))
+
+# Use of the chunks tagged at ingestion as mentioning the selected character: "filter"
+# searches only those (topped up from the whole book if there are fewer than k), "boost"
+# ranks them ahead of equally close chunks of the whole book, "off" ignores the tags
+CHARACTER_RETRIEVAL = os.getenv("CHARACTER_RETRIEVAL", "filter")
+CHARACTER_BOOST = float(os.getenv("CHARACTER_BOOST", "0.8"))  # Distance factor of the character's chunks
+
+# Share one retrieval + generation between concurrent identical first questions
+COALESCE_REQUESTS = os.getenv("CHAT_COALESCE", "1").lower() not in ("0", "false", "no")
+COALESCE_TIMEOUT = float(os.getenv("CHAT_COALESCE_TIMEOUT", "120"))  # Max seconds a follower waits per chunk
+
+# Persona prompt; {character_name} and {dossier} are bound per character, the rest per turn.
+# Everything up to [Book Context] is identical on every turn with a character (cacheable prefix).
+PERSONA_TEMPLATE = """
+            You are {character_name}, a character from a book. Respond naturally to questions while staying in character.
+            Use the [Character Dossier] for who you are, your relationships and how you speak.
+
+            When asked about someone (like "Tell me about someone"), summarize what you've learned about them from the [Conversation History]. 
+            Include details like their general behavior or any relevant information gleaned from previous interactions, but DO NOT reveal any personally identifiable information (PII) such as specific addresses, phone numbers, email addresses, or ages. 
+            If there are no mentions in the [Conversation History], state that you don't have enough information to provide a summary.
+            If there are mentions in the [Book Context] and not in the [Conversation History], use the book context to provide general information, excluding PII.
+            Use the [Conversation Summary] and [Recent Conversation] to stay consistent with what was already said to this user.
+
+            [Character Dossier]:
+            {dossier}
+
+            [Book Context]:
+            {context}
+
+            [Conversation Summary]:
+            {summary}
+
+            [Recent Conversation]:
+            {recent}
+
+            [Conversation History]:
+            {history}
+
+            Current Question:
+            {question}
+
+            Answer:
+        """
+
+# In-character reply sent instead of an answer when a turn is rate limited or shed
+BUSY_REPLY = ("*{character_name} glances up from a pile of letters* Forgive me, so many people are calling "
+              "on me just now that I can scarcely think. Ask me again in a moment?")
+
+_persona_prompt = None  # PromptTemplate compiled once from PERSONA_TEMPLATE
+_flights = SingleFlight()  # In-flight answers shared by every ChatManager in the process
+
+def _get_persona_prompt():
+    """Parses the persona template on first use"""
+    global _persona_prompt
+    if _persona_prompt is None:
+        from langchain.prompts import PromptTemplate
+        _persona_prompt = PromptTemplate(
+            template=PERSONA_TEMPLATE,
+            input_variables=["character_name", "dossier", "context", "question", "history", "summary", "recent"]
+        )
+    return _persona_prompt
+
+@lru_cache(maxsize=CHAIN_CACHE_SIZE)
+def _build_chain(book_source, character_name, dossier=""):
+    """
+    Builds the "stuff" QA chain for one character (cached, see get_conversational_chain);
+    the dossier text is part of the key, so a re-ingested book gets new chains
+    """
+    from langchain.chains.combine_documents import create_stuff_documents_chain
+
+    # Runnable "stuff" chain: supports both invoke() and token streaming
+    return create_stuff_documents_chain(
+        get_chat_model(temperature=0.3),
+        _get_persona_prompt().partial(character_name=character_name,
+                                      dossier=dossier or "(none)"),
+        document_variable_name="context"
+    )
 
 class ChatManager:
     """
@@ -16,221 +105,480 @@ class ChatManager:
     - Protecting personally identifiable information (PII)
     """
     
-    def __init__(self, book_source):
+    def __init__(self, book_source, character_manager=None, index_path=None):
         """
         Initialize chat manager with required components
         
         Args:
             book_source (str): Identifier for the source material being used
+            character_manager (CharacterManager): Optional shared character manager
+            index_path (str): Directory of the book's vector index (default: the book's
+                directory under BOOK_INDEX_DIR)
         """
-        self.db = DatabaseManager()  # Database operations handler
-        self.character_manager = CharacterManager()  # Character state manager
-        self.embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")  # Text embeddings
-        self.name_extraction_model = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.1)  # Name extraction LLM
+        self.character_manager = character_manager or CharacterManager()  # Character state manager
+        self.db = self.character_manager.db  # Database operations handler (shared connection)
+        self.memory = ConversationMemory(self.db)  # Rolling conversation summary
+        self.embeddings = get_embeddings()  # Text embeddings
+        self.vector_memory = ConversationVectorMemory(self.db, self.embeddings)  # Semantic recall of past messages
         self.book_source = book_source  # Current book/context identifier
+        self.index_path = index_path or book_index_dir(book_source)
+        self._vector_store = None  # Loaded (memory-mapped) book index, reused across turns
+        self._vector_store_mtime = None  # Modification time of the loaded index
+        self._dossiers = {}  # Character name -> dossier prompt text
+        self._dossiers_mtime = None  # Modification time of the loaded dossiers file
+
+    def get_vector_store(self):
+        """
+        Returns the book's index, loading it on first use and reloading
+        it only when the index on disk has been rewritten by a new ingestion
+        
+        The index is memory-mapped, so loading is cheap and every process
+        serving the book shares the same pages.
+        
+        Returns:
+            BookIndex: Loaded vector index
+        """
+        mtime = os.path.getmtime(BookIndex.meta_path(self.index_path))
+        if self._vector_store is None or mtime != self._vector_store_mtime:
+            with telemetry.span("chat.load_index"):
+                self._vector_store = BookIndex.load(self.index_path)
+            self._vector_store_mtime = mtime
+        return self._vector_store
+
+    def get_dossier(self, character_name):
+        """
+        Prompt text of a character's dossier, built at ingestion ("" if the
+        book has none); reloaded when the book is re-ingested
+        
+        Args:
+            character_name (str): Character name
+            
+        Returns:
+            str: Formatted dossier
+        """
+        path = os.path.join(self.index_path, DOSSIER_FILE)
+        mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        if mtime != self._dossiers_mtime:
+            self._dossiers = {name: format_dossier(dossier) for name, dossier in read_dossiers(self.index_path).items()}
+            self._dossiers_mtime = mtime
+        return self._dossiers.get(character_name, "")
 
     def get_conversational_chain(self, character_name):
         """
-        Creates a configured QA chain for character conversations with:
+        Returns the QA chain for character conversations with:
         - Character persona enforcement
+        - The character's dossier as a fixed prompt prefix
         - Conversation history awareness
         - PII protection safeguards
         
+        Chains are cached per (book, character) and shared by every session
+        in the process, so only the first turn with a character builds one.
+        
         Args:
             character_name (str): Name of character to roleplay
             
         Returns:
-            QA Chain: Configured conversation chain
+            Runnable: Configured conversation chain (returns the answer text)
         """
-        prompt_template = f"""
-            You are {character_name}, a character from a book. Respond naturally to questions while staying in character.
+        return _build_chain(self.book_source, character_name, self.get_dossier(character_name))
 
-            When asked about someone (like "Tell me about someone"), summarize what you've learned about them from the [Conversation History]. 
-            Include details like their general behavior or any relevant information gleaned from previous interactions, but DO NOT reveal any personally identifiable information (PII) such as specific addresses, phone numbers, email addresses, or ages. 
-            If there are no mentions in the [Conversation History], state that you don't have enough information to provide a summary.
-            If there are mentions in the [Book Context] and not in the [Conversation History], use the book context to provide general information, excluding PII.
-
-            [Book Context]:
-            {{context}}
-
-            [Conversation History]:
-            {{history}}
+    def warm_up(self, character_names):
+        """
+        Prepares everything a first turn would otherwise pay for: loads the
+        book index and dossiers and builds the chain of every character in the roster
+        
+        Args:
+            character_names (list): The book's characters
+        """
+        with telemetry.span("chat.warm_up"):
+            self.get_vector_store()
+            for character_name in character_names:
+                self.get_conversational_chain(character_name)
 
-            Current Question:
-            {{question}}
+    def load_session(self, character_name, user_id):
+        """
+        What the page shows for a newly selected character: its state and the
+        user's saved history (read only; see CharacterManager.get_character_state)
+        
+        Args:
+            character_name (str): Selected character
+            user_id (str): User identifier ("anonymous" for temporary sessions)
+            
+        Returns:
+            dict: character_state, character_id and history (empty for anonymous users)
+        """
+        with telemetry.span("chat.load_session"):
+            character_state, character_id = self.character_manager.get_character_state(
+                character_name, self.book_source, user_id
+            )
+            history = []
+            if character_id is not None and user_id != "anonymous":
+                history = self.db.get_conversation_history(character_id, user_id)
+        return {"character_state": character_state, "character_id": character_id, "history": history}
 
-            Answer:
+    def warm_up_character(self, character_name, character_id, user_id, cancelled=None):
         """
-        model = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.3)
-        prompt = PromptTemplate(
-            template=prompt_template,
-            input_variables=["context", "question", "history"]
-        )
-        return load_qa_chain(
-            model,
-            chain_type="stuff",
-            prompt=prompt,
-            document_variable_name="context"
-        )
+        Prepares the rest of a first turn with one character: the book index,
+        the character's chain and the user's message index (loaded from disk
+        and caught up with the database). Run in the background while the user
+        types; a step already running finishes, the next ones are skipped once
+        `cancelled` is set.
+        
+        Args:
+            character_name (str): Selected character
+            character_id (int): Database ID of the character
+            user_id (str): User identifier
+            cancelled (threading.Event): Set when the selection moved on
+            
+        Returns:
+            bool: False if cancelled before every step ran
+        """
+        steps = [
+            self.get_vector_store,
+            lambda: self.get_conversational_chain(character_name),
+            lambda: self.vector_memory.preload(character_id, user_id),
+        ]
+        with telemetry.span("chat.warm_up_character"):
+            for step in steps:
+                if cancelled is not None and cancelled.is_set():
+                    telemetry.count("chat.warm_up_cancelled")
+                    return False
+                step()
+        return True
 
-    def process_user_input(self, prompt, character_name, user_id):
+    def process_user_input(self, prompt, character_name, user_id, character_state=None, client_id=None):
         """
         Processes user input through the full conversation pipeline:
-        1. Retrieves character state
-        2. Checks for name references in history
-        3. Generates context-aware response
-        4. Updates character emotions
-        5. Persists data for logged-in users
+        1. Admits the turn (per-client rate limit)
+        2. Retrieves character state
+        3. Loads conversation summary and recent messages
+        4. Recalls semantically related past messages
+        5. Generates context-aware response
+        6. Updates character emotions
+        7. Persists data and compacts memory for logged-in users
+        
+        Rate-limited or shed turns get an in-character busy reply and change
+        nothing (no emotion update, nothing persisted). Identical first questions
+        asked concurrently share one retrieval and generation (see _join_flight);
+        each turn still updates emotions and persists on its own.
         
         Args:
             prompt (str): User's input message
             character_name (str): Character being conversed with
             user_id (str): User identifier ("anonymous" for temporary sessions)
+            character_state (CharacterState): Current state kept by the client for
+                anonymous sessions, which are never stored
+            client_id (str): Identity charged for rate limiting (default: user_id;
+                pass a per-session id for anonymous users)
             
         Returns:
             tuple: (response_text, updated_character_state)
         """
-        # Retrieve or initialize character state
-        character_state, character_id = self.character_manager.get_character_state(
-            character_name, 
-            self.book_source, 
-            user_id
-        )
+        with telemetry.trace("chat_turn", book_source=self.book_source, character=character_name):
+            if not self._admit_turn(client_id or user_id):
+                return self._busy_reply(character_name), self._unchanged_state(character_name, user_id, character_state)
 
-        # Only create new database records for authenticated users
-        if character_id is None and user_id != "anonymous":
-            character_id = self.db.save_character_state(
-                character_name, 
-                character_state, 
-                self.book_source
-            )
+            turn = self._start_turn(character_name, user_id, character_state)
 
-        # Check for name references in query
-        history_context = ""
-        name_query_phrases = ["tell me about", "you know", "describe", "who is"]
-        if any(phrase in prompt.lower() for phrase in name_query_phrases):
-            name_to_check = self._extract_name_from_question_using_llm(prompt)
-            if name_to_check:
-                print(f"Searching for mentions of: {name_to_check}")
-                # Retrieve relevant conversation history
-                all_conversations = self.db.search_conversations_for_mentions(
-                    character_id, 
-                    name_to_check
-                )
+            try:
+                flight, leader = self._join_flight(prompt, character_name, turn)
+                if leader:
+                    with flight.lead():
+                        inputs = self._build_chain_inputs(prompt, character_name, user_id, turn)
+                        with telemetry.span("chat.build_chain"):
+                            chain = self.get_conversational_chain(character_name)
+                        with telemetry.span("chat.generate"), get_controller().model_slot(CHAT_MODEL):
+                            response_text = chain.invoke(inputs, config=telemetry.chain_callbacks())
+                        flight.finish(response_text)
+                else:
+                    with telemetry.span("chat.coalesced_wait"):
+                        response_text = flight.wait(COALESCE_TIMEOUT)
+            except Overloaded:
+                return self._busy_reply(character_name), turn["character_state"]
+            except Exception as e:
+                response_text = f"I can't process that right now. Error: {str(e)}"
 
-                # Filter out meta-queries about knowledge
-                relevant_mentions = [
-                    (content, role, timestamp) 
-                    for content, role, timestamp in all_conversations
-                    if (name_to_check.lower() in content.lower() and 
-                        "did you know" not in content.lower())
-                ]
-
-                if relevant_mentions:
-                    history_context = f"Previous mentions of {name_to_check}:\n"
-                    for content, role, timestamp in relevant_mentions:
-                        history_context += f"- {role} said: '{content}'\n"
-                    print(f"History context built: {history_context}")
+            updated_state = self._finish_turn(prompt, response_text, character_name, user_id, turn)
+            return response_text, updated_state
+
+    def stream_user_input(self, prompt, character_name, user_id, character_state=None, client_id=None):
+        """
+        Streaming variant of process_user_input
+        
+        Args:
+            prompt (str): User's input message
+            character_name (str): Character being conversed with
+            user_id (str): User identifier ("anonymous" for temporary sessions)
+            character_state (CharacterState): Current state kept by the client for
+                anonymous sessions, which are never stored
+            client_id (str): Identity charged for rate limiting (default: user_id)
+            
+        Yields:
+            dict: {"type": "token", "content": str} for each generated chunk, then
+                  {"type": "done", "response": str, "state": dict} once the turn is persisted
+        """
+        # Each step of a generator may run in a different thread/context (e.g. on a
+        # server thread pool), so the trace is re-activated around every stage
+        trace = telemetry.start_trace("chat_turn", book_source=self.book_source, character=character_name, stream=True)
+        try:
+            with telemetry.activate(trace):
+                if not self._admit_turn(client_id or user_id):
+                    busy_reply = self._busy_reply(character_name)
+                    state = self._unchanged_state(character_name, user_id, character_state)
+                    yield {"type": "token", "content": busy_reply}
+                    yield {"type": "done", "response": busy_reply, "state": state.to_dict()}
+                    return
+                turn = self._start_turn(character_name, user_id, character_state)
+
+            response_text = ""
+            try:
+                with telemetry.activate(trace):
+                    flight, leader = self._join_flight(prompt, character_name, turn)
+                if leader:
+                    with flight.lead():
+                        with telemetry.activate(trace):
+                            inputs = self._build_chain_inputs(prompt, character_name, user_id, turn)
+                            with telemetry.span("chat.build_chain"):
+                                chain = self.get_conversational_chain(character_name)
+
+                        # The model slot is held until the last chunk has been consumed
+                        with get_controller().model_slot(CHAT_MODEL):
+                            stream = chain.stream(inputs, config=telemetry.chain_callbacks(trace))
+                            # Generation time includes time spent by the consumer between chunks
+                            generation_start = time.perf_counter()
+                            for chunk in stream:
+                                response_text += chunk
+                                flight.publish(chunk)
+                                yield {"type": "token", "content": chunk}
+                        flight.finish(response_text)
+                    with telemetry.activate(trace):
+                        telemetry.observe("chat.generate", time.perf_counter() - generation_start)
                 else:
-                    print("No relevant mentions found.")
+                    # Followers receive the leader's chunks as they are generated
+                    wait_start = time.perf_counter()
+                    for chunk in flight.stream(COALESCE_TIMEOUT):
+                        response_text += chunk
+                        yield {"type": "token", "content": chunk}
+                    # A non-streaming leader publishes its answer only as the result
+                    if not response_text and flight.result:
+                        response_text = flight.result
+                        yield {"type": "token", "content": response_text}
+                    with telemetry.activate(trace):
+                        telemetry.observe("chat.coalesced_wait", time.perf_counter() - wait_start)
+            except Overloaded:
+                busy_reply = self._busy_reply(character_name)
+                yield {"type": "token", "content": busy_reply}
+                yield {"type": "done", "response": busy_reply, "state": turn["character_state"].to_dict()}
+                return
+            except Exception as e:
+                error_text = f"I can't process that right now. Error: {str(e)}"
+                response_text += error_text
+                yield {"type": "token", "content": error_text}
+
+            with telemetry.activate(trace):
+                updated_state = self._finish_turn(prompt, response_text, character_name, user_id, turn)
+            yield {"type": "done", "response": response_text, "state": updated_state.to_dict()}
+        finally:
+            telemetry.finish_trace(trace)
 
+    def _admit_turn(self, client_id):
+        """Charges a turn to the client; False if it is over its rate limit"""
         try:
-            # Load document embeddings and generate response
-            new_db = FAISS.load_local("faiss_index", self.embeddings, allow_dangerous_deserialization=True)
-            docs = new_db.similarity_search(prompt)
-
-            chain = self.get_conversational_chain(character_name)
-            response = chain.invoke(
-                {
-                    "input_documents": docs,
-                    "question": prompt,
-                    "history": history_context
-                },
-                return_only_outputs=True
-            )
-            response_text = response["output_text"]
-        except Exception as e:
-            response_text = f"I can't process that right now. Error: {str(e)}"
+            get_controller().admit_turn(client_id)
+            return True
+        except RateLimited:
+            return False
 
-        # Update character's emotional state
-        updated_state = self.character_manager.simulate_emotions(
-            prompt, 
-            character_name, 
-            character_state, 
-            self.book_source, 
-            user_id
-        )
+    def _busy_reply(self, character_name):
+        """In-character reply for turns that were rate limited or shed"""
+        telemetry.count("chat.busy_replies")
+        return BUSY_REPLY.format(character_name=character_name)
+
+    def _unchanged_state(self, character_name, user_id, character_state):
+        """State to hand back for a turn that was not processed"""
+        if character_state is not None and user_id == "anonymous":
+            return character_state
+        return self.character_manager.get_character_state(character_name, self.book_source, user_id)[0]
+
+    def _join_flight(self, prompt, character_name, turn):
+        """
+        Joins the in-flight answer to the same first question, if any
         
-        # Persist data only for authenticated users
-        if user_id != "anonymous":
-            self.character_manager.save_character_state(
+        Only turns without any conversation memory are coalesced: their answer
+        depends on nothing but the book, the character and the question. The
+        question is compared case- and whitespace-insensitively.
+        
+        Returns:
+            Tuple[Flight, bool]: The flight, and whether this turn generates the answer
+        """
+        key = None
+        if COALESCE_REQUESTS and not turn["summary"] and not turn["recent_messages"]:
+            key = (self.book_source, character_name, " ".join(prompt.casefold().split()))
+        flight, leader = _flights.join(key)
+        if not leader:
+            telemetry.count("chat.coalesced")
+        return flight, leader
+
+    def _start_turn(self, character_name, user_id, character_state=None):
+        """
+        Loads everything a turn needs before generation
+        
+        Returns:
+            dict: character_state, character_id, summary and recent_messages
+        """
+        # Retrieve or initialize character state
+        with telemetry.span("chat.load_state"):
+            stored_state, character_id = self.character_manager.get_character_state(
                 character_name, 
-                updated_state, 
                 self.book_source, 
                 user_id
             )
-            conversation_id = self.db.create_conversation(character_id, user_id)
-            self.db.save_message(conversation_id, "user", prompt)
-            self.db.save_message(conversation_id, "assistant", response_text)
 
-        return response_text, updated_state
+        # Anonymous sessions keep their own state; everyone else uses the stored one
+        if character_state is None or user_id != "anonymous":
+            character_state = stored_state
 
-    def _extract_name_from_question_using_llm(self, question):
+        # Load rolling summary and the verbatim recent window
+        with telemetry.span("chat.memory_context"):
+            summary, recent_messages = self.memory.get_context(character_id, user_id)
+
+        return {
+            "character_state": character_state,
+            "character_id": character_id,
+            "summary": summary,
+            "recent_messages": recent_messages
+        }
+
+    def _build_chain_inputs(self, prompt, character_name, user_id, turn):
         """
-        Helper method to extract names from user questions using LLM
+        Retrieves book passages and recalled messages for the QA chain
+        
+        Characters with a dossier get fewer book passages (DOSSIER_RETRIEVAL_K):
+        their key passages are already in the prompt prefix.
         
+        Returns:
+            dict: Chain inputs (context, question, history, summary, recent)
+        """
+        # Embed the question once for both memory recall and book retrieval
+        with telemetry.span("chat.embed_query"), get_controller().model_slot(EMBEDDING_MODEL):
+            query_vector = self.embeddings.embed_query(prompt)
+
+        # Recall semantically related past messages outside the recent window
+        history_context = ""
+        with telemetry.span("chat.memory_recall"):
+            recalled_messages = self.vector_memory.search(
+                turn["character_id"],
+                user_id,
+                query_vector,
+                exclude_ids=[message["message_id"] for message in turn["recent_messages"]]
+            )
+        if recalled_messages:
+            history_context = "Relevant earlier messages:\n"
+            for message in recalled_messages:
+                history_context += f"- {message['role']} said: '{message['content']}'\n"
+
+        # Retrieve book passages
+        k = DOSSIER_RETRIEVAL_K if self.get_dossier(character_name) else RETRIEVAL_K
+        with telemetry.span("chat.similarity_search"):
+            docs = self.retrieve_passages(query_vector, character_name, k)
+
+        return {
+            "context": docs,
+            "question": prompt,
+            "history": history_context,
+            "summary": turn["summary"],
+            "recent": ConversationMemory.format_messages(turn["recent_messages"])
+        }
+
+    def retrieve_passages(self, query_vector, character_name, k=RETRIEVAL_K):
+        """
+        Book chunks closest to a query, favouring those that mention the
+        character (see CHARACTER_RETRIEVAL); books indexed without character
+        tags are searched whole
+
         Args:
-            question (str): User's input containing potential name reference
-            
+            query_vector (List[float]): Embedded question
+            character_name (str): Selected character
+            k (int): Number of chunks
+
         Returns:
-            str: Extracted name or None if not found
+            List[Document]: Chunks, best first
         """
-        prompt = f"""
-            Extract the full name of the person mentioned in the following question. 
-            If no name is mentioned, return 'None'.
+        vector_store = self.get_vector_store()
+        mentions = vector_store.character_chunks(character_name) if CHARACTER_RETRIEVAL != "off" else None
+        if mentions is None or not len(mentions):
+            return vector_store.similarity_search_by_vector(query_vector, k=k)
+
+        if CHARACTER_RETRIEVAL == "boost":
+            scored = vector_store.similarity_search_with_score_by_vector(query_vector, k=2 * k)
+            mentioned = np.isin([document.metadata["chunk_id"] for document, _ in scored], mentions)
+            ranked = sorted(zip(scored, mentioned),
+                            key=lambda item: item[0][1] * (CHARACTER_BOOST if item[1] else 1.0))
+            return [document for (document, _), _ in ranked[:k]]
 
-            Question: {question}
+        docs = vector_store.similarity_search_by_vector(query_vector, k=k, character=character_name)
+        if len(docs) < k:
+            seen = {document.metadata["chunk_id"] for document in docs}
+            docs += [document for document in vector_store.similarity_search_by_vector(query_vector, k=2 * k)
+                     if document.metadata["chunk_id"] not in seen][:k - len(docs)]
+        return docs
 
-            Name:
+    def _finish_turn(self, prompt, response_text, character_name, user_id, turn):
+        """
+        Updates emotions and persists the turn for logged-in users
+        
+        Returns:
+            CharacterState: Updated emotional state
         """
-        response = self.name_extraction_model.invoke(prompt)
+        character_id = turn["character_id"]
 
-        name = response.content.strip().strip(" .")
-        return name if name != 'None' else None
+        # Update character's emotional state
+        updated_state = self.character_manager.simulate_emotions(
+            prompt, 
+            character_name, 
+            turn["character_state"], 
+            self.book_source, 
+            user_id
+        )
+        
+        # Persist data only for authenticated users (simulate_emotions already saved the state)
+        if user_id != "anonymous":
+            if character_id is None:
+                # First turn with this character: it is stored now, not when it was first shown
+                character_id = self.db.ensure_character(character_name, self.book_source)
+            with telemetry.span("chat.save_messages"):
+                user_message_id, assistant_message_id = self.db.save_turn(
+                    character_id, user_id, [("user", prompt), ("assistant", response_text)]
+                )
+            with telemetry.span("chat.index_messages"):
+                self.vector_memory.add_messages(
+                    character_id,
+                    user_id,
+                    [(user_message_id, prompt), (assistant_message_id, response_text)]
+                )
+            self.memory.record_turn(character_id, user_id, len(turn["recent_messages"]))
+
+        return updated_state
 
-    def display_chat_history(self, character_name, user_id):
+    def get_chat_history(self, character_name, user_id):
         """
-        Renders conversation history in Streamlit UI
-        Skips rendering for anonymous users
+        Returns saved conversation history (empty for anonymous users)
         
         Args:
             character_name (str): Character being conversed with
             user_id (str): User identifier
+            
+        Returns:
+            list: Message dicts (role, content, timestamp)
         """
         if user_id == "anonymous":
-            return
+            return []
 
-        character_state, character_id = self.character_manager.db.get_character_state(
+        character_state, character_id = self.db.get_character_state(
             character_name, 
             self.book_source, 
             user_id
         )
-        history = self.character_manager.db.get_conversation_history(character_id, user_id)
-
-        # Format and display each message
-        for message in history:
-            timestamp = message.get("timestamp", "").strftime("%H:%M") if message.get("timestamp") else ""
-            if message["role"].lower() == "user":
-                st.markdown(f'''
-                    <div class="user">
-                        <strong>👤 You:</strong> {message["content"]}
-                        <div class="timestamp">{timestamp}</div>
-                    </div>
-                ''', unsafe_allow_html=True)
-            else:
-                st.markdown(f'''
-                    <div class="bot">
-                        <strong>🤖 {character_name}:</strong> {message["content"]}
-                        <div class="timestamp">{timestamp}</div>
-                    </div>
-                ''', unsafe_allow_html=True)
\ No newline at end of file
+        if character_id is None:
+            return []
+        return self.db.get_conversation_history(character_id, user_id)
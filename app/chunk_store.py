@@ -0,0 +1,133 @@
+import mmap
+import os
+import zlib
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:  # Optional dependency; zlib is always available
+    zstandard = None
+
+CHUNKS_FILE = "chunks.bin"   # Independently compressed chunk frames, concatenated
+ENTRIES_FILE = "chunks.idx"  # One ENTRY_DTYPE row per chunk plus an end sentinel (.npy)
+
+# Per-chunk entry: byte offset of its frame, index into the source list, page number (0 = unknown)
+ENTRY_DTYPE = np.dtype([("offset", "<u8"), ("source", "<u4"), ("page", "<u4")])
+
+# Compression level per codec (zstd 3 and zlib 6 are each library's default)
+COMPRESSION_LEVELS = {"zstd": 3, "zlib": 6}
+
+def default_codec():
+    """zstd when the zstandard package is installed, zlib otherwise"""
+    return "zstd" if zstandard is not None else "zlib"
+
+def _compressor(codec):
+    """Function compressing one chunk into a standalone frame"""
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=COMPRESSION_LEVELS["zstd"]).compress
+    return lambda data: zlib.compress(data, COMPRESSION_LEVELS["zlib"])
+
+def _decompress(codec, frame):
+    if codec == "zstd":
+        return zstandard.decompress(frame)
+    return zlib.decompress(frame)
+
+def write_atomic(path, write):
+    """Writes a file through a temporary sibling so readers never see a partial file"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+class ChunkStore:
+    """
+    Read-only, compressed chunk texts with random access by vector id:
+    - Every chunk is its own zstd (or zlib) frame, so a lookup only
+      decompresses the chunks it returns
+    - A fixed-width entry table gives each chunk's offset, source file and page
+    - Both files are memory-mapped: opening the store reads nothing up front
+      and processes serving the same book share the pages
+
+    Contains only bytes and plain numbers, so loading an untrusted store
+    cannot execute code (unlike a pickled docstore).
+    """
+
+    def __init__(self, index_dir, codec, sources):
+        """
+        Args:
+            index_dir (str): Directory written by ChunkStore.write
+            codec (str): Codec the chunks were written with ("zstd" or "zlib")
+            sources (List[str]): Source names referenced by the entry table
+        """
+        if codec == "zstd" and zstandard is None:
+            raise RuntimeError("This index is zstd-compressed; install the zstandard package to read it")
+        if codec not in COMPRESSION_LEVELS:
+            raise ValueError(f"Unknown chunk codec: {codec}")
+        self.codec = codec
+        self.sources = sources
+        self.entries = np.load(os.path.join(index_dir, ENTRIES_FILE), mmap_mode="r")
+        if self.entries.dtype != ENTRY_DTYPE:
+            raise ValueError(f"Unsupported chunk table in {index_dir}")
+        with open(os.path.join(index_dir, CHUNKS_FILE), "rb") as f:
+            # mmap cannot map an empty file
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+
+    @staticmethod
+    def write(index_dir, texts, metadatas=None, codec=None):
+        """
+        Compresses and persists chunk texts in id order
+
+        Args:
+            index_dir (str): Target directory
+            texts (List[str]): Chunk texts; position = vector id
+            metadatas (List[dict]): Optional {"source": str, "page": int} per chunk
+            codec (str): "zstd" or "zlib" (default: zstd if available)
+
+        Returns:
+            dict: codec, sources and raw/stored byte counts, recorded by the caller
+        """
+        codec = codec or default_codec()
+        compress = _compressor(codec)
+        metadatas = metadatas or [{}] * len(texts)
+        sources, source_ids = [], {}
+        entries = np.zeros(len(texts) + 1, dtype=ENTRY_DTYPE)
+        frames, offset, raw_bytes = [], 0, 0
+        for i, (text, metadata) in enumerate(zip(texts, metadatas)):
+            data = text.encode("utf-8")
+            frame = compress(data)
+            source = metadata.get("source") or ""
+            if source not in source_ids:
+                source_ids[source] = len(sources)
+                sources.append(source)
+            entries[i] = (offset, source_ids[source], metadata.get("page") or 0)
+            frames.append(frame)
+            offset += len(frame)
+            raw_bytes += len(data)
+        entries[len(texts)]["offset"] = offset
+
+        def write_frames(f):
+            for frame in frames:
+                f.write(frame)
+
+        write_atomic(os.path.join(index_dir, CHUNKS_FILE), write_frames)
+        write_atomic(os.path.join(index_dir, ENTRIES_FILE), lambda f: np.save(f, entries))
+        return {"codec": codec, "sources": sources, "raw_bytes": raw_bytes, "stored_bytes": offset}
+
+    def __len__(self):
+        return len(self.entries) - 1
+
+    def get(self, chunk_id):
+        """Text of one chunk"""
+        start, end = int(self.entries[chunk_id]["offset"]), int(self.entries[chunk_id + 1]["offset"])
+        return _decompress(self.codec, self._data[start:end]).decode("utf-8")
+
+    def metadata(self, chunk_id):
+        """
+        Origin of one chunk
+
+        Returns:
+            dict: chunk_id, source (file name or "") and page (1-based, None if unknown)
+        """
+        entry = self.entries[chunk_id]
+        return {"chunk_id": int(chunk_id), "source": self.sources[int(entry["source"])],
+                "page": int(entry["page"]) or None}
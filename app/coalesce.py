@@ -0,0 +1,152 @@
+"""
+SINGLE-FLIGHT REQUEST COALESCING
+Lets concurrent identical requests share one upstream call.
+
+The first caller for a key becomes the leader and does the work, publishing
+streamed chunks as they are produced. Callers arriving while it is in flight
+become followers: they replay the chunks published so far, then follow the
+live stream, and end with the leader's result or exception. A key is
+forgotten as soon as its flight completes, so results are shared only
+between requests that overlap in time (this is not a cache).
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+class FlightCancelled(Exception):
+    """Raised to followers when the leader stopped before producing a result"""
+
+class Flight:
+    """One in-flight call and everything it has produced so far"""
+
+    def __init__(self, key=None, group=None):
+        self.key = key
+        self.chunks = []
+        self.done = False
+        self.result = None
+        self.error = None
+        self.followers = 0
+        self._group = group
+        self._cond = threading.Condition()
+
+    def publish(self, chunk):
+        """Makes a streamed chunk visible to followers"""
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self, result):
+        """Completes the flight with the leader's result"""
+        with self._cond:
+            self.result = result
+            self.done = True
+            self._cond.notify_all()
+
+    def fail(self, error):
+        """Completes the flight with an exception re-raised in every follower"""
+        if not isinstance(error, Exception):  # GeneratorExit, KeyboardInterrupt, ...
+            error = FlightCancelled(f"Shared request was cancelled ({type(error).__name__})")
+        with self._cond:
+            self.error = error
+            self.done = True
+            self._cond.notify_all()
+
+    @contextmanager
+    def lead(self):
+        """
+        Wraps the leader's work: an exception fails the flight, and the key
+        is released when the block exits. The block must call finish().
+        """
+        try:
+            yield self
+        except BaseException as e:
+            self.fail(e)
+            raise
+        finally:
+            if not self.done:
+                self.fail(FlightCancelled("Shared request ended without a result"))
+            if self._group is not None:
+                self._group.forget(self)
+
+    def stream(self, timeout):
+        """
+        Follows the flight from its first chunk (run by followers)
+
+        Args:
+            timeout (float): Max seconds to wait for the next chunk or the result
+
+        Yields:
+            Chunks published by the leader, in order
+
+        Returns:
+            The leader's result (as the generator's return value)
+
+        Raises:
+            Exception: The leader's exception, or TimeoutError
+        """
+        position = 0
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + timeout
+                while position == len(self.chunks) and not self.done:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError("Timed out waiting for a shared request")
+                    self._cond.wait(remaining)
+                pending = self.chunks[position:]
+                done = self.done
+            # Chunks are yielded outside the lock so a slow consumer never blocks the leader
+            for chunk in pending:
+                yield chunk
+            position += len(pending)
+            if done and position == len(self.chunks):
+                if self.error is not None:
+                    raise self.error
+                return self.result
+
+    def wait(self, timeout):
+        """Blocks until the flight completes and returns its result (run by followers)"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.done, timeout):
+                raise TimeoutError("Timed out waiting for a shared request")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+class SingleFlight:
+    """Registry of in-flight calls by key, shared by every thread in the process"""
+
+    def __init__(self):
+        self._flights = {}  # key -> Flight
+        self._lock = threading.Lock()
+
+    def join(self, key):
+        """
+        Joins the flight for a key, starting one if none is in flight
+
+        Args:
+            key (Hashable): Request identity, or None to never coalesce
+
+        Returns:
+            Tuple[Flight, bool]: The flight, and whether the caller leads it
+        """
+        if key is None:
+            return Flight(), True
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.followers += 1
+                return flight, False
+            flight = self._flights[key] = Flight(key, self)
+            return flight, True
+
+    def forget(self, flight):
+        """Removes a completed flight so later requests start a new one"""
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._flights)
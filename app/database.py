@@ -1,258 +1,972 @@
 import psycopg2
+import psycopg2.extensions
 from psycopg2 import sql
-from psycopg2.extras import execute_values
+from psycopg2.extras import Json, execute_values
+import logging
 import os
+import threading
+import time
+from datetime import date
 from dotenv import load_dotenv
-import streamlit as st
+import telemetry
 from character_state import CharacterState
+from message_archive import COLUMNS, MessageArchive, add_months, as_message
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Database access layer: "psycopg2" (blocking, one shared connection) or "async"
+# (psycopg 3 connection pool with pipelining, see async_database)
+DB_BACKEND = os.getenv("DB_BACKEND", "psycopg2")
+
+# Number of hash partitions for per-user character state (fixed when the table is first created)
+STATE_SHARDS = int(os.getenv("STATE_SHARDS", "8"))
+
+# Monthly message partitions created ahead of the current month (see ensure_message_partitions)
+MESSAGE_PARTITIONS_AHEAD = int(os.getenv("MESSAGE_PARTITIONS_AHEAD", "2"))
+# Partition DDL waits at most this long for locks held by other sessions instead of
+# queueing every message query behind it; it is simply retried on the next run
+PARTITION_LOCK_TIMEOUT = os.getenv("PARTITION_LOCK_TIMEOUT", "5s")
+
+def message_partition_name(month):
+    """Table name of the messages partition of a month, e.g. messages_2024_05"""
+    return f"messages_{month:%Y_%m}"
+
+# ======================
+# SHARED SQL
+# ======================
+# Statements run by both DatabaseManager and async_database.AsyncDatabaseManager
+# (psycopg2 and psycopg 3 share the %s / %(name)s parameter style), so the two
+# backends can't drift apart
+
+INSERT_CHARACTER_SQL = """
+    INSERT INTO characters (name, source) VALUES (%s, %s)
+    ON CONFLICT (name, source) DO NOTHING
+    RETURNING character_id
+"""
+SELECT_CHARACTER_ID_SQL = "SELECT character_id FROM characters WHERE name = %s AND source = %s"
+
+# First write of a user's state copies the baseline into their own row
+INSERT_USER_STATE_SQL = """
+    INSERT INTO character_user_states (character_id, user_id, state, version)
+    VALUES (%s, %s, %s, 1)
+    ON CONFLICT (user_id, character_id) DO NOTHING
+"""
+UPDATE_USER_STATE_SQL = """
+    UPDATE character_user_states
+    SET state = %s, version = version + 1, updated_at = CURRENT_TIMESTAMP
+    WHERE user_id = %s AND character_id = %s AND version = %s
+"""
+# Per-user row if it exists, otherwise the shared baseline (see state_from_row)
+SELECT_CHARACTER_STATE_SQL = """
+    SELECT c.character_id, c.arousal, c.valence, c.dominance, c.sadness, c.anger, c.joy, c.fear,
+           c.selection_threshold, c.resolution_level, c.goal_directedness, c.securing_rate,
+           s.state, s.version
+    FROM characters c
+    LEFT JOIN character_user_states s
+        ON s.user_id = %s AND s.character_id = c.character_id
+    WHERE c.name = %s AND c.source = %s
+"""
+
+INSERT_CONVERSATION_SQL = """
+    INSERT INTO conversations (character_id, user_id) VALUES (%s, %s)
+    RETURNING conversation_id
+"""
+INSERT_MESSAGE_SQL = """
+    INSERT INTO messages (conversation_id, role, content) VALUES (%s, %s, %s)
+    RETURNING message_id
+"""
+ARCHIVED_RANGE_SQL = """
+    SELECT min(first_timestamp), max(last_timestamp), max(last_message_id)
+    FROM message_archive_index
+    WHERE character_id = %s AND (%s::text IS NULL OR user_id = %s)
+"""
+# The user's conversation ids first, then one index probe per partition
+# (as a join, the planner tends to hash-join against full partition scans)
+CONVERSATION_HISTORY_SQL = """
+    SELECT m.message_id, m.role, m.content, m.timestamp
+    FROM messages m
+    WHERE m.conversation_id = ANY(ARRAY(
+        SELECT conversation_id FROM conversations
+        WHERE character_id = %(character_id)s AND (%(user_id)s::text IS NULL OR user_id = %(user_id)s)))
+      AND (%(before)s::timestamp IS NULL OR m.timestamp < %(before)s)
+    ORDER BY m.timestamp DESC, m.message_id DESC
+    LIMIT %(limit)s
+"""
+# Sorted towards the end LIMIT keeps: {order} is ASC to page forward, DESC for the most recent
+MESSAGES_AFTER_SQL = """
+    SELECT m.message_id, m.role, m.content, m.timestamp
+    FROM messages m
+    WHERE m.conversation_id = ANY(ARRAY(
+        SELECT conversation_id FROM conversations WHERE character_id = %s AND user_id = %s))
+      AND m.message_id > %s
+    ORDER BY m.message_id {order}
+    LIMIT %s
+"""
+MESSAGES_BY_IDS_SQL = "SELECT message_id, role, content, timestamp FROM messages WHERE message_id = ANY(%s)"
+
+UPSERT_MEMORY_SQL = """
+    INSERT INTO long_term_memory (character_id, key, value) VALUES (%s, %s, %s)
+    ON CONFLICT (character_id, key) DO UPDATE
+    SET value = EXCLUDED.value, timestamp = CURRENT_TIMESTAMP
+"""
+SELECT_MEMORY_SQL = "SELECT value FROM long_term_memory WHERE character_id = %s AND key = %s"
+
+UPSERT_BOOK_SQL = """
+    INSERT INTO books (book_source, content_hash, index_dir, characters, metadata)
+    VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT (book_source) DO UPDATE
+    SET content_hash = EXCLUDED.content_hash, index_dir = EXCLUDED.index_dir,
+        characters = EXCLUDED.characters, metadata = EXCLUDED.metadata,
+        ingested_at = CURRENT_TIMESTAMP
+"""
+SELECT_BOOK_SQL = """
+    SELECT book_source, content_hash, index_dir, characters, metadata, ingested_at
+    FROM books WHERE book_source = %s
+"""
+LIST_BOOKS_SQL = "SELECT book_source, characters, ingested_at FROM books ORDER BY book_source"
+
+# Every field averaged per time bucket in the database
+EMOTION_TRAJECTORY_SQL = """
+    SELECT bucket, count, array_agg(value ORDER BY field)
+    FROM (
+        SELECT to_timestamp(floor(extract(epoch FROM h.recorded_at) / %(width)s) * %(width)s)
+                   AT TIME ZONE 'UTC' AS bucket,
+               s.field, avg(s.value) AS value, count(*) AS count
+        FROM emotion_history h, unnest(h.state) WITH ORDINALITY AS s(value, field)
+        WHERE h.character_id = %(character_id)s AND h.user_id = %(user_id)s
+          AND (%(since)s::timestamp IS NULL OR h.recorded_at >= %(since)s)
+          AND (%(until)s::timestamp IS NULL OR h.recorded_at < %(until)s)
+        GROUP BY bucket, s.field
+    ) fields
+    GROUP BY bucket, count
+    ORDER BY bucket
+"""
+EMOTION_SAMPLES_SQL = """
+    SELECT h.character_id, extract(epoch FROM h.recorded_at), h.state
+    FROM emotion_history h JOIN characters c ON c.character_id = h.character_id
+    WHERE (%(book_source)s::text IS NULL OR c.source = %(book_source)s)
+      AND (%(since)s::timestamp IS NULL OR h.recorded_at >= %(since)s)
+"""
+
+def state_from_row(row):
+    """(CharacterState, character_id) from a SELECT_CHARACTER_STATE_SQL row, (None, None) if there is none"""
+    if row is None:
+        return None, None
+    if row[12] is not None:
+        return CharacterState.from_vector(row[12], version=row[13]), row[0]
+    return CharacterState.from_vector(row[1:12]), row[0]
+
+def message_from_row(row):
+    """Message dict from a (message_id, role, content, timestamp) row"""
+    return {"message_id": row[0], "role": row[1], "content": row[2], "timestamp": row[3]}
+
+def book_from_row(row):
+    """Catalog entry from a SELECT_BOOK_SQL row, None if there is none"""
+    if row is None:
+        return None
+    return {"book_source": row[0], "content_hash": row[1], "index_dir": row[2],
+            "characters": row[3], "metadata": row[4], "ingested_at": row[5]}
+
+def trajectory_from_rows(rows):
+    """Trajectory points from EMOTION_TRAJECTORY_SQL rows"""
+    return [{"time": row[0], "samples": row[1], "state": row[2]} for row in rows]
+
+def emotion_sample_batch(rows):
+    """(character ids, POSIX timestamps, states) arrays of one batch of EMOTION_SAMPLES_SQL rows"""
+    import numpy as np
+
+    return (np.fromiter((row[0] for row in rows), dtype="int32", count=len(rows)),
+            np.fromiter((row[1] for row in rows), dtype="float64", count=len(rows)),
+            np.array([row[2] for row in rows], dtype="float32"))
+
+def join_emotion_samples(batches):
+    """Concatenates emotion_sample_batch results (empty arrays for no batches)"""
+    import numpy as np
+
+    if not batches:
+        return np.empty(0, dtype="int32"), np.empty(0), np.empty((0, len(CharacterState.FIELDS)), dtype="float32")
+    return tuple(np.concatenate(column) for column in zip(*batches))
+
+class StaleStateError(Exception):
+    """Raised when a character state was changed by someone else since it was read"""
+
+class _InstrumentedCursor(psycopg2.extensions.cursor):
+    """Cursor that reports query counts and time to telemetry"""
+
+    def execute(self, query, vars=None):
+        if not telemetry.is_enabled():
+            return super().execute(query, vars)
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            telemetry.count("db.queries")
+            telemetry.observe("db.query", time.perf_counter() - start)
+
+class _InstrumentedConnection(psycopg2.extensions.connection):
+    """Connection that hands out instrumented cursors and counts commits"""
+
+    def cursor(self, *args, **kwargs):
+        kwargs.setdefault("cursor_factory", _InstrumentedCursor)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self):
+        telemetry.count("db.commits")
+        return super().commit()
+
 class DatabaseManager:
     def __init__(self):
         self.conn = None
+        # One connection is shared by every session/request thread in the process;
+        # the lock keeps their transactions from interleaving on it.
+        self.lock = threading.RLock()
+        self.archive = MessageArchive()
+        self._partitioned_month = None  # Local month whose partitions were last ensured
         self.connect()
         self.initialize_database()
+        self._check_message_partitions()
 
     def connect(self):
-        try:
-            self.conn = psycopg2.connect(
-                dbname=os.getenv("DB_NAME", "chatbot_db"),
-                user=os.getenv("DB_USER", "postgres"),
-                password=os.getenv("DB_PASSWORD", "postgres"),
-                host=os.getenv("DB_HOST"),
-                port=os.getenv("DB_PORT")
-            )
-        except Exception as e:
-            st.error(f"Database connection failed: {e}")
-            raise
+        with self.lock:
+            try:
+                self.conn = psycopg2.connect(
+                    dbname=os.getenv("DB_NAME", "chatbot_db"),
+                    user=os.getenv("DB_USER", "postgres"),
+                    password=os.getenv("DB_PASSWORD", "postgres"),
+                    host=os.getenv("DB_HOST"),
+                    port=os.getenv("DB_PORT"),
+                    connection_factory=_InstrumentedConnection
+                )
+            except Exception as e:
+                logger.error(f"Database connection failed: {e}")
+                raise
+
+    def _end_read(self):
+        """
+        Ends the transaction a read opened. psycopg2 opens one on the first
+        query, and left idle it keeps AccessShareLock on every table it read,
+        which blocks partition DETACH/ATTACH (see drop_message_partition).
+        """
+        self.conn.rollback()
 
     def initialize_database(self):
-        try:
-            with self.conn.cursor() as cur:
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS characters (
-                        character_id SERIAL PRIMARY KEY,
-                        name TEXT NOT NULL,
-                        source TEXT NOT NULL,
-                        arousal FLOAT DEFAULT 0.5,
-                        valence FLOAT DEFAULT 0.5,
-                        dominance FLOAT DEFAULT 0.5,
-                        sadness FLOAT DEFAULT 0.0,
-                        anger FLOAT DEFAULT 0.0,
-                        joy FLOAT DEFAULT 0.0,
-                        fear FLOAT DEFAULT 0.0,
-                        selection_threshold FLOAT DEFAULT 0.5,
-                        resolution_level FLOAT DEFAULT 0.5,
-                        goal_directedness FLOAT DEFAULT 0.5,
-                        securing_rate FLOAT DEFAULT 0.5,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        UNIQUE (name, source)
-                    )
-                """)
-
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS conversations (
-                        conversation_id SERIAL PRIMARY KEY,
-                        character_id INTEGER REFERENCES characters(character_id),
-                        user_id TEXT NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS messages (
-                        message_id SERIAL PRIMARY KEY,
-                        conversation_id INTEGER REFERENCES conversations(conversation_id),
-                        role TEXT NOT NULL,
-                        content TEXT NOT NULL,
-                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS long_term_memory (
-                        memory_id SERIAL PRIMARY KEY,
-                        character_id INTEGER REFERENCES characters(character_id),
-                        key TEXT NOT NULL,
-                        value TEXT NOT NULL,
-                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        UNIQUE (character_id, key)
-                    )
-                """)
+        with self.lock:
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute("""
+                        CREATE TABLE IF NOT EXISTS characters (
+                            character_id SERIAL PRIMARY KEY,
+                            name TEXT NOT NULL,
+                            source TEXT NOT NULL,
+                            arousal FLOAT DEFAULT 0.5,
+                            valence FLOAT DEFAULT 0.5,
+                            dominance FLOAT DEFAULT 0.5,
+                            sadness FLOAT DEFAULT 0.0,
+                            anger FLOAT DEFAULT 0.0,
+                            joy FLOAT DEFAULT 0.0,
+                            fear FLOAT DEFAULT 0.0,
+                            selection_threshold FLOAT DEFAULT 0.5,
+                            resolution_level FLOAT DEFAULT 0.5,
+                            goal_directedness FLOAT DEFAULT 0.5,
+                            securing_rate FLOAT DEFAULT 0.5,
+                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                            UNIQUE (name, source)
+                        )
+                    """)
 
-                self.conn.commit()
-        except Exception as e:
-            self.conn.rollback()
-            st.error(f"Database initialization failed: {e}")
-            raise
+                    cur.execute("""
+                        CREATE TABLE IF NOT EXISTS conversations (
+                            conversation_id SERIAL PRIMARY KEY,
+                            character_id INTEGER REFERENCES characters(character_id),
+                            user_id TEXT NOT NULL,
+                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        )
+                    """)
 
-    def save_character_state(self, character_name, character_state, book_source, user_id):
-        try:
-            with self.conn.cursor() as cur:
-                cur.execute("""
-                    SELECT character_id FROM characters WHERE name = %s AND source = %s
-                """, (character_name, book_source)) # removed user_id from where clause
-                character_id_result = cur.fetchone()
-
-                if character_id_result:
-                    character_id = character_id_result[0]
                     cur.execute("""
-                        UPDATE characters SET arousal = %s, valence = %s, dominance = %s, sadness = %s, anger = %s, joy = %s, fear = %s, selection_threshold = %s, resolution_level = %s, goal_directedness = %s, securing_rate = %s WHERE character_id = %s
-                    """, (character_state.arousal, character_state.valence, character_state.dominance,
-                          character_state.sadness, character_state.anger, character_state.joy, character_state.fear,
-                          character_state.selection_threshold, character_state.resolution_level,
-                          character_state.goal_directedness, character_state.securing_rate, character_id))
-                else:
+                        CREATE INDEX IF NOT EXISTS conversations_user ON conversations (character_id, user_id)
+                    """)
+
+                    # Messages are range-partitioned by month on timestamp: queries only scan the
+                    # months still in the database, and old months are archived by dropping whole
+                    # partitions (see message_archive). An unpartitioned table from an older
+                    # version is migrated.
+                    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('messages')")
+                    existing = cur.fetchone()
+                    if existing is None or existing[0] != "p":
+                        self._create_partitioned_messages(cur, migrate=existing is not None)
+
+                    # Per character and user: what the archive holds, so history reads only
+                    # open archive files for users who actually have archived messages
                     cur.execute("""
-                        INSERT INTO characters (name, source) VALUES (%s, %s) RETURNING character_id
-                    """, (character_name, book_source)) # removed user_id from insert
-                    character_id = cur.fetchone()[0]
+                        CREATE TABLE IF NOT EXISTS message_archive_index (
+                            character_id INTEGER NOT NULL,
+                            user_id TEXT NOT NULL,
+                            messages INTEGER NOT NULL,
+                            first_timestamp TIMESTAMP NOT NULL,
+                            last_timestamp TIMESTAMP NOT NULL,
+                            last_message_id BIGINT NOT NULL,
+                            PRIMARY KEY (character_id, user_id)
+                        )
+                    """)
+
                     cur.execute("""
-                        UPDATE characters SET arousal = %s, valence = %s, dominance = %s, sadness = %s, anger = %s, joy = %s, fear = %s, selection_threshold = %s, resolution_level = %s, goal_directedness = %s, securing_rate = %s WHERE character_id = %s
-                    """, (character_state.arousal, character_state.valence, character_state.dominance,
-                          character_state.sadness, character_state.anger, character_state.joy, character_state.fear,
-                          character_state.selection_threshold, character_state.resolution_level,
-                          character_state.goal_directedness, character_state.securing_rate, character_id))
+                        CREATE TABLE IF NOT EXISTS long_term_memory (
+                            memory_id SERIAL PRIMARY KEY,
+                            character_id INTEGER REFERENCES characters(character_id),
+                            key TEXT NOT NULL,
+                            value TEXT NOT NULL,
+                            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                            UNIQUE (character_id, key)
+                        )
+                    """)
 
-                self.conn.commit()
-                return character_id
-        except Exception as e:
-            self.conn.rollback()
-            st.error(f"Failed to save character state: {e}")
-            raise
+                    # Catalog of ingested books, so reopening a book needs no re-ingestion
+                    cur.execute("""
+                        CREATE TABLE IF NOT EXISTS books (
+                            book_source TEXT PRIMARY KEY,
+                            content_hash TEXT NOT NULL,
+                            index_dir TEXT NOT NULL,
+                            characters TEXT[] NOT NULL,
+                            metadata JSONB NOT NULL DEFAULT '{}',
+                            ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        )
+                    """)
 
-    def get_character_state(self, character_name, book_source, user_id):
+                    # Append-only emotion time series: one row per turn, state as REAL[] in
+                    # CharacterState.FIELDS order. No primary key keeps rows and inserts small;
+                    # the BRIN index serves fleet-wide time-range scans at almost no size.
+                    cur.execute("""
+                        CREATE TABLE IF NOT EXISTS emotion_history (
+                            character_id INTEGER NOT NULL REFERENCES characters(character_id),
+                            user_id TEXT NOT NULL,
+                            recorded_at TIMESTAMP NOT NULL,
+                            state REAL[] NOT NULL
+                        )
+                    """)
+                    cur.execute("""
+                        CREATE INDEX IF NOT EXISTS emotion_history_trajectory
+                        ON emotion_history (character_id, user_id, recorded_at)
+                    """)
+                    cur.execute("""
+                        CREATE INDEX IF NOT EXISTS emotion_history_recorded_at
+                        ON emotion_history USING BRIN (recorded_at)
+                    """)
+
+                    # Per-user character state: the characters row is the shared baseline and a
+                    # user's row is only written on their first change (copy-on-first-write).
+                    # State is a compact REAL[] in CharacterState.FIELDS order; the table is
+                    # hash-partitioned by user so hot characters don't funnel into one heap/index.
+                    cur.execute("SELECT to_regclass('character_user_states')")
+                    if cur.fetchone()[0] is None:
+                        cur.execute("""
+                            CREATE TABLE character_user_states (
+                                character_id INTEGER NOT NULL REFERENCES characters(character_id),
+                                user_id TEXT NOT NULL,
+                                state REAL[] NOT NULL,
+                                version INTEGER NOT NULL DEFAULT 1,
+                                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                                PRIMARY KEY (user_id, character_id)
+                            ) PARTITION BY HASH (user_id)
+                        """)
+                        for remainder in range(STATE_SHARDS):
+                            cur.execute(sql.SQL("""
+                                CREATE TABLE {} PARTITION OF character_user_states
+                                FOR VALUES WITH (MODULUS %s, REMAINDER %s)
+                            """).format(sql.Identifier(f"character_user_states_p{remainder}")),
+                                (STATE_SHARDS, remainder))
+
+                    self.conn.commit()
+            except Exception as e:
+                self.conn.rollback()
+                logger.error(f"Database initialization failed: {e}")
+                raise
+
+    # ======================
+    # MESSAGE PARTITIONS
+    # ======================
+
+    def _create_partitioned_messages(self, cur, migrate):
+        """
+        Creates the partitioned messages table. With migrate, the existing
+        unpartitioned table is copied into it (ids kept) and dropped.
+        """
+        if migrate:
+            cur.execute("ALTER TABLE messages RENAME TO messages_unpartitioned")
+            cur.execute("ALTER INDEX messages_pkey RENAME TO messages_unpartitioned_pkey")
+            cur.execute("ALTER TABLE messages_unpartitioned ALTER COLUMN message_id DROP DEFAULT")
+            cur.execute("ALTER SEQUENCE messages_message_id_seq OWNED BY NONE")
+            cur.execute("ALTER SEQUENCE messages_message_id_seq AS BIGINT")
+        else:
+            cur.execute("CREATE SEQUENCE messages_message_id_seq")
+
+        # The primary key has to include the partition key
+        cur.execute("""
+            CREATE TABLE messages (
+                message_id BIGINT NOT NULL DEFAULT nextval('messages_message_id_seq'),
+                conversation_id INTEGER REFERENCES conversations(conversation_id),
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (message_id, timestamp)
+            ) PARTITION BY RANGE (timestamp)
+        """)
+        cur.execute("ALTER SEQUENCE messages_message_id_seq OWNED BY messages.message_id")
+        cur.execute("CREATE INDEX messages_conversation ON messages (conversation_id, message_id)")
+        # Catches rows outside every month created so far, so an insert never fails
+        cur.execute("CREATE TABLE messages_default PARTITION OF messages DEFAULT")
+
+        if migrate:
+            cur.execute("""
+                SELECT date_trunc('month', min(timestamp))::date, max(timestamp)::date FROM messages_unpartitioned
+            """)
+            month, last = cur.fetchone()
+            while month is not None and month <= last:
+                self._create_message_partition(cur, month)
+                month = add_months(month, 1)
+            cur.execute("""
+                INSERT INTO messages (message_id, conversation_id, role, content, timestamp)
+                SELECT message_id, conversation_id, role, content, COALESCE(timestamp, LOCALTIMESTAMP)
+                FROM messages_unpartitioned
+            """)
+            logger.info(f"Moved {cur.rowcount} messages into the partitioned messages table")
+            cur.execute("DROP TABLE messages_unpartitioned")
+
+    def _create_message_partition(self, cur, month):
+        """Creates the partition of a month unless it exists, moving in rows the default partition caught for it"""
+        name = message_partition_name(month)
+        cur.execute("SELECT to_regclass(%s)", (name,))
+        if cur.fetchone()[0] is not None:
+            return
+        table, start, end = sql.Identifier(name), month, add_months(month, 1)
+        cur.execute(sql.SQL("CREATE TABLE {} (LIKE messages INCLUDING DEFAULTS)").format(table))
+        cur.execute(sql.SQL("""
+            WITH moved AS (DELETE FROM messages_default WHERE timestamp >= %s AND timestamp < %s RETURNING *)
+            INSERT INTO {} SELECT * FROM moved
+        """).format(table), (start, end))
+        cur.execute(sql.SQL("ALTER TABLE messages ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s)").format(table),
+                    (start, end))
+
+    def ensure_message_partitions(self, months_ahead=MESSAGE_PARTITIONS_AHEAD):
+        """
+        Creates the message partitions of the current month, the next
+        months_ahead months and any month the default partition caught rows
+        of (existing ones are kept)
+
+        Returns:
+            date: First day of the current month by the database clock
+        """
+        with self.lock:
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute("SET LOCAL lock_timeout = %s", (PARTITION_LOCK_TIMEOUT,))
+                    cur.execute("SELECT date_trunc('month', LOCALTIMESTAMP)::date")
+                    current_month = cur.fetchone()[0]
+                    cur.execute("SELECT DISTINCT date_trunc('month', timestamp)::date FROM messages_default")
+                    months = {row[0] for row in cur.fetchall()}
+                    months.update(add_months(current_month, offset) for offset in range(months_ahead + 1))
+                    for month in sorted(months):
+                        self._create_message_partition(cur, month)
+                    self.conn.commit()
+                    self._partitioned_month = date.today().replace(day=1)
+                    return current_month
+            except Exception as e:
+                self.conn.rollback()
+                logger.error(f"Failed to create message partitions: {e}")
+                raise
+
+    def _check_message_partitions(self):
+        """Creates the upcoming partitions once a new month has started (one attempt per month)"""
+        if self._partitioned_month == date.today().replace(day=1):
+            return
         try:
-            with self.conn.cursor() as cur:
-                cur.execute("""
-                    SELECT character_id, arousal, valence, dominance, sadness, anger, joy, fear, selection_threshold, resolution_level, goal_directedness, securing_rate FROM characters WHERE name = %s AND source = %s
-                """, (character_name, book_source)) # removed user_id from where clause
-                result = cur.fetchone()
-
-                if result:
-                    character_state = CharacterState(
-                        arousal=result[1], valence=result[2], dominance=result[3],
-                        sadness=result[4], anger=result[5], joy=result[6], fear=result[7],
-                        selection_threshold=result[8], resolution_level=result[9],
-                        goal_directedness=result[10], securing_rate=result[11]
-                    )
-                    return character_state, result[0]
-                else:
-                    return None, None
+            self.ensure_message_partitions()
         except Exception as e:
-            st.error(f"Failed to get character state: {e}")
-            raise
+            # Not fatal: the default partition takes the rows, and the archival job retries
+            logger.warning(f"Message partitions not created (the archival job retries): {e}")
+            self._partitioned_month = date.today().replace(day=1)
+
+    def list_message_partitions(self):
+        """
+        Returns:
+            list: (name, first day, first day of the next month) of every monthly
+                  messages partition in the database, oldest first
+        """
+        with self.lock:
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute(r"""
+                        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                        WHERE i.inhparent = 'messages'::regclass AND c.relname ~ '^messages_\d{4}_\d{2}$'
+                        ORDER BY c.relname
+                    """)
+                    months = [date(int(name[9:13]), int(name[14:16]), 1) for (name,) in cur.fetchall()]
+                    return [(message_partition_name(month), month, add_months(month, 1)) for month in months]
+            except Exception as e:
+                logger.error(f"Failed to list message partitions: {e}")
+                raise
+            finally:
+                self._end_read()
+
+    def read_message_partition(self, name, batch_size=10000):
+        """
+        Loads one partition for archiving, with each message's character and
+        user, sorted by character, user and message id
+
+        Returns:
+            dict: message_archive.COLUMNS -> list of values
+        """
+        values = {column: [] for column in COLUMNS}
+        with self.lock:
+            try:
+                with self.conn.cursor(name="message_partition") as cur:
+                    cur.itersize = batch_size
+                    cur.execute(sql.SQL("""
+                        SELECT m.message_id, m.conversation_id, c.character_id, c.user_id, m.role, m.content, m.timestamp
+                        FROM {} m LEFT JOIN conversations c ON c.conversation_id = m.conversation_id
+                        ORDER BY c.character_id, c.user_id, m.message_id
+                    """).format(sql.Identifier(name)))
+                    while rows := cur.fetchmany(batch_size):
+                        for column, column_values in zip(COLUMNS, zip(*rows)):
+                            values[column].extend(column_values)
+                self.conn.commit()
+                return values
+            except Exception as e:
+                self.conn.rollback()
+                logger.error(f"Failed to read message partition {name}: {e}")
+                raise
+
+    def drop_message_partition(self, name):
+        """
+        Drops an archived partition in one transaction: records what it held
+        in message_archive_index, detaches and drops it, and deletes the
+        conversations left without messages
+        """
+        with self.lock:
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute("SET LOCAL lock_timeout = %s", (PARTITION_LOCK_TIMEOUT,))
+                    table = sql.Identifier(name)
+                    cur.execute(sql.SQL("""
+                        INSERT INTO message_archive_index AS a
+                            (character_id, user_id, messages, first_timestamp, last_timestamp, last_message_id)
+                        SELECT c.character_id, c.user_id, count(*), min(m.timestamp), max(m.timestamp), max(m.message_id)
+                        FROM {} m JOIN conversations c ON c.conversation_id = m.conversation_id
+                        GROUP BY c.character_id, c.user_id
+                        ON CONFLICT (character_id, user_id) DO UPDATE
+                        SET messages = a.messages + EXCLUDED.messages,
+                            first_timestamp = LEAST(a.first_timestamp, EXCLUDED.first_timestamp),
+                            last_timestamp = GREATEST(a.last_timestamp, EXCLUDED.last_timestamp),
+                            last_message_id = GREATEST(a.last_message_id, EXCLUDED.last_message_id)
+                    """).format(table))
+                    cur.execute(sql.SQL("SELECT max(timestamp) FROM {}").format(table))
+                    last_timestamp = cur.fetchone()[0]
+                    cur.execute(sql.SQL("ALTER TABLE messages DETACH PARTITION {}").format(table))
+                    cur.execute(sql.SQL("DROP TABLE {}").format(table))
+                    if last_timestamp is not None:
+                        cur.execute("""
+                            DELETE FROM conversations c
+                            WHERE c.created_at <= %s
+                              AND NOT EXISTS (SELECT 1 FROM messages m WHERE m.conversation_id = c.conversation_id)
+                        """, (last_timestamp,))
+                    self.conn.commit()
+            except Exception as e:
+                self.conn.rollback()
+                logger.error(f"Failed to drop message partition {name}: {e}")
+                raise
+
+    def _archived_range(self, cur, character_id, user_id):
+        """(first timestamp, last timestamp, last message id) of a character's (and user's) archived messages, or None"""
+        cur.execute(ARCHIVED_RANGE_SQL, (character_id, user_id, user_id))
+        row = cur.fetchone()
+        return row if row[0] is not None else None
+
+    def ensure_character(self, character_name, book_source):
+        with self.lock:
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute(INSERT_CHARACTER_SQL, (character_name, book_source))
+                    result = cur.fetchone()
+                    if result is None:
+                        cur.execute(SELECT_CHARACTER_ID_SQL, (character_name, book_source))
+                        result = cur.fetchone()
+                    self.conn.commit()
+                    return result[0]
+            except Exception as e:
+                self.conn.rollback()
+                logger.error(f"Failed to create character: {e}")
+                raise
+
+    def save_character_state(self, character_name, character_state, book_source, user_id):
+        """
+        Writes a user's state with optimistic concurrency. Anonymous users never
+        get a stored row; for them this only makes sure the character exists.
+
+        Raises:
+            StaleStateError: If the stored version no longer matches character_state.version
+        """
+        character_id = self.ensure_character(character_name, book_source)
+        if not user_id or user_id == "anonymous":
+            return character_id
+
+        with self.lock:
+            try:
+                with self.conn.cursor() as cur:
+                    if character_state.version == 0:
+                        cur.execute(INSERT_USER_STATE_SQL, (character_id, user_id, character_state.to_vector()))
+                    else:
+                        cur.execute(UPDATE_USER_STATE_SQL, (character_state.to_vector(), user_id, character_id,
+                                                            character_state.version))
+
+                    if cur.rowcount == 0:
+                        self.conn.rollback()
+                        raise StaleStateError(
+                            f"State of {character_name} for {user_id} changed since version {character_state.version}"
+                        )
+
+                    self.conn.commit()
+                    character_state.version += 1
+                    return character_id
+            except StaleStateError:
+                raise
+            except Exception as e:
+                self.conn.rollback()
+                logger.error(f"Failed to save character state: {e}")
+                raise
+
+    def get_character_state(self, character_name, book_source, user_id):
+        with self.lock:
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute(SELECT_CHARACTER_STATE_SQL, (user_id or "anonymous", character_name, book_source))
+                    return state_from_row(cur.fetchone())
+            except Exception as e:
+                logger.error(f"Failed to get character state: {e}")
+                raise
+            finally:
+                self._end_read()
 
     def create_conversation(self, character_id, user_id):
         if not user_id or user_id == "anonymous":
             return "anonymous"
 
-        try:
-            with self.conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO conversations (character_id, user_id)
-                    VALUES (%s, %s)
-                    RETURNING conversation_id
-                """, (character_id, user_id))
-                conversation_id = cur.fetchone()[0]
-                self.conn.commit()
-                return conversation_id
-        except Exception as e:
-            self.conn.rollback()
-            st.error(f"Failed to create conversation: {e}")
-            raise
+        with self.lock:
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute(INSERT_CONVERSATION_SQL, (character_id, user_id))
+                    conversation_id = cur.fetchone()[0]
+                    self.conn.commit()
+                    return conversation_id
+            except Exception as e:
+                self.conn.rollback()
+                logger.error(f"Failed to create conversation: {e}")
+                raise
 
     def save_message(self, conversation_id, role, content):
         if not conversation_id or conversation_id == "anonymous":
             return
 
-        try:
-            with self.conn.cursor() as cur:
-                normalized_role = role.lower()
-                cur.execute("""
-                    INSERT INTO messages (conversation_id, role, content)
-                    VALUES (%s, %s, %s)
-                """, (conversation_id, normalized_role, content))
-                self.conn.commit()
-        except Exception as e:
-            self.conn.rollback()
-            st.error(f"Failed to save message: {e}")
-            raise
+        self._check_message_partitions()
+        with self.lock:
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute(INSERT_MESSAGE_SQL, (conversation_id, role.lower(), content))
+                    message_id = cur.fetchone()[0]
+                    self.conn.commit()
+                    return message_id
+            except Exception as e:
+                self.conn.rollback()
+                logger.error(f"Failed to save message: {e}")
+                raise
 
-    def get_conversation_history(self, character_id, user_id=None, limit=20):
-        try:
-            with self.conn.cursor() as cur:
-                if user_id:
-                    cur.execute("""
-                        SELECT m.role, m.content, m.timestamp
-                        FROM messages m
-                        JOIN conversations c ON m.conversation_id = c.conversation_id
-                        WHERE c.character_id = %s AND c.user_id = %s
-                        ORDER BY m.timestamp ASC
-                        LIMIT %s
-                    """, (character_id, user_id, limit))
-                else:
-                    cur.execute("""
-                        SELECT m.role, m.content, m.timestamp
-                        FROM messages m
-                        JOIN conversations c ON m.conversation_id = c.conversation_id
-                        WHERE c.character_id = %s
-                        ORDER BY m.timestamp ASC
-                        LIMIT %s
-                    """, (character_id, limit))
-
-                return [{"role": row[0], "content": row[1], "timestamp": row[2]} for row in cur.fetchall()]
-        except Exception as e:
-            st.error(f"Failed to get conversation history: {e}")
-            raise
+    def save_turn(self, character_id, user_id, messages):
+        """
+        Creates a conversation and saves its messages in one transaction
+        (one commit instead of one per statement)
+
+        Args:
+            character_id (int): Database ID of the character
+            user_id (str): User identifier
+            messages (list): (role, content) tuples in order
+
+        Returns:
+            list: Message IDs in order (None for anonymous users, who are never stored)
+        """
+        if not user_id or user_id == "anonymous":
+            return [None] * len(messages)
+
+        self._check_message_partitions()
+        with self.lock:
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute(INSERT_CONVERSATION_SQL, (character_id, user_id))
+                    conversation_id = cur.fetchone()[0]
+                    message_ids = []
+                    for role, content in messages:
+                        cur.execute(INSERT_MESSAGE_SQL, (conversation_id, role.lower(), content))
+                        message_ids.append(cur.fetchone()[0])
+                    self.conn.commit()
+                    return message_ids
+            except Exception as e:
+                self.conn.rollback()
+                logger.error(f"Failed to save turn: {e}")
+                raise
+
+    def get_conversation_history(self, character_id, user_id=None, limit=20, before=None):
+        """
+        Most recent messages of a character (and user). Reads through to the
+        message archive when the database holds fewer than `limit` of them.
+
+        Args:
+            character_id (int): Database ID of the character
+            user_id (str): Optional user filter
+            limit (int): Maximum messages to return
+            before (datetime): Only messages older than this (to page further back)
+
+        Returns:
+            list: {"message_id", "role", "content", "timestamp"} in time order
+        """
+        with self.lock:
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute(CONVERSATION_HISTORY_SQL, {"character_id": character_id, "user_id": user_id,
+                                                           "before": before, "limit": limit})
+                    messages = [message_from_row(row) for row in cur.fetchall()]
+                    archived = self._archived_range(cur, character_id, user_id) if len(messages) < limit else None
+            except Exception as e:
+                logger.error(f"Failed to get conversation history: {e}")
+                raise
+            finally:
+                self._end_read()
+
+        if archived:
+            older_than = messages[-1]["timestamp"] if messages else before
+            messages += [as_message(row) for row in self.archive.history(
+                character_id, user_id, limit - len(messages), older_than, archived[0], archived[1])]
+        return messages[::-1]
+
+    def get_messages_after(self, character_id, user_id, after_message_id=0, limit=None, oldest_first=False):
+        """
+        Messages of a user newer than a message id, reading through to the
+        message archive when they reach into archived months
+
+        Args:
+            character_id (int): Database ID of the character
+            user_id (str): User identifier
+            after_message_id (int): Only messages with a greater id
+            limit (int): Keep only the most recent ones
+            oldest_first (bool): Keep the oldest `limit` ones instead (to page forward)
+
+        Returns:
+            list: {"message_id", "role", "content", "timestamp"} in id order
+        """
+        with self.lock:
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute(MESSAGES_AFTER_SQL.format(order="ASC" if oldest_first else "DESC"),
+                                (character_id, user_id, after_message_id, limit))
+                    rows = cur.fetchall()
+                    archived = None
+                    # Archived messages are the oldest, so they are needed first when paging forward
+                    if oldest_first or limit is None or len(rows) < limit:
+                        archived = self._archived_range(cur, character_id, user_id)
+            except Exception as e:
+                logger.error(f"Failed to get messages: {e}")
+                raise
+            finally:
+                self._end_read()
+
+        messages = [message_from_row(row) for row in (rows if oldest_first else reversed(rows))]
+        if archived and archived[2] > after_message_id:
+            seen = {message["message_id"] for message in messages}
+            older = [as_message(row) for row in self.archive.messages_after(
+                character_id, user_id, after_message_id, archived[0], archived[1]) if row["message_id"] not in seen]
+            messages = older + messages
+            if limit:
+                messages = messages[:limit] if oldest_first else messages[-limit:]
+        return messages
 
     def save_to_memory(self, character_id, key, value):
-        try:
-            with self.conn.cursor() as cur:
-                cur.execute("""
-                    DELETE FROM long_term_memory
-                    WHERE character_id = %s AND key = %s
-                """, (character_id, key))
-
-                cur.execute("""
-                    INSERT INTO long_term_memory (character_id, key, value)
-                    VALUES (%s, %s, %s)
-                """, (character_id, key, value))
-                self.conn.commit()
-        except Exception as e:
-            self.conn.rollback()
-            st.error(f"Failed to save to memory: {e}")
-            raise
+        with self.lock:
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute(UPSERT_MEMORY_SQL, (character_id, key, value))
+                    self.conn.commit()
+            except Exception as e:
+                self.conn.rollback()
+                logger.error(f"Failed to save to memory: {e}")
+                raise
 
-    def search_conversations_for_mentions(self, character_id, search_term):
-        try:
-            with self.conn.cursor() as cur:
-                cur.execute("""
-                    SELECT m.content, m.role, m.timestamp
-                    FROM messages m
-                    JOIN conversations c ON m.conversation_id = c.conversation_id
-                    WHERE c.character_id = %s AND m.content ILIKE %s
-                    ORDER BY m.timestamp DESC
-                """, (character_id, f"%{search_term}%"))
-                return cur.fetchall()
-        except Exception as e:
-            st.error(f"Failed to search conversations: {e}")
+    def get_messages_by_ids(self, message_ids):
+        if not message_ids:
             return []
 
+        with self.lock:
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute(MESSAGES_BY_IDS_SQL, (list(message_ids),))
+                    messages = [message_from_row(row) for row in cur.fetchall()]
+            except Exception as e:
+                logger.error(f"Failed to get messages: {e}")
+                return []
+            finally:
+                self._end_read()
+
+        # Ids not in the database belong to archived months
+        missing = set(message_ids) - {message["message_id"] for message in messages}
+        if missing and self.archive.partitions():
+            messages += [as_message(row) for row in self.archive.messages_by_ids(missing)]
+        return messages
+
     def get_from_memory(self, character_id, key):
-        try:
-            with self.conn.cursor() as cur:
-                cur.execute("""
-                    SELECT value FROM long_term_memory
-                    WHERE character_id = %s AND key = %s
-                """, (character_id, key))
-                result = cur.fetchone()
-                return result[0] if result else None
-        except Exception as e:
-            st.error(f"Failed to get from memory: {e}")
-            raise
+        with self.lock:
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute(SELECT_MEMORY_SQL, (character_id, key))
+                    result = cur.fetchone()
+                    return result[0] if result else None
+            except Exception as e:
+                logger.error(f"Failed to get from memory: {e}")
+                raise
+            finally:
+                self._end_read()
+
+    def save_book(self, book_source, content_hash, index_dir, characters, metadata=None):
+        """Adds a book to the catalog, replacing the entry of an earlier ingestion"""
+        with self.lock:
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute(UPSERT_BOOK_SQL, (book_source, content_hash, index_dir, list(characters),
+                                                  Json(metadata or {})))
+                    self.conn.commit()
+            except Exception as e:
+                self.conn.rollback()
+                logger.error(f"Failed to save book: {e}")
+                raise
+
+    def get_book(self, book_source):
+        """
+        Returns:
+            dict: Catalog entry (book_source, content_hash, index_dir, characters,
+                  metadata, ingested_at) or None if the book was never ingested
+        """
+        with self.lock:
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute(SELECT_BOOK_SQL, (book_source,))
+                    return book_from_row(cur.fetchone())
+            except Exception as e:
+                logger.error(f"Failed to get book: {e}")
+                raise
+            finally:
+                self._end_read()
+
+    def list_books(self):
+        """
+        Returns:
+            list: {"book_source", "characters", "ingested_at"} for every cataloged book, by name
+        """
+        with self.lock:
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute(LIST_BOOKS_SQL)
+                    return [{"book_source": row[0], "characters": row[1], "ingested_at": row[2]}
+                            for row in cur.fetchall()]
+            except Exception as e:
+                logger.error(f"Failed to list books: {e}")
+                raise
+            finally:
+                self._end_read()
+
+    def save_emotion_samples(self, samples):
+        """
+        Appends emotion samples in one statement
+
+        Args:
+            samples (list): (character_id, user_id, recorded_at, state vector) tuples
+        """
+        with self.lock:
+            try:
+                with self.conn.cursor() as cur:
+                    execute_values(cur, """
+                        INSERT INTO emotion_history (character_id, user_id, recorded_at, state) VALUES %s
+                    """, samples, page_size=1000)
+                    self.conn.commit()
+            except Exception as e:
+                self.conn.rollback()
+                logger.error(f"Failed to save emotion samples: {e}")
+                raise
+
+    def get_emotion_trajectory(self, character_id, user_id, since=None, until=None, bucket_seconds=60):
+        """
+        Downsampled emotion history of one character for one user; every
+        field is averaged per time bucket in the database
+
+        Args:
+            character_id (int): Database ID of the character
+            user_id (str): User identifier
+            since (datetime): Optional start of the range
+            until (datetime): Optional end of the range
+            bucket_seconds (float): Bucket width
+
+        Returns:
+            list: {"time": bucket start, "samples": n, "state": [11 floats]} in time order
+        """
+        with self.lock:
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute(EMOTION_TRAJECTORY_SQL, {"width": bucket_seconds, "character_id": character_id,
+                                                         "user_id": user_id, "since": since, "until": until})
+                    return trajectory_from_rows(cur.fetchall())
+            except Exception as e:
+                logger.error(f"Failed to get emotion trajectory: {e}")
+                raise
+            finally:
+                self._end_read()
+
+    def fetch_emotion_samples(self, book_source=None, since=None, batch_size=10000):
+        """
+        Loads raw emotion samples as arrays for bulk analytics (see emotion_history.EmotionAggregator)
+
+        Args:
+            book_source (str): Only this book's characters (default: all books)
+            since (datetime): Only samples recorded at or after this time
+            batch_size (int): Rows fetched per round trip
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: character ids, POSIX timestamps
+                and (n, 11) float32 states
+        """
+        batches = []
+        with self.lock:
+            try:
+                # Server-side cursor: rows are streamed in batches instead of materialized at once
+                with self.conn.cursor(name="emotion_samples") as cur:
+                    cur.itersize = batch_size
+                    cur.execute(EMOTION_SAMPLES_SQL, {"book_source": book_source, "since": since})
+                    while rows := cur.fetchmany(batch_size):
+                        batches.append(emotion_sample_batch(rows))
+                self.conn.commit()  # Ends the transaction that held the cursor
+            except Exception as e:
+                self.conn.rollback()
+                logger.error(f"Failed to fetch emotion samples: {e}")
+                raise
+        return join_emotion_samples(batches)
 
     def close(self):
         if self.conn:
             self.conn.close()
+
+def get_database():
+    """
+    Database manager for the configured DB_BACKEND
+
+    Returns:
+        DatabaseManager or async_database.SyncDatabaseAdapter (same methods)
+    """
+    if DB_BACKEND == "async":
+        from async_database import SyncDatabaseAdapter
+        return SyncDatabaseAdapter()
+    return DatabaseManager()
@@ -0,0 +1,213 @@
+"""
+INGESTION DEDUPLICATION
+Drops text that would otherwise be embedded and stored many times.
+
+- strip_boilerplate() works on raw page texts, before whitespace is collapsed:
+  it removes running headers and footers (lines repeated at the top or bottom
+  of many pages, page numbers ignored), bare page numbers, and front-matter
+  pages (tables of contents, copyright pages)
+- dedupe_pages() and dedupe_chunks() drop pages/chunks whose SimHash over
+  word shingles is within a few bits of one already kept. Pages catch
+  reprinted chapters and the same PDF uploaded twice, whose chunks would not
+  line up; chunks catch repeats in pasted text.
+
+Both return a stats dict; DedupReport adds them up per book.
+"""
+
+import hashlib
+import os
+import re
+import numpy as np
+
+EDGE_LINES = int(os.getenv("BOILERPLATE_EDGE_LINES", "3"))                    # Lines checked at each end of a page
+BOILERPLATE_MIN_PAGES = int(os.getenv("BOILERPLATE_MIN_PAGES", "3"))
+BOILERPLATE_MIN_FRACTION = float(os.getenv("BOILERPLATE_MIN_FRACTION", "0.3"))  # Of the book's pages
+FRONT_MATTER_MAX_CHARS = 2000     # Copyright pages are short; longer pages are never dropped as such
+SHINGLE_WORDS = int(os.getenv("DEDUP_SHINGLE_WORDS", "5"))
+SIMHASH_DISTANCE = int(os.getenv("DEDUP_SIMHASH_DISTANCE", "3"))              # Max differing bits of 64
+SIMHASH_BANDS = SIMHASH_DISTANCE + 1  # Pigeonhole: near duplicates agree on at least one band
+
+ROMAN = r"(?=[ivxlcdm])m{0,3}(?:cm|cd|d?c{0,3})(?:xc|xl|l?x{0,3})(?:ix|iv|v?i{0,3})"
+PAGE_NUMBER = re.compile(rf"^[\W_]*(?:(?:page\s+)?\d{{1,4}}|page\s+{ROMAN})(?:\s*(?:of|/)\s*\d{{1,4}})?[\W_]*$",
+                         re.IGNORECASE)
+# Bare roman numerals are also words ("I", "Mix"): they are page numbers only when
+# lines like them sit at the edge of at least BOILERPLATE_MIN_PAGES pages
+ROMAN_PAGE_NUMBER = re.compile(rf"^[\W_]*{ROMAN}[\W_]*$", re.IGNORECASE)
+EDGE_NUMBER = re.compile(r"^(?:\d{1,4}\s+)|(?:\s+\d{1,4})$")
+TOC_ENTRY = re.compile(rf"(?:\.{{2,}}\s*|\s+)(?:\d{{1,4}}|{ROMAN})$", re.IGNORECASE)  # Title, leaders, page
+TOC_LINE_CHARS = 120
+COPYRIGHT = re.compile(r"all rights reserved|\bisbn\b|copyright\s+(?:©|\(c\)|\d{4})|©\s*\d{4}", re.IGNORECASE)
+
+class DedupReport(dict):
+    """
+    Per-book totals of what deduplication removed
+
+    Keys: boilerplate_lines, front_matter_pages, duplicate_pages, chars_removed,
+    duplicate_chunks and embeddings_saved (duplicate chunks not sent to the embedding model)
+    """
+
+    KEYS = ("boilerplate_lines", "front_matter_pages", "duplicate_pages", "chars_removed",
+            "duplicate_chunks", "embeddings_saved")
+
+    def __init__(self):
+        super().__init__((key, 0) for key in self.KEYS)
+
+    def add(self, stats):
+        for key, value in stats.items():
+            self[key] = self.get(key, 0) + value
+        return self
+
+# ======================
+# BOILERPLATE
+# ======================
+
+def _line_key(line):
+    """Identity of a header/footer line: case, spacing and a leading/trailing page number ignored"""
+    return EDGE_NUMBER.sub("", " ".join(line.casefold().split()))
+
+def is_front_matter(lines):
+    """True for table-of-contents and copyright pages"""
+    if not lines:
+        return False
+    toc_entries = sum(len(line) <= TOC_LINE_CHARS and bool(re.search(r"[^\W\d_]", line)) and bool(TOC_ENTRY.search(line))
+                      for line in lines)
+    if len(lines) >= 3 and toc_entries >= 0.6 * len(lines):
+        return True
+    return sum(len(line) for line in lines) <= FRONT_MATTER_MAX_CHARS and bool(COPYRIGHT.search(" ".join(lines)))
+
+def strip_boilerplate(page_texts):
+    """
+    Removes headers, footers, page numbers and front-matter pages
+
+    A line near the top or bottom of a page is boilerplate if the same line
+    (ignoring case, spacing and a page number at either end) is near the edge
+    of at least BOILERPLATE_MIN_PAGES pages and BOILERPLATE_MIN_FRACTION of
+    all pages. Page numbers at the edges are always removed; bare roman
+    numerals only when at least BOILERPLATE_MIN_PAGES pages have one there.
+
+    Args:
+        page_texts (List[str]): Raw text of each page, with its newlines
+
+    Returns:
+        Tuple[List[str], dict]: Page texts with boilerplate removed ("" for
+            dropped pages, so positions still match) and the stats
+    """
+    pages = [[line.strip() for line in text.splitlines() if line.strip()] for text in page_texts]
+
+    # On how many pages each edge line appears, and how many have a roman numeral there
+    page_counts, roman_pages = {}, 0
+    for lines in pages:
+        edges = lines[:EDGE_LINES] + lines[-EDGE_LINES:]
+        for key in {_line_key(line) for line in edges}:
+            page_counts[key] = page_counts.get(key, 0) + 1
+        roman_pages += any(ROMAN_PAGE_NUMBER.match(line) for line in edges)
+    min_pages = max(BOILERPLATE_MIN_PAGES, BOILERPLATE_MIN_FRACTION * len(pages))
+    repeated = {key for key, count in page_counts.items() if count >= min_pages and key}
+    roman_numbered = roman_pages >= BOILERPLATE_MIN_PAGES
+
+    stats = {"boilerplate_lines": 0, "front_matter_pages": 0, "chars_removed": 0}
+    cleaned = []
+    for lines in pages:
+        kept = []
+        for position, line in enumerate(lines):
+            at_edge = position < EDGE_LINES or position >= len(lines) - EDGE_LINES
+            page_number = PAGE_NUMBER.match(line) or (roman_numbered and ROMAN_PAGE_NUMBER.match(line))
+            if at_edge and (page_number or _line_key(line) in repeated):
+                stats["boilerplate_lines"] += 1
+                stats["chars_removed"] += len(line)
+            else:
+                kept.append(line)
+        if is_front_matter(kept):
+            stats["front_matter_pages"] += 1
+            stats["chars_removed"] += sum(len(line) for line in kept)
+            kept = []
+        cleaned.append("\n".join(kept))
+    return cleaned, stats
+
+# ======================
+# NEAR DUPLICATES
+# ======================
+
+def simhash(text, shingle_words=SHINGLE_WORDS):
+    """
+    64-bit SimHash of a text over its distinct word shingles
+
+    Texts sharing most of their shingles get fingerprints that differ in few bits.
+
+    Returns:
+        int: Fingerprint
+    """
+    words = re.findall(r"\w+", text.casefold())
+    if len(words) < shingle_words:
+        words = words + [""] * (shingle_words - len(words))
+    shingles = {" ".join(words[i:i + shingle_words]) for i in range(len(words) - shingle_words + 1)}
+    hashes = np.frombuffer(b"".join(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest()
+                                    for shingle in shingles), dtype=np.uint8)
+    bits = np.unpackbits(hashes).reshape(len(shingles), 64)
+    # Each bit of the fingerprint is the majority vote of that bit over all shingles
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 > len(shingles)
+    return int.from_bytes(np.packbits(votes).tobytes(), "big")
+
+def _bands(fingerprint):
+    width = 64 // SIMHASH_BANDS
+    return [(band, (fingerprint >> (band * width)) & ((1 << width) - 1)) for band in range(SIMHASH_BANDS)]
+
+def find_near_duplicates(texts):
+    """
+    Positions of texts that are near duplicates of an earlier text
+
+    Fingerprints are bucketed by band, so each text is compared only with
+    earlier texts sharing at least one band instead of with all of them.
+
+    Args:
+        texts (List[str]): Texts in order
+
+    Returns:
+        Set[int]: Positions to drop (the first occurrence is always kept)
+    """
+    duplicates, buckets, fingerprints = set(), {}, []
+    for position, text in enumerate(texts):
+        fingerprint = simhash(text)
+        candidates = {index for band in _bands(fingerprint) for index in buckets.get(band, ())}
+        if any(bin(fingerprint ^ fingerprints[index]).count("1") <= SIMHASH_DISTANCE for index in candidates):
+            duplicates.add(position)
+            continue
+        for band in _bands(fingerprint):
+            buckets.setdefault(band, []).append(len(fingerprints))
+        fingerprints.append(fingerprint)
+    return duplicates
+
+def dedupe_pages(pages):
+    """
+    Drops pages that are near duplicates of an earlier page (in any document)
+
+    Args:
+        pages (List[Tuple[str, int, str]]): (source, page number, text), as
+            returned by PDFProcessor.get_pdf_pages
+
+    Returns:
+        Tuple[List[Tuple[str, int, str]], dict]: Kept pages and the stats
+    """
+    duplicates = find_near_duplicates([text for _, _, text in pages])
+    stats = {"duplicate_pages": len(duplicates),
+             "chars_removed": sum(len(pages[position][2]) for position in duplicates)}
+    return [page for position, page in enumerate(pages) if position not in duplicates], stats
+
+def dedupe_chunks(chunks, metadatas=None):
+    """
+    Drops chunks that are near duplicates of an earlier chunk
+
+    Args:
+        chunks (List[str]): Chunk texts in book order
+        metadatas (List[dict]): Optional metadata per chunk, filtered alongside
+
+    Returns:
+        Tuple[List[str], List[dict], dict]: Kept chunks, their metadatas (None if
+            none were given) and the stats
+    """
+    duplicates = find_near_duplicates(chunks)
+    stats = {"duplicate_chunks": len(duplicates), "embeddings_saved": len(duplicates),
+             "chars_removed": sum(len(chunks[position]) for position in duplicates)}
+    kept = [position for position in range(len(chunks)) if position not in duplicates]
+    kept_metadatas = [metadatas[position] for position in kept] if metadatas is not None else None
+    return [chunks[position] for position in kept], kept_metadatas, stats
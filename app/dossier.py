@@ -0,0 +1,211 @@
+"""
+CHARACTER DOSSIERS
+Compact, per-character context built once at ingestion and stored with the book.
+
+A dossier holds the passages where a character is most present (ranked by
+how densely their name is mentioned) and a short LLM-written profile: who
+they are, their relationships and how they speak. The chat chain puts it in
+the prompt as a fixed prefix for that character, so every turn starts from
+the same text (cacheable by the model provider) and per-turn retrieval can
+fetch fewer generic chunks.
+"""
+
+import json
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+import telemetry
+from chunk_store import write_atomic
+from models import get_chat_model
+
+logger = logging.getLogger(__name__)
+
+DOSSIER_FILE = "dossiers.json"  # {character name: {"profile", "passages"}}
+DOSSIER_PASSAGES = int(os.getenv("DOSSIER_PASSAGES", "6"))                # Key passages per character
+DOSSIER_PASSAGE_CHARS = int(os.getenv("DOSSIER_PASSAGE_CHARS", "600"))    # Length of one passage
+DOSSIER_WORKERS = int(os.getenv("DOSSIER_WORKERS", "4"))                  # Concurrent profile calls
+
+PROFILE_PROMPT = """
+You are preparing a character dossier for an actor who will roleplay {character_name}.
+Using only the passages below from the book, write a compact profile of {character_name} in at most 120 words:
+who they are, their key relationships, their personality, and how they speak.
+Return only the profile text.
+
+Passages:
+{passages}
+"""
+
+# A name word keeps its hyphens and apostrophes: "Anne-Marie" is one word, not "Anne" and "Marie"
+NAME_WORD = re.compile(r"[\w'-]+")
+
+def name_words(character_name):
+    """Words of four letters or more of a name (e.g. "Darcy" for "Fitzwilliam Darcy")"""
+    return [word for word in NAME_WORD.findall(character_name) if len(word) >= 4]
+
+def name_pattern(character_name):
+    """
+    Regex matching the ways a character is referred to: the full name and
+    each of its name_words
+    """
+    terms = sorted({character_name, *name_words(character_name)}, key=len, reverse=True)
+    return re.compile(r"\b(?:" + "|".join(re.escape(term) for term in terms) + r")\b")
+
+def _word_runs(text):
+    """
+    Every run of whole words within each hyphenated or apostrophized word of a
+    text ("Darcy's" gives "Darcy", "s" and "Darcy's"): exactly the strings a
+    \\b-delimited name word can match there
+    """
+    runs = set(NAME_WORD.findall(text))
+    for word in [word for word in runs if "-" in word or "'" in word]:
+        pieces = [(match.start(), match.end()) for match in re.finditer(r"\w+", word)]
+        for position, (start, _) in enumerate(pieces):
+            runs.update(word[start:end] for _, end in pieces[position:])
+    return runs
+
+def find_mentions(chunks, characters):
+    """
+    Tags chunks with the characters they mention, matching exactly what
+    name_pattern matches: any of the name_words of a name (or the full name
+    if it has none)
+
+    Each chunk is split into words once and looked up in one table of name
+    words, instead of running every character's regex over it.
+
+    Args:
+        chunks (List[str]): The book's chunks
+        characters (List[str]): Extracted roster
+
+    Returns:
+        Dict[str, List[int]]: Character -> ids of the chunks mentioning them, ascending
+    """
+    names_by_word = {}  # Word -> characters whose name contains it
+    full_names = []  # Names without a distinctive word, matched as a whole
+    for name in characters:
+        words = name_words(name)
+        for word in words:
+            names_by_word.setdefault(word, set()).add(name)
+        if not words:
+            full_names.append(name)
+
+    mentions = {name: [] for name in characters}
+    with telemetry.span("ingest.tag_mentions"):
+        for chunk_id, chunk in enumerate(chunks):
+            found = set().union(*(names_by_word[word] for word in names_by_word.keys() & _word_runs(chunk)))
+            found.update(name for name in full_names if re.search(rf"\b{re.escape(name)}\b", chunk))
+            for name in found:
+                mentions[name].append(chunk_id)
+    return mentions
+
+def find_passages(chunks, metadatas, character_name, limit=DOSSIER_PASSAGES, width=DOSSIER_PASSAGE_CHARS):
+    """
+    Picks the passages with the most mentions of a character
+
+    Args:
+        chunks (List[str]): The book's chunks
+        metadatas (List[dict]): Optional {"source", "page"} per chunk
+        character_name (str): Character to look for
+        limit (int): Passages to return
+        width (int): Characters per passage
+
+    Returns:
+        List[dict]: {"text", "page"} in book order
+    """
+    pattern = name_pattern(character_name)
+    candidates = []
+    for chunk_id, chunk in enumerate(chunks):
+        positions = [match.start() for match in pattern.finditer(chunk)]
+        for position in positions:
+            # Window centred on the mention, snapped outwards to word boundaries
+            start = max(0, position - width // 2)
+            start = chunk.rfind(" ", 0, start) + 1 if start else 0
+            end = min(len(chunk), start + width)
+            if end < len(chunk):
+                space = chunk.find(" ", end)
+                end = space if space >= 0 else len(chunk)
+            mentions = sum(start <= other < end for other in positions)
+            candidates.append((mentions, chunk_id, start, end))
+
+    # Densest windows first; skip windows overlapping one already taken (also across
+    # the overlap shared by neighbouring chunks)
+    taken, seen_texts = [], []
+    for mentions, chunk_id, start, end in sorted(candidates, key=lambda c: (-c[0], c[1], c[2])):
+        if any(chunk_id == other_id and start < other_end and other_start < end
+               for _, other_id, other_start, other_end in taken):
+            continue
+        text = chunks[chunk_id][start:end].strip()
+        probe = text[len(text) // 4: len(text) // 4 + 80]
+        if any(probe in seen for seen in seen_texts):
+            continue
+        taken.append((mentions, chunk_id, start, end))
+        seen_texts.append(text)
+        if len(taken) == limit:
+            break
+
+    passages = []
+    for _, chunk_id, start, end in sorted(taken, key=lambda c: (c[1], c[2])):
+        metadata = metadatas[chunk_id] if metadatas else {}
+        passages.append({"text": chunks[chunk_id][start:end].strip(), "page": metadata.get("page")})
+    return passages
+
+def write_profile(character_name, passages):
+    """Condensed profile of a character from their key passages (one LLM call)"""
+    if not passages:
+        return ""
+    model = get_chat_model(temperature=0.3)
+    prompt = PROFILE_PROMPT.format(
+        character_name=character_name,
+        passages="\n\n".join(passage["text"] for passage in passages)
+    )
+    try:
+        response = model.invoke(prompt)
+    except Exception as e:
+        logger.warning(f"Failed to write the profile of {character_name}: {e}")
+        return ""
+    telemetry.record_usage(response)
+    return response.content.strip()
+
+def build_dossiers(chunks, metadatas, characters, index_dir):
+    """
+    Builds and stores the dossier of every character of a book
+
+    Args:
+        chunks (List[str]): The book's chunks
+        metadatas (List[dict]): Optional {"source", "page"} per chunk
+        characters (List[str]): Extracted character names
+        index_dir (str): The book's index directory
+
+    Returns:
+        dict: Character name -> {"profile", "passages"}
+    """
+    with telemetry.span("ingest.dossiers"):
+        passages = {name: find_passages(chunks, metadatas, name) for name in characters}
+        with ThreadPoolExecutor(max_workers=DOSSIER_WORKERS) as pool:
+            profiles = dict(zip(characters, pool.map(lambda name: write_profile(name, passages[name]), characters)))
+        dossiers = {name: {"profile": profiles[name], "passages": passages[name]} for name in characters}
+        write_atomic(os.path.join(index_dir, DOSSIER_FILE),
+                     lambda f: f.write(json.dumps(dossiers, ensure_ascii=False).encode("utf-8")))
+    return dossiers
+
+def read_dossiers(index_dir):
+    """Dossiers stored with a book ({} for books ingested before dossiers existed)"""
+    try:
+        with open(os.path.join(index_dir, DOSSIER_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def format_dossier(dossier):
+    """Prompt text of one dossier ("" if there is none)"""
+    if not dossier:
+        return ""
+    lines = []
+    if dossier.get("profile"):
+        lines.append(f"Profile: {dossier['profile']}")
+    if dossier.get("passages"):
+        lines.append("Key passages:")
+        for passage in dossier["passages"]:
+            where = f"(p. {passage['page']}) " if passage.get("page") else ""
+            lines.append(f"- {where}\"{passage['text']}\"")
+    return "\n".join(lines)
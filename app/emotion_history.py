@@ -0,0 +1,210 @@
+"""
+EMOTION HISTORY
+Append-only time series of character emotion states, one sample per turn.
+
+- EmotionRecorder buffers samples in memory and writes them in batches from a
+  background thread, so a chat turn only appends to a list
+- downsample() averages a trajectory into fixed time buckets
+- EmotionAggregator computes fleet-wide statistics over many samples with NumPy
+
+Samples live in the emotion_history table (see DatabaseManager.save_emotion_samples,
+get_emotion_trajectory and fetch_emotion_samples).
+"""
+
+import atexit
+import logging
+import os
+import threading
+from datetime import datetime
+import numpy as np
+import telemetry
+from character_state import CharacterState
+
+logger = logging.getLogger(__name__)
+
+EMOTION_BATCH_SIZE = int(os.getenv("EMOTION_BATCH_SIZE", "200"))            # Samples per INSERT
+EMOTION_FLUSH_SECONDS = float(os.getenv("EMOTION_FLUSH_SECONDS", "5"))      # Max age of a buffered sample
+EMOTION_MAX_PENDING = int(os.getenv("EMOTION_MAX_PENDING", "50000"))        # Buffered samples kept while the DB is down
+
+class EmotionRecorder:
+    """Batches emotion samples and writes them off the request path"""
+
+    def __init__(self, db, batch_size=EMOTION_BATCH_SIZE, flush_interval=EMOTION_FLUSH_SECONDS,
+                 max_pending=EMOTION_MAX_PENDING):
+        """
+        Args:
+            db (DatabaseManager): Target of the batched writes
+            batch_size (int): Buffered samples that trigger an early flush
+            flush_interval (float): Seconds between periodic flushes
+            max_pending (int): Oldest samples are dropped beyond this many
+        """
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = []  # (character_id, user_id, recorded_at, state vector)
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # One flush at a time keeps samples in order
+        self._thread = None
+        self._closed = False
+
+    def record(self, character_id, user_id, state):
+        """
+        Buffers one sample (never blocks on the database)
+
+        Args:
+            character_id (int): Database ID of the character
+            user_id (str): User identifier
+            state (CharacterState): State after the turn
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._pending.append((character_id, user_id, datetime.now(), state.to_vector()))
+            if len(self._pending) > self.max_pending:
+                dropped = len(self._pending) - self.max_pending
+                del self._pending[:dropped]
+                telemetry.count("emotion_history.dropped", dropped)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="emotion-history", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._pending) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                if self._closed:
+                    return
+            self.flush()
+
+    def flush(self):
+        """
+        Writes every buffered sample
+
+        Returns:
+            int: Samples written (0 if the write failed; they stay buffered)
+        """
+        with self._flush_lock:
+            with self._cond:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                with telemetry.span("emotion_history.flush"):
+                    self.db.save_emotion_samples(batch)
+            except Exception as e:
+                logger.warning(f"Failed to write {len(batch)} emotion samples, will retry: {e}")
+                with self._cond:
+                    self._pending[:0] = batch
+                return 0
+            telemetry.count("emotion_history.samples", len(batch))
+            return len(batch)
+
+    def close(self):
+        """Stops the background writer and flushes what is left"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self.flush()
+
+def _group_sums(groups, count, states):
+    """Per-group column sums of states (bincount per field; much faster than np.add.at)"""
+    return np.stack([np.bincount(groups, weights=states[:, i], minlength=count)
+                     for i in range(states.shape[1])], axis=1)
+
+def downsample(timestamps, states, bucket_seconds):
+    """
+    Averages samples into fixed-width time buckets
+
+    Args:
+        timestamps (np.ndarray): Sample times as POSIX seconds, ascending
+        states (np.ndarray): (n, 11) state vectors in CharacterState.FIELDS order
+        bucket_seconds (float): Bucket width
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: Bucket start times, (buckets, 11)
+            mean states and samples per bucket
+    """
+    if not len(timestamps):
+        return np.empty(0), np.empty((0, len(CharacterState.FIELDS)), dtype="float32"), np.empty(0, dtype="int64")
+    buckets = np.floor(np.asarray(timestamps, dtype="float64") / bucket_seconds).astype("int64")
+    starts, inverse, counts = np.unique(buckets, return_inverse=True, return_counts=True)
+    sums = _group_sums(inverse, len(starts), states)
+    return starts * bucket_seconds, (sums / counts[:, None]).astype("float32"), counts
+
+class EmotionAggregator:
+    """
+    Fleet-wide statistics over emotion samples, vectorized with NumPy
+
+    Built from the arrays returned by DatabaseManager.fetch_emotion_samples;
+    every statistic is computed per field in CharacterState.FIELDS order.
+    """
+
+    def __init__(self, character_ids, timestamps, states):
+        """
+        Args:
+            character_ids (np.ndarray): Character of each sample
+            timestamps (np.ndarray): POSIX seconds of each sample
+            states (np.ndarray): (n, 11) float32 state vectors
+        """
+        self.character_ids = np.asarray(character_ids)
+        self.timestamps = np.asarray(timestamps, dtype="float64")
+        self.states = np.asarray(states, dtype="float32").reshape(-1, len(CharacterState.FIELDS))
+
+    @classmethod
+    def from_db(cls, db, book_source=None, since=None):
+        """Loads the samples of one book (or all books) recorded since a datetime"""
+        return cls(*db.fetch_emotion_samples(book_source=book_source, since=since))
+
+    def __len__(self):
+        return len(self.states)
+
+    def _by_field(self, values):
+        return {field: float(value) for field, value in zip(CharacterState.FIELDS, values)}
+
+    def summary(self, percentiles=(10, 50, 90)):
+        """
+        Distribution of every field over all samples
+
+        Returns:
+            dict: {"samples": n, "mean": {...}, "std": {...}, "p10": {...}, ...}
+        """
+        result = {"samples": len(self)}
+        if not len(self):
+            return result
+        result["mean"] = self._by_field(self.states.mean(axis=0))
+        result["std"] = self._by_field(self.states.std(axis=0))
+        for p, values in zip(percentiles, np.percentile(self.states, percentiles, axis=0)):
+            result[f"p{p}"] = self._by_field(values)
+        return result
+
+    def by_character(self):
+        """
+        Mean state and sample count per character
+
+        Returns:
+            dict: character_id -> {"samples": n, "mean": {field: value}}
+        """
+        ids, inverse, counts = np.unique(self.character_ids, return_inverse=True, return_counts=True)
+        sums = _group_sums(inverse, len(ids), self.states)
+        return {int(character_id): {"samples": int(count), "mean": self._by_field(total / count)}
+                for character_id, count, total in zip(ids, counts, sums)}
+
+    def histogram(self, field, bins=10):
+        """
+        Distribution of one field over [0, 1]
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Counts per bin and the bin edges
+        """
+        column = self.states[:, CharacterState.FIELDS.index(field)]
+        return np.histogram(column, bins=bins, range=(0.0, 1.0))
+
+    def trend(self, bucket_seconds=3600):
+        """Fleet-wide mean state over time (see downsample)"""
+        order = np.argsort(self.timestamps, kind="stable")
+        return downsample(self.timestamps[order], self.states[order], bucket_seconds)
@@ -0,0 +1,79 @@
+import hashlib
+import json
+import os
+import telemetry
+from book_index import BookIndex, book_index_dir
+
+HASH_BLOCK_SIZE = 1 << 20
+
+def content_hash(parts):
+    """
+    SHA-256 identifying a book's content
+
+    Args:
+        parts (list): File paths, file-like objects (rewound after reading) or bytes, in order
+
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            digest.update(part)
+        elif isinstance(part, str):
+            with open(part, "rb") as f:
+                for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+                    digest.update(block)
+        else:
+            for block in iter(lambda: part.read(HASH_BLOCK_SIZE), b""):
+                digest.update(block)
+            part.seek(0)
+    return digest.hexdigest()
+
+def index_metadata(index_dir):
+    """Catalog metadata taken from a built index (chunk count, source files, vector layout, deduplication stats)"""
+    with open(BookIndex.meta_path(index_dir), encoding="utf-8") as f:
+        meta = json.load(f)
+    metadata = {"chunks": meta["chunks"], "sources": meta["sources"], "quantization": meta.get("quantization", "flat")}
+    if "dedup" in meta:
+        metadata["dedup"] = meta["dedup"]
+    return metadata
+
+def find_current_book(db, book_source, digest):
+    """
+    Returns the catalog entry of a book if it was ingested from the same
+    content and its index is still on disk, otherwise None
+    """
+    book = db.get_book(book_source)
+    if book and book["content_hash"] == digest and os.path.exists(BookIndex.meta_path(book["index_dir"])):
+        return book
+    return None
+
+def ingest(pdf_processor, db, book_source, pdf_docs=None, text=None):
+    """
+    Ingests a book and records it in the catalog (empty input builds nothing
+    and is not recorded). Content that is already cataloged under the same
+    book source is not processed again.
+
+    Args:
+        pdf_processor (PDFProcessor): Ingestion pipeline
+        db (DatabaseManager): Holds the book catalog
+        book_source (str): Book identifier
+        pdf_docs (list): PDF files (paths or file-like objects), or
+        text (str): Pasted text
+
+    Returns:
+        Tuple[List[str], bool]: Character names, and whether the existing index was reused
+    """
+    digest = content_hash(pdf_docs if pdf_docs else [text.encode("utf-8")])
+    book = find_current_book(db, book_source, digest)
+    if book:
+        telemetry.count("ingest.reused")
+        return book["characters"], True
+
+    index_dir = book_index_dir(book_source)
+    result = pdf_processor.run_pipeline(index_dir, pdf_docs=pdf_docs, text=text)
+    if result["chunks"]:
+        # Cataloged even without characters, so the same content isn't processed again
+        db.save_book(book_source, digest, index_dir, result["characters"], index_metadata(index_dir))
+    return result["characters"], False
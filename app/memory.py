@@ -0,0 +1,249 @@
+import json
+import logging
+import os
+import threading
+import telemetry
+from admission import BACKGROUND, Overloaded, get_controller
+from models import CHAT_MODEL, get_chat_model
+
+logger = logging.getLogger(__name__)
+
+# Compaction is triggered once this many turns have piled up past the recent window
+SUMMARY_INTERVAL = int(os.getenv("MEMORY_SUMMARY_INTERVAL", "10"))
+
+# Number of most recent messages that are always kept verbatim in the prompt
+RECENT_WINDOW = int(os.getenv("MEMORY_RECENT_WINDOW", "6"))
+
+# Messages folded into the summary per summarization call (a long backlog takes several)
+COMPACT_BATCH = 2 * SUMMARY_INTERVAL
+
+COMPACTOR_IDLE_SECONDS = 30  # The background compaction thread exits after this long without work
+
+class SummaryCompactor:
+    """
+    Runs compactions on a background thread, so a turn never waits for the
+    summarization call. Requests for a (character, user) already queued are
+    merged; one left unfinished at exit is simply requested again by a later turn.
+    """
+
+    def __init__(self, compact):
+        """
+        Args:
+            compact (callable): compact(character_id, user_id)
+        """
+        self.compact = compact
+        self._pending = {}  # (character_id, user_id) -> None, in request order
+        self._running = None  # Key being compacted
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def submit(self, character_id, user_id):
+        """Queues a compaction (never blocks on the model or the database)"""
+        with self._cond:
+            if self._closed:
+                return
+            self._pending[(character_id, user_id)] = None
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="memory-compaction", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                # An idle thread exits (and is started again by the next request),
+                # so a memory that is no longer used doesn't keep a thread alive
+                if not self._pending and not self._cond.wait_for(
+                        lambda: self._closed or self._pending, COMPACTOR_IDLE_SECONDS):
+                    self._thread = None
+                    return
+                if self._closed:
+                    return
+                key = next(iter(self._pending))
+                del self._pending[key]
+                self._running = key
+            try:
+                self.compact(*key)
+            except Exception as e:
+                logger.warning(f"Conversation compaction failed: {e}")
+            finally:
+                with self._cond:
+                    self._running = None
+                    self._cond.notify_all()
+
+    def drain(self, timeout=None):
+        """
+        Waits until every queued compaction has run
+
+        Returns:
+            bool: False if the timeout expired first
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and self._running is None, timeout)
+
+    def close(self):
+        """Stops the background thread; queued compactions are dropped"""
+        with self._cond:
+            self._closed = True
+            self._pending.clear()
+            self._cond.notify_all()
+
+class ConversationMemory:
+    """
+    Rolling summarization memory for long-running chats:
+    - Keeps a persisted summary per (character, user) in long_term_memory
+    - Keeps the most recent messages verbatim
+    - Folds older messages into the summary every SUMMARY_INTERVAL turns,
+      in the background and COMPACT_BATCH messages per summarization call
+
+    Both the chat prompt (the summary plus at most RECENT_WINDOW + 2 * SUMMARY_INTERVAL
+    unsummarized messages) and every summarization prompt (the summary plus
+    COMPACT_BATCH messages) stay bounded no matter how long the user has been chatting.
+    """
+
+    def __init__(self, db):
+        """
+        Initialize memory with a database handle
+
+        Args:
+            db (DatabaseManager): Database operations handler
+        """
+        self.db = db
+        self.summary_model = get_chat_model(temperature=0.2)  # Summarization LLM
+        self.compactor = SummaryCompactor(self.compact)  # Runs compactions off the request path
+
+    @staticmethod
+    def _memory_key(user_id):
+        """Key of the summary record in long_term_memory (characters are shared across users)"""
+        return f"conversation_summary:{user_id}"
+
+    def load(self, character_id, user_id):
+        """
+        Loads the persisted summary record
+
+        Args:
+            character_id (int): Database ID of the character
+            user_id (str): User identifier
+
+        Returns:
+            dict: {"summary": str, "last_message_id": int}
+        """
+        raw = self.db.get_from_memory(character_id, self._memory_key(user_id))
+        if raw:
+            try:
+                return json.loads(raw)
+            except json.JSONDecodeError:
+                pass
+        return {"summary": "", "last_message_id": 0}
+
+    def get_context(self, character_id, user_id):
+        """
+        Builds the memory context for the next prompt
+
+        Args:
+            character_id (int): Database ID of the character
+            user_id (str): User identifier
+
+        Returns:
+            tuple: (summary_text, recent_messages)
+        """
+        if character_id is None or user_id == "anonymous":
+            return "", []
+
+        record = self.load(character_id, user_id)
+        messages = self.db.get_messages_after(
+            character_id,
+            user_id,
+            record["last_message_id"],
+            limit=RECENT_WINDOW + 2 * SUMMARY_INTERVAL
+        )
+        return record["summary"], messages
+
+    def record_turn(self, character_id, user_id, unsummarized_count):
+        """
+        Schedules a background compaction once enough turns accumulated
+
+        Args:
+            character_id (int): Database ID of the character
+            user_id (str): User identifier
+            unsummarized_count (int): Unsummarized messages before this turn
+        """
+        if character_id is None or user_id == "anonymous":
+            return
+
+        # Each turn adds a user and an assistant message
+        if unsummarized_count + 2 >= RECENT_WINDOW + 2 * SUMMARY_INTERVAL:
+            self.compactor.submit(character_id, user_id)
+
+    def compact(self, character_id, user_id):
+        """
+        Folds every message older than the recent window into the summary,
+        oldest first and COMPACT_BATCH messages per summarization call; the
+        summary is saved after each call, so an interrupted backlog resumes
+        where it stopped
+
+        Args:
+            character_id (int): Database ID of the character
+            user_id (str): User identifier
+        """
+        record = self.load(character_id, user_id)
+        while True:
+            limit = COMPACT_BATCH + RECENT_WINDOW
+            batch = self.db.get_messages_after(character_id, user_id, record["last_message_id"],
+                                               limit=limit, oldest_first=True)
+            # At least RECENT_WINDOW newer messages follow these ones
+            older = batch[:len(batch) - RECENT_WINDOW]
+            if not older:
+                return
+            summary = self.summarize(record["summary"], older)
+            if summary is None:
+                return
+            record = {"summary": summary, "last_message_id": older[-1]["message_id"]}
+            self.db.save_to_memory(character_id, self._memory_key(user_id), json.dumps(record))
+            if len(batch) < limit:
+                return
+
+    def summarize(self, summary, messages):
+        """
+        Updates a summary with new messages
+
+        Args:
+            summary (str): Current summary ("" if none)
+            messages (list): Messages to fold in, oldest first
+
+        Returns:
+            str: The updated summary, or None if the model call was shed or failed
+        """
+        prompt = f"""
+            You maintain the long-term memory of a roleplay conversation.
+            Update the existing summary with the new messages below.
+            Keep facts the user shared, names, relationships, promises and open threads.
+            Do NOT include personally identifiable information such as addresses, phone numbers, email addresses or ages.
+            Keep the summary under 250 words and return only the summary text.
+
+            Existing summary:
+            {summary or "(empty)"}
+
+            New messages:
+            {self.format_messages(messages)}
+
+            Updated summary:
+        """
+        try:
+            with telemetry.span("memory.compact"), get_controller().model_slot(CHAT_MODEL, BACKGROUND):
+                response = self.summary_model.invoke(prompt)
+            telemetry.record_usage(response)
+            return response.content.strip()
+        except Overloaded:
+            # Shed under load; the same messages are folded in on a later turn
+            return None
+        except Exception as e:
+            # Keep the previous summary; compaction is retried on a later turn
+            logger.warning(f"Error summarizing conversation: {e}")
+            return None
+
+    @staticmethod
+    def format_messages(messages):
+        """Formats messages as one "role: content" line each"""
+        return "\n".join(f"{message['role']}: {message['content']}" for message in messages)
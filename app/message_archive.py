@@ -0,0 +1,282 @@
+"""
+MESSAGE ARCHIVE
+Cold storage for old months of chat messages.
+
+The messages table is range-partitioned by month on its timestamp (see
+DatabaseManager.ensure_message_partitions). archive_messages() writes every
+partition older than MESSAGE_HOT_MONTHS to a compressed file under
+MESSAGE_ARCHIVE_DIR and drops it from the database, so the database only
+holds recent months and its size stays bounded.
+
+History reads go through DatabaseManager as before: a query is answered from
+the database, and only when it reaches further back than the database holds
+for that character and user (per the message_archive_index table) does it
+read the archive files that can contain the missing messages.
+
+Files are Parquet (zstd, sorted by character and user so row-group statistics
+skip the other users) when pyarrow is installed, gzip-compressed JSON lines
+otherwise. manifest.json lists the files and the month and ids each covers.
+
+Usage (e.g. daily from cron; it also creates upcoming partitions):
+    python app/message_archive.py [--hot-months 3] [--archive-dir message_archive]
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+from datetime import date, datetime
+from dotenv import load_dotenv
+from chunk_store import write_atomic
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Optional dependency; gzip JSON lines are always available
+    pyarrow = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_ARCHIVE_DIR = os.getenv("MESSAGE_ARCHIVE_DIR", "message_archive")
+MESSAGE_HOT_MONTHS = int(os.getenv("MESSAGE_HOT_MONTHS", "3"))  # Months kept in the database, current one included
+ARCHIVE_ROW_GROUP = 16384
+MANIFEST_FILE = "manifest.json"
+COLUMNS = ("message_id", "conversation_id", "character_id", "user_id", "role", "content", "timestamp")
+
+def add_months(month, months):
+    """First day of the month `months` after (or before, if negative) the month of `month`"""
+    year, index = divmod(month.year * 12 + month.month - 1 + months, 12)
+    return date(year, index + 1, 1)
+
+def as_message(row):
+    """An archived row in the shape the database returns messages in"""
+    return {"message_id": row["message_id"], "role": row["role"], "content": row["content"],
+            "timestamp": row["timestamp"]}
+
+def archive_format():
+    """parquet when pyarrow is installed, jsonl.gz otherwise"""
+    return "parquet" if pyarrow is not None else "jsonl.gz"
+
+class MessageArchive:
+    """Archived message partitions: one file per archived partition plus a manifest"""
+
+    def __init__(self, directory=MESSAGE_ARCHIVE_DIR):
+        self.directory = directory
+        self._manifest = []
+        self._manifest_mtime = None
+
+    def _manifest_path(self):
+        return os.path.join(self.directory, MANIFEST_FILE)
+
+    def partitions(self):
+        """
+        Returns:
+            list: Manifest entries (name, file, format, start, end, rows,
+                  min_message_id, max_message_id) by start; reloaded when the
+                  manifest changes
+        """
+        try:
+            mtime = os.path.getmtime(self._manifest_path())
+        except OSError:
+            return []
+        if mtime != self._manifest_mtime:
+            with open(self._manifest_path(), encoding="utf-8") as f:
+                self._manifest = json.load(f)["partitions"]
+            self._manifest_mtime = mtime
+        return self._manifest
+
+    def write_partition(self, name, start, end, columns):
+        """
+        Writes the messages of one partition and adds the file to the manifest
+
+        Args:
+            name (str): Partition table name
+            start (date): First day of the month
+            end (date): First day of the next month
+            columns (dict): COLUMNS -> list of values, rows sorted by character, user and message id
+
+        Returns:
+            dict: The manifest entry
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        file_format = archive_format()
+        message_ids = columns["message_id"]
+        first_id, last_id = min(message_ids, default=0), max(message_ids, default=0)
+        # Named after its ids: writing the same partition again (an interrupted run) replaces
+        # the file, while rows of the same month archived later get a file of their own
+        file_name = f"{name}_{first_id}_{last_id}.{file_format}"
+
+        if file_format == "parquet":
+            table = pyarrow.table({column: columns[column] for column in COLUMNS})
+            write_atomic(os.path.join(self.directory, file_name), lambda f: pyarrow.parquet.write_table(
+                table, f, compression="zstd", row_group_size=ARCHIVE_ROW_GROUP))
+        else:
+            def write_lines(f):
+                with gzip.GzipFile(fileobj=f, mode="wb") as out:
+                    for row in zip(*(columns[column] for column in COLUMNS)):
+                        record = dict(zip(COLUMNS, row))
+                        record["timestamp"] = record["timestamp"].isoformat()
+                        out.write((json.dumps(record) + "\n").encode("utf-8"))
+            write_atomic(os.path.join(self.directory, file_name), write_lines)
+
+        entry = {"name": name, "file": file_name, "format": file_format,
+                 "start": start.isoformat(), "end": end.isoformat(), "rows": len(message_ids),
+                 "min_message_id": first_id, "max_message_id": last_id}
+        partitions = [p for p in self.partitions() if p["file"] != file_name] + [entry]
+        partitions.sort(key=lambda p: p["start"])
+        write_atomic(self._manifest_path(),
+                     lambda f: f.write(json.dumps({"partitions": partitions}, indent=2).encode("utf-8")))
+        return entry
+
+    # ======================
+    # READ-THROUGH
+    # ======================
+
+    def _read(self, entry, filters):
+        """
+        Rows of one archive file matching every filter
+
+        Args:
+            entry (dict): Manifest entry
+            filters (list): (column, op, value) with op one of "=", "<", ">", "in"
+
+        Returns:
+            list: Row dicts with every column in COLUMNS
+        """
+        path = os.path.join(self.directory, entry["file"])
+        if entry["format"] == "parquet":
+            if pyarrow is None:
+                raise RuntimeError(f"{path} is Parquet; install the pyarrow package to read it")
+            return pyarrow.parquet.read_table(path, filters=filters or None).to_pylist()
+
+        checks = {"=": lambda a, b: a == b, "<": lambda a, b: a < b, ">": lambda a, b: a > b,
+                  "in": lambda a, b: a in b}
+        filters = [(column, checks[op], set(value) if op == "in" else value) for column, op, value in filters]
+        rows = []
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+                if all(check(row[column], value) for column, check, value in filters):
+                    rows.append(row)
+        return rows
+
+    def _months(self, first=None, last=None):
+        """Manifest entries whose month overlaps [first, last]"""
+        return [entry for entry in self.partitions()
+                if (first is None or entry["end"] > first.date().isoformat())
+                and (last is None or entry["start"] <= last.date().isoformat())]
+
+    def _user_filters(self, character_id, user_id):
+        filters = [("character_id", "=", character_id)]
+        if user_id is not None:
+            filters.append(("user_id", "=", user_id))
+        return filters
+
+    def history(self, character_id, user_id=None, limit=20, before=None, first=None, last=None):
+        """
+        Newest archived messages of a character (and user) before a time
+
+        Args:
+            character_id (int): Database ID of the character
+            user_id (str): Optional user filter
+            limit (int): Maximum messages to return
+            before (datetime): Only messages older than this
+            first, last (datetime): Known range of the user's archived messages (skips other months)
+
+        Returns:
+            list: Row dicts, newest first
+        """
+        rows = []
+        filters = self._user_filters(character_id, user_id)
+        if before is not None:
+            filters.append(("timestamp", "<", before))
+            last = before if last is None else min(last, before)
+        # Month by month, newest first (a month can have several files), until enough were found
+        entries = self._months(first, last)
+        for month in sorted({entry["start"] for entry in entries}, reverse=True):
+            found = [row for entry in entries if entry["start"] == month for row in self._read(entry, filters)]
+            found.sort(key=lambda row: (row["timestamp"], row["message_id"]), reverse=True)
+            rows.extend(found[:limit - len(rows)])
+            if len(rows) >= limit:
+                break
+        return rows
+
+    def messages_after(self, character_id, user_id, after_message_id=0, first=None, last=None):
+        """
+        Archived messages of a user newer than a message id
+
+        Returns:
+            list: Row dicts, oldest first
+        """
+        filters = self._user_filters(character_id, user_id) + [("message_id", ">", after_message_id)]
+        rows = [row for entry in self._months(first, last) if entry["max_message_id"] > after_message_id
+                for row in self._read(entry, filters)]
+        return sorted(rows, key=lambda row: row["message_id"])
+
+    def messages_by_ids(self, message_ids):
+        """
+        Archived messages by id; only months whose id range contains one of them are read
+
+        Returns:
+            list: Row dicts
+        """
+        rows = []
+        for entry in self.partitions():
+            wanted = [i for i in message_ids if entry["min_message_id"] <= i <= entry["max_message_id"]]
+            if wanted:
+                rows.extend(self._read(entry, [("message_id", "in", wanted)]))
+        return rows
+
+# ======================
+# ARCHIVAL JOB
+# ======================
+
+def archive_messages(db=None, archive=None, hot_months=MESSAGE_HOT_MONTHS):
+    """
+    Moves message partitions older than the hot months into the archive
+
+    Each partition's file is written before the partition is dropped, so an
+    interrupted run loses nothing; the next run writes the file again.
+
+    Args:
+        db (DatabaseManager): Database (default: a new connection)
+        archive (MessageArchive): Archive (default: MESSAGE_ARCHIVE_DIR)
+        hot_months (int): Months kept in the database, current one included
+
+    Returns:
+        list: Manifest entries of the partitions archived by this run
+    """
+    if db is None:
+        from database import DatabaseManager
+        db = DatabaseManager()
+    archive = archive or MessageArchive()
+
+    current_month = db.ensure_message_partitions()
+    cutoff = add_months(current_month, -(max(hot_months, 1) - 1))
+    archived = []
+    for name, start, end in db.list_message_partitions():
+        if end > cutoff:
+            continue
+        entry = archive.write_partition(name, start, end, db.read_message_partition(name))
+        db.drop_message_partition(name)
+        logger.info(f"Archived {name}: {entry['rows']} messages to {entry['file']}")
+        archived.append(entry)
+    return archived
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hot-months", type=int, default=MESSAGE_HOT_MONTHS,
+                        help="Months kept in the database, current one included")
+    parser.add_argument("--archive-dir", default=MESSAGE_ARCHIVE_DIR, help="Directory of the archive files")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    archived = archive_messages(archive=MessageArchive(args.archive_dir), hot_months=args.hot_months)
+    print(f"Archived {len(archived)} partitions, {sum(entry['rows'] for entry in archived)} messages")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import threading
+
+# Model identifiers used across the application
+CHAT_MODEL = "gemini-2.0-flash"
+EMBEDDING_MODEL = "models/embedding-001"
+
+_clients = {}  # (kind, model, temperature) -> shared client instance
+_lock = threading.Lock()
+
+# Optional replacements for the Gemini clients (e.g. the deterministic fakes in benchmarks/)
+_chat_factory = None
+_embeddings_factory = None
+
+def set_model_backend(chat_factory=None, embeddings_factory=None):
+    """
+    Replace how chat and embedding clients are built. Passing None restores Gemini.
+
+    Args:
+        chat_factory (callable): f(model, temperature) -> chat model
+        embeddings_factory (callable): f(model) -> embeddings
+    """
+    global _chat_factory, _embeddings_factory
+    with _lock:
+        _chat_factory = chat_factory
+        _embeddings_factory = embeddings_factory
+        _clients.clear()
+
+def get_chat_model(temperature, model=CHAT_MODEL):
+    """
+    Returns a shared Gemini chat client for the given temperature
+
+    The Google client library is only imported on first use, so importing
+    modules that depend on this one stays cheap.
+
+    Args:
+        temperature (float): Sampling temperature
+        model (str): Gemini model name
+
+    Returns:
+        ChatGoogleGenerativeAI: Chat model client
+    """
+    key = ("chat", model, temperature)
+    with _lock:
+        if key not in _clients:
+            if _chat_factory is not None:
+                _clients[key] = _chat_factory(model, temperature)
+            else:
+                from langchain_google_genai import ChatGoogleGenerativeAI
+                _clients[key] = ChatGoogleGenerativeAI(model=model, temperature=temperature)
+        return _clients[key]
+
+def get_embeddings(model=EMBEDDING_MODEL):
+    """
+    Returns a shared Gemini embeddings client
+
+    Args:
+        model (str): Embedding model name
+
+    Returns:
+        GoogleGenerativeAIEmbeddings: Embeddings client
+    """
+    key = ("embeddings", model, None)
+    with _lock:
+        if key not in _clients:
+            if _embeddings_factory is not None:
+                _clients[key] = _embeddings_factory(model)
+            else:
+                from langchain_google_genai import GoogleGenerativeAIEmbeddings
+                _clients[key] = GoogleGenerativeAIEmbeddings(model=model)
+        return _clients[key]
@@ -0,0 +1,104 @@
+"""
+PDF TEXT EXTRACTION BACKENDS
+One function per extraction library, selected with PDF_BACKEND.
+
+A backend takes a PDF (path or file-like object) and returns the raw text of
+every page in order, keeping line breaks (boilerplate removal needs them).
+Libraries are imported on first use; only PyPDF2 is a hard requirement.
+
+- pypdf2 (default): PyPDF2, pure Python
+- pypdf: pypdf, PyPDF2's maintained successor with the same API
+- pdfium: pypdfium2, bindings to Chrome's PDFium (C++, fastest)
+- pdfminer: pdfminer.six layout analysis, pure Python (slowest, best reading order on complex layouts)
+
+`python benchmarks/bench_pdf_backends.py` compares their speed and text fidelity.
+"""
+
+import importlib.util
+import os
+import threading
+from typing import Callable, Dict, List
+
+PDF_BACKEND = os.getenv("PDF_BACKEND", "pypdf2")
+
+# (module, pip package) of each optional backend
+PACKAGES = {"pypdf": ("pypdf", "pypdf"), "pdfium": ("pypdfium2", "pypdfium2"), "pdfminer": ("pdfminer", "pdfminer.six")}
+
+_pdfium_lock = threading.Lock()  # PDFium is not thread-safe
+
+def _pypdf2_pages(pdf) -> List[str]:
+    from PyPDF2 import PdfReader
+    return [page.extract_text() or "" for page in PdfReader(pdf).pages]  # Handle None returns
+
+def _pypdf_pages(pdf) -> List[str]:
+    from pypdf import PdfReader
+    return [page.extract_text() or "" for page in PdfReader(pdf).pages]
+
+def _pdfium_pages(pdf) -> List[str]:
+    import pypdfium2
+
+    pages = []
+    with _pdfium_lock:
+        document = pypdfium2.PdfDocument(pdf)
+        try:
+            for page in document:
+                text_page = page.get_textpage()
+                pages.append(text_page.get_text_range())
+                text_page.close()
+                page.close()
+        finally:
+            document.close()
+    return pages
+
+def _pdfminer_pages(pdf) -> List[str]:
+    from pdfminer.high_level import extract_pages
+    from pdfminer.layout import LTTextContainer
+
+    return ["".join(element.get_text() for element in layout if isinstance(element, LTTextContainer))
+            for layout in extract_pages(pdf)]
+
+BACKENDS: Dict[str, Callable] = {
+    "pypdf2": _pypdf2_pages,
+    "pypdf": _pypdf_pages,
+    "pdfium": _pdfium_pages,
+    "pdfminer": _pdfminer_pages,
+}
+
+def register_backend(name, extract_pages):
+    """
+    Adds or replaces a backend
+
+    Args:
+        name (str): Value of PDF_BACKEND that selects it
+        extract_pages (callable): f(pdf) -> list of page texts
+    """
+    BACKENDS[name] = extract_pages
+
+def is_available(name):
+    """True if the backend exists and its library is installed"""
+    if name not in BACKENDS:
+        return False
+    if name not in PACKAGES:
+        return True
+    return importlib.util.find_spec(PACKAGES[name][0]) is not None
+
+def get_backend(name=None):
+    """
+    Returns the page extraction function of a backend
+
+    Args:
+        name (str): Backend name (default: PDF_BACKEND)
+
+    Returns:
+        callable: f(pdf) -> List[str] of raw page texts
+
+    Raises:
+        ValueError: If the backend is unknown
+        ImportError: If its library is not installed
+    """
+    name = name or PDF_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown PDF backend {name!r}; choose one of {', '.join(BACKENDS)}")
+    if not is_available(name):
+        raise ImportError(f"PDF backend {name!r} needs `pip install {PACKAGES[name][1]}`")
+    return BACKENDS[name]
@@ -1,36 +1,63 @@
-import json
-from PyPDF2 import PdfReader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain.vectorstores import FAISS
+from typing import Union, List, Tuple
+import bisect
+import logging
 import os
-from typing import Union, List, Optional
 import re
+import dedup
+import telemetry
+from book_index import BookIndex
+from dossier import build_dossiers, find_mentions
+from models import get_chat_model, get_embeddings
+from pdf_backends import get_backend
+
+logger = logging.getLogger(__name__)
+
+# Strip headers/footers/front matter and drop near-duplicate chunks before embedding
+INGEST_DEDUP = os.getenv("INGEST_DEDUP", "1") != "0"
 
 class PDFProcessor:
     """
     Handles processing of PDF and text inputs including:
-    - Text extraction from PDFs
+    - Text extraction from PDFs (pluggable backend, see pdf_backends)
     - Text cleaning and normalization
+    - Boilerplate and near-duplicate removal
     - Chunking for vector storage
     - Character extraction using LLMs
-    - FAISS vector store creation
+    - Vector index creation (memory-mappable BookIndex)
+    - Per-character dossiers stored with the index
     
     Uses Google's Generative AI embeddings for text vectorization
     and Gemini model for character extraction.
     """
     
-    def __init__(self):
-        """Initialize with embeddings model and text splitter configuration"""
-        # Google's text embedding model
-        self.embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-        
-        # Configured text splitter for optimal chunking
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=10000,      # Optimal size for context retention
-            chunk_overlap=1000,    # Maintains context between chunks
-            length_function=len    # Standard length calculation
-        )
+    def __init__(self, pdf_backend: str = None):
+        """
+        Initialize processor. Embeddings client and text splitter are created
+        on first use so constructing a processor (e.g. on every Streamlit
+        rerun) doesn't import langchain or the Google clients.
+        
+        Args:
+            pdf_backend: PDF text extraction backend (default: PDF_BACKEND, see pdf_backends)
+        """
+        self._text_splitter = None
+        self.pdf_backend = pdf_backend
+        
+    @property
+    def embeddings(self):
+        """Google's text embedding model (shared client)"""
+        return get_embeddings()
+
+    @property
+    def text_splitter(self):
+        """Configured text splitter, built on first use"""
+        if self._text_splitter is None:
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
+            self._text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=10000,      # Optimal size for context retention
+                chunk_overlap=1000,    # Maintains context between chunks
+                length_function=len    # Standard length calculation
+            )
+        return self._text_splitter
         
     def get_pdf_text(self, input_source: Union[List[str], str]) -> str:
         """
@@ -60,16 +87,81 @@ class PDFProcessor:
             
         Returns:
             str: Combined text from all PDF pages
+        """
+        return " ".join(text for _, _, text in self.get_pdf_pages(pdf_docs))
+
+    def get_pdf_pages(self, pdf_docs: List[str], report: dict = None) -> List[Tuple[str, int, str]]:
+        """
+        Extract cleaned text page by page, keeping where each page came from
+        
+        Running headers, footers, page numbers and front-matter pages are
+        removed per document, then pages repeating an earlier page (in any of
+        the documents) are dropped; see dedup. INGEST_DEDUP=0 turns this off.
+        
+        Args:
+            pdf_docs: List of PDF files (paths or file-like objects)
+            report: Optional dedup.DedupReport to add the removal stats to
+            
+        Returns:
+            List[Tuple[str, int, str]]: (source file name, 1-based page number, text)
             
         Note:
-            Silently skips pages that return None from extract_text()
-        """
-        text = ""
-        for pdf in pdf_docs:
-            pdf_reader = PdfReader(pdf)
-            for page in pdf_reader.pages:
-                text += page.extract_text() or ""  # Handle None returns
-        return self._clean_text(text)
+            Silently skips pages without extractable text
+        """
+        extract_pages = get_backend(self.pdf_backend)
+
+        pages = []
+        with telemetry.span("ingest.extract_text"):
+            for position, pdf in enumerate(pdf_docs):
+                source = pdf if isinstance(pdf, str) else getattr(pdf, "name", None)
+                source = os.path.basename(source) if isinstance(source, str) else f"document-{position + 1}"
+                page_texts = extract_pages(pdf)
+                telemetry.count("ingest.pages", len(page_texts))
+                if INGEST_DEDUP:
+                    page_texts = self._strip_boilerplate(page_texts, report)
+                for page_number, page_text in enumerate(page_texts, start=1):
+                    text = self._clean_text(page_text)
+                    if text:
+                        pages.append((source, page_number, text))
+        if INGEST_DEDUP:
+            with telemetry.span("ingest.dedupe_pages"):
+                pages, stats = dedup.dedupe_pages(pages)
+            telemetry.count("ingest.duplicate_pages", stats["duplicate_pages"])
+            if report is not None:
+                report.add(stats)
+        return pages
+
+    def _strip_boilerplate(self, page_texts: List[str], report: dict = None) -> List[str]:
+        """Removes the boilerplate of one document's raw pages and records the stats"""
+        with telemetry.span("ingest.strip_boilerplate"):
+            page_texts, stats = dedup.strip_boilerplate(page_texts)
+        telemetry.count("ingest.boilerplate_lines", stats["boilerplate_lines"])
+        telemetry.count("ingest.front_matter_pages", stats["front_matter_pages"])
+        if report is not None:
+            report.add(stats)
+        return page_texts
+
+    def dedupe_chunks(self, text_chunks: List[str], metadatas: List[dict] = None,
+                      report: dict = None) -> Tuple[List[str], List[dict]]:
+        """
+        Drop chunks that are near duplicates of earlier ones (see dedup.dedupe_chunks)
+        
+        Args:
+            text_chunks: Chunks in book order
+            metadatas: Optional {"source", "page"} per chunk
+            report: Optional dedup.DedupReport to add the removal stats to
+            
+        Returns:
+            Tuple[List[str], List[dict]]: Kept chunks and their metadatas
+        """
+        if not INGEST_DEDUP:
+            return text_chunks, metadatas
+        with telemetry.span("ingest.dedupe_chunks"):
+            text_chunks, metadatas, stats = dedup.dedupe_chunks(text_chunks, metadatas)
+        telemetry.count("ingest.duplicate_chunks", stats["duplicate_chunks"])
+        if report is not None:
+            report.add(stats)
+        return text_chunks, metadatas
     
     def _clean_text(self, text: str) -> str:
         """
@@ -103,42 +195,136 @@ class PDFProcessor:
         """
         if not text.strip():
             raise ValueError("Empty text provided for chunking")
-        return self.text_splitter.split_text(text)
+        with telemetry.span("ingest.chunk"):
+            chunks = self.text_splitter.split_text(text)
+        telemetry.count("ingest.chunks", len(chunks))
+        return chunks
+
+    def get_page_chunks(self, pages: List[Tuple[str, int, str]]) -> Tuple[List[str], List[dict]]:
+        """
+        Split extracted pages into chunks, recording the file and page each chunk starts on
+        
+        Chunks span page boundaries exactly as get_text_chunks does on the
+        combined text; only the metadata is added.
+        
+        Args:
+            pages: Output of get_pdf_pages
+            
+        Returns:
+            Tuple[List[str], List[dict]]: Chunks and one {"source", "page"} per chunk
+        """
+        text = " ".join(page_text for _, _, page_text in pages)
+        chunks = self.get_text_chunks(text)
+
+        # Character offset where each page starts in the combined text
+        page_starts, position = [], 0
+        for _, _, page_text in pages:
+            page_starts.append(position)
+            position += len(page_text) + 1
+
+        metadatas, search_from = [], 0
+        for chunk in chunks:
+            start = text.find(chunk, search_from)
+            if start < 0:  # Not expected: the splitter only strips whitespace
+                start = search_from
+            search_from = start + 1
+            source, page_number, _ = pages[bisect.bisect_right(page_starts, start) - 1]
+            metadatas.append({"source": source, "page": page_number})
+        return chunks, metadatas
     
-    def create_vector_store(self, text_chunks: List[str], index_name: str = "faiss_index") -> FAISS:
+    def create_vector_store(self, text_chunks: List[str], index_name: str = "faiss_index",
+                            metadatas: List[dict] = None, report: dict = None,
+                            characters: List[str] = None, quantization: str = None) -> BookIndex:
         """
-        Create and persist FAISS vector store from text chunks
+        Create and persist the vector index for text chunks
         
         Args:
             text_chunks: List of text segments to vectorize
-            index_name: Name for the saved index (default: "faiss_index")
+            index_name: Directory for the saved index (default: "faiss_index")
+            metadatas: Optional {"source", "page"} per chunk (see get_page_chunks)
+            report: Optional dedup.DedupReport stored with the index
+            characters: Optional roster; chunks are tagged with the characters they
+                mention, for character-filtered retrieval
+            quantization: Vector layout of the index (default: INDEX_QUANTIZATION,
+                see book_index)
             
         Returns:
-            FAISS: Created vector store
+            BookIndex: Created index (memory-mapped from disk)
             
         Raises:
             ValueError: If no text chunks provided
         """
         if not text_chunks:
             raise ValueError("No text chunks provided for vector store creation")
-            
-        # Generate embeddings and create vector store
-        vector_store = FAISS.from_texts(text_chunks, embedding=self.embeddings)
+
+        # Generate embeddings
+        with telemetry.span("ingest.embed_and_index"):
+            vectors = self.embeddings.embed_documents(text_chunks)
         
-        # Persist to disk for later use
-        vector_store.save_local(index_name)
-        return vector_store
+        # Persist vectors and chunk texts in the memory-mappable layout
+        mentions = find_mentions(text_chunks, characters) if characters is not None else None
+        with telemetry.span("ingest.save_index"):
+            return BookIndex.build(index_name, text_chunks, vectors, metadatas, dedup=report, mentions=mentions,
+                                   quantization=quantization)
     
-    def process_input(self, text: str) -> List[str]:
+    def run_pipeline(self, index_name: str, pdf_docs: List[str] = None, text: str = None,
+                     quantization: str = None) -> dict:
         """
-        Complete text processing pipeline:
-        1. Text cleaning
-        2. Chunking
-        3. Vector store creation
+        The ingestion pipeline behind every entry point (app, API, bulk ingester):
+        1. Page-by-page PDF text extraction without boilerplate, or text cleaning
+        2. Chunking (with file/page metadata for PDFs)
+        3. Near-duplicate chunk removal
         4. Character extraction
+        5. Vector store creation, chunks tagged with the characters they mention
+        6. Character dossiers
+        
+        Args:
+            index_name: Directory for the book's index
+            pdf_docs: List of PDF files (paths or file-like objects), or
+            text: Text to process
+            quantization: Vector layout of the index (default: INDEX_QUANTIZATION)
+            
+        Returns:
+            dict: characters, pages (0 for text), chunks and dedup (dedup.DedupReport).
+                  Empty text, or PDFs without extractable text, yield no
+                  characters and build nothing.
+        """
+        report = dedup.DedupReport()
+        if pdf_docs:
+            pages = self.get_pdf_pages(pdf_docs, report)
+            text = " ".join(page_text for _, _, page_text in pages)
+        else:
+            pages, text = [], self._clean_text(text or "")
+        if not text.strip():
+            return {"characters": [], "pages": len(pages), "chunks": 0, "dedup": report}
+        text_chunks, metadatas = self.get_page_chunks(pages) if pdf_docs else (self.get_text_chunks(text), None)
+        text_chunks, metadatas = self.dedupe_chunks(text_chunks, metadatas, report)
+        logger.info("Deduplicated %s: %s", index_name, report)
+        characters = self.extract_characters(text)
+        self.create_vector_store(text_chunks, index_name, metadatas, report, characters, quantization)
+        build_dossiers(text_chunks, metadatas, characters, index_name)
+        return {"characters": characters, "pages": len(pages), "chunks": len(text_chunks), "dedup": report}
+
+    def process_pdfs(self, pdf_docs: List[str], index_name: str = "faiss_index") -> List[str]:
+        """
+        Complete PDF processing pipeline (see run_pipeline)
+        
+        Args:
+            pdf_docs: List of PDF files (paths or file-like objects)
+            index_name: Directory for the book's index
+            
+        Returns:
+            List[str]: Extracted character names
+        """
+        return self.run_pipeline(index_name, pdf_docs=pdf_docs)["characters"]
+
+    def process_input(self, text: str, index_name: str = "faiss_index") -> List[str]:
+        """
+        Complete text processing pipeline (see run_pipeline)
         
         Args:
             text: Input text to process
+            index_name: Directory for the book's index
             
         Returns:
             List[str]: Extracted character names
@@ -146,14 +332,7 @@ class PDFProcessor:
         Note:
             Returns empty list for empty/non-narrative text
         """
-        if not text.strip():
-            return []
-            
-        text_chunks = self.get_text_chunks(text)
-        self.create_vector_store(text_chunks)
-        characters = self.extract_characters(text)
-        
-        return characters
+        return self.run_pipeline(index_name, text=text)["characters"]
 
     def extract_characters(self, text: str) -> List[str]:
         """
@@ -169,7 +348,7 @@ class PDFProcessor:
             - Returns empty list for non-narrative/short text
             - Handles edge cases with NO_CHARACTERS_FOUND response
         """
-        model = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.5)
+        model = get_chat_model(temperature=0.5)
         
         # Dynamic prompt based on text length
         if len(text.split()) < 50:  # Short text detection
@@ -188,7 +367,9 @@ class PDFProcessor:
             For non-narrative text, return exactly: NO_CHARACTERS_FOUND
             """
         
-        response = model.invoke(prompt)
+        with telemetry.span("ingest.extract_characters"):
+            response = model.invoke(prompt)
+        telemetry.record_usage(response)
         response_text = response.content.strip()
         
         # Handle special case response
@@ -0,0 +1,352 @@
+"""
+HEADLESS CHAT SERVICE
+ASGI (Starlette) API exposing the chat engine without Streamlit, so chat
+traffic can be served by several worker processes behind a load balancer:
+
+    uvicorn service:app --app-dir app --host 0.0.0.0 --port 8000 --workers 4
+
+Endpoints:
+    GET  /health                                          Liveness probe
+    GET  /metrics                                         Prometheus metrics of this worker (TELEMETRY_ENABLED=1)
+    GET  /books                                           List ingested books
+    POST /books                                           Ingest PDFs (multipart "files") or "text" (ingest scope)
+    GET  /books/{book_source}/characters                  List extracted characters
+    GET  /books/{book_source}/characters/{name}/state     Current emotional state
+    GET  /books/{book_source}/characters/{name}/history   Saved conversation (logged-in users)
+    GET  /books/{book_source}/characters/{name}/emotions  Downsampled emotion history (logged-in users)
+    GET  /books/{book_source}/emotions                    Emotion statistics over all users and characters
+    POST /chat                                            One turn, streamed as NDJSON events
+    WS   /chat/ws                                         Many turns over one socket, streamed as JSON events
+
+The user is identified by the signed bearer token in the Authorization header
+(see auth.py); requests without one are anonymous. Ingesting a book replaces
+what every user chats against, so POST /books needs a token with the ingest
+scope. Books and characters must be in the book catalog; anything else is
+answered with 404.
+"""
+
+import json
+import os
+from datetime import datetime
+from functools import lru_cache
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocketDisconnect
+import library
+from auth import INGEST_SCOPE, InvalidToken, MissingScope, user_from_headers
+from character import CharacterManager
+from character_state import CharacterState
+from chat import ChatManager
+from emotion_history import EmotionAggregator
+from pdf_processor import PDFProcessor
+import telemetry
+
+# Load environment variables (API keys, etc.)
+load_dotenv()
+
+# Books whose chat manager (index, dossiers, chains) is kept loaded per worker process
+CHAT_MANAGER_CACHE_SIZE = int(os.getenv("CHAT_MANAGER_CACHE_SIZE", "64"))
+
+# ======================
+# SHARED RESOURCES (one per worker process)
+# ======================
+
+@lru_cache(maxsize=None)
+def get_pdf_processor():
+    """Shared PDF/text processor"""
+    return PDFProcessor()
+
+@lru_cache(maxsize=None)
+def get_character_manager():
+    """Shared character state manager (owns the database connection)"""
+    return CharacterManager()
+
+@lru_cache(maxsize=CHAT_MANAGER_CACHE_SIZE)
+def _chat_manager(book_source, index_dir):
+    return ChatManager(book_source, character_manager=get_character_manager(), index_path=index_dir)
+
+def get_book(book_source):
+    """Catalog entry of a book, or None if it was never ingested"""
+    return get_character_manager().db.get_book(book_source)
+
+def get_chat_manager(book_source, book=None):
+    """
+    Shared chat manager of a cataloged book; the least recently used ones
+    beyond CHAT_MANAGER_CACHE_SIZE are dropped, and a re-ingested book (new
+    index directory) gets a new one
+
+    Args:
+        book_source (str): Book identifier
+        book (dict): Its catalog entry, if already looked up
+
+    Returns:
+        ChatManager or None if the book is not in the catalog
+    """
+    book = book or get_book(book_source)
+    if book is None:
+        return None
+    return _chat_manager(book_source, book["index_dir"])
+
+def ingest(book_source, pdf_files=None, text=None):
+    """
+    Runs the ingestion pipeline used by the Streamlit sidebar and records the
+    book in the catalog (shared by all worker processes through the database)
+
+    Returns:
+        list: Extracted character names
+    """
+    with telemetry.trace("ingest", book_source=book_source):
+        characters, _ = library.ingest(get_pdf_processor(), get_character_manager().db, book_source,
+                                       pdf_docs=pdf_files, text=text)
+    if characters:
+        # This worker serves the book's first turns without building anything
+        get_chat_manager(book_source).warm_up(characters)
+    return characters
+
+def error(message, status_code=400):
+    """JSON error response"""
+    return JSONResponse({"error": message}, status_code=status_code)
+
+def check_character(book_source, character_name=None):
+    """
+    Looks a book (and one of its characters) up in the catalog
+
+    Returns:
+        Tuple[dict, str]: The catalog entry, and an error message (None if both exist)
+    """
+    book = get_book(book_source)
+    if book is None:
+        return None, f"Unknown book: {book_source}"
+    if character_name is not None and character_name not in book["characters"]:
+        return book, f"Unknown character of {book_source}: {character_name}"
+    return book, None
+
+def authenticate(request, scope=None):
+    """
+    User of a request (see auth.user_from_headers)
+
+    Args:
+        request: The HTTP request
+        scope (str): Scope the request needs, if any
+
+    Returns:
+        Tuple[str, JSONResponse]: The user ID, or an error response (401 for a
+            missing or invalid token, 403 for one without the scope)
+    """
+    try:
+        return user_from_headers(request.headers, scope=scope), None
+    except MissingScope as e:
+        return None, error(str(e), status_code=403)
+    except InvalidToken as e:
+        return None, error(str(e), status_code=401)
+
+# ======================
+# HTTP ENDPOINTS
+# ======================
+
+async def health(request):
+    return JSONResponse({"status": "ok"})
+
+async def metrics(request):
+    return PlainTextResponse(telemetry.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+async def create_book(request):
+    _, failure = authenticate(request, scope=INGEST_SCOPE)
+    if failure:
+        return failure
+    form = await request.form()
+    book_source = form.get("book_source")
+    pdf_files = [upload.file for upload in form.getlist("files")]
+    text = form.get("text")
+    if not book_source or not (pdf_files or text):
+        return error("book_source and either files or text are required")
+
+    characters = await run_in_threadpool(ingest, book_source, pdf_files, text)
+    if not characters:
+        return error("No identifiable characters found in the text", status_code=422)
+    return JSONResponse({"book_source": book_source, "characters": characters}, status_code=201)
+
+async def list_books(request):
+    books = await run_in_threadpool(get_character_manager().db.list_books)
+    return JSONResponse({"books": [{"book_source": book["book_source"], "characters": book["characters"],
+                                    "ingested_at": book["ingested_at"].isoformat()} for book in books]})
+
+async def list_characters(request):
+    book_source = request.path_params["book_source"]
+    book, problem = await run_in_threadpool(check_character, book_source)
+    if problem:
+        return error(problem, status_code=404)
+    return JSONResponse({"book_source": book_source, "characters": book["characters"]})
+
+async def character_state(request):
+    book_source = request.path_params["book_source"]
+    character_name = request.path_params["name"]
+    user_id, failure = authenticate(request)
+    if failure:
+        return failure
+    _, problem = await run_in_threadpool(check_character, book_source, character_name)
+    if problem:
+        return error(problem, status_code=404)
+    state, character_id = await run_in_threadpool(
+        get_character_manager().get_character_state, character_name, book_source, user_id
+    )
+    return JSONResponse({"character": character_name, "character_id": character_id, "state": state.to_dict()})
+
+async def chat_history(request):
+    book_source = request.path_params["book_source"]
+    character_name = request.path_params["name"]
+    user_id, failure = authenticate(request)
+    if failure:
+        return failure
+    book, problem = await run_in_threadpool(check_character, book_source, character_name)
+    if problem:
+        return error(problem, status_code=404)
+    history = await run_in_threadpool(
+        get_chat_manager(book_source, book).get_chat_history, character_name, user_id
+    )
+    for message in history:
+        if message.get("timestamp"):
+            message["timestamp"] = message["timestamp"].isoformat()
+    return JSONResponse({"character": character_name, "messages": history})
+
+def parse_since(request):
+    """Optional ISO-8601 "since" query parameter"""
+    since = request.query_params.get("since")
+    return datetime.fromisoformat(since) if since else None
+
+async def emotion_trajectory(request):
+    book_source = request.path_params["book_source"]
+    character_name = request.path_params["name"]
+    user_id, failure = authenticate(request)
+    if failure:
+        return failure
+    try:
+        bucket_seconds = float(request.query_params.get("bucket", "60"))
+        since = parse_since(request)
+    except ValueError as e:
+        return error(str(e))
+    if bucket_seconds <= 0:
+        return error("bucket must be positive")
+    _, problem = await run_in_threadpool(check_character, book_source, character_name)
+    if problem:
+        return error(problem, status_code=404)
+    trajectory = await run_in_threadpool(
+        get_character_manager().get_emotion_trajectory, character_name, book_source, user_id, since,
+        None, bucket_seconds
+    )
+    return JSONResponse({"character": character_name, "fields": list(CharacterState.FIELDS), "points": [
+        {"time": point["time"].isoformat(), "samples": point["samples"], "state": point["state"]}
+        for point in trajectory
+    ]})
+
+async def emotion_stats(request):
+    book_source = request.path_params["book_source"]
+    try:
+        since = parse_since(request)
+    except ValueError as e:
+        return error(str(e))
+    character_manager = get_character_manager()
+    await run_in_threadpool(character_manager.emotion_history.flush)
+    aggregator = await run_in_threadpool(EmotionAggregator.from_db, character_manager.db, book_source, since)
+    return JSONResponse({"book_source": book_source, **aggregator.summary(),
+                         "by_character": aggregator.by_character()})
+
+def parse_turn(payload):
+    """
+    Validates a chat turn payload (the user comes from the request's token, never the payload)
+
+    Returns:
+        tuple: (book_source, character, message, state). Anonymous clients
+               may send back the "state" they last received, since it isn't stored.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("Expected a JSON object")
+    missing = [field for field in ("book_source", "character", "message") if not payload.get(field)]
+    if missing:
+        raise ValueError(f"Missing fields: {', '.join(missing)}")
+    not_text = [field for field in ("book_source", "character", "message") if not isinstance(payload[field], str)]
+    if not_text:
+        raise ValueError(f"Fields must be strings: {', '.join(not_text)}")
+
+    state = payload.get("state")
+    if state is not None:
+        if not isinstance(state, dict):
+            raise ValueError("state must be a JSON object")
+        state =CharacterState(**{field: float(state[field]) for field in CharacterState.FIELDS if field in state})
+    return payload["book_source"], payload["character"], payload["message"], state
+
+def client_id(user_id, client):
+    """Identity charged for rate limiting: the user, or the peer address for anonymous users"""
+    if user_id != "anonymous" or client is None:
+        return user_id
+    return f"anonymous@{client.host}"
+
+async def chat(request):
+    user_id, failure = authenticate(request)
+    if failure:
+        return failure
+    try:
+        book_source, character_name, message, state = parse_turn(await request.json())
+    except (ValueError, TypeError, json.JSONDecodeError) as e:
+        return error(str(e))
+    book, problem = await run_in_threadpool(check_character, book_source, character_name)
+    if problem:
+        return error(problem, status_code=404)
+
+    events = get_chat_manager(book_source, book).stream_user_input(message, character_name, user_id, state,
+                                                                   client_id(user_id, request.client))
+
+    async def body():
+        # The engine is synchronous; iterate it on the thread pool so the event loop stays free
+        async for event in iterate_in_threadpool(events):
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+# ======================
+# WEBSOCKET ENDPOINT
+# ======================
+
+async def chat_socket(websocket):
+    # The token may also be passed as ?token=, since browsers can't set headers on the handshake
+    try:
+        user_id = user_from_headers(websocket.headers, websocket.query_params)
+    except InvalidToken:
+        await websocket.close(code=1008)  # Policy violation
+        return
+    await websocket.accept()
+    try:
+        while True:
+            try:
+                book_source, character_name, message, state = parse_turn(await websocket.receive_json())
+            except (ValueError, TypeError, json.JSONDecodeError) as e:
+                await websocket.send_json({"type": "error", "error": str(e)})
+                continue
+            book, problem = await run_in_threadpool(check_character, book_source, character_name)
+            if problem:
+                await websocket.send_json({"type": "error", "error": problem})
+                continue
+
+            events = get_chat_manager(book_source, book).stream_user_input(message, character_name, user_id, state,
+                                                                           client_id(user_id, websocket.client))
+            async for event in iterate_in_threadpool(events):
+                await websocket.send_json(event)
+    except WebSocketDisconnect:
+        pass
+
+app = Starlette(routes=[
+    Route("/health", health),
+    Route("/metrics", metrics),
+    Route("/books", list_books, methods=["GET"]),
+    Route("/books", create_book, methods=["POST"]),
+    Route("/books/{book_source}/characters", list_characters),
+    Route("/books/{book_source}/characters/{name}/state", character_state),
+    Route("/books/{book_source}/characters/{name}/history", chat_history),
+    Route("/books/{book_source}/characters/{name}/emotions", emotion_trajectory),
+    Route("/books/{book_source}/emotions", emotion_stats),
+    Route("/chat", chat, methods=["POST"]),
+    WebSocketRoute("/chat/ws", chat_socket),
+])
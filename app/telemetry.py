@@ -0,0 +1,274 @@
+"""
+LIGHTWEIGHT TRACING AND METRICS
+Per-stage timings and counters for chat turns and ingestion.
+
+- span(name): times a block; durations go to the active trace and to a
+  process-wide histogram
+- count(name, value): increments a counter (DB queries, LLM tokens, ...)
+- trace(name, **attrs): groups the spans/counters of one chat turn or one
+  ingestion and emits them as a single JSON log line when it ends
+- render_prometheus(): process metrics in Prometheus text format
+
+Disabled by default (TELEMETRY_ENABLED=1 turns it on); when disabled every
+call returns immediately with a shared no-op context manager.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+_enabled = os.getenv("TELEMETRY_ENABLED", "").lower() in ("1", "true", "yes")
+
+# Histogram buckets (seconds) for span durations
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+logger = logging.getLogger("telemetry")
+_NOOP = nullcontext()
+_current_trace = contextvars.ContextVar("telemetry_trace", default=None)
+
+def is_enabled():
+    """Whether instrumentation is recording"""
+    return _enabled
+
+def set_enabled(enabled):
+    """Turn instrumentation on or off at runtime"""
+    global _enabled
+    _enabled = bool(enabled)
+    if _enabled and not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+
+class Trace:
+    """Spans and counters collected for one unit of work"""
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.spans = {}     # span name -> total seconds
+        self.counters = {}  # counter name -> total
+        self._lock = threading.Lock()  # LLM callbacks may report from other threads
+
+    def add_span(self, name, seconds):
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def add_count(self, name, value):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+class _Registry:
+    """Process-wide histograms and counters"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}  # span name -> [bucket counts..., +Inf count, sum]
+        self.counters = {}
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = [0] * (len(BUCKETS) + 1) + [0.0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[len(BUCKETS)] += 1
+            histogram[-1] += seconds
+
+    def increment(self, name, value):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+_registry = _Registry()
+
+def observe(name, seconds):
+    """Records a duration measured by the caller"""
+    if not _enabled:
+        return
+    _registry.observe(name, seconds)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_span(name, seconds)
+
+@contextmanager
+def _span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+def span(name):
+    """
+    Times a block of work
+
+    Args:
+        name (str): Stage name, e.g. "chat.similarity_search"
+    """
+    return _span(name) if _enabled else _NOOP
+
+def count(name, value=1):
+    """
+    Increments a counter on the process registry and the active trace
+
+    Args:
+        name (str): Counter name, e.g. "db.queries"
+        value (int): Amount to add
+    """
+    if not _enabled:
+        return
+    _registry.increment(name, value)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_count(name, value)
+
+def record_usage(message, trace=None):
+    """
+    Counts LLM calls and tokens from a response's usage_metadata
+
+    Args:
+        message: AIMessage returned by a chat model
+        trace (Trace): Trace to attribute to (defaults to the active one)
+    """
+    if not _enabled:
+        return
+    usage = getattr(message, "usage_metadata", None) or {}
+    counts = {"llm.calls": 1,
+              "llm.input_tokens": usage.get("input_tokens", 0),
+              "llm.output_tokens": usage.get("output_tokens", 0)}
+    trace = trace or _current_trace.get()
+    for name, value in counts.items():
+        _registry.increment(name, value)
+        if trace is not None:
+            trace.add_count(name, value)
+
+def start_trace(name, **attrs):
+    """Creates a trace without activating it (see activate/finish_trace); None when disabled"""
+    return Trace(name, attrs) if _enabled else None
+
+@contextmanager
+def activate(trace):
+    """Makes `trace` the active trace for the enclosed block (no-op for None)"""
+    if trace is None:
+        yield
+        return
+    token = _current_trace.set(trace)
+    try:
+        yield
+    finally:
+        _current_trace.reset(token)
+
+def finish_trace(trace):
+    """Records the trace duration and writes it as one structured log line"""
+    if trace is None:
+        return
+    duration = time.perf_counter() - trace.start
+    _registry.observe(trace.name, duration)
+    logger.info(json.dumps({
+        "trace": trace.name,
+        "duration_ms": round(duration * 1000, 2),
+        **trace.attrs,
+        "spans_ms": {name: round(seconds * 1000, 2) for name, seconds in trace.spans.items()},
+        "counters": trace.counters,
+    }))
+
+@contextmanager
+def trace(name, **attrs):
+    """
+    Groups everything recorded in the block into one trace
+
+    Args:
+        name (str): Unit of work, e.g. "chat_turn" or "ingest"
+        **attrs: Extra fields for the log line (book, character, ...)
+    """
+    current = start_trace(name, **attrs)
+    try:
+        with activate(current):
+            yield current
+    finally:
+        finish_trace(current)
+
+_usage_callback_class = None  # Defined on first use so LangChain is only imported when needed
+
+def chain_callbacks(trace=None):
+    """
+    LangChain run config that attributes LLM token usage inside a chain to a trace
+
+    Returns:
+        dict: {"callbacks": [...]} or {} when disabled
+    """
+    global _usage_callback_class
+    if not _enabled:
+        return {}
+    if _usage_callback_class is None:
+        from langchain_core.callbacks import BaseCallbackHandler
+
+        class UsageCallback(BaseCallbackHandler):
+            def __init__(self, trace):
+                self.trace = trace
+
+            def on_llm_end(self, response, **kwargs):
+                for generations in response.generations:
+                    for generation in generations:
+                        record_usage(getattr(generation, "message", None), self.trace)
+
+        _usage_callback_class = UsageCallback
+    return {"callbacks": [_usage_callback_class(trace or _current_trace.get())]}
+
+def render_prometheus():
+    """
+    Process metrics in the Prometheus text exposition format
+
+    Returns:
+        str: Metrics page body
+    """
+    lines = ["# TYPE chatbot_stage_seconds histogram"]
+    with _registry.lock:
+        histograms = {name: list(values) for name, values in _registry.histograms.items()}
+        counters = dict(_registry.counters)
+    for name, values in sorted(histograms.items()):
+        for bound, bucket_count in zip(BUCKETS, values):
+            lines.append(f'chatbot_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {bucket_count}')
+        lines.append(f'chatbot_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {values[len(BUCKETS)]}')
+        lines.append(f'chatbot_stage_seconds_sum{{stage="{name}"}} {values[-1]}')
+        lines.append(f'chatbot_stage_seconds_count{{stage="{name}"}} {values[len(BUCKETS)]}')
+    lines.append("# TYPE chatbot_events_total counter")
+    for name, value in sorted(counters.items()):
+        lines.append(f'chatbot_events_total{{event="{name}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+def start_metrics_server(port):
+    """
+    Serves /metrics on a background thread (for processes without their own
+    HTTP server, e.g. Streamlit)
+
+    Args:
+        port (int): TCP port to listen on
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = render_prometheus().encode()
+            self.send_response(200 if self.path == "/metrics" else 404)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.end_headers()
+            if self.path == "/metrics":
+                self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# Attach the log handler when enabled through the environment
+set_enabled(_enabled)
@@ -0,0 +1,57 @@
+"""
+STREAMLIT RENDERING HELPERS
+Everything that draws to the Streamlit page lives here, so the chat engine
+(ChatManager, CharacterManager, DatabaseManager) stays UI-independent.
+"""
+
+import streamlit as st
+
+def render_emotions(character_state):
+    """
+    Display all emotional and cognitive states as Streamlit progress bars.
+    Formats the display with clear section headers and visual indicators.
+    
+    Args:
+        character_state (CharacterState): State to display
+    """
+    st.write("### Emotional State")
+    
+    # Display each group with appropriate formatting
+    for group_name, emotions in character_state.emotion_groups().items():
+        st.write(f"**{group_name}**")
+        for emotion, value in emotions.items():
+            # Ensure value is within valid range before display
+            clamped_value = max(0.0, min(1.0, value))
+            st.write(f"{emotion}:")
+            st.progress(clamped_value)
+        st.write("---")  # Visual separator between groups
+
+def render_message(role, content, character_name, timestamp=""):
+    """
+    Render one chat bubble
+    
+    Args:
+        role (str): "user" or "assistant"
+        content (str): Message text
+        character_name (str): Name shown on assistant messages
+        timestamp (str): Optional formatted time shown under the message
+    """
+    timestamp_html = f'<div class="timestamp">{timestamp}</div>' if timestamp else ""
+    if role.lower() == "user":
+        st.markdown(f'<div class="user"><strong>👤 You:</strong> {content}{timestamp_html}</div>',
+                    unsafe_allow_html=True)
+    else:
+        st.markdown(f'<div class="bot"><strong>🤖 {character_name}:</strong> {content}{timestamp_html}</div>',
+                    unsafe_allow_html=True)
+
+def render_chat_history(history, character_name):
+    """
+    Render a list of messages as returned by ChatManager.get_chat_history
+    
+    Args:
+        history (list): Message dicts (role, content, optional timestamp)
+        character_name (str): Character being conversed with
+    """
+    for message in history:
+        timestamp = message["timestamp"].strftime("%H:%M") if message.get("timestamp") else ""
+        render_message(message["role"], message["content"], character_name, timestamp)
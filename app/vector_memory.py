@@ -0,0 +1,230 @@
+import hashlib
+import os
+import threading
+import numpy as np
+
+# Directory holding one FAISS index per (character, user)
+MEMORY_INDEX_DIR = os.getenv("MEMORY_INDEX_DIR", "memory_index")
+
+# Maximum number of past messages recalled into a prompt
+MEMORY_TOP_K = int(os.getenv("MEMORY_TOP_K", "5"))
+
+# HNSW graph degree; higher is more accurate but uses more memory
+HNSW_NEIGHBORS = 32
+
+# Messages embedded per call when catching an index up with the database
+MEMORY_BACKFILL_BATCH = int(os.getenv("MEMORY_BACKFILL_BATCH", "256"))
+
+class _Entry:
+    """Index of one (character, user) pair and the locks around it"""
+
+    def __init__(self):
+        self.index = None  # faiss.Index, None until the user has history
+        self.loaded = False  # Read from disk and caught up with the database
+        self.lock = threading.Lock()  # Held to add vectors, search or persist
+        self.load_lock = threading.Lock()  # One thread loads and catches up
+
+class ConversationVectorMemory:
+    """
+    Semantic recall over past conversations:
+    - Keeps one HNSW index per (character, user), stored locally
+    - Indexes message embeddings under their database message_id
+    - Adds new turns incrementally as they are saved
+    - Returns the top-k most similar past messages for a query
+    - Imports FAISS lazily, on first use
+
+    Only vectors and ids live in the index; message text is fetched from
+    the messages table by id, so the index never duplicates the history.
+
+    Every index has its own lock, held only to add vectors, search or write
+    the index; embedding calls run outside it, so users never wait on each
+    other's embedding requests.
+    """
+
+    def __init__(self, db, embeddings, index_dir=MEMORY_INDEX_DIR):
+        """
+        Initialize vector memory
+
+        Args:
+            db (DatabaseManager): Database operations handler
+            embeddings: Embedding model with embed_query/embed_documents
+            index_dir (str): Directory where indexes are persisted
+        """
+        self.db = db
+        self.embeddings = embeddings
+        self.index_dir = index_dir
+        self._entries = {}  # (character_id, user_id) -> _Entry
+        self._entries_lock = threading.Lock()
+
+    def _index_path(self, character_id, user_id):
+        """File path of the index for a (character, user) pair"""
+        user_key = hashlib.sha1(user_id.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.index_dir, f"{character_id}_{user_key}.faiss")
+
+    @staticmethod
+    def _normalize(vectors):
+        """Converts embeddings to unit-length float32 rows for cosine similarity"""
+        import faiss
+
+        matrix = np.asarray(vectors, dtype="float32")
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        faiss.normalize_L2(matrix)
+        return matrix
+
+    def _entry(self, character_id, user_id):
+        with self._entries_lock:
+            entry = self._entries.get((character_id, user_id))
+            if entry is None:
+                entry = self._entries[(character_id, user_id)] = _Entry()
+            return entry
+
+    @staticmethod
+    def _contains(index, message_id):
+        """Whether a message is already indexed (IndexIDMap2 keeps a reverse id map)"""
+        try:
+            index.reconstruct(int(message_id))
+            return True
+        except RuntimeError:
+            return False
+
+    def _add(self, entry, messages, vectors):
+        """Adds embedded messages not indexed yet (caller holds entry.lock)"""
+        import faiss
+
+        keep = [i for i, (message_id, _) in enumerate(messages)
+                if entry.index is None or not self._contains(entry.index, message_id)]
+        if not keep:
+            return False
+        if entry.index is None:
+            entry.index = faiss.IndexIDMap2(
+                faiss.IndexHNSWFlat(vectors.shape[1], HNSW_NEIGHBORS, faiss.METRIC_INNER_PRODUCT)
+            )
+        entry.index.add_with_ids(vectors[keep], np.array([messages[i][0] for i in keep], dtype="int64"))
+        return True
+
+    def _get_index(self, character_id, user_id):
+        """
+        Returns the entry of a (character, user) pair, loading its index from
+        disk and catching up on messages saved since it was last written, in
+        batches of MEMORY_BACKFILL_BATCH messages per embedding call
+
+        Returns:
+            _Entry: entry.index is None if the user has no history yet
+        """
+        import faiss
+
+        entry = self._entry(character_id, user_id)
+        if entry.loaded:
+            return entry
+
+        with entry.load_lock:
+            if entry.loaded:
+                return entry
+            path = self._index_path(character_id, user_id)
+            last_indexed_id = 0
+            if os.path.exists(path):
+                index = faiss.read_index(path)
+                with entry.lock:
+                    entry.index = index
+                if index.ntotal:
+                    last_indexed_id = int(faiss.vector_to_array(index.id_map).max())
+
+            # Backfill history written before the index existed (or while it was stale)
+            added = False
+            while True:
+                batch = self.db.get_messages_after(character_id, user_id, last_indexed_id,
+                                                   limit=MEMORY_BACKFILL_BATCH, oldest_first=True)
+                if not batch:
+                    break
+                messages = [(m["message_id"], m["content"]) for m in batch]
+                vectors = self._normalize(self.embeddings.embed_documents([content for _, content in messages]))
+                with entry.lock:
+                    added = self._add(entry, messages, vectors) or added
+                last_indexed_id = batch[-1]["message_id"]
+                if len(batch) < MEMORY_BACKFILL_BATCH:
+                    break
+            if added:
+                with entry.lock:
+                    self._persist(path, entry.index)
+            entry.loaded = True
+        return entry
+
+    def _persist(self, path, index):
+        """Atomically writes an index to disk"""
+        import faiss
+
+        os.makedirs(self.index_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        faiss.write_index(index, tmp_path)
+        os.replace(tmp_path, path)
+
+    def add_messages(self, character_id, user_id, messages):
+        """
+        Indexes newly saved messages
+
+        Args:
+            character_id (int): Database ID of the character
+            user_id (str): User identifier
+            messages (list): (message_id, content) tuples
+        """
+        messages = [(message_id, content) for message_id, content in messages if message_id]
+        if character_id is None or user_id == "anonymous" or not messages:
+            return
+
+        # Loading catches up from the database, which already holds these messages
+        entry = self._get_index(character_id, user_id)
+        with entry.lock:
+            messages = [(message_id, content) for message_id, content in messages
+                        if entry.index is None or not self._contains(entry.index, message_id)]
+        if not messages:
+            return
+
+        vectors = self._normalize(self.embeddings.embed_documents([content for _, content in messages]))
+        with entry.lock:
+            if self._add(entry, messages, vectors):
+                self._persist(self._index_path(character_id, user_id), entry.index)
+
+    def preload(self, character_id, user_id):
+        """
+        Loads the index of a (character, user) pair ahead of its first search
+
+        Args:
+            character_id (int): Database ID of the character
+            user_id (str): User identifier
+        """
+        if character_id is None or user_id == "anonymous":
+            return
+        self._get_index(character_id, user_id)
+
+    def search(self, character_id, user_id, query_vector, k=MEMORY_TOP_K, exclude_ids=()):
+        """
+        Finds the past messages most similar to a query
+
+        Args:
+            character_id (int): Database ID of the character
+            user_id (str): User identifier
+            query_vector (list): Embedding of the current question
+            k (int): Maximum number of messages to return
+            exclude_ids (iterable): Message IDs already present in the prompt
+
+        Returns:
+            list: Message dicts (message_id, role, content, timestamp), most similar first
+        """
+        if character_id is None or user_id == "anonymous":
+            return []
+
+        entry = self._get_index(character_id, user_id)
+        query = self._normalize(query_vector)
+        exclude_ids = set(exclude_ids)
+        with entry.lock:
+            if entry.index is None or entry.index.ntotal == 0:
+                return []
+            _, ids = entry.index.search(query, k + len(exclude_ids))
+
+        ranked_ids = [int(i) for i in ids[0] if i != -1 and int(i) not in exclude_ids][:k]
+        if not ranked_ids:
+            return []
+
+        messages = {m["message_id"]: m for m in self.db.get_messages_by_ids(ranked_ids)}
+        return [messages[i] for i in ranked_ids if i in messages]
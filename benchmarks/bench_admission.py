@@ -0,0 +1,107 @@
+"""
+Admission control under overload (app/admission.py) with fake models.
+
+A few well-behaved users send a turn every couple of seconds while one
+spammer fires turns back to back from many threads. The model allows
+MODEL_CONCURRENCY calls at once either way (as a provider quota would). Runs
+twice: queueing only (no rate limits, unbounded queue, no shedding) and with
+the default admission limits, and reports the well-behaved users' latency and how many turns of
+each kind of client got a real answer rather than the busy reply.
+
+Usage:
+    python benchmarks/bench_admission.py [--users 6] [--spam-threads 24] [--seconds 20]
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bootstrap  # noqa: F401  (puts app/ on sys.path)
+from admission import AdmissionController, set_controller
+from fakes import InMemoryDatabaseManager, use_fake_models
+
+LLM_LATENCY = 0.5         # Seconds per (fake) chat model call
+EMBEDDING_LATENCY = 0.05
+MODEL_CONCURRENCY = 4     # Calls the (fake) model quota allows at once
+SPAM_INTERVAL = 0.05      # Round trip between the spammer's turns
+
+def run(chat_manager, character, users, spam_threads, seconds, user_interval):
+    """
+    Returns:
+        Tuple[List[float], dict]: Well-behaved turn latencies, and
+            {client kind: [answered turns, total turns]}
+    """
+    from chat import BUSY_REPLY
+
+    busy_reply = BUSY_REPLY.format(character_name=character)
+    deadline = time.perf_counter() + seconds
+    latencies, lock = [], threading.Lock()
+    outcomes = {"users": [0, 0], "spammer": [0, 0]}
+
+    def record(kind, response):
+        with lock:
+            outcomes[kind][0] += response != busy_reply
+            outcomes[kind][1] += 1
+
+    def user(i):
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response, _ = chat_manager.process_user_input(
+                f"What happened at the ball? ({i})", character, f"user-{i}")
+            with lock:
+                latencies.append(time.perf_counter() - start)
+            record("users", response)
+            time.sleep(user_interval)
+
+    def spammer(_):
+        while time.perf_counter() < deadline:
+            response, _ = chat_manager.process_user_input("spam", character, "spammer")
+            record("spammer", response)
+            time.sleep(SPAM_INTERVAL)
+
+    with ThreadPoolExecutor(max_workers=users + spam_threads) as pool:
+        futures = [pool.submit(user, i) for i in range(users)]
+        futures += [pool.submit(spammer, i) for i in range(spam_threads)]
+        for future in futures:
+            future.result()
+    return latencies, outcomes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=6, help="Well-behaved users")
+    parser.add_argument("--spam-threads", type=int, default=24, help="Concurrent threads of the spamming client")
+    parser.add_argument("--seconds", type=float, default=20, help="Duration of each run")
+    parser.add_argument("--user-interval", type=float, default=2.0, help="Pause between a user's turns")
+    args = parser.parse_args()
+
+    use_fake_models(chat_latency=LLM_LATENCY, embedding_latency=EMBEDDING_LATENCY)
+    os.chdir(tempfile.mkdtemp(prefix="bench-admission-"))
+    from character import CharacterManager
+    from chat import ChatManager
+    from pdf_processor import PDFProcessor
+
+    characters = PDFProcessor().process_input(
+        "Elizabeth Bennet met Mr. Darcy at the ball. Jane Bennet danced with Mr. Bingley. " * 50, "admission-book")
+    chat_manager = ChatManager("admission-book", character_manager=CharacterManager(InMemoryDatabaseManager()),
+                               index_path="admission-book")
+
+    modes = (
+        ("queueing", AdmissionController(model_concurrency=MODEL_CONCURRENCY, queue_limit=10000, timeout=3600,
+                                          background_timeout=3600, turns_per_minute=0)),
+        ("admission", AdmissionController(model_concurrency=MODEL_CONCURRENCY)),
+    )
+    for label, controller in modes:
+        set_controller(controller)
+        latencies, outcomes = run(chat_manager, characters[0], args.users, args.spam_threads,
+                                  args.seconds, args.user_interval)
+        p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+        print(f"{label:<9} users p50 {statistics.median(latencies) * 1000:7.0f} ms  p95 {p95 * 1000:7.0f} ms  "
+              f"answered {outcomes['users'][0]}/{outcomes['users'][1]}   "
+              f"spammer answered {outcomes['spammer'][0]}/{outcomes['spammer'][1]}")
+
+if __name__ == "__main__":
+    main()
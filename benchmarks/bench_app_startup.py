@@ -0,0 +1,197 @@
+"""
+Cold-start and rerun-latency benchmark for the Streamlit app.
+
+Measures:
+- Cold import time of app/app.py in a fresh interpreter
+- Latency of the first script run and of subsequent reruns triggered by
+  switching the character selectbox (Streamlit's AppTest harness)
+- Latency of a chat turn (a fragment rerun, fake models) and of a full rerun
+  as the transcript grows
+- Latency of the first turn after selecting a character, with and without
+  the background warm-up (CHARACTER_WARMUP)
+
+Reruns need the same environment as the app itself (Postgres reachable
+through the DB_* variables and GOOGLE_API_KEY set); no model calls are made
+for the selectbox reruns, and chat turns use the fakes. Run it on two
+revisions to compare:
+
+    python benchmarks/bench_app_startup.py --runs 20
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+
+def measure_cold_import(runs):
+    """Times `import app` in fresh interpreters, returns seconds per run"""
+    code = "import time; t = time.perf_counter(); import app; print(time.perf_counter() - t)"
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", code], cwd=APP_DIR, capture_output=True, text=True, check=True
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return timings
+
+def make_app_test(characters, temp_messages=None, book_source="benchmark"):
+    """AppTest past the login step, as if a book was already processed"""
+    from streamlit.testing.v1 import AppTest
+
+    sys.path.insert(0, APP_DIR)
+    os.chdir(APP_DIR)
+    app_test = AppTest.from_file(os.path.join(APP_DIR, "app.py"), default_timeout=120)
+    app_test.session_state["user_id"] = "anonymous"
+    app_test.session_state["temp_messages"] = temp_messages or {}
+    app_test.session_state["authenticated"] = True
+    app_test.session_state["emotion_updates"] = 0
+    app_test.session_state["book_source"] = book_source
+    app_test.session_state["characters"] = characters
+    return app_test
+
+def measure_reruns(runs, characters):
+    """Times the first app run and reruns caused by switching characters"""
+    app_test = make_app_test(characters)
+
+    start = time.perf_counter()
+    app_test.run()
+    first_run = time.perf_counter() - start
+
+    timings = []
+    for i in range(runs):
+        start = time.perf_counter()
+        character_select = next(box for box in app_test.selectbox if box.label == "Choose a Character:")
+        character_select.select(characters[i % len(characters)]).run()
+        timings.append(time.perf_counter() - start)
+    return first_run, timings
+
+def ingest_chat_book(embedding_latency=0.0):
+    """
+    Ingests a small book with the benchmark fakes, so turns go through
+    retrieval and generation
+
+    Returns:
+        list: The book's characters
+    """
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, APP_DIR)
+    import book_index
+    import library
+    from database import get_database
+    from fakes import DEFAULT_ROSTER, use_fake_models
+    from pdf_processor import PDFProcessor
+    from pdfgen import make_book_pages
+    use_fake_models(embedding_latency=embedding_latency)
+
+    # Absolute index path: the app runs from APP_DIR
+    os.chdir(APP_DIR)
+    book_index.BOOK_INDEX_DIR = tempfile.mkdtemp(prefix="bench-app-")
+    text = " ".join(make_book_pages(20, DEFAULT_ROSTER))
+    characters, _ = library.ingest(PDFProcessor(), get_database(), "benchmark-chat", text=text)
+    return characters
+
+def measure_chat_turns(runs, history):
+    """
+    Times chat turns (fragment reruns) and full reruns with `history` earlier
+    messages in the transcript; models are the benchmark fakes
+
+    Returns:
+        Tuple[List[float], List[float]]: Seconds per turn and per full rerun
+    """
+    characters = ingest_chat_book()
+
+    transcript = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"Earlier message {i} " * 20}
+                  for i in range(history)]
+    app_test = make_app_test(characters, {characters[0]: transcript}, book_source="benchmark-chat")
+    app_test.run()
+
+    turns, full_runs = [], []
+    for i in range(runs):
+        start = time.perf_counter()
+        app_test.chat_input[0].set_value(f"Tell me about the ball ({i})").run()
+        turns.append(time.perf_counter() - start)
+        # AppTest keeps only what a fragment rerun drew; a full run restores the page (and the input)
+        start = time.perf_counter()
+        app_test.run()
+        full_runs.append(time.perf_counter() - start)
+    return turns, full_runs
+
+def measure_first_turns(runs, history, think, warmup, embedding_latency):
+    """
+    Times the first turn sent to a newly selected character by a logged-in
+    user with `history` saved messages (and no message index yet), `think`
+    seconds after the selection, with or without the background warm-up,
+    and the turn after it (steady state)
+
+    Returns:
+        Tuple[List[float], List[float]]: Seconds per first and per second turn
+    """
+    characters = ingest_chat_book(embedding_latency)
+    from database import get_database
+    db = get_database()
+    character_id = db.ensure_character(characters[1], "benchmark-chat")
+    os.environ["CHARACTER_WARMUP"] = "1" if warmup else "0"
+
+    first_turns, second_turns = [], []
+    for i in range(runs):
+        # A new user each run: nothing about them is loaded or indexed yet
+        user_id = f"bench-warmup-{os.getpid()}-{warmup}-{i}"
+        for turn in range(history // 2):
+            db.save_turn(character_id, user_id, [("user", f"Do you remember question {turn}?"),
+                                                 ("assistant", f"Of course, question {turn} was about the ball.")])
+        app_test = make_app_test(characters, book_source="benchmark-chat")
+        app_test.session_state["user_id"] = user_id
+        app_test.run()
+        character_select = next(box for box in app_test.selectbox if box.label == "Choose a Character:")
+        character_select.select(characters[1]).run()
+        time.sleep(think)  # The user typing their first message
+
+        start = time.perf_counter()
+        app_test.chat_input[0].set_value("Tell me about the ball").run()
+        first_turns.append(time.perf_counter() - start)
+        app_test.run()
+        start = time.perf_counter()
+        app_test.chat_input[0].set_value("And who danced with whom?").run()
+        second_turns.append(time.perf_counter() - start)
+    return first_turns, second_turns
+
+def summarize(label, timings):
+    """Prints median and p95 in milliseconds"""
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    print(f"{label:<22} median {statistics.median(ordered) * 1000:8.1f} ms   p95 {p95 * 1000:8.1f} ms   (n={len(ordered)})")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10, help="Repetitions per measurement")
+    parser.add_argument("--skip-reruns", action="store_true", help="Only measure cold import (no database needed)")
+    parser.add_argument("--history", type=int, nargs="+", default=[10, 200, 1000],
+                        help="Transcript lengths for the chat turn measurement")
+    parser.add_argument("--think", type=float, default=2.0,
+                        help="Seconds between selecting a character and sending the first turn")
+    parser.add_argument("--embedding-latency", type=float, default=0.2,
+                        help="Seconds per fake embedding call in the first turn measurement")
+    args = parser.parse_args()
+
+    summarize("cold import", measure_cold_import(args.runs))
+    if not args.skip_reruns:
+        first_run, timings = measure_reruns(args.runs, ["Alice", "Bob", "Carol"])
+        print(f"{'first run':<22} {first_run * 1000:8.1f} ms")
+        summarize("selectbox rerun", timings)
+        for history in args.history:
+            turns, full_runs = measure_chat_turns(args.runs, history)
+            summarize(f"chat turn, {history} msgs", turns)
+            summarize(f"full rerun, {history} msgs", full_runs)
+        for warmup in (False, True):
+            first_turns, second_turns = measure_first_turns(args.runs, max(args.history), args.think, warmup,
+                                                            args.embedding_latency)
+            summarize(f"first turn, warm-up {'on' if warmup else 'off'}", first_turns)
+            summarize(f"second turn, warm-up {'on' if warmup else 'off'}", second_turns)
+
+if __name__ == "__main__":
+    main()
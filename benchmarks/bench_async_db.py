@@ -0,0 +1,162 @@
+"""
+Database throughput of the chat path with many concurrent sessions: the
+blocking DatabaseManager (one shared, locked psycopg2 connection) against
+the psycopg 3 AsyncDatabaseManager (connection pool, pipelined turn writes).
+
+Each simulated turn performs the database work of a real one: load the
+character state, load the recent messages, save the updated state and save
+the user/assistant messages. Needs a local Postgres reachable through the
+DB_* variables; it writes to the configured database under a throwaway
+book name.
+
+Modes:
+    sync      DatabaseManager, one thread per session
+    adapter   SyncDatabaseAdapter (DB_BACKEND=async as the app uses it), one thread per session
+    async     AsyncDatabaseManager driven by asyncio tasks, no threads
+
+--rtt adds a network round trip: connections then go through a forwarding
+proxy (separate process) that delays each direction by half of it, as a
+database on another host would. Without it a local server answers in
+microseconds, and there is little waiting for the async layer to overlap.
+
+Usage:
+    python benchmarks/bench_async_db.py [--sessions 64] [--turns 20] [--pool 20] [--rtt 0.001]
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bootstrap  # noqa: F401  (puts app/ on sys.path)
+from async_database import AsyncDatabaseManager, SyncDatabaseAdapter
+from database import DatabaseManager, StaleStateError
+
+BOOK = f"bench-async-db-{os.getpid()}"
+CHARACTER = "Elizabeth Bennet"
+
+PROXY_PORT = 55432
+
+def run_delay_proxy(rtt, port):
+    """Forwards localhost:port to the DB_* server, delaying each direction by rtt / 2"""
+    async def pipe(reader, writer):
+        queue = asyncio.Queue()
+
+        async def deliver():
+            while (item := await queue.get()) is not None:
+                due, data = item
+                await asyncio.sleep(max(0.0, due - loop.time()))
+                writer.write(data)
+                await writer.drain()
+            writer.close()
+
+        delivery = asyncio.create_task(deliver())
+        while data := await reader.read(65536):
+            queue.put_nowait((loop.time() + rtt / 2, data))
+        queue.put_nowait(None)
+        await delivery
+
+    async def handle(client_reader, client_writer):
+        host = os.getenv("DB_HOST") or "localhost"
+        if host.startswith("/"):
+            server = await asyncio.open_unix_connection(os.path.join(host, f".s.PGSQL.{os.getenv('DB_PORT') or 5432}"))
+        else:
+            server = await asyncio.open_connection(host, int(os.getenv("DB_PORT") or 5432))
+        await asyncio.gather(pipe(client_reader, server[1]), pipe(server[0], client_writer))
+
+    async def serve():
+        server = await asyncio.start_server(handle, "127.0.0.1", port)
+        await server.serve_forever()
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(serve())
+
+def sync_turn(db, user_id, turn):
+    state, character_id = db.get_character_state(CHARACTER, BOOK, user_id)
+    db.get_messages_after(character_id, user_id, 0, 12)
+    state.joy = (turn % 10) / 10
+    try:
+        db.save_character_state(CHARACTER, state, BOOK, user_id)
+    except StaleStateError:
+        pass
+    db.save_turn(character_id, user_id, [("user", f"question {turn}"), ("assistant", f"answer {turn}")])
+
+async def async_turn(db, user_id, turn):
+    state, character_id = await db.get_character_state(CHARACTER, BOOK, user_id)
+    await db.get_messages_after(character_id, user_id, 0, 12)
+    state.joy = (turn % 10) / 10
+    try:
+        await db.save_character_state(CHARACTER, state, BOOK, user_id)
+    except StaleStateError:
+        pass
+    await db.save_turn(character_id, user_id, [("user", f"question {turn}"), ("assistant", f"answer {turn}")])
+
+def run_threads(db, label, sessions, turns):
+    latencies, lock = [], threading.Lock()
+
+    def session(i):
+        for turn in range(turns):
+            start = time.perf_counter()
+            sync_turn(db, f"{label}-user-{i}", turn)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        list(pool.map(session, range(sessions)))
+    return latencies, time.perf_counter() - start
+
+async def run_tasks(pool_size, sessions, turns):
+    db = AsyncDatabaseManager(min_size=pool_size, max_size=pool_size)
+    await db.connect()
+    latencies = []
+
+    async def session(i):
+        for turn in range(turns):
+            start = time.perf_counter()
+            await async_turn(db, f"async-user-{i}", turn)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await db.ensure_character(CHARACTER, BOOK)
+    await asyncio.gather(*(session(i) for i in range(sessions)))
+    elapsed = time.perf_counter() - start
+    await db.close()
+    return latencies, elapsed
+
+def report(label, latencies, elapsed):
+    p95 = statistics.quantiles(latencies, n=20)[-1]
+    print(f"{label:<8} {len(latencies) / elapsed:8.1f} turns/s   p50 {statistics.median(latencies) * 1000:7.2f} ms   "
+          f"p95 {p95 * 1000:7.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=64, help="Concurrent sessions")
+    parser.add_argument("--turns", type=int, default=20, help="Turns per session")
+    parser.add_argument("--pool", type=int, default=20, help="Async connection pool size")
+    parser.add_argument("--rtt", type=float, default=0.0, help="Simulated network round trip (seconds)")
+    args = parser.parse_args()
+
+    if args.rtt:
+        proxy = multiprocessing.Process(target=run_delay_proxy, args=(args.rtt, PROXY_PORT), daemon=True)
+        proxy.start()
+        time.sleep(0.5)
+        os.environ["DB_HOST"], os.environ["DB_PORT"] = "127.0.0.1", str(PROXY_PORT)
+
+    db = DatabaseManager()
+    db.ensure_character(CHARACTER, BOOK)
+    report("sync", *run_threads(db, "sync", args.sessions, args.turns))
+    db.close()
+
+    adapter = SyncDatabaseAdapter(AsyncDatabaseManager(min_size=args.pool, max_size=args.pool))
+    report("adapter", *run_threads(adapter, "adapter", args.sessions, args.turns))
+    adapter.close()
+
+    report("async", *asyncio.run(run_tasks(args.pool, args.sessions, args.turns)))
+
+if __name__ == "__main__":
+    main()
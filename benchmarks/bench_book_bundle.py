@@ -0,0 +1,115 @@
+"""
+Book bundles (book_bundle.py): provisioning a replica from one file instead of re-ingesting.
+
+Builds a book index from synthetic 768-dimensional vectors (as many chunks as
+a long series), exports its bundle, then imports it into empty index roots:
+from the file, and through a pipe as a replica pulling it over the network
+would. Imports run in a fresh process so their memory can be measured.
+
+Reports:
+
+    export        writing the bundle (checksumming every file)
+    import        streaming the bundle into place, checksums verified
+    peak memory   growth of the importing process's peak RSS (VmHWM, Linux);
+                  stays flat because members are copied in blocks
+    first search  loading the imported index and answering one question
+    re-embedding  what re-ingesting would spend on embeddings alone, at
+                  --embed-rate chunks per second
+
+Usage:
+    python benchmarks/bench_book_bundle.py [--chunks 100000] [--quantization flat] [--embed-rate 200]
+"""
+
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import bootstrap  # noqa: F401  (puts app/ on sys.path)
+
+BOOK = "A Benchmark Series"
+
+def peak_rss_kb():
+    """Peak resident memory of this process in KiB"""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+
+def import_in_process(bundle, index_root, question, results):
+    """Runs in a fresh process: imports the bundle, then loads the book and searches it once"""
+    import book_bundle
+    from book_index import BookIndex
+
+    before = peak_rss_kb()
+    start = time.perf_counter()
+    info, _ = book_bundle.import_bundle(bundle, index_root)
+    import_seconds = time.perf_counter() - start
+    peak_mb = (peak_rss_kb() - before) / 1024
+    start = time.perf_counter()
+    BookIndex.load(info["index_dir"]).similarity_search_by_vector(question, k=4)
+    results.put({"import": import_seconds, "peak_mb": peak_mb, "search": time.perf_counter() - start})
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--quantization", default="flat", help="Index layout (see INDEX_QUANTIZATION)")
+    parser.add_argument("--embed-rate", type=float, default=200, help="Chunks embedded per second when re-ingesting")
+    args = parser.parse_args()
+
+    import book_bundle
+    from book_index import BookIndex, book_index_dir, write_book_info
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.chunks, args.dimension)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    texts = [f"Chunk {i}: Elizabeth walked to Netherfield in the rain, and Mr. Darcy said nothing." * 4
+             for i in range(args.chunks)]
+    workspace = tempfile.mkdtemp(prefix="bench-book-bundle-")
+    index_dir = book_index_dir(BOOK, os.path.join(workspace, "source"))
+    BookIndex.build(index_dir, texts, vectors, quantization=args.quantization)
+    book = {"book_source": BOOK, "content_hash": "0" * 64, "index_dir": index_dir,
+            "characters": ["Elizabeth Bennet", "Fitzwilliam Darcy"]}
+    write_book_info(index_dir, book)
+    del vectors, texts
+
+    bundle = os.path.join(workspace, "series.bookbundle")
+    start = time.perf_counter()
+    with open(bundle, "wb") as f:
+        book_bundle.export_book(book, f)
+    export_seconds = time.perf_counter() - start
+    size_mb = os.path.getsize(bundle) / 2**20
+    print(f"{args.chunks} chunks ({args.quantization}), bundle {size_mb:.1f} MiB, export {export_seconds:.2f} s")
+
+    ctx = multiprocessing.get_context("spawn")
+    question = rng.standard_normal(args.dimension).astype("float32")
+    print(f"{'source':<8} {'import':>9} {'throughput':>12} {'peak memory':>12} {'first search':>13}")
+    for source in ("file", "pipe"):
+        index_root = os.path.join(workspace, f"replica-{source}")
+        if source == "file":
+            results = ctx.Queue()
+            process = ctx.Process(target=import_in_process, args=(bundle, index_root, question, results))
+            process.start()
+            result = results.get()
+            process.join()
+        else:
+            # The same import fed through a pipe, as from `curl ... | book_bundle.py import -` (includes CLI startup)
+            start = time.perf_counter()
+            with open(bundle, "rb") as f:
+                subprocess.run([sys.executable, os.path.join(bootstrap.APP_DIR, "book_bundle.py"), "--index-dir",
+                                index_root, "--no-catalog", "import", "-"], stdin=f, check=True,
+                               stderr=subprocess.DEVNULL)
+            result = {"import": time.perf_counter() - start}
+        memory = f"{result['peak_mb']:8.1f} MiB" if "peak_mb" in result else f"{'-':>12}"
+        search = f"{result['search'] * 1000:10.0f} ms" if "search" in result else f"{'-':>13}"
+        print(f"{source:<8} {result['import']:7.2f} s {size_mb / result['import']:7.0f} MiB/s {memory} {search}")
+    print(f"re-embedding {args.chunks} chunks at {args.embed_rate:.0f}/s: {args.chunks / args.embed_rate:.0f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Throughput of the bulk library ingester (app/bulk_ingest.py) with fake models.
+
+Generates a library of synthetic PDF books, ingests it with 1 worker and
+with N workers, then re-runs to show that unchanged books are skipped.
+
+Usage:
+    python benchmarks/bench_bulk_ingest.py [--books 16] [--pages 100] [--workers 4]
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+
+import bootstrap  # noqa: F401  (puts app/ on sys.path)
+import bulk_ingest
+from fakes import DEFAULT_ROSTER, use_fake_models
+from pdfgen import make_book_pages, write_pdf
+
+LLM_LATENCY = 2.0        # Whole-book character extraction call (seconds)
+EMBEDDING_LATENCY = 0.5   # One embedding request per book
+
+def init_fake_worker():
+    """Worker setup that swaps the Gemini clients for the fakes"""
+    use_fake_models(chat_latency=LLM_LATENCY, embedding_latency=EMBEDDING_LATENCY)
+    bulk_ingest._init_worker()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=16, help="Books in the library")
+    parser.add_argument("--pages", type=int, default=100, help="Pages per book")
+    parser.add_argument("--workers", type=int, default=4, help="Worker processes for the parallel run")
+    args = parser.parse_args()
+
+    workspace = tempfile.mkdtemp(prefix="bench-bulk-")
+    library = os.path.join(workspace, "library")
+    os.makedirs(library)
+    for i in range(args.books):
+        write_pdf(os.path.join(library, f"book-{i:03d}.pdf"),
+                  make_book_pages(args.pages, DEFAULT_ROSTER, seed=i, title=f"Book {i}"))
+    books = bulk_ingest.discover_books(library)
+
+    for label, workers in (("1 worker", 1), (f"{args.workers} workers", args.workers)):
+        index_root = os.path.join(workspace, "indexes")
+        shutil.rmtree(index_root, ignore_errors=True)
+        report = bulk_ingest.ingest_library(books, index_root, workers, initializer=init_fake_worker)
+        print(f"{label:<10} {report['seconds']:7.2f} s   {report['pages'] / report['seconds']:8.1f} pages/s   "
+              f"{report['chunks'] / report['seconds']:7.1f} chunks/s   failed {len(report['failed'])}")
+
+    report = bulk_ingest.ingest_library(books, index_root, args.workers, initializer=init_fake_worker)
+    print(f"rerun      {report['seconds']:7.2f} s   skipped {len(report['skipped'])}/{len(books)} unchanged books")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Character-aware book retrieval (CHARACTER_RETRIEVAL, ChatManager.retrieve_passages) with fake models.
+
+Builds a synthetic novel the way real ones are cast: scenes of a few pages
+each feature three characters from a long roster, and a few main characters
+appear in many scenes while most appear in few. Chunks are tagged with the
+characters they mention, then every CHARACTER_RETRIEVAL mode answers the
+same questions for a main, a supporting and a minor character.
+
+Reports the median search time, the share of the book's chunks each search
+covers, and the share of retrieved chunks (prompt context) that mention the
+character being talked to.
+
+Usage:
+    python benchmarks/bench_character_retrieval.py [--pages 20000] [--roster 40] [--queries 50]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import bootstrap  # noqa: F401  (puts app/ on sys.path)
+import chat
+from book_index import BookIndex
+from character import CharacterManager
+from dossier import find_mentions, name_pattern
+from fakes import InMemoryDatabaseManager, use_fake_models
+from models import get_embeddings
+from pdf_processor import PDFProcessor
+from pdfgen import SENTENCES, make_book_pages
+
+BOOK = "A Benchmark Novel"
+SYLLABLES = ["ka", "lo", "mir", "ten", "va", "ros", "el", "dun", "sa", "bri", "or", "win", "the", "mar", "ul", "ces"]
+
+def make_roster(size, rng):
+    """Distinct two-word names that share no word (so each name only matches itself)"""
+    words = set()
+    while len(words) < 2 * size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(3)).capitalize())
+    words = sorted(words)
+    rng.shuffle(words)
+    return [f"{words[2 * i]} {words[2 * i + 1]}" for i in range(size)]
+
+def make_book(pages, roster, scene_pages, rng):
+    """Scenes of scene_pages pages, each with a cast of three drawn with Zipf weights (roster[0] most often)"""
+    weights = [1 / (rank + 1) for rank in range(len(roster))]
+    texts = []
+    for scene in range(0, pages, scene_pages):
+        cast = set()
+        while len(cast) < 3:
+            cast.add(rng.choices(roster, weights)[0])
+        texts += make_book_pages(min(scene_pages, pages - scene), sorted(cast), seed=scene, title=BOOK)
+    return [("novel.pdf", number, text) for number, text in enumerate(texts, start=1)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=20000)
+    parser.add_argument("--roster", type=int, default=40, help="Characters in the book")
+    parser.add_argument("--scene-pages", type=int, default=5, help="Pages per scene (about one chunk)")
+    parser.add_argument("--queries", type=int, default=50, help="Questions per character and mode")
+    parser.add_argument("--k", type=int, default=chat.RETRIEVAL_K)
+    args = parser.parse_args()
+    use_fake_models()
+    rng = random.Random(0)
+
+    roster = make_roster(args.roster, rng)
+    pages = make_book(args.pages, roster, args.scene_pages, rng)
+    processor = PDFProcessor()
+    chunks, metadatas = processor.get_page_chunks(pages)
+    start = time.perf_counter()
+    mentions = find_mentions(chunks, roster)
+    tagging = time.perf_counter() - start
+    index_dir = os.path.join(tempfile.mkdtemp(prefix="bench-character-retrieval-"), "index")
+    BookIndex.build(index_dir, chunks, get_embeddings().embed_documents(chunks), metadatas, mentions=mentions)
+    print(f"{len(pages)} pages, {len(chunks)} chunks, {len(roster)} characters; tagging took {tagging * 1000:.0f} ms")
+
+    chat_manager = chat.ChatManager(BOOK, character_manager=CharacterManager(InMemoryDatabaseManager()),
+                                    index_path=index_dir)
+    embeddings = get_embeddings()
+    characters = [("main", roster[0]), ("supporting", roster[len(roster) // 4]), ("minor", roster[-1])]
+    print(f"{'character':<24} {'mode':<7} {'searched':>9} {'search p50':>11} {'on-character':>13}")
+    for label, name in characters:
+        pattern = name_pattern(name)
+        others = [other for other in roster if other != name]
+        questions = [embeddings.embed_query(rng.choice(SENTENCES).format(a=name, b=rng.choice(others)))
+                     for _ in range(args.queries)]
+        for mode in ("off", "filter", "boost"):
+            chat.CHARACTER_RETRIEVAL = mode
+            timings, relevant, returned = [], 0, 0
+            for query in questions:
+                start = time.perf_counter()
+                docs = chat_manager.retrieve_passages(query, name, args.k)
+                timings.append(time.perf_counter() - start)
+                relevant += sum(bool(pattern.search(doc.page_content)) for doc in docs)
+                returned += len(docs)
+            searched = len(mentions[name]) / len(chunks) if mode == "filter" else 1.0
+            print(f"{label + ' (' + str(len(mentions[name])) + ' chunks)':<24} {mode:<7} {searched:9.0%} "
+                  f"{statistics.median(timings) * 1000:8.2f} ms {relevant / returned:13.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Request coalescing for identical first questions (app/coalesce.py) with fake models.
+
+Simulates a featured-book burst: N new sessions ask the same character the
+same opening question at the same moment, half of them streaming. Runs with
+coalescing off and on, and reports answer generations (LLM calls that
+produce an answer, not emotion updates), embedding calls and turn latency.
+
+Usage:
+    python benchmarks/bench_coalesce.py [--sessions 32] [--llm-latency 1.0]
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bootstrap  # noqa: F401  (puts app/ on sys.path)
+import chat
+from admission import AdmissionController, set_controller
+from fakes import FakeChatModel, FakeEmbeddings, InMemoryDatabaseManager, use_fake_models
+
+QUESTIONS = ("Who are you?", "who are you ?", "WHO ARE YOU?")  # Normalize to two distinct keys
+
+class CallCounter:
+    """Counts answer generations and query embeddings made through the fakes"""
+
+    def __init__(self):
+        self.answers = 0
+        self.embeddings = 0
+        self.lock = threading.Lock()
+        respond, embed_query = FakeChatModel._respond, FakeEmbeddings.embed_query
+
+        def counting_respond(model, prompt):
+            if "Current Question:" in prompt:
+                with self.lock:
+                    self.answers += 1
+            return respond(model, prompt)
+
+        def counting_embed_query(embeddings, text):
+            with self.lock:
+                self.embeddings += 1
+            return embed_query(embeddings, text)
+
+        FakeChatModel._respond = counting_respond
+        FakeEmbeddings.embed_query = counting_embed_query
+
+    def reset(self):
+        with self.lock:
+            self.answers = self.embeddings = 0
+
+def run(chat_manager, character, sessions, label):
+    barrier = threading.Barrier(sessions)
+    latencies = []
+
+    def session(i):
+        question = QUESTIONS[i % len(QUESTIONS)]
+        user_id = f"{label}-user-{i}"
+        barrier.wait()
+        start = time.perf_counter()
+        if i % 2:
+            for event in chat_manager.stream_user_input(question, character, user_id):
+                pass
+        else:
+            chat_manager.process_user_input(question, character, user_id)
+        latencies.append(time.perf_counter() - start)
+
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        list(pool.map(session, range(sessions)))
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=32, help="Sessions asking at the same moment")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="Fake LLM seconds per call")
+    parser.add_argument("--token-latency", type=float, default=0.02, help="Fake LLM seconds per streamed token")
+    args = parser.parse_args()
+
+    use_fake_models(chat_latency=args.llm_latency, token_latency=args.token_latency, embedding_latency=0.1)
+    set_controller(AdmissionController(turns_per_minute=0, model_concurrency=args.sessions * 2,
+                                       queue_limit=args.sessions * 2))
+    counter = CallCounter()
+    os.chdir(tempfile.mkdtemp(prefix="bench-coalesce-"))
+    from character import CharacterManager
+    from pdf_processor import PDFProcessor
+
+    characters = PDFProcessor().process_input(
+        "Elizabeth Bennet met Mr. Darcy at the ball. Jane Bennet danced with Mr. Bingley. " * 50, "coalesce-book")
+    chat_manager = chat.ChatManager("coalesce-book", character_manager=CharacterManager(InMemoryDatabaseManager()),
+                                    index_path="coalesce-book")
+
+    for label, enabled in (("off", False), ("on", True)):
+        chat.COALESCE_REQUESTS = enabled
+        counter.reset()
+        latencies = run(chat_manager, characters[0], args.sessions, label)
+        print(f"coalescing {label:<3}  answers generated {counter.answers:3d}  query embeddings {counter.embeddings:3d}  "
+              f"p50 {statistics.median(latencies) * 1000:6.0f} ms  max {max(latencies) * 1000:6.0f} ms")
+
+if __name__ == "__main__":
+    main()
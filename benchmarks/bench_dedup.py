@@ -0,0 +1,99 @@
+"""
+Savings of ingestion deduplication (app/dedup.py) with fake models.
+
+Builds a synthetic book shaped like real scans: a copyright page and a table
+of contents, running headers and page-number footers, and an appendix that
+reprints some chapters. The book is uploaded as two PDFs, the second one a
+copy of part of the first. Ingests it with INGEST_DEDUP on and off and
+compares what reaches the embedding model.
+
+Usage:
+    python benchmarks/bench_dedup.py [--pages 200] [--reprinted 30]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import bootstrap  # noqa: F401  (puts app/ on sys.path)
+import pdf_processor
+from dedup import DedupReport
+from fakes import DEFAULT_ROSTER, use_fake_models
+from models import get_embeddings
+from pdfgen import make_book_pages, write_pdf
+
+TITLE = "A Benchmark Novel"
+
+def front_matter(chapters):
+    """Copyright page and table of contents, with the running header and footer"""
+    copyright_page = (f"{TITLE}\nCopyright © 2024 Benchmark Press. All rights reserved.\n"
+                      "No part of this book may be reproduced without permission.\nISBN 978-0-00-000000-0\ni")
+    toc = "\n".join(f"Chapter {number} {'.' * 20} {page}" for number, page in chapters)
+    return [copyright_page, f"{TITLE}\nContents\n{toc}\nii"]
+
+def make_book(pages, reprinted):
+    """Front matter, body and an appendix reprinting the first `reprinted` body pages"""
+    body = make_book_pages(pages, DEFAULT_ROSTER, title=TITLE)
+    appendix = [page.rsplit("\n", 1)[0] + f"\n{pages + number}" for number, page in enumerate(body[:reprinted], start=1)]
+    return front_matter([(number, 1 + 10 * (number - 1)) for number in range(1, pages // 10 + 1)]) + body + appendix
+
+class CountingEmbeddings:
+    """Wraps the embedding client to count what is sent to it"""
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self.texts = 0
+        self.chars = 0
+
+    def embed_documents(self, texts):
+        self.texts += len(texts)
+        self.chars += sum(len(text) for text in texts)
+        return self.embeddings.embed_documents(texts)
+
+class CountingProcessor(pdf_processor.PDFProcessor):
+    """PDFProcessor whose embedding calls are counted"""
+
+    embeddings = None
+
+    def __init__(self):
+        super().__init__()
+        self.embeddings = CountingEmbeddings(get_embeddings())
+
+def ingest(pdf_paths, index_dir, dedup):
+    pdf_processor.INGEST_DEDUP = dedup
+    processor = CountingProcessor()
+    report = DedupReport()
+    start = time.perf_counter()
+    pages = processor.get_pdf_pages(pdf_paths, report)
+    chunks, metadatas = processor.get_page_chunks(pages)
+    chunks, metadatas = processor.dedupe_chunks(chunks, metadatas, report)
+    processor.create_vector_store(chunks, index_dir, metadatas, report)
+    return processor.embeddings, report, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200, help="Body pages of the book")
+    parser.add_argument("--reprinted", type=int, default=30, help="Body pages reprinted in the appendix")
+    args = parser.parse_args()
+    use_fake_models()
+
+    workspace = tempfile.mkdtemp(prefix="bench-dedup-")
+    book = make_book(args.pages, args.reprinted)
+    pdf_paths = [os.path.join(workspace, "book.pdf"), os.path.join(workspace, "book-part-1.pdf")]
+    write_pdf(pdf_paths[0], book)
+    write_pdf(pdf_paths[1], book[:len(book) // 4])
+
+    results = {}
+    for label, dedup in (("dedup off", False), ("dedup on", True)):
+        embeddings, report, seconds = ingest(pdf_paths, os.path.join(workspace, label.replace(" ", "-")), dedup)
+        results[label] = embeddings
+        print(f"{label:<10} {embeddings.texts:5d} chunks embedded   {embeddings.chars / 1e6:6.2f} M chars   "
+              f"{seconds:6.2f} s ingest (without model latency)")
+    off, on = results["dedup off"], results["dedup on"]
+    print(f"saved      {off.texts - on.texts:5d} embeddings ({1 - on.texts / off.texts:.0%})   "
+          f"{(off.chars - on.chars) / 1e6:6.2f} M chars ({1 - on.chars / off.chars:.0%})")
+    print("report    ", dict(report))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Cost of the emotion time series (app/emotion_history.py).
+
+1. Write path: time added to a turn by recording a sample through the
+   batching EmotionRecorder, compared to one INSERT per turn, against the
+   in-memory database with a simulated round trip.
+2. Analytics: EmotionAggregator summary, per-character means and a
+   downsampled trend over N synthetic samples.
+
+Usage:
+    python benchmarks/bench_emotion_history.py [--turns 2000] [--samples 1000000] [--db-latency 0.002]
+"""
+
+import argparse
+import time
+from datetime import datetime
+import numpy as np
+
+import bootstrap  # noqa: F401  (puts app/ on sys.path)
+from character_state import CharacterState
+from emotion_history import EmotionAggregator, EmotionRecorder
+from fakes import InMemoryDatabaseManager
+
+def bench_write_path(turns, db_latency):
+    state = CharacterState(joy=0.4)
+
+    db = InMemoryDatabaseManager(query_latency=db_latency)
+    start = time.perf_counter()
+    for turn in range(turns):
+        db.save_emotion_samples([(1, f"user-{turn % 50}", datetime.now(), state.to_vector())])
+    per_turn_insert = (time.perf_counter() - start) / turns
+
+    db = InMemoryDatabaseManager(query_latency=db_latency)
+    recorder = EmotionRecorder(db)
+    start = time.perf_counter()
+    for turn in range(turns):
+        recorder.record(1, f"user-{turn % 50}", state)
+    per_turn_batched = (time.perf_counter() - start) / turns
+    recorder.close()
+    assert len(db.emotion_samples) == turns
+
+    print(f"write path   INSERT per turn {per_turn_insert * 1e6:8.1f} us/turn   "
+          f"batched recorder {per_turn_batched * 1e6:6.1f} us/turn")
+
+def bench_analytics(samples, characters=200):
+    rng = np.random.default_rng(0)
+    character_ids = rng.integers(1, characters + 1, samples).astype("int32")
+    timestamps = np.sort(time.time() - rng.random(samples) * 30 * 86400)
+    states = rng.random((samples, len(CharacterState.FIELDS)), dtype="float32")
+    aggregator = EmotionAggregator(character_ids, timestamps, states)
+
+    for label, run in (("summary", aggregator.summary), ("by_character", aggregator.by_character),
+                       ("hourly trend", lambda: aggregator.trend(3600))):
+        start = time.perf_counter()
+        run()
+        print(f"{label:<13} {samples:,} samples  {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=2000, help="Samples recorded in the write-path test")
+    parser.add_argument("--samples", type=int, default=1_000_000, help="Samples aggregated in the analytics test")
+    parser.add_argument("--db-latency", type=float, default=0.002, help="Simulated DB round trip (seconds)")
+    args = parser.parse_args()
+    bench_write_path(args.turns, args.db_latency)
+    bench_analytics(args.samples)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Memory and load time of the book index across worker processes.
+
+Builds one index, then starts W processes that each load it and run a
+query, and reports per-process load time and memory from
+/proc/self/smaps_rollup (Linux):
+
+    private  pages only this process uses (what each extra worker costs)
+    pss      proportional share of pages shared with other processes
+
+Compares the memory-mapped BookIndex with LangChain's FAISS.load_local
+(pickled docstore, private heap copy).
+
+Usage:
+    python benchmarks/bench_index_memory.py [--chunks 50000] [--workers 4]
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+import bootstrap  # noqa: F401  (puts app/ on sys.path)
+from fakes import FakeEmbeddings
+
+def memory_kb():
+    """Private and proportional memory of this process in KiB"""
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                values[parts[0].rstrip(":")] = int(parts[1])
+    return {"private": values["Private_Clean"] + values["Private_Dirty"], "pss": values["Pss"]}
+
+def load_and_query(kind, index_dir, ready, results):
+    embeddings = FakeEmbeddings()
+    before = memory_kb()
+    start = time.perf_counter()
+    if kind == "mmap":
+        from book_index import BookIndex
+        store = BookIndex.load(index_dir)
+    else:
+        from langchain_community.vectorstores import FAISS
+        store = FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
+    load_seconds = time.perf_counter() - start
+    # A flat index scans every vector, so one query touches all of them like a busy worker would
+    store.similarity_search_by_vector(embeddings.embed_query("the ball at Netherfield"))
+    ready.wait()  # Measure while all workers hold the index
+    after = memory_kb()
+    results.put({"load_ms": load_seconds * 1000, "private_mb": (after["private"] - before["private"]) / 1024,
+                 "pss_mb": (after["pss"] - before["pss"]) / 1024})
+
+def run(kind, index_dir, workers):
+    ctx = multiprocessing.get_context("spawn")
+    ready, results = ctx.Barrier(workers), ctx.Queue()
+    processes = [ctx.Process(target=load_and_query, args=(kind, index_dir, ready, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    rows = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return {key: sum(row[key] for row in rows) / len(rows) for key in rows[0]}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=50_000, help="Chunks in the index")
+    parser.add_argument("--chunk-chars", type=int, default=2000, help="Characters per chunk")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent worker processes")
+    args = parser.parse_args()
+
+    from book_index import BookIndex
+    from langchain_community.vectorstores import FAISS
+
+    embeddings = FakeEmbeddings()
+    texts = [f"Chunk {i}: " + ("Elizabeth walked to Netherfield in the rain. " * (args.chunk_chars // 45))
+             for i in range(args.chunks)]
+    vectors = [embeddings._embed(f"chunk {i} {i % 97} {i % 89}") for i in range(args.chunks)]
+
+    workspace = tempfile.mkdtemp(prefix="bench-index-")
+    BookIndex.build(os.path.join(workspace, "mmap"), texts, vectors)
+    FAISS.from_embeddings(list(zip(texts, vectors)), embeddings).save_local(os.path.join(workspace, "pickle"))
+
+    for kind in ("pickle", "mmap"):
+        index_dir = os.path.join(workspace, kind)
+        disk_mb = sum(os.path.getsize(os.path.join(index_dir, name)) for name in os.listdir(index_dir)) / 2**20
+        result = run(kind, index_dir, args.workers)
+        print(f"{kind:<7} disk {disk_mb:7.1f} MiB   load {result['load_ms']:8.1f} ms   "
+              f"private {result['private_mb']:8.1f} MiB/worker   pss {result['pss_mb']:8.1f} MiB/worker   "
+              f"({args.workers} workers)")
+
+if __name__ == "__main__":
+    main()
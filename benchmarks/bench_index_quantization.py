@@ -0,0 +1,110 @@
+"""
+Quantized book index layouts (INDEX_QUANTIZATION, INDEX_RERANK) against the float32 flat index.
+
+Builds the same book index in every layout from synthetic 768-dimensional
+unit vectors clustered around topics (the fake embeddings of generated text
+are too alike to rank meaningfully), then, in a fresh process per layout,
+loads it and answers --queries questions (vectors near random chunks).
+
+Reports per layout:
+
+    disk      index.faiss plus the float32 vectors kept for re-ranking
+    memory    resident memory the loaded index adds once every vector was
+              searched (/proc/self/smaps_rollup Rss, Linux), including the
+              faiss and langchain imports, which are the same for every layout
+    p50       median BookIndex search latency (k chunks, texts decompressed)
+    recall    share of the exact top-k (float32, brute force) returned
+
+Usage:
+    python benchmarks/bench_index_quantization.py [--chunks 20000] [--queries 200] [--k 4]
+"""
+
+import argparse
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+import bootstrap  # noqa: F401  (puts app/ on sys.path)
+
+LAYOUTS = [("flat", False), ("fp16", False), ("fp16", True), ("sq8", False), ("sq8", True),
+           ("pq", False), ("pq", True)]
+
+def rss_kb():
+    """Resident memory of this process in KiB"""
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            if line.startswith("Rss:"):
+                return int(line.split()[1])
+
+def make_vectors(chunks, queries, dimension, topics, seed=0):
+    """Unit vectors scattered around random topic centres, and queries near random chunks"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((topics, dimension)).astype("float32")
+    vectors = centres[rng.integers(0, topics, chunks)] + 0.6 * rng.standard_normal((chunks, dimension)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    questions = vectors[rng.integers(0, chunks, queries)] + 0.03 * rng.standard_normal((queries, dimension)).astype("float32")
+    questions /= np.linalg.norm(questions, axis=1, keepdims=True)
+    return vectors, questions.astype("float32")
+
+def exact_top_k(vectors, questions, k):
+    """Ids of the k nearest chunks of every question by exact squared L2 distance"""
+    distances = (questions ** 2).sum(1)[:, None] - 2 * questions @ vectors.T + (vectors ** 2).sum(1)[None, :]
+    return np.argsort(distances, axis=1)[:, :k]
+
+def search_layout(index_dir, questions, truth, k, results):
+    """Runs in a fresh process: loads the index, searches every question, reports memory, latency and recall"""
+    from book_index import BookIndex
+
+    before = rss_kb()
+    index = BookIndex.load(index_dir)
+    timings, found = [], 0
+    for question, expected in zip(questions, truth):
+        start = time.perf_counter()
+        docs = index.similarity_search_by_vector(question, k=k)
+        timings.append(time.perf_counter() - start)
+        found += len({document.metadata["chunk_id"] for document in docs} & set(expected.tolist()))
+    results.put({"memory_mb": (rss_kb() - before) / 1024, "p50_ms": statistics.median(timings) * 1000,
+                 "recall": found / (k * len(questions))})
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20_000, help="Chunks in the index")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4, help="Chunks retrieved per question")
+    parser.add_argument("--topics", type=int, default=200, help="Clusters the chunk vectors are drawn around")
+    parser.add_argument("--dimension", type=int, default=768)
+    args = parser.parse_args()
+
+    from book_index import INDEX_FILE, VECTORS_FILE, BookIndex
+
+    vectors, questions = make_vectors(args.chunks, args.queries, args.dimension, args.topics)
+    truth = exact_top_k(vectors, questions, args.k)
+    texts = [f"Chunk {i}: Elizabeth walked to Netherfield in the rain." for i in range(args.chunks)]
+    workspace = tempfile.mkdtemp(prefix="bench-quantization-")
+    ctx = multiprocessing.get_context("spawn")
+
+    print(f"{args.chunks} chunks of {args.dimension} dimensions, {args.queries} questions, k={args.k}")
+    print(f"{'layout':<12} {'build':>8} {'disk':>10} {'memory':>10} {'p50':>9} {'recall':>7}")
+    for quantization, rerank in LAYOUTS:
+        label = quantization + (" +rerank" if rerank else "")
+        index_dir = os.path.join(workspace, label.replace(" +", "-"))
+        start = time.perf_counter()
+        BookIndex.build(index_dir, texts, vectors, quantization=quantization, rerank=rerank)
+        build_seconds = time.perf_counter() - start
+        disk_mb = sum(os.path.getsize(os.path.join(index_dir, name)) for name in (INDEX_FILE, VECTORS_FILE)
+                      if os.path.exists(os.path.join(index_dir, name))) / 2**20
+
+        results = ctx.Queue()
+        process = ctx.Process(target=search_layout, args=(index_dir, questions, truth, args.k, results))
+        process.start()
+        result = results.get()
+        process.join()
+        print(f"{label:<12} {build_seconds:6.1f} s {disk_mb:6.1f} MiB {result['memory_mb']:6.1f} MiB "
+              f"{result['p50_ms']:6.2f} ms {result['recall']:7.1%}")
+
+if __name__ == "__main__":
+    main()
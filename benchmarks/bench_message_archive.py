@@ -0,0 +1,122 @@
+"""
+Message partitioning and archival (app/message_archive.py) on a year of history.
+
+Fills the messages table with --months of chat for --users users (a few
+turns per user and day, written straight in SQL), then measures the hot
+history reads the chat path makes, the size of the messages table, the
+archival job, and history reads that reach into archived months.
+
+Needs a local Postgres reachable through the DB_* variables. It writes to the
+configured database under a throwaway book name and archives every message
+partition older than --hot-months there (into a temporary directory).
+
+Usage:
+    python benchmarks/bench_message_archive.py [--users 200] [--months 12] [--turns 3] [--hot-months 3]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import bootstrap  # noqa: F401  (puts app/ on sys.path)
+from database import DatabaseManager
+from message_archive import MessageArchive, archive_messages
+
+BOOK = f"bench-message-archive-{os.getpid()}"
+CHARACTER = "Elizabeth Bennet"
+
+def populate(db, character_id, users, months, turns):
+    """One conversation per user, day and turn, each with a user and an assistant message"""
+    with db.conn.cursor() as cur:
+        cur.execute("""
+            WITH conversation AS (
+                INSERT INTO conversations (character_id, user_id, created_at)
+                SELECT %(character_id)s, 'user-' || u,
+                       date_trunc('day', LOCALTIMESTAMP) - make_interval(days => d) + make_interval(mins => 10 * t)
+                FROM generate_series(1, %(users)s) u, generate_series(1, %(days)s) d, generate_series(1, %(turns)s) t
+                RETURNING conversation_id, created_at
+            )
+            INSERT INTO messages (conversation_id, role, content, timestamp)
+            SELECT conversation_id, role, repeat('Of course I remember the ball at Netherfield. ', 6),
+                   created_at + make_interval(secs => position)
+            FROM conversation, (VALUES (0, 'user'), (1, 'assistant')) AS turn(position, role)
+        """, {"character_id": character_id, "users": users, "days": months * 30, "turns": turns})
+        rows = cur.rowcount
+    db.conn.commit()
+    db.ensure_message_partitions()  # Moves the rows into their monthly partitions
+    # Reclaim the rows moved out of the default partition and refresh statistics
+    db.conn.autocommit = True
+    with db.conn.cursor() as cur:
+        cur.execute("VACUUM ANALYZE messages")
+        cur.execute("VACUUM ANALYZE conversations")
+    db.conn.autocommit = False
+    return rows
+
+def messages_size(db):
+    with db.conn.cursor() as cur:
+        cur.execute("""
+            SELECT count(*), coalesce(sum(pg_total_relation_size(inhrelid)), 0)
+            FROM pg_inherits WHERE inhparent = 'messages'::regclass
+        """)
+        partitions, size = cur.fetchone()
+    db.conn.commit()
+    return partitions, size
+
+def median_ms(call, users, runs):
+    timings = []
+    for user in random.Random(0).sample(users, min(runs, len(users))):
+        start = time.perf_counter()
+        call(user)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+def measure(db, character_id, users, runs):
+    """Median latency (ms) of the reads the chat path makes for a returning user"""
+    return {
+        "history": median_ms(lambda user: db.get_conversation_history(character_id, user, 20), users, runs),
+        "recent": median_ms(lambda user: db.get_messages_after(character_id, user, 0, 12), users, runs),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--months", type=int, default=12, help="Months of history (30 days each)")
+    parser.add_argument("--turns", type=int, default=3, help="Turns per user and day")
+    parser.add_argument("--hot-months", type=int, default=3, help="Months kept in the database")
+    parser.add_argument("--runs", type=int, default=50, help="Users sampled per measurement")
+    args = parser.parse_args()
+
+    db = DatabaseManager()
+    db.archive = MessageArchive(tempfile.mkdtemp(prefix="bench-archive-"))
+    character_id = db.ensure_character(CHARACTER, BOOK)
+    users = [f"user-{u}" for u in range(1, args.users + 1)]
+
+    start = time.perf_counter()
+    rows = populate(db, character_id, args.users, args.months, args.turns)
+    print(f"{rows} messages over {args.months} months written in {time.perf_counter() - start:.1f} s")
+
+    def report(label):
+        partitions, size = messages_size(db)
+        latency = measure(db, character_id, users, args.runs)
+        print(f"{label:<16} {partitions:3d} partitions  {size / 2**20:8.1f} MiB   "
+              f"history {latency['history']:7.2f} ms   recent {latency['recent']:7.2f} ms")
+
+    report("before archival")
+    start = time.perf_counter()
+    archived = archive_messages(db, db.archive, args.hot_months)
+    archive_size = sum(os.path.getsize(os.path.join(db.archive.directory, entry["file"])) for entry in archived)
+    print(f"archived {len(archived)} partitions, {sum(entry['rows'] for entry in archived)} messages "
+          f"in {time.perf_counter() - start:.1f} s to {archive_size / 2**20:.1f} MiB of {archived[0]['format'] if archived else '-'}")
+    report("after archival")
+
+    # Paging back past the hot months reads the archive files of the user's older months
+    before = datetime.now() - timedelta(days=30 * (args.hot_months + 2))
+    cold = median_ms(lambda user: db.get_conversation_history(character_id, user, 20, before=before), users, args.runs)
+    print(f"{'read-through':<16} history before {before:%Y-%m-%d} {cold:7.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Speed and text fidelity of the PDF extraction backends (app/pdf_backends.py).
+
+Generates a set of PDFs with known text: different page counts, font sizes,
+one- and two-column layouts, raw and Flate-compressed content streams. Every
+installed backend extracts all of them; we report pages/s and how closely the
+extracted words match the words that were written (difflib ratio per page,
+1.0 = identical word sequence; two-column pages also test reading order).
+
+Usage:
+    python benchmarks/bench_pdf_backends.py [--pages 100] [--repeat 3] [--backends pypdf2 pdfium]
+"""
+
+import argparse
+import difflib
+import os
+import re
+import tempfile
+import time
+
+import bootstrap  # noqa: F401  (puts app/ on sys.path)
+from fakes import DEFAULT_ROSTER
+from pdf_backends import BACKENDS, PACKAGES, get_backend, is_available
+from pdfgen import make_book_pages, write_pdf
+
+# (name, write_pdf options) of each generated document
+LAYOUTS = [
+    ("plain", {}),
+    ("compressed", {"compress": True}),
+    ("small font", {"font_size": 9, "line_width": 120, "compress": True}),
+    ("two columns", {"columns": 2, "compress": True}),
+]
+
+def words(text):
+    return re.findall(r"\w+", text)
+
+def fidelity(expected_pages, extracted_pages):
+    """Mean word-sequence similarity per page (missing or extra pages score 0)"""
+    scores = [difflib.SequenceMatcher(None, words(expected), words(extracted), autojunk=False).ratio()
+              for expected, extracted in zip(expected_pages, extracted_pages)]
+    return sum(scores) / max(len(expected_pages), len(extracted_pages))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=100, help="Pages per generated PDF")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per backend (the fastest is reported)")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), help="Backends to compare")
+    args = parser.parse_args()
+
+    workspace = tempfile.mkdtemp(prefix="bench-pdf-")
+    documents = []
+    for seed, (layout, options) in enumerate(LAYOUTS):
+        pages = make_book_pages(args.pages, DEFAULT_ROSTER, seed=seed)
+        path = os.path.join(workspace, f"{layout.replace(' ', '-')}.pdf")
+        write_pdf(path, pages, **options)
+        documents.append((layout, path, pages))
+
+    print(f"{len(documents)} PDFs x {args.pages} pages: {', '.join(layout for layout, _, _ in documents)}")
+    print(f"{'backend':<10} {'pages/s':>9}  " + "  ".join(f"{layout:>11}" for layout, _, _ in documents))
+    for name in args.backends:
+        if not is_available(name):
+            print(f"{name:<10} skipped (pip install {PACKAGES[name][1]})")
+            continue
+        extract_pages = get_backend(name)
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            extracted = [extract_pages(path) for _, path, _ in documents]
+            best = min(best, time.perf_counter() - start)
+        scores = [fidelity(pages, result) for (_, _, pages), result in zip(documents, extracted)]
+        print(f"{name:<10} {len(documents) * args.pages / best:9.1f}  " + "  ".join(f"{score:11.3f}" for score in scores))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Overhead of the telemetry layer.
+
+1. Micro: cost of span()/count() calls with telemetry disabled vs enabled
+2. End to end: fake chat turns with telemetry disabled vs enabled
+
+Usage:
+    python benchmarks/bench_telemetry.py [--turns 200]
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import time
+import timeit
+
+import bootstrap  # noqa: F401  (puts app/ on sys.path)
+import telemetry
+from fakes import InMemoryDatabaseManager, use_fake_models
+
+def micro(iterations):
+    """Nanoseconds per instrumented no-op block"""
+    def instrumented():
+        with telemetry.span("bench.stage"):
+            telemetry.count("bench.events")
+
+    return timeit.timeit(instrumented, number=iterations) / iterations * 1e9
+
+def end_to_end(turns, user_id):
+    """Median seconds per fake chat turn (no model or DB latency, so overhead is not hidden)"""
+    from character import CharacterManager
+    from chat import ChatManager
+    from run import ingest_book
+
+    book_source = f"telemetry-book-{os.getpid()}"
+    characters, _, _ = ingest_book(5, "telemetry-book", book_source)
+    chat_manager = ChatManager(book_source, character_manager=CharacterManager(InMemoryDatabaseManager()))
+    latencies = []
+    for turn in range(turns):
+        start = time.perf_counter()
+        chat_manager.process_user_input(f"How was the ball, question {turn}?", characters[0], user_id)
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200_000, help="Micro-benchmark iterations")
+    parser.add_argument("--turns", type=int, default=200, help="Chat turns per mode")
+    args = parser.parse_args()
+
+    use_fake_models()
+    os.chdir(tempfile.mkdtemp(prefix="bench-telemetry-"))
+
+    results = {}
+    for enabled in (False, True):
+        telemetry.set_enabled(enabled)
+        logging.getLogger("telemetry").disabled = True  # Measure recording, not terminal output
+        results[enabled] = (micro(args.iterations), end_to_end(args.turns, f"telemetry-user-{enabled}"))
+
+    (off_ns, off_turn), (on_ns, on_turn) = results[False], results[True]
+    print(f"span+count   disabled {off_ns:8.1f} ns   enabled {on_ns:8.1f} ns")
+    print(f"chat turn    disabled {off_turn * 1000:8.3f} ms   enabled {on_turn * 1000:8.3f} ms   "
+          f"overhead {(on_turn / off_turn - 1) * 100:+.1f}%")
+
+if __name__ == "__main__":
+    main()
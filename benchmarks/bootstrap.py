@@ -0,0 +1,9 @@
+"""Makes the app modules (flat layout under app/) importable from benchmark scripts"""
+
+import os
+import sys
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "app"))
+
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
@@ -0,0 +1,328 @@
+"""
+Deterministic offline stand-ins for the Gemini clients and Postgres.
+
+- FakeChatModel replaces ChatGoogleGenerativeAI. It is a real LangChain chat
+  model, so chains, streaming and usage metadata work unchanged. It answers
+  the app's emotion, character-extraction and summary prompts in the format
+  the app expects.
+- FakeEmbeddings replaces GoogleGenerativeAIEmbeddings. It uses feature
+  hashing, so texts that share words get similar vectors.
+- InMemoryDatabaseManager implements the DatabaseManager methods used by
+  the chat path, with the same versioned per-user state semantics.
+
+All fakes accept configurable latency so scenarios can model network cost.
+"""
+
+import hashlib
+import itertools
+import json
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Any, Iterator, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+import bootstrap  # noqa: F401  (puts app/ on sys.path)
+import telemetry
+from character_state import CharacterState
+from database import StaleStateError
+
+DEFAULT_ROSTER = ["Elizabeth Bennet", "Fitzwilliam Darcy", "Jane Bennet", "Charles Bingley", "Lydia Bennet"]
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+def _digest(text):
+    """Stable 64-bit integer derived from text"""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic chat model with configurable latency"""
+
+    latency: float = 0.0            # Seconds per call (time to first token)
+    token_latency: float = 0.0      # Seconds per generated token
+    answer_words: int = 40          # Length of free-form answers
+    roster: List[str] = DEFAULT_ROSTER
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-gemini"
+
+    def _respond(self, prompt: str) -> str:
+        """Chooses an output shaped like what the app expects for this prompt"""
+        seed = _digest(prompt)
+        if "Generate new values for these parameters in JSON format" in prompt:
+            rng = np.random.default_rng(seed)
+            return json.dumps({field: round(float(v), 3) for field, v in zip(CharacterState.FIELDS, rng.random(11))})
+        if "comma-separated list" in prompt:
+            return ", ".join(self.roster)
+        if "preparing a character dossier" in prompt:
+            return "A proud and witty member of the gentry who speaks with measured, ironic courtesy."
+        if "long-term memory of a roleplay conversation" in prompt:
+            return f"The user and the character have talked about {len(prompt) // 100} topics so far."
+        rng = np.random.default_rng(seed)
+        vocabulary = ["indeed", "the", "ball", "letter", "estate", "sister", "I", "believe", "pride", "prejudice",
+                      "Netherfield", "Pemberley", "truly", "must", "confess", "that", "a", "walk", "was", "pleasant"]
+        return " ".join(vocabulary[i] for i in rng.integers(0, len(vocabulary), self.answer_words)) + "."
+
+    @staticmethod
+    def _prompt_text(messages: List[BaseMessage]) -> str:
+        return "\n".join(str(message.content) for message in messages)
+
+    @staticmethod
+    def _usage(prompt: str, output: str) -> dict:
+        # Roughly four characters per token, like most tokenizers on English text
+        input_tokens, output_tokens = len(prompt) // 4 + 1, len(output) // 4 + 1
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        prompt = self._prompt_text(messages)
+        output = self._respond(prompt)
+        time.sleep(self.latency + self.token_latency * len(output.split()))
+        message = AIMessage(content=output, usage_metadata=self._usage(prompt, output))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        prompt = self._prompt_text(messages)
+        output = self._respond(prompt)
+        time.sleep(self.latency)
+        words = output.split(" ")
+        for i, word in enumerate(words):
+            time.sleep(self.token_latency)
+            usage = self._usage(prompt, output) if i == len(words) - 1 else None
+            chunk = word if i == len(words) - 1 else word + " "
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk, usage_metadata=usage))
+
+class FakeEmbeddings(Embeddings):
+    """Feature-hashing embeddings with configurable latency"""
+
+    def __init__(self, dimension=768, latency=0.0, per_text_latency=0.0):
+        """
+        Args:
+            dimension (int): Vector size (Gemini embedding-001 uses 768)
+            latency (float): Seconds per request
+            per_text_latency (float): Additional seconds per embedded text
+        """
+        self.dimension = dimension
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+
+    def _embed(self, text):
+        vector = np.zeros(self.dimension, dtype="float32")
+        for word in _WORD.findall(text.lower()):
+            h = _digest(word)
+            vector[h % self.dimension] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency + self.per_text_latency * len(texts))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        time.sleep(self.latency + self.per_text_latency)
+        return self._embed(text)
+
+def use_fake_models(chat_latency=0.0, token_latency=0.0, embedding_latency=0.0, roster=None):
+    """Routes models.get_chat_model/get_embeddings to the fakes"""
+    from models import set_model_backend
+
+    set_model_backend(
+        chat_factory=lambda model, temperature: FakeChatModel(
+            latency=chat_latency, token_latency=token_latency, roster=roster or DEFAULT_ROSTER
+        ),
+        embeddings_factory=lambda model: FakeEmbeddings(latency=embedding_latency),
+    )
+
+class InMemoryDatabaseManager:
+    """
+    Thread-safe in-process replacement for DatabaseManager covering the
+    operations used by ChatManager, CharacterManager and the memory layers
+    """
+
+    def __init__(self, query_latency=0.0):
+        """
+        Args:
+            query_latency (float): Seconds added to every operation (models a DB round trip)
+        """
+        self.lock = threading.RLock()
+        self.query_latency = query_latency
+        self._ids = itertools.count(1)
+        self.characters = {}     # (name, source) -> character_id
+        self.user_states = {}    # (character_id, user_id) -> (vector, version)
+        self.conversations = {}  # conversation_id -> (character_id, user_id)
+        self.messages = []       # dicts: message_id, conversation_id, role, content, timestamp
+        self.memory = {}         # (character_id, key) -> value
+        self.books = {}          # book_source -> catalog entry
+        self.emotion_samples = []  # (character_id, user_id, recorded_at, state vector)
+
+    def _roundtrip(self):
+        telemetry.count("db.queries")
+        if self.query_latency:
+            time.sleep(self.query_latency)
+
+    def ensure_character(self, character_name, book_source):
+        self._roundtrip()
+        with self.lock:
+            key = (character_name, book_source)
+            if key not in self.characters:
+                self.characters[key] = next(self._ids)
+            return self.characters[key]
+
+    def save_character_state(self, character_name, character_state, book_source, user_id):
+        character_id = self.ensure_character(character_name, book_source)
+        if not user_id or user_id == "anonymous":
+            return character_id
+        self._roundtrip()
+        with self.lock:
+            stored = self.user_states.get((character_id, user_id))
+            stored_version = stored[1] if stored else 0
+            if stored_version != character_state.version:
+                raise StaleStateError(f"State of {character_name} for {user_id} changed")
+            self.user_states[(character_id, user_id)] = (character_state.to_vector(), stored_version + 1)
+            character_state.version += 1
+            return character_id
+
+    def get_character_state(self, character_name, book_source, user_id):
+        self._roundtrip()
+        with self.lock:
+            character_id = self.characters.get((character_name, book_source))
+            if character_id is None:
+                return None, None
+            stored = self.user_states.get((character_id, user_id))
+            if stored:
+                return CharacterState.from_vector(stored[0], version=stored[1]), character_id
+            return CharacterState(), character_id
+
+    def create_conversation(self, character_id, user_id):
+        if not user_id or user_id == "anonymous":
+            return "anonymous"
+        self._roundtrip()
+        with self.lock:
+            conversation_id = next(self._ids)
+            self.conversations[conversation_id] = (character_id, user_id)
+            return conversation_id
+
+    def save_message(self, conversation_id, role, content):
+        if not conversation_id or conversation_id == "anonymous":
+            return
+        self._roundtrip()
+        with self.lock:
+            message_id = next(self._ids)
+            self.messages.append({"message_id": message_id, "conversation_id": conversation_id,
+                                  "role": role.lower(), "content": content, "timestamp": datetime.now()})
+            return message_id
+
+    def save_turn(self, character_id, user_id, messages):
+        if not user_id or user_id == "anonymous":
+            return [None] * len(messages)
+        conversation_id = self.create_conversation(character_id, user_id)
+        with self.lock:
+            message_ids = []
+            for role, content in messages:
+                message_ids.append(next(self._ids))
+                self.messages.append({"message_id": message_ids[-1], "conversation_id": conversation_id,
+                                      "role": role.lower(), "content": content, "timestamp": datetime.now()})
+            return message_ids
+
+    def _user_messages(self, character_id, user_id):
+        return [m for m in self.messages
+                if self.conversations.get(m["conversation_id"]) == (character_id, user_id)]
+
+    def get_conversation_history(self, character_id, user_id=None, limit=20, before=None):
+        self._roundtrip()
+        with self.lock:
+            messages = [m for m in self.messages
+                        if self.conversations[m["conversation_id"]][0] == character_id
+                        and (user_id is None or self.conversations[m["conversation_id"]][1] == user_id)
+                        and (before is None or m["timestamp"] < before)]
+            return [{"message_id": m["message_id"], "role": m["role"], "content": m["content"],
+                     "timestamp": m["timestamp"]} for m in messages[-limit:]]
+
+    def get_messages_after(self, character_id, user_id, after_message_id=0, limit=None, oldest_first=False):
+        self._roundtrip()
+        with self.lock:
+            messages = [dict(m) for m in self._user_messages(character_id, user_id)
+                        if m["message_id"] > after_message_id]
+            if not limit:
+                return messages
+            return messages[:limit] if oldest_first else messages[-limit:]
+
+    def get_messages_by_ids(self, message_ids):
+        self._roundtrip()
+        wanted = set(message_ids)
+        with self.lock:
+            return [dict(m) for m in self.messages if m["message_id"] in wanted]
+
+    def save_to_memory(self, character_id, key, value):
+        self._roundtrip()
+        with self.lock:
+            self.memory[(character_id, key)] = value
+
+    def get_from_memory(self, character_id, key):
+        self._roundtrip()
+        with self.lock:
+            return self.memory.get((character_id, key))
+
+    def save_book(self, book_source, content_hash, index_dir, characters, metadata=None):
+        self._roundtrip()
+        with self.lock:
+            self.books[book_source] = {"book_source": book_source, "content_hash": content_hash,
+                                       "index_dir": index_dir, "characters": list(characters),
+                                       "metadata": metadata or {}, "ingested_at": datetime.now()}
+
+    def get_book(self, book_source):
+        self._roundtrip()
+        with self.lock:
+            book = self.books.get(book_source)
+            return dict(book) if book else None
+
+    def list_books(self):
+        self._roundtrip()
+        with self.lock:
+            return [{"book_source": book["book_source"], "characters": book["characters"],
+                     "ingested_at": book["ingested_at"]} for _, book in sorted(self.books.items())]
+
+    def save_emotion_samples(self, samples):
+        self._roundtrip()
+        with self.lock:
+            self.emotion_samples.extend(samples)
+
+    def _emotion_arrays(self, samples):
+        character_ids = np.array([sample[0] for sample in samples], dtype="int32")
+        timestamps = np.array([sample[2].timestamp() for sample in samples], dtype="float64")
+        states = np.array([sample[3] for sample in samples], dtype="float32").reshape(-1, len(CharacterState.FIELDS))
+        return character_ids, timestamps, states
+
+    def get_emotion_trajectory(self, character_id, user_id, since=None, until=None, bucket_seconds=60):
+        from emotion_history import downsample
+
+        self._roundtrip()
+        with self.lock:
+            samples = sorted((sample for sample in self.emotion_samples
+                              if sample[0] == character_id and sample[1] == user_id
+                              and (since is None or sample[2] >= since) and (until is None or sample[2] < until)),
+                             key=lambda sample: sample[2])
+        _, timestamps, states = self._emotion_arrays(samples)
+        starts, means, counts = downsample(timestamps, states, bucket_seconds)
+        return [{"time": datetime.fromtimestamp(start), "samples": int(count), "state": mean.tolist()}
+                for start, mean, count in zip(starts, means, counts)]
+
+    def fetch_emotion_samples(self, book_source=None, since=None, batch_size=10000):
+        self._roundtrip()
+        with self.lock:
+            book_ids = {character_id for (_, source), character_id in self.characters.items()
+                        if book_source is None or source == book_source}
+            samples = [sample for sample in self.emotion_samples
+                       if sample[0] in book_ids and (since is None or sample[2] >= since)]
+        return self._emotion_arrays(samples)
+
+    def close(self):
+        pass
@@ -0,0 +1,119 @@
+"""
+Synthetic books for ingestion benchmarks.
+
+make_book_pages() produces deterministic narrative text that mentions a
+character roster, with a running header and page-number footer like real
+scanned books. write_pdf() writes pages to a plain PDF (Type1 Helvetica,
+one content stream per page) without any third-party dependency.
+"""
+
+import random
+import textwrap
+import zlib
+
+SENTENCES = [
+    "{a} walked with {b} along the lane toward the village.",
+    "It was generally agreed that {a} had never looked so well.",
+    "{a} could not help but smile at the letter from {b}.",
+    "The ball at Netherfield was spoken of for weeks, and {a} most of all.",
+    "{b} confessed to {a} that the estate was in some difficulty.",
+    "Nobody could say what {a} truly felt about {b}.",
+    "The rain kept {a} indoors, reading until the candles burned low.",
+    "{a} and {b} quarrelled briefly over the merits of the new curate.",
+]
+
+def make_book_pages(n_pages, roster, seed=0, title="A Benchmark Novel", words_per_page=350):
+    """
+    Generate page texts
+
+    Args:
+        n_pages (int): Number of pages
+        roster (list): Character names mentioned in the text
+        seed (int): Random seed for reproducible output
+        title (str): Running header printed on every page
+        words_per_page (int): Approximate body length per page
+
+    Returns:
+        list: One string per page (header, body, footer separated by newlines)
+    """
+    rng = random.Random(seed)
+    pages = []
+    for number in range(1, n_pages + 1):
+        body, words = [], 0
+        while words < words_per_page:
+            a, b = rng.sample(roster, 2)
+            sentence = rng.choice(SENTENCES).format(a=a, b=b)
+            body.append(sentence)
+            words += len(sentence.split())
+        pages.append(f"{title}\n{' '.join(body)}\n{number}")
+    return pages
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def write_pdf(path, pages, font_size=11, line_width=95, columns=1, compress=False):
+    """
+    Write pages of plain text to a PDF file
+
+    Args:
+        path (str): Output file path
+        pages (list): Page texts; newlines start new lines, long lines are wrapped
+        font_size (int): Font size in points
+        line_width (int): Characters per wrapped line (of the whole page width)
+        columns (int): Text columns per page, filled left to right
+        compress (bool): Flate-compress the page content streams, like most real PDFs
+    """
+    objects = []  # PDF object bodies, object number = index + 1
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(None)  # Filled in once the page tree exists
+    pages_id = add(None)
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    page_ids = []
+    for text in pages:
+        lines = []
+        for paragraph in text.split("\n"):
+            lines.extend(textwrap.wrap(paragraph, line_width // columns) or [""])
+        if columns == 1:
+            ops = [f"BT /F1 {font_size} Tf {font_size + 3} TL 56 800 Td"]
+            ops += [f"({_escape(line)}) Tj T*" for line in lines]
+        else:
+            # Drawn row by row across the columns, as many producers do, so
+            # extractors that follow the content stream get the reading order wrong
+            per_column = -(-len(lines) // columns)
+            ops = [f"BT /F1 {font_size} Tf"]
+            for row in range(per_column):
+                for column in range(columns):
+                    if column * per_column + row < len(lines):
+                        x, y = 56 + column * 483 // columns, 800 - row * (font_size + 3)
+                        ops.append(f"1 0 0 1 {x} {y} Tm ({_escape(lines[column * per_column + row])}) Tj")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", "replace")
+        stream_filter = b""
+        if compress:
+            stream, stream_filter = zlib.compress(stream), b" /Filter /FlateDecode"
+        content = add(b"<< /Length %d%s >>\nstream\n" % (len(stream), stream_filter) + stream + b"\nendstream")
+        page_ids.append(add(
+            f"<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 {font} 0 R >> >> /Contents {content} 0 R >>".encode()
+        ))
+
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[pages_id - 1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+    objects[catalog - 1] = f"<< /Type /Catalog /Pages {pages_id} 0 R >>".encode()
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref))
@@ -0,0 +1,279 @@
+"""
+Offline end-to-end benchmark suite.
+
+Runs the real ingestion and chat code paths (PDFProcessor, ChatManager,
+CharacterManager, memory layers) with deterministic fake Gemini clients and,
+by default, an in-memory database, so results are reproducible without API
+keys or a running Postgres.
+
+Scenarios:
+    ingest        Ingest a generated N-page PDF book (text extraction, chunking,
+                  embedding, index build, character extraction)
+    chat          M concurrent sessions sending T turns each
+    long_history  Users with H stored messages sending T turns each
+
+Each scenario runs in its own subprocess so memory numbers are not polluted
+by earlier scenarios. Reports p50/p95/p99 latency, throughput and peak RSS.
+
+Usage:
+    python benchmarks/run.py                          # all scenarios
+    python benchmarks/run.py --scenario chat --sessions 32 --turns 10
+    python benchmarks/run.py --db postgres            # real database (DB_* env vars, DB_BACKEND)
+    python benchmarks/run.py --save-baseline          # store results in benchmarks/baseline.json
+    python benchmarks/run.py --compare                # exit 1 if slower than the baseline
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bootstrap  # noqa: F401  (puts app/ on sys.path)
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(BENCH_DIR, "baseline.json")
+SCENARIOS = ("ingest", "chat", "long_history")
+
+# ======================
+# MEASUREMENT HELPERS
+# ======================
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))]
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def summarize(latencies, elapsed, operations, unit, **extra):
+    """Builds the result record for one scenario"""
+    return {
+        "latency_ms": {q: round(percentile(latencies, int(q[1:])) * 1000, 2) for q in ("p50", "p95", "p99")},
+        "throughput": round(operations / elapsed, 2) if elapsed else 0.0,
+        "unit": unit,
+        "operations": operations,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        **extra,
+    }
+
+# ======================
+# SCENARIO SETUP
+# ======================
+
+def make_database(kind):
+    """In-memory fake or the real Postgres-backed manager (DB_BACKEND selects which)"""
+    if kind == "postgres":
+        from database import get_database
+        return get_database()
+    from fakes import InMemoryDatabaseManager
+    return InMemoryDatabaseManager()
+
+def ingest_book(pages, book_title, book_source=None):
+    """Writes a synthetic PDF and indexes it for book_source (default: the title); returns (characters, stage timings)"""
+    from book_index import book_index_dir
+    from dossier import build_dossiers
+    from fakes import DEFAULT_ROSTER
+    from pdf_processor import PDFProcessor
+    from pdfgen import make_book_pages, write_pdf
+
+    pdf_path = os.path.join(os.getcwd(), f"{book_title}.pdf")
+    write_pdf(pdf_path, make_book_pages(pages, DEFAULT_ROSTER, title=book_title))
+
+    processor = PDFProcessor()
+    timings = {}
+    start = time.perf_counter()
+    pages = processor.get_pdf_pages([pdf_path])
+    timings["extract"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    chunks, metadatas = processor.get_page_chunks(pages)
+    timings["chunk"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    chunks, metadatas = processor.dedupe_chunks(chunks, metadatas)
+    timings["dedupe"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    characters = processor.extract_characters(" ".join(text for _, _, text in pages))
+    timings["extract_characters"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    processor.create_vector_store(chunks, book_index_dir(book_source or book_title), metadatas, characters=characters)
+    timings["embed_and_index"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    build_dossiers(chunks, metadatas, characters, book_index_dir(book_source or book_title))
+    timings["dossiers"] = time.perf_counter() - start
+    return characters, timings, len(chunks)
+
+def run_turns(chat_manager, character, user_ids, turns, concurrency):
+    """Sends `turns` messages for every user, `concurrency` sessions at a time; returns per-turn latencies"""
+    latencies = []
+    lock = threading.Lock()
+
+    def session(user_id):
+        for turn in range(turns):
+            start = time.perf_counter()
+            chat_manager.process_user_input(f"Tell me about the ball, question {turn} from {user_id}", character, user_id)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(session, user_ids))
+    return latencies
+
+# ======================
+# SCENARIOS
+# ======================
+
+def scenario_ingest(args):
+    latencies, pages_total, chunks_total = [], 0, 0
+    stage_totals = {}
+    start_all = time.perf_counter()
+    for repeat in range(args.repeats):
+        start = time.perf_counter()
+        characters, timings, chunks = ingest_book(args.pages, f"ingest-{repeat}")
+        latencies.append(time.perf_counter() - start)
+        pages_total += args.pages
+        chunks_total += chunks
+        for stage, seconds in timings.items():
+            stage_totals[stage] = stage_totals.get(stage, 0.0) + seconds
+    elapsed = time.perf_counter() - start_all
+    return summarize(
+        latencies, elapsed, pages_total, "pages/s",
+        chunks_per_s=round(chunks_total / elapsed, 2),
+        stage_ms={stage: round(seconds / args.repeats * 1000, 2) for stage, seconds in stage_totals.items()},
+        characters=len(characters),
+    )
+
+def scenario_chat(args):
+    from character import CharacterManager
+    from chat import ChatManager
+
+    book_source = f"chat-book-{os.getpid()}"
+    characters, _, _ = ingest_book(args.setup_pages, "chat-book", book_source)
+    chat_manager = ChatManager(book_source, character_manager=CharacterManager(make_database(args.db)))
+    user_ids = [f"bench-user-{i}" for i in range(args.sessions)]
+
+    start = time.perf_counter()
+    latencies = run_turns(chat_manager, characters[0], user_ids, args.turns, args.sessions)
+    elapsed = time.perf_counter() - start
+    return summarize(latencies, elapsed, len(latencies), "turns/s", sessions=args.sessions)
+
+def scenario_long_history(args):
+    from character import CharacterManager
+    from chat import ChatManager
+
+    book_source = f"history-book-{os.getpid()}"
+    characters, _, _ = ingest_book(args.setup_pages, "history-book", book_source)
+    db = make_database(args.db)
+    chat_manager = ChatManager(book_source, character_manager=CharacterManager(db))
+    user_ids = [f"history-user-{i}" for i in range(args.users)]
+
+    # Preload history directly through the database layer
+    character_id = db.ensure_character(characters[0], book_source)
+    for user_id in user_ids:
+        conversation_id = db.create_conversation(character_id, user_id)
+        for i in range(args.history // 2):
+            db.save_message(conversation_id, "user", f"Earlier I told you about my cousin number {i} and the ball.")
+            db.save_message(conversation_id, "assistant", f"I remember cousin number {i}; the ball was delightful.")
+
+    start = time.perf_counter()
+    latencies = run_turns(chat_manager, characters[0], user_ids, args.turns, args.users)
+    elapsed = time.perf_counter() - start
+    return summarize(latencies, elapsed, len(latencies), "turns/s", history_messages=args.history)
+
+# ======================
+# DRIVER
+# ======================
+
+def run_worker(args):
+    """Runs one scenario in this process and prints its result as JSON"""
+    from admission import AdmissionController, set_controller
+    from fakes import use_fake_models
+
+    use_fake_models(chat_latency=args.llm_latency, token_latency=args.token_latency,
+                    embedding_latency=args.embedding_latency)
+    # Sessions send turns back to back; per-user rate limits would turn them into busy replies
+    set_controller(AdmissionController(turns_per_minute=0))
+    workspace = tempfile.mkdtemp(prefix=f"bench-{args.worker}-")
+    os.chdir(workspace)  # Indexes and memory files are written relative to the working directory
+    result = globals()[f"scenario_{args.worker}"](args)
+    print(json.dumps(result))
+
+def compare(results, baseline, tolerance):
+    """Returns a list of regression descriptions"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result["latency_ms"]["p95"] > base["latency_ms"]["p95"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['latency_ms']['p95']} ms vs baseline {base['latency_ms']['p95']} ms")
+        if result["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {result['throughput']} vs baseline {base['throughput']} {result['unit']}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=SCENARIOS, action="append", help="Scenario to run (repeatable, default all)")
+    parser.add_argument("--db", choices=("memory", "postgres"), default="memory", help="Database backend")
+    parser.add_argument("--pages", type=int, default=200, help="Pages in the ingested book")
+    parser.add_argument("--repeats", type=int, default=3, help="Ingestion repetitions")
+    parser.add_argument("--setup-pages", type=int, default=20, help="Pages of the book used by chat scenarios")
+    parser.add_argument("--sessions", type=int, default=8, help="Concurrent chat sessions")
+    parser.add_argument("--turns", type=int, default=5, help="Turns per session/user")
+    parser.add_argument("--users", type=int, default=4, help="Users in the long-history scenario")
+    parser.add_argument("--history", type=int, default=2000, help="Stored messages per long-history user")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Fake LLM seconds per call")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Fake LLM seconds per output token")
+    parser.add_argument("--embedding-latency", type=float, default=0.01, help="Fake embedding seconds per call")
+    parser.add_argument("--save-baseline", action="store_true", help=f"Write results to {BASELINE_FILE}")
+    parser.add_argument("--compare", action="store_true", help="Fail if results regress against the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression (default 0.2)")
+    parser.add_argument("--worker", choices=SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    forwarded = [arg for arg in sys.argv[1:] if arg not in ("--save-baseline", "--compare")]
+    results = {}
+    for name in args.scenario or SCENARIOS:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), *forwarded, "--worker", name],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        results[name] = json.loads(output.strip().splitlines()[-1])
+        latency = results[name]["latency_ms"]
+        print(f"{name:<13} p50 {latency['p50']:>9.2f} ms  p95 {latency['p95']:>9.2f} ms  p99 {latency['p99']:>9.2f} ms  "
+              f"{results[name]['throughput']:>9.2f} {results[name]['unit']:<8} peak RSS {results[name]['peak_rss_mb']} MiB")
+
+    if args.save_baseline:
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {BASELINE_FILE}")
+
+    if args.compare:
+        if not os.path.exists(BASELINE_FILE):
+            sys.exit(f"No baseline at {BASELINE_FILE}; run with --save-baseline first")
+        with open(BASELINE_FILE) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Shared test setup: app/ and benchmarks/ (for the fakes) on sys.path, fake models, fresh admission control"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+for path in (os.path.join(ROOT, "app"), os.path.join(ROOT, "benchmarks")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+
+@pytest.fixture(autouse=True)
+def fake_models():
+    """Every test talks to the deterministic fake Gemini clients"""
+    from fakes import use_fake_models
+
+    use_fake_models()
+
+@pytest.fixture(autouse=True)
+def admission():
+    """A fresh admission controller without per-user rate limits"""
+    from admission import AdmissionController, set_controller
+
+    controller = AdmissionController(turns_per_minute=0)
+    set_controller(controller)
+    return controller
+
+@pytest.fixture
+def db():
+    from fakes import InMemoryDatabaseManager
+
+    return InMemoryDatabaseManager()
+
+@pytest.fixture(scope="session")
+def postgres_database():
+    """
+    Name of a throwaway database on the server the DB_* variables point at
+    (tests using it are skipped when no server is reachable)
+    """
+    import psycopg2
+
+    params = dict(user=os.getenv("DB_USER", "postgres"), password=os.getenv("DB_PASSWORD", "postgres"),
+                  host=os.getenv("DB_HOST"), port=os.getenv("DB_PORT"))
+    try:
+        admin = psycopg2.connect(dbname="postgres", connect_timeout=3, **params)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"Postgres is not reachable: {e}")
+    admin.autocommit = True
+    name = f"chatbot_test_{os.getpid()}"
+    with admin.cursor() as cur:
+        cur.execute(f"DROP DATABASE IF EXISTS {name}")
+        cur.execute(f"CREATE DATABASE {name}")
+    yield name
+    with admin.cursor() as cur:
+        cur.execute(f"DROP DATABASE IF EXISTS {name} WITH (FORCE)")
+    admin.close()
+
+@pytest.fixture
+def postgres(postgres_database, monkeypatch, tmp_path):
+    """A DatabaseManager on an empty schema, archiving to a temporary directory"""
+    from database import DatabaseManager
+    from message_archive import MessageArchive
+
+    monkeypatch.setenv("DB_NAME", postgres_database)
+    db = DatabaseManager()
+    db.archive = MessageArchive(str(tmp_path / "archive"))
+    with db.conn.cursor() as cur:
+        cur.execute("""
+            SELECT string_agg(quote_ident(tablename), ', ') FROM pg_tables
+            WHERE schemaname = 'public' AND tablename NOT LIKE 'messages_%'
+        """)
+        tables = cur.fetchone()[0]
+        if tables:
+            cur.execute(f"TRUNCATE {tables} RESTART IDENTITY CASCADE")
+    db.conn.commit()
+    yield db
+    db.close()
+
+@pytest.fixture(params=["psycopg2", "async"])
+def any_backend(request, postgres):
+    """The same empty database through each DB_BACKEND (see database.get_database)"""
+    if request.param == "psycopg2":
+        yield postgres
+        return
+    from async_database import AsyncDatabaseManager, SyncDatabaseAdapter
+
+    db = SyncDatabaseAdapter(AsyncDatabaseManager(min_size=1, max_size=4))
+    db.async_db.archive = postgres.archive
+    yield db
+    db.close()
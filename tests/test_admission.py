@@ -0,0 +1,140 @@
+import threading
+import time
+
+import pytest
+
+import admission
+from admission import BACKGROUND, INTERACTIVE, AdmissionController, ModelGate, Overloaded, RateLimited, TokenBucket
+from models import CHAT_MODEL, EMBEDDING_MODEL
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.001)
+
+def test_token_bucket_refills_up_to_capacity():
+    bucket = TokenBucket(rate=0.5, capacity=2, now=0)
+
+    assert [bucket.try_take(0) for _ in range(3)] == [True, True, False]
+    assert not bucket.try_take(1.9)
+    assert bucket.try_take(2.0)
+    bucket.refill(100)
+    assert bucket.tokens == 2
+
+def test_turns_are_limited_per_client():
+    clock = Clock()
+    controller = AdmissionController(turns_per_minute=3, burst=2, clock=clock)
+
+    controller.admit_turn("alice")
+    controller.admit_turn("alice")
+    with pytest.raises(RateLimited):
+        controller.admit_turn("alice")
+    controller.admit_turn("bob")  # Another client has its own budget
+
+    clock.now = 20  # One turn every 20 seconds
+    controller.admit_turn("alice")
+    with pytest.raises(RateLimited):
+        controller.admit_turn("alice")
+
+def test_rate_limiting_can_be_disabled():
+    controller = AdmissionController(turns_per_minute=0, burst=1)
+    for _ in range(100):
+        controller.admit_turn("alice")
+
+def test_idle_clients_are_forgotten(monkeypatch):
+    monkeypatch.setattr(admission, "MAX_TRACKED_CLIENTS", 2)
+    clock = Clock()
+    controller = AdmissionController(turns_per_minute=60, burst=2, clock=clock)
+
+    controller.admit_turn("alice")
+    controller.admit_turn("bob")
+    controller.admit_turn("bob")
+    clock.now = 1  # Alice's bucket is full again, Bob's is not
+    controller.admit_turn("carol")
+
+    assert set(controller._buckets) == {"bob", "carol"}
+
+def test_gate_serves_priority_then_arrival_order():
+    gate = ModelGate(limit=1, queue_limit=10)
+    gate.acquire(INTERACTIVE, timeout=1)
+    served = []
+
+    def call(name, priority):
+        gate.acquire(priority, timeout=5)
+        served.append(name)
+        gate.release()
+
+    threads = []
+    for name, priority in [("summary", BACKGROUND), ("first answer", INTERACTIVE), ("second answer", INTERACTIVE)]:
+        threads.append(threading.Thread(target=call, args=(name, priority)))
+        threads[-1].start()
+        wait_for(lambda: len(gate.waiting) == len(threads))
+
+    gate.release()
+    for thread in threads:
+        thread.join(5)
+
+    assert served == ["first answer", "second answer", "summary"]
+    assert gate.active == 0 and gate.waiting == []
+
+def test_gate_sheds_when_the_queue_is_full():
+    gate = ModelGate(limit=1, queue_limit=1)
+    gate.acquire(INTERACTIVE, timeout=1)
+    waiter = threading.Thread(target=lambda: gate.acquire(INTERACTIVE, timeout=5))
+    waiter.start()
+    wait_for(lambda: len(gate.waiting) == 1)
+
+    start = time.monotonic()
+    with pytest.raises(Overloaded, match="full"):
+        gate.acquire(INTERACTIVE, timeout=5)
+    assert time.monotonic() - start < 1  # Rejected without waiting
+
+    gate.release()
+    waiter.join(5)
+    assert gate.active == 1
+
+def test_timed_out_head_lets_the_next_waiter_through():
+    gate = ModelGate(limit=1, queue_limit=10)
+    gate.acquire(INTERACTIVE, timeout=1)
+    results = {}
+
+    def call(name, priority, timeout):
+        try:
+            gate.acquire(priority, timeout)
+            results[name] = "served"
+        except Overloaded:
+            results[name] = "shed"
+
+    impatient = threading.Thread(target=call, args=("impatient", INTERACTIVE, 0.05))
+    impatient.start()
+    wait_for(lambda: len(gate.waiting) == 1)
+    patient = threading.Thread(target=call, args=("patient", BACKGROUND, 5))
+    patient.start()
+    impatient.join(5)
+    assert results == {"impatient": "shed"} and len(gate.waiting) == 1
+
+    gate.release()
+    patient.join(5)
+    assert results["patient"] == "served" and gate.waiting == []
+
+def test_model_slots_are_limited_per_model():
+    controller = AdmissionController(model_concurrency=1, embedding_concurrency=2, background_timeout=0.01)
+
+    with controller.model_slot(CHAT_MODEL):
+        with pytest.raises(Overloaded):
+            with controller.model_slot(CHAT_MODEL, BACKGROUND):
+                pass
+        with controller.model_slot(EMBEDDING_MODEL), controller.model_slot(EMBEDDING_MODEL):
+            pass
+
+    with controller.model_slot(CHAT_MODEL):  # Released after the block
+        pass
+    assert controller._gate(CHAT_MODEL).active == 0
@@ -0,0 +1,69 @@
+import pytest
+
+from auth import InvalidToken, issue_token, user_from_headers, verify_token
+
+SECRET = "test-secret"
+
+def test_token_round_trip():
+    token = issue_token("alice", ttl=60, secret=SECRET, now=1000)
+
+    assert verify_token(token, secret=SECRET, now=1059) == "alice"
+    with pytest.raises(InvalidToken, match="expired"):
+        verify_token(token, secret=SECRET, now=1060)
+
+def test_tampered_token_is_rejected():
+    payload, signature = issue_token("alice", secret=SECRET).split(".")
+    forged = issue_token("mallory", secret=SECRET).split(".")[0]
+
+    with pytest.raises(InvalidToken):
+        verify_token(f"{forged}.{signature}", secret=SECRET)
+    with pytest.raises(InvalidToken):
+        verify_token(f"{payload}.{signature}", secret="other-secret")
+    with pytest.raises(InvalidToken):
+        verify_token(payload, secret=SECRET)
+    with pytest.raises(InvalidToken):
+        verify_token("%%%.%%%", secret=SECRET)
+
+def test_no_secret_means_no_named_users(monkeypatch):
+    import auth
+
+    monkeypatch.setattr(auth, "API_SECRET_KEY", "")
+    with pytest.raises(ValueError):
+        issue_token("alice")
+    with pytest.raises(InvalidToken):
+        verify_token(issue_token("alice", secret=SECRET))
+    assert user_from_headers({}) == "anonymous"
+
+def test_anonymous_tokens_are_not_issued():
+    with pytest.raises(ValueError):
+        issue_token("anonymous", secret=SECRET)
+    with pytest.raises(ValueError):
+        issue_token("", secret=SECRET)
+
+def test_user_from_headers(monkeypatch):
+    import auth
+
+    monkeypatch.setattr(auth, "API_SECRET_KEY", SECRET)
+    token = issue_token("alice")
+
+    assert user_from_headers({"authorization": f"Bearer {token}"}) == "alice"
+    assert user_from_headers({}, {"token": token}) == "alice"
+    assert user_from_headers({}, {}) == "anonymous"
+    with pytest.raises(InvalidToken):
+        user_from_headers({"authorization": f"Basic {token}"})
+
+def test_scopes(monkeypatch):
+    import auth
+
+    monkeypatch.setattr(auth, "API_SECRET_KEY", SECRET)
+    scoped = issue_token("librarian", scopes=[auth.INGEST_SCOPE])
+    plain = issue_token("alice")
+
+    assert verify_token(scoped, scope=auth.INGEST_SCOPE) == "librarian"
+    assert verify_token(scoped) == "librarian"
+    assert user_from_headers({"authorization": f"Bearer {scoped}"}, scope=auth.INGEST_SCOPE) == "librarian"
+    with pytest.raises(auth.MissingScope):
+        user_from_headers({"authorization": f"Bearer {plain}"}, scope=auth.INGEST_SCOPE)
+    with pytest.raises(InvalidToken) as missing:
+        user_from_headers({}, scope=auth.INGEST_SCOPE)
+    assert not isinstance(missing.value, auth.MissingScope)
@@ -0,0 +1,112 @@
+import io
+import os
+import tarfile
+import threading
+
+import pytest
+
+import book_bundle
+from book_bundle import MANIFEST_NAME, export_book, file_digest, import_bundle
+from book_index import BookIndex, book_index_dir, write_book_info
+from fakes import FakeEmbeddings
+
+BOOK = "Pride and Prejudice"
+CHUNKS = ["Elizabeth Bennet walked to Netherfield.", "Mr. Darcy was proud.", "Jane was kind to everyone.",
+          "Mr. Collins proposed to Elizabeth.", "Lydia ran away with Wickham."]
+
+@pytest.fixture
+def book(tmp_path):
+    """An ingested book, as bulk ingestion leaves it"""
+    index_dir = book_index_dir(BOOK, str(tmp_path / "source"))
+    BookIndex.build(index_dir, CHUNKS, FakeEmbeddings().embed_documents(CHUNKS))
+    book = {"book_source": BOOK, "content_hash": "a" * 64, "index_dir": index_dir,
+            "characters": ["Elizabeth Bennet", "Fitzwilliam Darcy"]}
+    write_book_info(index_dir, book)
+    return book
+
+def export_bytes(book):
+    out = io.BytesIO()
+    export_book(book, out)
+    return out.getvalue()
+
+def rewrite(bundle, change):
+    """A copy of a bundle with change(name, data) applied to each member's data (None drops the member)"""
+    out = io.BytesIO()
+    with tarfile.open(fileobj=io.BytesIO(bundle), mode="r:") as source, tarfile.open(fileobj=out, mode="w:") as tar:
+        for member in source.getmembers():
+            data = change(member.name, source.extractfile(member).read())
+            if data is not None:
+                member.size = len(data)
+                tar.addfile(member, io.BytesIO(data))
+    return out.getvalue()
+
+def search(index_dir, text):
+    docs = BookIndex.load(index_dir).similarity_search_by_vector(FakeEmbeddings().embed_query(text), k=2)
+    return [doc.page_content for doc in docs]
+
+def test_round_trip_through_a_file(book, tmp_path, db):
+    path = str(tmp_path / "pride.bookbundle")
+    with open(path, "wb") as f:
+        manifest = export_book(book, f)
+
+    info, kept = import_bundle(path, str(tmp_path / "replica"), db)
+
+    assert not kept and info["characters"] == book["characters"] and info["chunks"] == len(CHUNKS)
+    for entry in manifest["files"]:
+        assert file_digest(os.path.join(info["index_dir"], entry["name"])) == entry["sha256"]
+    assert search(info["index_dir"], CHUNKS[1]) == search(book["index_dir"], CHUNKS[1])
+    cataloged = db.get_book(BOOK)
+    assert cataloged["index_dir"] == info["index_dir"] and cataloged["content_hash"] == book["content_hash"]
+    assert cataloged["metadata"]["bundle_created_at"] == manifest["created_at"]
+    assert os.listdir(tmp_path / "replica") == [os.path.basename(info["index_dir"])]  # No temporary directories left
+
+def test_round_trip_through_a_pipe(book, tmp_path):
+    read_end, write_end = os.pipe()
+
+    def export():
+        with os.fdopen(write_end, "wb") as out:
+            export_book(book, out)
+    writer = threading.Thread(target=export)
+    writer.start()
+    with os.fdopen(read_end, "rb") as source:
+        info, _ = import_bundle(source, str(tmp_path / "replica"))
+    writer.join()
+
+    assert search(info["index_dir"], CHUNKS[3]) == search(book["index_dir"], CHUNKS[3])
+
+def test_same_content_is_kept_unless_forced(book, tmp_path, db):
+    bundle = export_bytes(book)
+    root = str(tmp_path / "replica")
+    first, _ = import_bundle(io.BytesIO(bundle), root)
+
+    again, kept = import_bundle(io.BytesIO(bundle), root, db)
+    forced, forced_kept = import_bundle(io.BytesIO(bundle), root, force=True)
+
+    assert kept and again["ingested_at"] == first["ingested_at"]
+    assert db.get_book(BOOK) is not None  # Cataloged even though the files were already present
+    assert not forced_kept
+
+@pytest.mark.parametrize("change, message", [
+    (lambda name, data: data if name == MANIFEST_NAME else data[:-1] + bytes([data[-1] ^ 1]), "corrupt"),
+    (lambda name, data: data if name == MANIFEST_NAME or not name.startswith("meta") else None, "truncated"),
+    (lambda name, data: None if name == MANIFEST_NAME else data, "must start with"),
+])
+def test_damaged_bundles_are_rejected_without_leaving_files(book, tmp_path, change, message):
+    root = tmp_path / "replica"
+    root.mkdir()
+
+    with pytest.raises(ValueError, match=message):
+        import_bundle(io.BytesIO(rewrite(export_bytes(book), change)), str(root))
+
+    assert os.listdir(root) == []
+
+def test_bundles_of_another_embedding_model_are_rejected(book, tmp_path, monkeypatch):
+    bundle = export_bytes(book)
+    monkeypatch.setattr(book_bundle, "EMBEDDING_MODEL", "another-embedding-model")
+
+    with pytest.raises(ValueError, match="embedded with"):
+        import_bundle(io.BytesIO(bundle), str(tmp_path / "replica"))
+    with pytest.raises(ValueError, match="Not a readable book bundle"):
+        import_bundle(io.BytesIO(b"not a tar stream" * 64), str(tmp_path / "replica"))
+
+    assert not os.path.exists(tmp_path / "replica")
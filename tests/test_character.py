@@ -0,0 +1,35 @@
+from character import CharacterManager
+from character_state import CharacterState
+
+BOOK = "Pride and Prejudice"
+CHARACTER = "Elizabeth Bennet"
+
+def test_reading_an_unknown_character_writes_nothing(db):
+    manager = CharacterManager(db)
+
+    state, character_id = manager.get_character_state(CHARACTER, BOOK, "reader")
+
+    assert character_id is None
+    assert state.to_dict() == CharacterState().to_dict()
+    assert manager.get_conversation_history(CHARACTER, BOOK, "reader") == []
+    assert manager.get_from_memory(CHARACTER, BOOK, "topic", "reader") is None
+    assert db.characters == {}
+
+def test_anonymous_emotions_are_not_stored(db):
+    manager = CharacterManager(db)
+    state, _ = manager.get_character_state(CHARACTER, BOOK, "anonymous")
+
+    updated = manager.simulate_emotions("What a lovely day", CHARACTER, state, BOOK, "anonymous")
+
+    assert updated is state
+    assert db.characters == {} and db.user_states == {}
+
+def test_first_saved_emotions_create_the_character(db):
+    manager = CharacterManager(db)
+    state, _ = manager.get_character_state(CHARACTER, BOOK, "reader")
+
+    manager.simulate_emotions("What a lovely day", CHARACTER, state, BOOK, "reader")
+    stored, character_id = manager.get_character_state(CHARACTER, BOOK, "reader")
+
+    assert character_id == db.characters[(CHARACTER, BOOK)]
+    assert stored.version == 1 and stored.to_vector() == state.to_vector()
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+import chunk_store
+from book_index import BookIndex
+from chunk_store import CHUNKS_FILE, ENTRIES_FILE, ChunkStore
+from fakes import FakeEmbeddings
+from pdf_processor import PDFProcessor
+
+CODECS = ["zlib", pytest.param("zstd", marks=pytest.mark.skipif(chunk_store.zstandard is None,
+                                                                 reason="zstandard is not installed"))]
+
+TEXTS = ["It is a truth universally acknowledged…", "", "Ünïcödé and ’quotes’", "Mr. Darcy " * 500]
+METADATAS = [{"source": "volume1.pdf", "page": 1}, {"source": "volume1.pdf", "page": 2},
+             {"source": "volume2.pdf", "page": 7}, {}]
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_round_trip(tmp_path, codec):
+    written = ChunkStore.write(str(tmp_path), TEXTS, METADATAS, codec=codec)
+    store = ChunkStore(str(tmp_path), written["codec"], written["sources"])
+
+    assert len(store) == len(TEXTS)
+    assert [store.get(i) for i in range(len(TEXTS))] == TEXTS
+    assert store.metadata(2) == {"chunk_id": 2, "source": "volume2.pdf", "page": 7}
+    assert store.metadata(3) == {"chunk_id": 3, "source": "", "page": None}
+    assert written["sources"] == ["volume1.pdf", "volume2.pdf", ""]
+    assert written["stored_bytes"] < written["raw_bytes"]  # The repetitive chunk compresses
+
+def test_chunks_are_independent_frames(tmp_path):
+    ChunkStore.write(str(tmp_path), TEXTS, codec="zlib")
+    # Damage the first frame: the others still decompress
+    data = bytearray((tmp_path / CHUNKS_FILE).read_bytes())
+    data[3] ^= 0xFF
+    (tmp_path / CHUNKS_FILE).write_bytes(bytes(data))
+    store = ChunkStore(str(tmp_path), "zlib", [""])
+
+    assert store.get(3) == TEXTS[3]
+    with pytest.raises(Exception):
+        store.get(0)
+
+def test_empty_store(tmp_path):
+    written = ChunkStore.write(str(tmp_path), [], codec="zlib")
+    store = ChunkStore(str(tmp_path), written["codec"], written["sources"])
+
+    assert len(store) == 0 and written["stored_bytes"] == 0
+
+def test_foreign_files_are_rejected(tmp_path):
+    ChunkStore.write(str(tmp_path), TEXTS, codec="zlib")
+    with pytest.raises(ValueError):
+        ChunkStore(str(tmp_path), "brotli", [""])
+
+    with open(tmp_path / ENTRIES_FILE, "wb") as f:
+        np.save(f, np.zeros(3, dtype=np.int64))
+    with pytest.raises(ValueError):
+        ChunkStore(str(tmp_path), "zlib", [""])
+
+def test_object_arrays_are_not_loaded(tmp_path):
+    ChunkStore.write(str(tmp_path), TEXTS, codec="zlib")
+    with open(tmp_path / ENTRIES_FILE, "wb") as f:
+        np.save(f, np.array([{"a": 1}], dtype=object), allow_pickle=True)
+
+    with pytest.raises(ValueError):  # np.load refuses pickles by default
+        ChunkStore(str(tmp_path), "zlib", [""])
+
+def test_book_index_returns_chunk_origin(tmp_path):
+    texts = ["Elizabeth walked to Netherfield.", "Darcy wrote a letter.", "Jane fell ill."]
+    embeddings = FakeEmbeddings()
+    BookIndex.build(str(tmp_path), texts, embeddings.embed_documents(texts),
+                    metadatas=[{"source": "book.pdf", "page": page} for page in (1, 4, 9)])
+
+    [document] = BookIndex.load(str(tmp_path)).similarity_search_by_vector(embeddings.embed_query(texts[1]), k=1)
+
+    assert document.page_content == texts[1]
+    assert document.metadata["source"] == "book.pdf" and document.metadata["page"] == 4
+
+def test_page_chunks_record_the_page_each_chunk_starts_on():
+    processor = PDFProcessor()
+    pages = [("a.pdf", page, f"Page {page} " + "lorem ipsum dolor sit amet " * 80) for page in (1, 2, 3)]
+    pages.append(("b.pdf", 1, "A short last page."))
+
+    chunks, metadatas = processor.get_page_chunks(pages)
+
+    assert chunks == processor.get_text_chunks(" ".join(text for _, _, text in pages))
+    assert metadatas[0] == {"source": "a.pdf", "page": 1}
+    assert metadatas[-1]["source"] in ("a.pdf", "b.pdf")
+    for chunk, metadata in zip(chunks, metadatas):
+        if chunk.startswith("Page "):
+            assert chunk.startswith(f"Page {metadata['page']} ")
+    origins = [(metadata["source"], metadata["page"]) for metadata in metadatas]
+    assert origins == sorted(origins)
@@ -0,0 +1,149 @@
+import threading
+
+import pytest
+
+import chat
+from book_index import BookIndex
+from character import CharacterManager
+from chat import ChatManager
+from coalesce import Flight, FlightCancelled, SingleFlight
+from fakes import FakeEmbeddings, use_fake_models
+
+def follow(flight, timeout=5):
+    """Chunks a follower streams, and the flight's result"""
+    chunks, stream = [], flight.stream(timeout)
+    while True:
+        try:
+            chunks.append(next(stream))
+        except StopIteration as stop:
+            return chunks, stop.value
+
+def test_concurrent_callers_share_a_flight():
+    flights = SingleFlight()
+
+    leader, leads = flights.join("key")
+    follower, follows = flights.join("key")
+    other, other_leads = flights.join("other key")
+
+    assert leads and not follows and other_leads
+    assert follower is leader and leader.followers == 1 and other is not leader
+    assert len(flights) == 2
+
+def test_requests_without_a_key_never_coalesce():
+    flights = SingleFlight()
+
+    first, first_leads = flights.join(None)
+    second, second_leads = flights.join(None)
+
+    assert first_leads and second_leads and first is not second
+    assert len(flights) == 0
+
+def test_followers_replay_then_follow_the_stream():
+    flights = SingleFlight()
+    flight, _ = flights.join("key")
+    follower_flight, _ = flights.join("key")
+    published, replayed = threading.Event(), threading.Event()
+    received = []
+
+    def late_follower():
+        published.wait(5)  # Starts following after the first chunk was published
+        stream = follower_flight.stream(5)
+        received.append(next(stream))
+        replayed.set()
+        try:
+            while True:
+                received.append(next(stream))
+        except StopIteration as stop:
+            received.append(stop.value)
+
+    follower = threading.Thread(target=late_follower)
+    follower.start()
+    with flight.lead():
+        flight.publish("Indeed, ")
+        published.set()
+        assert replayed.wait(5)
+        flight.publish("a ball!")  # Live
+        flight.finish("Indeed, a ball!")
+    follower.join(5)
+
+    assert received == ["Indeed, ", "a ball!", "Indeed, a ball!"]
+    assert len(flights) == 0
+    assert flights.join("key")[1]  # Completed flights are not reused
+
+def test_leader_errors_reach_followers():
+    flights = SingleFlight()
+    flight, _ = flights.join("key")
+
+    with pytest.raises(ValueError):
+        with flight.lead():
+            flight.publish("partial")
+            raise ValueError("model failed")
+
+    with pytest.raises(ValueError, match="model failed"):
+        follow(flight)
+    with pytest.raises(ValueError):
+        flight.wait(1)
+    assert len(flights) == 0
+
+@pytest.mark.parametrize("ending", ["no result", "generator closed"])
+def test_abandoned_flights_cancel_followers(ending):
+    flights = SingleFlight()
+    flight, _ = flights.join("key")
+
+    if ending == "no result":
+        with flight.lead():
+            pass
+    else:
+        def leader():
+            with flight.lead():
+                yield "chunk"
+        stream = leader()
+        next(stream)
+        stream.close()  # GeneratorExit inside lead()
+
+    with pytest.raises(FlightCancelled):
+        flight.wait(1)
+    assert len(flights) == 0
+
+def test_followers_time_out():
+    flight = Flight("key")
+
+    with pytest.raises(TimeoutError):
+        flight.wait(0.01)
+    with pytest.raises(TimeoutError):
+        follow(flight, timeout=0.01)
+
+class CountingFlights(SingleFlight):
+    def __init__(self):
+        super().__init__()
+        self.leaders = 0
+
+    def join(self, key):
+        flight, leader = super().join(key)
+        self.leaders += leader
+        return flight, leader
+
+def test_identical_first_questions_share_one_answer(db, tmp_path, monkeypatch):
+    use_fake_models(chat_latency=0.2)
+    flights = CountingFlights()
+    monkeypatch.setattr(chat, "_flights", flights)
+    chunks = ["Elizabeth Bennet walked to Netherfield.", "Mr. Darcy was proud."]
+    BookIndex.build(str(tmp_path / "index"), chunks, FakeEmbeddings().embed_documents(chunks))
+    manager = ChatManager("Pride and Prejudice", character_manager=CharacterManager(db),
+                          index_path=str(tmp_path / "index"))
+    manager.warm_up(["Elizabeth Bennet"])
+    answers = {}
+
+    def ask(user):
+        events = manager.stream_user_input("What do you  think of Mr. Darcy?", "Elizabeth Bennet", "anonymous",
+                                           client_id=user)
+        answers[user] = [event for event in events if event["type"] == "done"][0]["response"]
+
+    threads = [threading.Thread(target=ask, args=(f"reader-{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert len(set(answers.values())) == 1 and len(answers) == 4
+    assert flights.leaders == 1
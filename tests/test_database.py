@@ -0,0 +1,91 @@
+"""Both database backends against a real Postgres (skipped without one, see conftest.postgres)"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import async_database
+from character_state import CharacterState
+from database import StaleStateError
+
+def save_history(db, messages, user_id="reader"):
+    character_id = db.ensure_character("Elizabeth Bennet", "Pride and Prejudice")
+    ids = []
+    for i in range(0, messages, 2):
+        ids += db.save_turn(character_id, user_id, [("user", f"question {i}"), ("assistant", f"answer {i}")])
+    return character_id, ids
+
+def test_get_messages_after_pages_forward_and_backward(any_backend):
+    character_id, ids = save_history(any_backend, 20)
+
+    newest = any_backend.get_messages_after(character_id, "reader", ids[4], limit=5)
+    oldest = any_backend.get_messages_after(character_id, "reader", ids[4], limit=5, oldest_first=True)
+    everything = any_backend.get_messages_after(character_id, "reader", ids[4])
+
+    assert [m["message_id"] for m in newest] == ids[-5:]
+    assert [m["message_id"] for m in oldest] == ids[5:10]
+    assert [m["message_id"] for m in everything] == ids[5:]
+    assert any_backend.get_messages_after(character_id, "someone else", 0, limit=5, oldest_first=True) == []
+
+def test_history_and_lookups(any_backend):
+    character_id, ids = save_history(any_backend, 6)
+    save_history(any_backend, 2, user_id="someone else")
+
+    history = any_backend.get_conversation_history(character_id, "reader", limit=4)
+    recalled = any_backend.get_messages_by_ids([ids[0], ids[3]])
+
+    assert [m["content"] for m in history] == ["question 2", "answer 2", "question 4", "answer 4"]
+    assert [m["role"] for m in history] == ["user", "assistant"] * 2
+    assert sorted(m["message_id"] for m in recalled) == [ids[0], ids[3]]
+    assert any_backend.ensure_character("Elizabeth Bennet", "Pride and Prejudice") == character_id
+
+def test_state_is_versioned_per_user(any_backend):
+    assert any_backend.get_character_state("Elizabeth Bennet", "Pride and Prejudice", "reader") == (None, None)
+    character_id = any_backend.ensure_character("Elizabeth Bennet", "Pride and Prejudice")
+
+    state, _ = any_backend.get_character_state("Elizabeth Bennet", "Pride and Prejudice", "reader")
+    state.joy = 0.9
+    any_backend.save_character_state("Elizabeth Bennet", state, "Pride and Prejudice", "reader")
+    stale = CharacterState(version=0)
+    with pytest.raises(StaleStateError):
+        any_backend.save_character_state("Elizabeth Bennet", stale, "Pride and Prejudice", "reader")
+
+    stored, stored_id = any_backend.get_character_state("Elizabeth Bennet", "Pride and Prejudice", "reader")
+    baseline, _ = any_backend.get_character_state("Elizabeth Bennet", "Pride and Prejudice", "someone else")
+    assert stored_id == character_id and stored.version == 1 and stored.joy == pytest.approx(0.9)
+    assert baseline.version == 0 and baseline.joy != pytest.approx(0.9)
+
+def test_memory_and_catalog(any_backend):
+    character_id = any_backend.ensure_character("Elizabeth Bennet", "Pride and Prejudice")
+    any_backend.save_to_memory(character_id, "summary", "first")
+    any_backend.save_to_memory(character_id, "summary", "second")
+    any_backend.save_book("Pride and Prejudice", "hash", "/indexes/pp", ["Elizabeth Bennet"], {"chunks": 3})
+
+    book = any_backend.get_book("Pride and Prejudice")
+
+    assert any_backend.get_from_memory(character_id, "summary") == "second"
+    assert any_backend.get_from_memory(character_id, "missing") is None
+    assert book["index_dir"] == "/indexes/pp" and book["metadata"] == {"chunks": 3}
+    assert [b["book_source"] for b in any_backend.list_books()] == ["Pride and Prejudice"]
+    assert any_backend.get_book("Unknown") is None
+
+def test_emotion_samples(any_backend, monkeypatch):
+    character_id = any_backend.ensure_character("Elizabeth Bennet", "Pride and Prejudice")
+    other_id = any_backend.ensure_character("Sherlock Holmes", "A Study in Scarlet")
+    start = datetime(2024, 5, 1, 12, 0)
+    any_backend.save_emotion_samples(
+        [(character_id, "reader", start + timedelta(seconds=10 * i), [i / 10] * 11) for i in range(6)]
+        + [(other_id, "reader", start, [0.5] * 11)])
+    # Analytics reads must not open connections of their own
+    monkeypatch.setattr(async_database, "DatabaseManager", None)
+
+    trajectory = any_backend.get_emotion_trajectory(character_id, "reader", bucket_seconds=30)
+    ids, timestamps, states = any_backend.fetch_emotion_samples(book_source="Pride and Prejudice", batch_size=4)
+    nothing = any_backend.fetch_emotion_samples(book_source="Unknown")
+
+    assert [point["samples"] for point in trajectory] == [3, 3]
+    assert trajectory[0]["state"][0] == pytest.approx(0.1)
+    assert set(ids) == {character_id} and len(timestamps) == 6
+    assert states.shape == (6, 11) and states.dtype == np.float32
+    assert [len(column) for column in nothing] == [0, 0, 0]
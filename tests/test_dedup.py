@@ -0,0 +1,81 @@
+import pytest
+
+from dedup import DedupReport, dedupe_chunks, dedupe_pages, find_near_duplicates, simhash, strip_boilerplate
+
+PROSE = ("It is a truth universally acknowledged, that a single man in possession of a good fortune, "
+         "must be in want of a wife. However little known the feelings or views of such a man may be "
+         "on his first entering a neighbourhood, this truth is so well fixed in the minds of the "
+         "surrounding families, that he is considered the rightful property of some one or other of "
+         "their daughters.")
+
+def page(*lines):
+    return "\n".join(lines)
+
+@pytest.mark.parametrize("line", ["12", "- 12 -", "Page 7", "page 3 of 40", "Page iv", "PAGE XII."])
+def test_page_numbers_are_stripped(line):
+    cleaned, stats = strip_boilerplate([page(line, "Elizabeth walked on alone.")])
+
+    assert cleaned == ["Elizabeth walked on alone."]
+    assert stats["boilerplate_lines"] == 1
+
+@pytest.mark.parametrize("line", ["I", "Mix", "Civil", "Liv", "V."])
+def test_words_that_read_as_roman_numerals_are_kept(line):
+    text = page(line, "Elizabeth walked on alone.", line)
+    cleaned, stats = strip_boilerplate([text, page("Jane stayed at Netherfield.")])
+
+    assert cleaned[0] == text
+    assert stats["boilerplate_lines"] == 0
+
+def test_roman_page_numbers_repeated_across_pages_are_stripped():
+    numerals = ["ix", "x", "xi", "xii"]
+    pages = [page(f"Preface paragraph {i}.", numeral) for i, numeral in enumerate(numerals)]
+    cleaned, _ = strip_boilerplate(pages)
+
+    assert cleaned == [f"Preface paragraph {i}." for i in range(len(numerals))]
+
+def test_running_headers_and_footers_are_stripped():
+    pages = [page(f"PRIDE AND PREJUDICE {n}", f"Chapter text number {n} goes here.", f"Jane Austen {n}")
+             for n in range(1, 6)]
+    cleaned, stats = strip_boilerplate(pages)
+
+    assert cleaned == [f"Chapter text number {n} goes here." for n in range(1, 6)]
+    assert stats["boilerplate_lines"] == 10
+
+def test_front_matter_pages_are_dropped():
+    contents = page("Contents", "Chapter One ........ 1", "Chapter Two ........ 9", "Chapter Three ....... xii")
+    copyright = page("Copyright 1998 by the Publisher", "All rights reserved.", "ISBN 0-14-143951-3")
+    cleaned, stats = strip_boilerplate([contents, copyright, page(PROSE)])
+
+    assert cleaned == ["", "", PROSE]
+    assert stats["front_matter_pages"] == 2
+
+def test_simhash_is_close_for_near_duplicates():
+    edited = PROSE.replace("rightful", "lawful")
+    other = "Mr. Darcy walked to Pemberley in the rain, thinking of nothing but the letter he had written."
+
+    assert bin(simhash(PROSE) ^ simhash(edited)).count("1") < bin(simhash(PROSE) ^ simhash(other)).count("1")
+    assert find_near_duplicates([PROSE, other, PROSE, PROSE.upper()]) == {2, 3}
+
+def test_dedupe_pages_keeps_the_first_copy():
+    pages = [("a.pdf", 1, PROSE), ("a.pdf", 2, "Another page entirely."), ("b.pdf", 1, PROSE)]
+    kept, stats = dedupe_pages(pages)
+
+    assert kept == pages[:2]
+    assert stats == {"duplicate_pages": 1, "chars_removed": len(PROSE)}
+
+def test_dedupe_chunks_filters_metadata_alongside():
+    chunks = [PROSE, "A short different chunk about Jane.", PROSE]
+    metadatas = [{"page": 1}, {"page": 2}, {"page": 3}]
+
+    kept, kept_metadatas, stats = dedupe_chunks(chunks, metadatas)
+    unlabelled = dedupe_chunks(chunks)
+
+    assert kept == chunks[:2] and kept_metadatas == metadatas[:2]
+    assert stats["duplicate_chunks"] == stats["embeddings_saved"] == 1
+    assert unlabelled[1] is None
+
+def test_report_adds_stats_up():
+    report = DedupReport().add({"duplicate_pages": 2, "chars_removed": 10}).add({"chars_removed": 5})
+
+    assert report["duplicate_pages"] == 2 and report["chars_removed"] == 15
+    assert report["duplicate_chunks"] == 0
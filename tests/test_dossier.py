@@ -0,0 +1,29 @@
+import pytest
+
+from dossier import find_mentions, name_pattern
+
+ROSTER = ["Anne-Marie Dupont", "Scarlett O'Hara", "Fitzwilliam Darcy", "Marie", "Mr Li"]
+CHUNKS = [
+    "Anne-Marie smiled at the garden.",          # 0: Anne-Marie (and Marie, inside it)
+    "Anne walked alone; Marie stayed behind.",   # 1: Marie only, not Anne-Marie
+    "Hara is not a name in this book.",          # 2: nobody
+    "Scarlett O'Hara's dress was green.",        # 3: Scarlett O'Hara
+    "Everyone waited for O'Hara.",               # 4: Scarlett O'Hara
+    "Darcy's letter arrived; Mr Li read it.",    # 5: Darcy, Mr Li
+    "Dupont-Smith is a different family.",       # 6: Anne-Marie Dupont, as name_pattern matches it
+]
+
+def test_hyphenated_and_apostrophized_names():
+    mentions = find_mentions(CHUNKS, ROSTER)
+
+    assert mentions["Anne-Marie Dupont"] == [0, 6]
+    assert mentions["Marie"] == [0, 1]
+    assert mentions["Scarlett O'Hara"] == [3, 4]
+    assert mentions["Fitzwilliam Darcy"] == [5]
+    assert mentions["Mr Li"] == [5]
+
+@pytest.mark.parametrize("name", ROSTER)
+def test_mentions_agree_with_name_pattern(name):
+    expected = [chunk_id for chunk_id, chunk in enumerate(CHUNKS) if name_pattern(name).search(chunk)]
+
+    assert find_mentions(CHUNKS, ROSTER)[name] == expected
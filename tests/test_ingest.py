@@ -0,0 +1,102 @@
+import os
+
+import pytest
+
+import bulk_ingest
+import library
+from book_index import BookIndex
+from fakes import DEFAULT_ROSTER
+from pdf_processor import PDFProcessor
+from pdfgen import make_book_pages, write_pdf
+
+def book_text(pages=6):
+    return "\n\n".join(make_book_pages(pages, DEFAULT_ROSTER))
+
+def indexed(index_dir):
+    index = BookIndex.load(index_dir)
+    return [(index.chunks.get(i), index.chunks.metadata(i)) for i in range(len(index.chunks))]
+
+@pytest.fixture
+def worker(monkeypatch):
+    """bulk_ingest.ingest_book run in this process"""
+    monkeypatch.setattr(bulk_ingest, "_processor", PDFProcessor())
+
+def test_text_entry_points_build_the_same_index(db, tmp_path, monkeypatch, worker):
+    monkeypatch.chdir(tmp_path)
+    text = book_text()
+    (tmp_path / "book.txt").write_text(text, encoding="utf-8")
+
+    characters = PDFProcessor().process_input(text, str(tmp_path / "direct"))
+    cataloged, reused = library.ingest(PDFProcessor(), db, "Book", text=text)
+    info = bulk_ingest.ingest_book({"book_source": "Book", "paths": [str(tmp_path / "book.txt")]},
+                                   str(tmp_path / "bulk"), "digest")
+
+    assert characters and cataloged == characters == info["characters"] and not reused
+    chunks = indexed(str(tmp_path / "direct"))
+    assert indexed(db.get_book("Book")["index_dir"]) == chunks
+    assert indexed(info["index_dir"]) == chunks
+    assert info["chunks"] == len(chunks) and info["pages"] == 0
+
+def test_pdf_entry_points_build_the_same_index(db, tmp_path, monkeypatch, worker):
+    monkeypatch.chdir(tmp_path)
+    pdf_path = str(tmp_path / "book.pdf")
+    write_pdf(pdf_path, make_book_pages(8, DEFAULT_ROSTER))
+
+    characters = PDFProcessor().process_pdfs([pdf_path], str(tmp_path / "direct"))
+    cataloged, _ = library.ingest(PDFProcessor(), db, "Book", pdf_docs=[pdf_path])
+    info = bulk_ingest.ingest_book({"book_source": "Book", "paths": [pdf_path]}, str(tmp_path / "bulk"), "digest")
+
+    assert characters and cataloged == characters == info["characters"]
+    chunks = indexed(str(tmp_path / "direct"))
+    assert {metadata["source"] for _, metadata in chunks} == {"book.pdf"}
+    assert indexed(db.get_book("Book")["index_dir"]) == chunks
+    assert indexed(info["index_dir"]) == chunks
+    assert info["pages"] == 8 and info["chunks"] == len(chunks)
+
+def test_empty_text_builds_nothing(tmp_path, worker):
+    result = PDFProcessor().run_pipeline(str(tmp_path / "index"), text="  \n ")
+
+    assert result["characters"] == [] and result["chunks"] == 0
+    assert not os.path.exists(tmp_path / "index")
+
+    (tmp_path / "empty.txt").write_text("\n", encoding="utf-8")
+    with pytest.raises(ValueError):
+        bulk_ingest.ingest_book({"book_source": "Empty", "paths": [str(tmp_path / "empty.txt")]},
+                                str(tmp_path / "bulk"), "digest")
+
+def test_pdfs_without_text_build_nothing(db, tmp_path, monkeypatch):
+    from PyPDF2 import PdfWriter
+
+    monkeypatch.chdir(tmp_path)
+    writer = PdfWriter()
+    writer.add_blank_page(width=612, height=792)
+    with open(tmp_path / "scan.pdf", "wb") as f:
+        writer.write(f)
+
+    result = PDFProcessor().run_pipeline(str(tmp_path / "index"), pdf_docs=[str(tmp_path / "scan.pdf")])
+
+    assert result["characters"] == [] and result["chunks"] == 0
+    assert not os.path.exists(tmp_path / "index")
+    assert library.ingest(PDFProcessor(), db, "Scan", pdf_docs=[str(tmp_path / "scan.pdf")]) == ([], False)
+    assert db.get_book("Scan") is None
+
+def test_books_without_characters_are_cataloged(db, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(PDFProcessor, "extract_characters", lambda self, text: [])
+    processor = PDFProcessor()
+    runs = []
+    run_pipeline = processor.run_pipeline
+    monkeypatch.setattr(processor, "run_pipeline", lambda *args, **kwargs: runs.append(1) or run_pipeline(*args, **kwargs))
+
+    first = library.ingest(processor, db, "Notes", text=book_text(2))
+    again = library.ingest(processor, db, "Notes", text=book_text(2))
+
+    assert first == ([], False) and again == ([], True)
+    assert len(runs) == 1
+    assert db.get_book("Notes")["characters"] == []
+
+def test_empty_text_is_not_cataloged(db, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    assert library.ingest(PDFProcessor(), db, "Nothing", text=" ") == ([], False)
+    assert db.get_book("Nothing") is None
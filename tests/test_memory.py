@@ -0,0 +1,162 @@
+import json
+import threading
+
+import memory
+from memory import COMPACT_BATCH, RECENT_WINDOW, SUMMARY_INTERVAL, ConversationMemory, SummaryCompactor
+
+class Reply:
+    def __init__(self, content):
+        self.content = content
+        self.usage_metadata = None
+
+class RecordingModel:
+    """Summary model that records its prompts, optionally blocking or failing"""
+
+    def __init__(self, release=None, fail=False):
+        self.prompts = []
+        self.release = release
+        self.fail = fail
+
+    def invoke(self, prompt):
+        if self.release is not None:
+            self.release.wait(5)
+        self.prompts.append(prompt)
+        if self.fail:
+            raise RuntimeError("model unavailable")
+        return Reply(f"summary {len(self.prompts)}")
+
+def add_history(db, messages, user_id="reader"):
+    character_id = db.ensure_character("Elizabeth Bennet", "Pride and Prejudice")
+    conversation_id = db.create_conversation(character_id, user_id)
+    ids = [db.save_message(conversation_id, "user" if i % 2 == 0 else "assistant", f"message {i}")
+           for i in range(messages)]
+    return character_id, ids
+
+def stored_record(db, character_id, user_id="reader"):
+    return json.loads(db.get_from_memory(character_id, f"conversation_summary:{user_id}"))
+
+def test_compact_folds_a_long_backlog_in_bounded_batches(db):
+    character_id, ids = add_history(db, 10 * COMPACT_BATCH + RECENT_WINDOW + 3)
+    conversation_memory = ConversationMemory(db)
+    conversation_memory.summary_model = model = RecordingModel()
+
+    conversation_memory.compact(character_id, "reader")
+
+    assert len(model.prompts) == 11
+    for prompt in model.prompts:
+        assert prompt.count("\nuser: ") + prompt.count("\nassistant: ") <= COMPACT_BATCH
+    record = stored_record(db, character_id)
+    assert record == {"summary": "summary 11", "last_message_id": ids[-RECENT_WINDOW - 1]}
+    # Later batches extend the summary of the earlier ones
+    assert "summary 10" in model.prompts[-1]
+
+def test_compact_keeps_the_recent_window_verbatim(db):
+    character_id, ids = add_history(db, RECENT_WINDOW)
+    conversation_memory = ConversationMemory(db)
+    conversation_memory.summary_model = model = RecordingModel()
+
+    conversation_memory.compact(character_id, "reader")
+
+    assert model.prompts == []
+    assert db.get_from_memory(character_id, "conversation_summary:reader") is None
+
+def test_failed_summary_keeps_previous_record(db):
+    character_id, ids = add_history(db, 3 * COMPACT_BATCH + RECENT_WINDOW)
+    conversation_memory = ConversationMemory(db)
+    conversation_memory.summary_model = RecordingModel()
+    conversation_memory.compact(character_id, "reader")
+    before = stored_record(db, character_id)
+
+    add_history(db, COMPACT_BATCH)
+    conversation_memory.summary_model = failing = RecordingModel(fail=True)
+    conversation_memory.compact(character_id, "reader")
+
+    assert len(failing.prompts) == 1
+    assert stored_record(db, character_id) == before
+
+def test_record_turn_compacts_in_the_background(db):
+    character_id, _ = add_history(db, RECENT_WINDOW + 2 * SUMMARY_INTERVAL)
+    conversation_memory = ConversationMemory(db)
+    release = threading.Event()
+    conversation_memory.summary_model = model = RecordingModel(release=release)
+
+    conversation_memory.record_turn(character_id, "reader", RECENT_WINDOW + 2 * SUMMARY_INTERVAL - 2)
+    # The turn returned while the summarization call is still blocked
+    assert model.prompts == []
+
+    release.set()
+    assert conversation_memory.compactor.drain(timeout=5)
+    assert stored_record(db, character_id)["summary"] == "summary 1"
+    conversation_memory.compactor.close()
+
+def test_record_turn_skips_short_and_anonymous_conversations(db, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(SummaryCompactor, "submit", lambda self, *key: submitted.append(key))
+    conversation_memory = ConversationMemory(db)
+
+    conversation_memory.record_turn(1, "reader", 0)
+    conversation_memory.record_turn(1, "anonymous", 10 * COMPACT_BATCH)
+    conversation_memory.record_turn(None, "reader", 10 * COMPACT_BATCH)
+    assert submitted == []
+    conversation_memory.record_turn(1, "reader", RECENT_WINDOW + 2 * SUMMARY_INTERVAL)
+    assert submitted == [(1, "reader")]
+
+def test_compactor_merges_requests_for_the_same_conversation():
+    release = threading.Event()
+    calls = []
+
+    def compact(character_id, user_id):
+        release.wait(5)
+        calls.append((character_id, user_id))
+
+    compactor = SummaryCompactor(compact)
+    compactor.submit(1, "a")
+    for _ in range(5):
+        compactor.submit(2, "b")
+    compactor.submit(1, "a")
+    release.set()
+    assert compactor.drain(timeout=5)
+    compactor.close()
+
+    # (1, "a") may run again if its second request came after the first had started
+    assert calls.count((2, "b")) == 1
+    assert calls.count((1, "a")) in (1, 2)
+
+def test_compactor_survives_a_failing_compaction():
+    calls = []
+
+    def compact(character_id, user_id):
+        calls.append(character_id)
+        if character_id == 1:
+            raise RuntimeError("database down")
+
+    compactor = SummaryCompactor(compact)
+    compactor.submit(1, "a")
+    compactor.submit(2, "a")
+    assert compactor.drain(timeout=5)
+    compactor.close()
+    assert calls == [1, 2]
+
+def test_get_context_is_bounded(db):
+    character_id, ids = add_history(db, 500)
+
+    summary, recent = ConversationMemory(db).get_context(character_id, "reader")
+
+    assert summary == ""
+    assert [message["message_id"] for message in recent] == ids[-(RECENT_WINDOW + 2 * SUMMARY_INTERVAL):]
+
+def test_idle_compactor_thread_exits_and_restarts(monkeypatch):
+    monkeypatch.setattr(memory, "COMPACTOR_IDLE_SECONDS", 0.05)
+    calls = []
+    compactor = SummaryCompactor(lambda character_id, user_id: calls.append(character_id))
+
+    compactor.submit(1, "a")
+    first = compactor._thread
+    assert compactor.drain(timeout=5)
+    first.join(5)
+    assert not first.is_alive() and compactor._thread is None
+
+    compactor.submit(2, "a")
+    assert compactor.drain(timeout=5)
+    compactor.close()
+    assert calls == [1, 2]
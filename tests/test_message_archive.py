@@ -0,0 +1,146 @@
+"""Message partitions and the archive read-through against a real Postgres (skipped without one)"""
+
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import database
+import message_archive
+from database import DatabaseManager, message_partition_name
+from message_archive import add_months, archive_messages
+
+BOOK = "Pride and Prejudice"
+CHARACTER = "Elizabeth Bennet"
+
+def add_turn(db, character_id, user_id, when):
+    """A conversation with a user and an assistant message at a given time, bypassing save_turn's clock"""
+    with db.conn.cursor() as cur:
+        cur.execute("INSERT INTO conversations (character_id, user_id, created_at) VALUES (%s, %s, %s) "
+                    "RETURNING conversation_id", (character_id, user_id, when))
+        conversation_id = cur.fetchone()[0]
+        cur.execute("""
+            INSERT INTO messages (conversation_id, role, content, timestamp)
+            VALUES (%s, 'user', %s, %s), (%s, 'assistant', %s, %s) RETURNING message_id
+        """, (conversation_id, f"question at {when}", when, conversation_id, f"answer at {when}",
+              when + timedelta(seconds=1)))
+        ids = sorted(row[0] for row in cur.fetchall())
+    db.conn.commit()
+    return ids
+
+def scalar(db, query, params=None):
+    with db.conn.cursor() as cur:
+        cur.execute(query, params)
+        value = cur.fetchone()[0]
+    db.conn.commit()
+    return value
+
+def test_unpartitioned_messages_are_migrated(postgres):
+    character_id = postgres.ensure_character(CHARACTER, BOOK)
+    with postgres.conn.cursor() as cur:
+        # The messages table as older versions created it
+        cur.execute("DROP TABLE messages CASCADE")
+        cur.execute("""
+            CREATE TABLE messages (
+                message_id SERIAL PRIMARY KEY,
+                conversation_id INTEGER REFERENCES conversations(conversation_id),
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    postgres.conn.commit()
+    old = add_turn(postgres, character_id, "reader", datetime(2020, 1, 10)) \
+        + add_turn(postgres, character_id, "reader", datetime(2020, 2, 10))
+
+    migrated = DatabaseManager()
+    try:
+        new = migrated.save_turn(character_id, "reader", [("user", "still there?"), ("assistant", "Always.")])
+        history = migrated.get_conversation_history(character_id, "reader", limit=10)
+        partitions = [name for name, _, _ in migrated.list_message_partitions()]
+    finally:
+        migrated.close()
+
+    assert scalar(postgres, "SELECT relkind FROM pg_class WHERE oid = 'messages'::regclass") == "p"
+    assert {"messages_2020_01", "messages_2020_02"} <= set(partitions)
+    assert scalar(postgres, "SELECT count(*) FROM messages_2020_01") == 2
+    assert [m["message_id"] for m in history] == old + new
+    assert min(new) > max(old)  # The id sequence carried over
+
+def test_ensure_message_partitions_moves_rows_out_of_the_default_partition(postgres):
+    character_id = postgres.ensure_character(CHARACTER, BOOK)
+    ids = add_turn(postgres, character_id, "reader", datetime(2021, 3, 15))
+    assert scalar(postgres, "SELECT count(*) FROM messages_default") == 2
+
+    current_month = postgres.ensure_message_partitions(months_ahead=1)
+    postgres.ensure_message_partitions(months_ahead=1)  # Idempotent
+    partitions = {name: (start, end) for name, start, end in postgres.list_message_partitions()}
+
+    assert current_month == date.today().replace(day=1)
+    assert partitions["messages_2021_03"] == (date(2021, 3, 1), date(2021, 4, 1))
+    upcoming = {message_partition_name(current_month), message_partition_name(add_months(current_month, 1))}
+    assert upcoming <= set(partitions)
+    assert scalar(postgres, "SELECT count(*) FROM messages_default") == 0
+    assert scalar(postgres, "SELECT array_agg(message_id ORDER BY message_id) FROM messages_2021_03") == ids
+
+@pytest.mark.parametrize("file_format", ["parquet", "jsonl.gz"])
+def test_archived_months_are_read_through(postgres, any_backend, monkeypatch, file_format):
+    if file_format == "parquet" and message_archive.pyarrow is None:
+        pytest.skip("pyarrow is not installed")
+    if file_format == "jsonl.gz":
+        monkeypatch.setattr(message_archive, "pyarrow", None)
+    character_id = postgres.ensure_character(CHARACTER, BOOK)
+    old = add_turn(postgres, character_id, "reader", datetime(2022, 1, 10, 12)) \
+        + add_turn(postgres, character_id, "reader", datetime(2022, 2, 10, 12))
+    other = add_turn(postgres, character_id, "someone else", datetime(2022, 1, 11, 12))
+    postgres.ensure_message_partitions()
+    recent = postgres.save_turn(character_id, "reader", [("user", "recent question"), ("assistant", "recent answer")])
+
+    archived = {entry["name"]: entry for entry in archive_messages(postgres, postgres.archive, hot_months=1)}
+
+    assert archived["messages_2022_01"]["rows"] == 4 and archived["messages_2022_02"]["rows"] == 2
+    assert {entry["format"] for entry in archived.values()} == {file_format}
+    assert not set(archived) & {name for name, _, _ in postgres.list_message_partitions()}
+    assert scalar(postgres, "SELECT count(*) FROM messages") == 2
+    assert scalar(postgres, "SELECT count(*) FROM conversations") == 1  # Emptied conversations are deleted
+    assert scalar(postgres, "SELECT messages FROM message_archive_index WHERE user_id = 'reader'") == 4
+
+    def ids(messages):
+        return [m["message_id"] for m in messages]
+
+    history = any_backend.get_conversation_history(character_id, "reader", limit=10)
+    assert ids(history) == old + recent
+    assert history[0]["content"] == "question at 2022-01-10 12:00:00" and history[0]["role"] == "user"
+    assert ids(any_backend.get_conversation_history(character_id, "reader", limit=3)) == (old + recent)[-3:]
+    assert ids(any_backend.get_conversation_history(character_id, "someone else", limit=10)) == other
+    assert ids(any_backend.get_messages_after(character_id, "reader", old[0])) == old[1:] + recent
+    assert ids(any_backend.get_messages_after(character_id, "reader", 0, limit=3, oldest_first=True)) == old[:3]
+    assert sorted(ids(any_backend.get_messages_by_ids([old[1], recent[0]]))) == [old[1], recent[0]]
+
+def test_partitions_are_dropped_while_another_process_reads(postgres, monkeypatch):
+    monkeypatch.setattr(database, "PARTITION_LOCK_TIMEOUT", "500ms")
+    character_id = postgres.ensure_character(CHARACTER, BOOK)
+    old = add_turn(postgres, character_id, "reader", datetime(2023, 4, 10, 12))
+    postgres.ensure_message_partitions()
+
+    app = DatabaseManager()  # Another worker process sharing the database and the archive
+    app.archive = postgres.archive
+    try:
+        assert [m["message_id"] for m in app.get_conversation_history(character_id, "reader")] == old
+        app.get_messages_after(character_id, "reader", 0)
+        app.get_messages_by_ids(old)
+        app.get_character_state(CHARACTER, BOOK, "reader")
+        app.get_from_memory(character_id, "summary")
+        app.get_book(BOOK)
+        app.list_books()
+        app.get_emotion_trajectory(character_id, "reader")
+        app.list_message_partitions()
+        # Reads leave no transaction (and no locks) open behind them
+        assert scalar(postgres, "SELECT state FROM pg_stat_activity WHERE pid = %s",
+                      (app.conn.get_backend_pid(),)) == "idle"
+
+        archived = archive_messages(postgres, postgres.archive, hot_months=1)
+
+        assert "messages_2023_04" in {entry["name"] for entry in archived}
+        assert [m["message_id"] for m in app.get_conversation_history(character_id, "reader")] == old
+    finally:
+        app.close()
@@ -0,0 +1,167 @@
+import json
+
+import pytest
+from starlette.testclient import TestClient
+
+import auth
+import service
+from book_index import BookIndex
+from character import CharacterManager
+from fakes import FakeEmbeddings
+
+BOOK = "Pride and Prejudice"
+CHARACTER = "Elizabeth Bennet"
+
+@pytest.fixture
+def catalog(db, tmp_path, monkeypatch):
+    """The service on the in-memory database, with one small cataloged book"""
+    chunks = ["Elizabeth Bennet walked to Netherfield.", "Mr. Darcy was proud.", "Jane was kind to everyone."]
+    index_dir = str(tmp_path / "index")
+    BookIndex.build(index_dir, chunks, FakeEmbeddings().embed_documents(chunks))
+    db.save_book(BOOK, "hash", index_dir, [CHARACTER, "Fitzwilliam Darcy"])
+
+    character_manager = CharacterManager(db)
+    monkeypatch.setattr(service, "get_character_manager", lambda: character_manager)
+    monkeypatch.setattr(auth, "API_SECRET_KEY", "test-secret")
+    monkeypatch.chdir(tmp_path)  # Conversation indexes are written relative to the working directory
+    service._chat_manager.cache_clear()
+    yield db
+    service._chat_manager.cache_clear()
+
+@pytest.fixture
+def client(catalog):
+    return TestClient(service.app)
+
+def bearer(user_id):
+    return {"Authorization": f"Bearer {auth.issue_token(user_id)}"}
+
+def turn(client, headers=None, **payload):
+    payload = {"book_source": BOOK, "character": CHARACTER, "message": "Hello there", **payload}
+    response = client.post("/chat", json=payload, headers=headers or {})
+    events = [json.loads(line) for line in response.text.splitlines()] if response.status_code == 200 else []
+    return response, events
+
+def test_turn_is_stored_for_the_token_user(client, catalog):
+    response, events = turn(client, bearer("alice"))
+
+    assert response.status_code == 200
+    assert events[-1]["type"] == "done"
+    character_id = catalog.characters[(CHARACTER, BOOK)]
+    assert [m["role"] for m in catalog.get_conversation_history(character_id, "alice")] == ["user", "assistant"]
+
+def test_user_id_in_the_payload_is_ignored(client, catalog):
+    response, events = turn(client, user_id="alice")
+
+    assert response.status_code == 200 and events[-1]["type"] == "done"
+    assert catalog.messages == []  # Served as an anonymous turn, which is never stored
+
+def test_history_is_read_for_the_token_user_only(client, catalog):
+    turn(client, bearer("alice"))
+
+    own = client.get(f"/books/{BOOK}/characters/{CHARACTER}/history", headers=bearer("alice"))
+    spoofed = client.get(f"/books/{BOOK}/characters/{CHARACTER}/history", params={"user_id": "alice"})
+    other = client.get(f"/books/{BOOK}/characters/{CHARACTER}/history", headers=bearer("mallory"))
+
+    assert len(own.json()["messages"]) == 2
+    assert spoofed.json()["messages"] == []
+    assert other.json()["messages"] == []
+
+@pytest.mark.parametrize("token", [
+    "not-a-token",
+    "eyJzdWIiOiJhbGljZSIsImV4cCI6OTk5OTk5OTk5OX0.AAAA",
+    auth.issue_token("alice", ttl=-1, secret="test-secret"),
+    auth.issue_token("alice", secret="another-secret"),
+])
+def test_invalid_tokens_are_rejected(client, catalog, token):
+    response, _ = turn(client, {"Authorization": f"Bearer {token}"})
+    state = client.get(f"/books/{BOOK}/characters/{CHARACTER}/state", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 401 and state.status_code == 401
+    assert catalog.messages == []
+
+def test_unknown_books_and_characters_are_404_and_leave_no_trace(client, catalog):
+    unknown_book, _ = turn(client, bearer("alice"), book_source="Made Up Book")
+    unknown_character, _ = turn(client, bearer("alice"), character="Nobody")
+    history = client.get("/books/Made Up Book/characters/Nobody/history", headers=bearer("alice"))
+    state = client.get(f"/books/{BOOK}/characters/Nobody/state")
+
+    assert [r.status_code for r in (unknown_book, unknown_character, history, state)] == [404] * 4
+    assert catalog.messages == []
+    assert (CHARACTER, BOOK) not in catalog.characters and ("Nobody", BOOK) not in catalog.characters
+    assert service._chat_manager.cache_info().currsize == 0
+
+def test_chat_managers_are_cached_per_book(client, catalog):
+    turn(client, bearer("alice"))
+    turn(client, bearer("bob"))
+
+    assert service._chat_manager.cache_info().currsize == 1
+    assert service._chat_manager.cache_info().maxsize == service.CHAT_MANAGER_CACHE_SIZE
+
+def test_websocket_takes_the_token_from_the_query(client, catalog):
+    token = auth.issue_token("alice")
+    with client.websocket_connect(f"/chat/ws?token={token}") as socket:
+        socket.send_json({"book_source": BOOK, "character": CHARACTER, "message": "Hello"})
+        while socket.receive_json()["type"] != "done":
+            pass
+        socket.send_json({"book_source": "Made Up Book", "character": CHARACTER, "message": "Hello"})
+        assert socket.receive_json()["type"] == "error"
+
+    character_id = catalog.characters[(CHARACTER, BOOK)]
+    assert len(catalog.get_conversation_history(character_id, "alice")) == 2
+
+def test_websocket_with_a_bad_token_is_closed(client):
+    from starlette.websockets import WebSocketDisconnect
+
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect("/chat/ws?token=forged") as socket:
+            socket.receive_json()
+
+def test_characters_are_stored_on_their_first_saved_turn(client, catalog):
+    client.get(f"/books/{BOOK}/characters/{CHARACTER}/state", headers=bearer("alice"))
+    client.get(f"/books/{BOOK}/characters/{CHARACTER}/history", headers=bearer("alice"))
+    turn(client)  # Anonymous
+    assert catalog.characters == {}
+
+    turn(client, bearer("alice"))
+    state = client.get(f"/books/{BOOK}/characters/{CHARACTER}/state", headers=bearer("alice")).json()
+
+    assert state["character_id"] == catalog.characters[(CHARACTER, BOOK)]
+    assert (catalog.characters[(CHARACTER, BOOK)], "alice") in catalog.user_states
+
+@pytest.mark.parametrize("payload", [
+    ["x"],
+    "Hello",
+    {"book_source": BOOK, "character": CHARACTER, "message": ["Hello"]},
+    {"book_source": BOOK, "character": CHARACTER, "message": "Hello", "state": [0.5]},
+    {"book_source": BOOK, "character": CHARACTER, "message": "Hello", "state": {"joy": "very"}},
+])
+def test_malformed_turns_are_rejected(client, catalog, payload):
+    response = client.post("/chat", json=payload)
+    with client.websocket_connect("/chat/ws") as socket:
+        socket.send_json(payload)
+        frame = socket.receive_json()
+        # The socket stays usable after an error frame
+        socket.send_json({"book_source": BOOK, "character": CHARACTER, "message": "Hello"})
+        while socket.receive_json()["type"] != "done":
+            pass
+
+    assert response.status_code == 400 and "error" in response.json()
+    assert frame["type"] == "error"
+
+def test_ingesting_needs_a_token_with_the_ingest_scope(client, catalog):
+    before = catalog.get_book(BOOK)
+    form = {"book_source": BOOK, "text": "Elizabeth Bennet laughed. Mr. Darcy frowned at the assembly."}
+
+    anonymous = client.post("/books", data=form)
+    unscoped = client.post("/books", data=form, headers=bearer("alice"))
+    forged = client.post("/books", data=form, headers={"Authorization": "Bearer forged"})
+
+    assert [r.status_code for r in (anonymous, unscoped, forged)] == [401, 403, 401]
+    assert catalog.get_book(BOOK) == before
+
+    token = auth.issue_token("librarian", scopes=[auth.INGEST_SCOPE])
+    created = client.post("/books", data={**form, "book_source": "Another Book"},
+                          headers={"Authorization": f"Bearer {token}"})
+
+    assert created.status_code == 201
+    assert catalog.get_book("Another Book") is not None and catalog.get_book(BOOK) == before
@@ -0,0 +1,108 @@
+import threading
+
+import pytest
+
+import vector_memory
+from fakes import FakeEmbeddings
+from vector_memory import ConversationVectorMemory
+
+class RecordingEmbeddings(FakeEmbeddings):
+    """Fake embeddings that record batch sizes and can block on texts containing a marker"""
+
+    def __init__(self, block_marker=None):
+        super().__init__()
+        self.batches = []
+        self.block_marker = block_marker
+        self.blocked = threading.Event()
+        self.release = threading.Event()
+
+    def embed_documents(self, texts):
+        self.batches.append(len(texts))
+        if self.block_marker and any(self.block_marker in text for text in texts):
+            self.blocked.set()
+            self.release.wait(5)
+        return super().embed_documents(texts)
+
+def save_history(db, user_id, contents):
+    character_id = db.ensure_character("Elizabeth Bennet", "Pride and Prejudice")
+    ids = []
+    for i in range(0, len(contents), 2):
+        ids += db.save_turn(character_id, user_id, [("user", contents[i]), ("assistant", contents[i + 1])])
+    return character_id, ids
+
+@pytest.fixture
+def backfill_batch(monkeypatch):
+    monkeypatch.setattr(vector_memory, "MEMORY_BACKFILL_BATCH", 16)
+    return 16
+
+def test_backfill_embeds_history_in_bounded_batches(db, tmp_path, backfill_batch):
+    contents = [f"small talk number {i}" for i in range(99)] + ["my cousin lives near Pemberley"]
+    character_id, ids = save_history(db, "reader", contents)
+    embeddings = RecordingEmbeddings()
+    memory = ConversationVectorMemory(db, embeddings, index_dir=str(tmp_path))
+
+    found = memory.search(character_id, "reader", embeddings.embed_query("cousin near Pemberley"), k=1)
+
+    assert max(embeddings.batches) <= backfill_batch
+    assert sum(embeddings.batches) == len(contents)
+    assert [message["message_id"] for message in found] == [ids[-1]]
+
+def test_reloaded_index_catches_up_with_new_messages(db, tmp_path):
+    character_id, ids = save_history(db, "reader", ["hello", "good day"])
+    ConversationVectorMemory(db, FakeEmbeddings(), index_dir=str(tmp_path)).preload(character_id, "reader")
+    _, more = save_history(db, "reader", ["the letter from Mr. Collins", "a tiresome letter"])
+
+    embeddings = RecordingEmbeddings()
+    memory = ConversationVectorMemory(db, embeddings, index_dir=str(tmp_path))
+    found = memory.search(character_id, "reader", embeddings.embed_query("letter from Mr. Collins"), k=1)
+
+    # Only the messages saved after the index was written are embedded again
+    assert embeddings.batches == [2]
+    assert [message["message_id"] for message in found] == [more[0]]
+
+def test_add_messages_skips_messages_already_indexed(db, tmp_path):
+    character_id, ids = save_history(db, "reader", ["hello", "good day"])
+    embeddings = RecordingEmbeddings()
+    memory = ConversationVectorMemory(db, embeddings, index_dir=str(tmp_path))
+    memory.preload(character_id, "reader")
+
+    _, new_ids = save_history(db, "reader", ["a walk to Meryton", "a pleasant walk"])
+    memory.add_messages(character_id, "reader", [(new_ids[0], "a walk to Meryton"), (new_ids[1], "a pleasant walk")])
+    # A repeated call (e.g. a retried turn) finds them indexed and embeds nothing
+    memory.add_messages(character_id, "reader", [(new_ids[0], "a walk to Meryton"), (new_ids[1], "a pleasant walk")])
+
+    assert memory._get_index(character_id, "reader").index.ntotal == 4
+    assert embeddings.batches == [2, 2]
+
+def test_embedding_for_one_user_does_not_block_another(db, tmp_path):
+    character_id, _ = save_history(db, "slow", ["hello", "good day"])
+    save_history(db, "fast", ["the ball at Netherfield", "a crowded ball"])
+    embeddings = RecordingEmbeddings(block_marker="BLOCK")
+    memory = ConversationVectorMemory(db, embeddings, index_dir=str(tmp_path))
+    memory.preload(character_id, "slow")
+    memory.preload(character_id, "fast")
+
+    _, new_ids = save_history(db, "slow", ["BLOCK this", "and this"])
+    # Already loaded, so the slow user's new turn is only embedded (outside any lock) and added
+    writer = threading.Thread(target=memory.add_messages,
+                              args=(character_id, "slow", [(new_ids[0], "BLOCK this"), (new_ids[1], "and this")]))
+    writer.start()
+    assert embeddings.blocked.wait(5)
+
+    found = memory.search(character_id, "fast", embeddings.embed_query("ball at Netherfield"), k=1)
+    assert found and found[0]["content"] == "the ball at Netherfield"
+    # The slow user's own index stays searchable while its embedding call is in flight
+    assert memory.search(character_id, "slow", embeddings.embed_query("hello"), k=1)
+
+    embeddings.release.set()
+    writer.join(5)
+    assert memory._get_index(character_id, "slow").index.ntotal == 4
+
+def test_anonymous_and_unknown_users_have_no_memory(db, tmp_path):
+    memory = ConversationVectorMemory(db, FakeEmbeddings(), index_dir=str(tmp_path))
+    character_id = db.ensure_character("Elizabeth Bennet", "Pride and Prejudice")
+
+    assert memory.search(character_id, "anonymous", [0.1] * 768) == []
+    assert memory.search(character_id, "nobody", [0.1] * 768) == []
+    memory.add_messages(character_id, "anonymous", [(1, "hello")])
+    assert not list(tmp_path.iterdir())